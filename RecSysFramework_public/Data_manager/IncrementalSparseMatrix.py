@@ -152,6 +152,40 @@ class IncrementalSparseMatrix_ListBased(object):
 
 
 import numpy as np
+import pandas as pd
+
+
+
+def _get_index_array(original_ID_list, original_ID_to_index, add_new_IDs):
+    """
+    Translates the original IDs into indices with the mapper. The dictionary is queried once for each unique ID
+    instead of once for each element.
+    If add_new_IDs, the IDs not in the mapper are added to it in order of first appearance, as adding them one at a time,
+    otherwise their index is -1
+    :param original_ID_list:
+    :param original_ID_to_index:
+    :param add_new_IDs:
+    :return:
+    """
+
+    # Index.unique keeps the order of first appearance, tolist returns the IDs as Python objects so the mapper
+    # keys have the same type they would have when added one at a time
+    original_ID_array = pd.Index(original_ID_list)
+    unique_ID_array = original_ID_array.unique()
+    unique_ID_code = unique_ID_array.get_indexer(original_ID_array)
+    unique_ID_list = unique_ID_array.tolist()
+
+    unique_ID_index = np.fromiter((original_ID_to_index.get(original_ID, -1) for original_ID in unique_ID_list),
+                                  dtype=np.int64, count=len(unique_ID_list))
+
+    if add_new_IDs:
+        new_ID_position = np.flatnonzero(unique_ID_index == -1)
+        unique_ID_index[new_ID_position] = np.arange(len(original_ID_to_index), len(original_ID_to_index) + len(new_ID_position))
+
+        for position in new_ID_position:
+            original_ID_to_index[unique_ID_list[position]] = int(unique_ID_index[position])
+
+    return unique_ID_index[unique_ID_code]
 
 
 
@@ -180,27 +214,73 @@ class IncrementalSparseMatrix(IncrementalSparseMatrix_ListBased):
         return self._next_cell_pointer
 
 
-    def add_data_lists(self, row_list_to_add, col_list_to_add, data_list_to_add):
+    def _ensure_capacity(self, n_elements_to_add):
+        """
+        Grows the arrays geometrically, so that adding the data in many small lists has an amortized constant cost
+        :param n_elements_to_add:
+        :return:
+        """
 
-        assert len(row_list_to_add) == len(col_list_to_add) and len(row_list_to_add) == len(data_list_to_add),\
-            "IncrementalSparseMatrix: element lists must have the same length"
+        if self._next_cell_pointer + n_elements_to_add <= len(self._row_array):
+            return
+
+        new_capacity = max(self._next_cell_pointer + n_elements_to_add, 2*len(self._row_array))
+
+        for array_name in ["_row_array", "_col_array", "_data_array"]:
+            old_array = getattr(self, array_name)
+            new_array = np.zeros(new_capacity, dtype=old_array.dtype)
+            new_array[:self._next_cell_pointer] = old_array[:self._next_cell_pointer]
+            setattr(self, array_name, new_array)
+
+
+    def _get_row_index_array(self, row_list):
+
+        if not self._auto_create_row_mapper:
+            return np.asarray(row_list)
+
+        return _get_index_array(row_list, self._row_original_ID_to_index, add_new_IDs = True)
+
+
+    def _get_column_index_array(self, col_list):
 
-        for data_point_index in range(len(row_list_to_add)):
+        if not self._auto_create_column_mapper:
+            return np.asarray(col_list)
+
+        return _get_index_array(col_list, self._column_original_ID_to_index, add_new_IDs = True)
+
+
+    def _add_index_arrays(self, row_index_array, col_index_array, data_array):
+
+        n_elements_to_add = len(row_index_array)
+        self._ensure_capacity(n_elements_to_add)
+
+        new_cell_pointer = self._next_cell_pointer + n_elements_to_add
 
-            if self._next_cell_pointer == len(self._row_array):
-                self._row_array = np.concatenate((self._row_array, np.zeros(self._dataBlock, dtype=self._dtype_coordinates)))
-                self._col_array = np.concatenate((self._col_array, np.zeros(self._dataBlock, dtype=self._dtype_coordinates)))
-                self._data_array = np.concatenate((self._data_array, np.zeros(self._dataBlock, dtype=self._dtype_data)))
+        self._row_array[self._next_cell_pointer:new_cell_pointer] = row_index_array
+        self._col_array[self._next_cell_pointer:new_cell_pointer] = col_index_array
+        self._data_array[self._next_cell_pointer:new_cell_pointer] = data_array
 
+        self._next_cell_pointer = new_cell_pointer
 
-            row_index = self._get_row_index(row_list_to_add[data_point_index])
-            col_index = self._get_column_index(col_list_to_add[data_point_index])
 
-            self._row_array[self._next_cell_pointer] = row_index
-            self._col_array[self._next_cell_pointer] = col_index
-            self._data_array[self._next_cell_pointer] = data_list_to_add[data_point_index]
+    def add_data_lists(self, row_list_to_add, col_list_to_add, data_list_to_add):
+        """
+        Adds the elements in bulk, the lists can be either python lists or numpy arrays
+        :param row_list_to_add:
+        :param col_list_to_add:
+        :param data_list_to_add:
+        :return:
+        """
+
+        assert len(row_list_to_add) == len(col_list_to_add) and len(row_list_to_add) == len(data_list_to_add),\
+            "IncrementalSparseMatrix: element lists must have the same length"
+
+        if len(row_list_to_add) == 0:
+            return
 
-            self._next_cell_pointer += 1
+        self._add_index_arrays(self._get_row_index_array(row_list_to_add),
+                               self._get_column_index_array(col_list_to_add),
+                               np.asarray(data_list_to_add))
 
 
 
@@ -219,18 +299,35 @@ class IncrementalSparseMatrix(IncrementalSparseMatrix_ListBased):
 
     def get_SparseMatrix(self):
 
+        # An empty matrix without a fixed shape has a single cell, as its coordinates were all initialized to zero
         if self._n_rows is None:
-            self._n_rows = self._row_array.max() + 1
+            self._n_rows = self._row_array[:self._next_cell_pointer].max() + 1 if self._next_cell_pointer > 0 else 1
 
         if self._n_cols is None:
-            self._n_cols = self._col_array.max() + 1
+            self._n_cols = self._col_array[:self._next_cell_pointer].max() + 1 if self._next_cell_pointer > 0 else 1
 
         shape = (self._n_rows, self._n_cols)
 
-        sparseMatrix = sps.csr_matrix((self._data_array[:self._next_cell_pointer],
-                                       (self._row_array[:self._next_cell_pointer], self._col_array[:self._next_cell_pointer])),
-                                      shape=shape,
-                                      dtype=self._dtype_data)
+        row_array = self._row_array[:self._next_cell_pointer]
+
+        # If the rows were added in order the CSR can be built directly, without the COO conversion.
+        # Duplicates are then summed and the indices sorted only if needed
+        if np.all(row_array[1:] >= row_array[:-1]):
+            indptr = np.zeros(self._n_rows + 1, dtype=np.int64)
+            np.cumsum(np.bincount(row_array, minlength=self._n_rows), out=indptr[1:])
+
+            sparseMatrix = sps.csr_matrix((self._data_array[:self._next_cell_pointer].copy(),
+                                           self._col_array[:self._next_cell_pointer].copy(),
+                                           indptr),
+                                          shape=shape,
+                                          dtype=self._dtype_data)
+            sparseMatrix.sum_duplicates()
+
+        else:
+            sparseMatrix = sps.csr_matrix((self._data_array[:self._next_cell_pointer],
+                                           (row_array, self._col_array[:self._next_cell_pointer])),
+                                          shape=shape,
+                                          dtype=self._dtype_data)
 
         sparseMatrix.eliminate_zeros()
 
@@ -340,31 +437,31 @@ class IncrementalSparseMatrix_FilterIDs(IncrementalSparseMatrix):
 
 
 
-    def add_data_lists(self, row_list_to_add, col_list_to_add, data_list_to_add):
-
-        assert len(row_list_to_add) == len(col_list_to_add) and len(row_list_to_add) == len(data_list_to_add),\
-            "IncrementalSparseMatrix: element lists must have different length"
+    def _get_row_index_array(self, row_list):
+        return _get_index_array(row_list, self._row_original_ID_to_index, add_new_IDs = self._on_new_row_add_flag)
 
 
-        for data_point_index in range(len(row_list_to_add)):
+    def _get_column_index_array(self, col_list):
+        return _get_index_array(col_list, self._column_original_ID_to_index, add_new_IDs = self._on_new_col_add_flag)
 
-            if self._next_cell_pointer == len(self._row_array):
-                self._row_array = np.concatenate((self._row_array, np.zeros(self._dataBlock, dtype=self._dtype_coordinates)))
-                self._col_array = np.concatenate((self._col_array, np.zeros(self._dataBlock, dtype=self._dtype_coordinates)))
-                self._data_array = np.concatenate((self._data_array, np.zeros(self._dataBlock, dtype=self._dtype_data)))
 
+    def add_data_lists(self, row_list_to_add, col_list_to_add, data_list_to_add):
 
-            row_index = self._get_row_index(row_list_to_add[data_point_index])
-            col_index = self._get_column_index(col_list_to_add[data_point_index])
+        assert len(row_list_to_add) == len(col_list_to_add) and len(row_list_to_add) == len(data_list_to_add),\
+            "IncrementalSparseMatrix: element lists must have different length"
 
+        if len(row_list_to_add) == 0:
+            return
 
-            if row_index is not None and col_index is not None:
+        row_index_array = self._get_row_index_array(row_list_to_add)
+        col_index_array = self._get_column_index_array(col_list_to_add)
 
-                self._row_array[self._next_cell_pointer] = row_index
-                self._col_array[self._next_cell_pointer] = col_index
-                self._data_array[self._next_cell_pointer] = data_list_to_add[data_point_index]
+        # Elements with ignored IDs are not added
+        valid_mask = np.logical_and(row_index_array != -1, col_index_array != -1)
 
-                self._next_cell_pointer += 1
+        self._add_index_arrays(row_index_array[valid_mask],
+                               col_index_array[valid_mask],
+                               np.asarray(data_list_to_add)[valid_mask])
 
 
 
@@ -8,95 +8,83 @@ Created on 23/04/2019
 
 import numpy as np
 import scipy.sparse as sps
-from Data_manager.IncrementalSparseMatrix import IncrementalSparseMatrix
 
 
 
 
-def split_train_leave_k_out_user_wise(URM, k_out = 1, use_validation_set = True, leave_random_out = True):
+def _get_split_from_positions(URM, interaction_position, interaction_user, split_mask):
     """
-    The function splits an URM in two matrices selecting the k_out interactions one user at a time
-    :param URM:
-    :param k_out:
-    :param use_validation_set:
-    :param leave_random_out:
+    Builds the CSR matrix containing the sampled interactions of URM selected by split_mask
+    :param URM:                     CSR matrix
+    :param interaction_position:    position in URM.indices and URM.data of each sampled interaction, grouped by user
+    :param interaction_user:        user of each sampled interaction
+    :param split_mask:              mask of the sampled interactions belonging to the split
     :return:
     """
 
-    assert k_out > 0, "k_out must be a value greater than 0, provided was '{}'".format(k_out)
-
-    URM = sps.csr_matrix(URM)
     n_users, n_items = URM.shape
 
+    interaction_position = interaction_position[split_mask]
+    split_profile_length = np.bincount(interaction_user[split_mask], minlength=n_users)
 
-    URM_train_builder = IncrementalSparseMatrix(auto_create_row_mapper=False, n_rows = n_users,
-                                        auto_create_col_mapper=False, n_cols = n_items)
-
-    URM_test_builder = IncrementalSparseMatrix(auto_create_row_mapper=False, n_rows = n_users,
-                                        auto_create_col_mapper=False, n_cols = n_items)
-
-    if use_validation_set:
-         URM_validation_builder = IncrementalSparseMatrix(auto_create_row_mapper=False, n_rows = n_users,
-                                                          auto_create_col_mapper=False, n_cols = n_items)
-
-
-
-    for user_id in range(n_users):
-
-        start_user_position = URM.indptr[user_id]
-        end_user_position = URM.indptr[user_id+1]
-
-        user_profile = URM.indices[start_user_position:end_user_position]
-
-
-        if leave_random_out:
-            indices_to_suffle = np.arange(len(user_profile), dtype=np.int)
+    URM_split = sps.csr_matrix((URM.data[interaction_position].astype(np.float64),
+                                URM.indices[interaction_position],
+                                np.concatenate(([0], np.cumsum(split_profile_length)))),
+                               shape=(n_users, n_items))
 
-            np.random.shuffle(indices_to_suffle)
+    # The interactions are in sampling order, sum duplicates as in the COO constructor and sort the indices
+    URM_split.sum_duplicates()
+    URM_split.eliminate_zeros()
 
-            user_interaction_items = user_profile[indices_to_suffle]
-            user_interaction_data = URM.data[start_user_position:end_user_position][indices_to_suffle]
+    return URM_split
 
-        else:
 
-            # The first will be sampled so the last interaction must be the first one
-            interaction_position = URM.data[start_user_position:end_user_position]
 
-            sort_interaction_index = np.argsort(-interaction_position)
 
-            user_interaction_items = user_profile[sort_interaction_index]
-            user_interaction_data = URM.data[start_user_position:end_user_position][sort_interaction_index]
-
-
-
-        #Test interactions
-        user_interaction_items_test = user_interaction_items[0:k_out]
-        user_interaction_data_test = user_interaction_data[0:k_out]
-
-        URM_test_builder.add_data_lists([user_id]*len(user_interaction_items_test), user_interaction_items_test, user_interaction_data_test)
+def split_train_leave_k_out_user_wise(URM, k_out = 1, use_validation_set = True, leave_random_out = True):
+    """
+    The function splits an URM in two matrices selecting the k_out interactions one user at a time
+    :param URM:
+    :param k_out:
+    :param use_validation_set:
+    :param leave_random_out:
+    :return:
+    """
 
+    assert k_out > 0, "k_out must be a value greater than 0, provided was '{}'".format(k_out)
 
-        #validation interactions
-        if use_validation_set:
-            user_interaction_items_validation = user_interaction_items[k_out:k_out*2]
-            user_interaction_data_validation = user_interaction_data[k_out:k_out*2]
+    URM = sps.csr_matrix(URM)
+    n_users, n_items = URM.shape
 
-            URM_validation_builder.add_data_lists([user_id]*k_out, user_interaction_items_validation, user_interaction_data_validation)
+    profile_length = np.ediff1d(URM.indptr)
+    interaction_user = np.repeat(np.arange(n_users), profile_length)
 
+    # Position in URM of the interactions of every user, in the order in which they are sampled
+    if leave_random_out:
+        interaction_position = np.arange(URM.nnz)
 
-        #Train interactions
-        user_interaction_items_train = user_interaction_items[k_out*2:]
-        user_interaction_data_train = user_interaction_data[k_out*2:]
+        # Profiles are shuffled one user at a time so that the global random state produces the same split as
+        # shuffling each profile separately. Profiles with less than two interactions do not consume random numbers
+        for user_id in np.flatnonzero(profile_length > 1):
+            np.random.shuffle(interaction_position[URM.indptr[user_id]:URM.indptr[user_id+1]])
 
-        URM_train_builder.add_data_lists([user_id]*len(user_interaction_items_train), user_interaction_items_train, user_interaction_data_train)
+    else:
+        # The first will be sampled so the last interaction must be the first one
+        # Sort by user and decreasing data, ties keep the order they have in the profile.
+        # The rank of the data is unique, so a single key of user and rank can be sorted with a non-stable sort
+        data_rank = np.empty(URM.nnz, dtype=np.int64)
+        data_rank[np.argsort(-URM.data, kind="stable")] = np.arange(URM.nnz)
 
+        interaction_position = np.argsort(interaction_user.astype(np.int64)*URM.nnz + data_rank)
 
 
-    URM_train = URM_train_builder.get_SparseMatrix()
-    URM_test = URM_test_builder.get_SparseMatrix()
+    # Rank of each sampled interaction within its user profile
+    interaction_rank = np.arange(URM.nnz) - URM.indptr[interaction_user]
 
+    # The train interactions start after those of test and validation even when the validation is not used
+    URM_test = _get_split_from_positions(URM, interaction_position, interaction_user, interaction_rank < k_out)
+    URM_train = _get_split_from_positions(URM, interaction_position, interaction_user, interaction_rank >= k_out*2)
 
-    URM_train = sps.csr_matrix(URM_train)
     user_no_item_train = np.sum(np.ediff1d(URM_train.indptr) == 0)
 
     if user_no_item_train != 0:
@@ -105,9 +93,8 @@ def split_train_leave_k_out_user_wise(URM, k_out = 1, use_validation_set = True,
 
 
     if use_validation_set:
-        URM_validation = URM_validation_builder.get_SparseMatrix()
+        URM_validation = _get_split_from_positions(URM, interaction_position, interaction_user, np.logical_and(interaction_rank >= k_out, interaction_rank < k_out*2))
 
-        URM_validation = sps.csr_matrix(URM_validation)
         user_no_item_validation = np.sum(np.ediff1d(URM_validation.indptr) == 0)
 
         if user_no_item_validation != 0:
@@ -118,5 +105,3 @@ def split_train_leave_k_out_user_wise(URM, k_out = 1, use_validation_set = True,
 
 
     return URM_train, URM_test
-
-
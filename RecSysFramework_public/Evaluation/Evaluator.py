@@ -9,12 +9,14 @@ Created on 26/06/18
 import numpy as np
 import scipy.sparse as sps
 import time, sys, copy
+import multiprocessing
 import pandas as pd
 
 from enum import Enum
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
+from Recommenders.BaseRecommender import BaseRecommender
 
-from Evaluation.metrics import precision, precision_recall_min_denominator, recall, MAP, MAP_MIN_DEN, MRR, HIT_RATE, ndcg, arhr_all_hits, \
+from Evaluation.metrics import precision_batch, precision_recall_min_denominator_batch, recall_batch, MAP, MAP_MIN_DEN, MRR, HIT_RATE, ndcg_batch, arhr_all_hits_batch, \
     Novelty, Coverage_Item, Coverage_Item_HIT, Items_In_GT, _Metrics_Object, Coverage_User, Coverage_User_HIT, Users_In_GT, Gini_Diversity, Shannon_Entropy, Diversity_MeanInterList,\
     Diversity_Herfindahl, AveragePopularity, Ratio_Diversity_Gini, Ratio_Diversity_Herfindahl, Ratio_Shannon_Entropy, Ratio_AveragePopularity, Ratio_Novelty
 
@@ -172,6 +174,28 @@ def _remove_item_interactions(URM, item_list):
     return URM
 
 
+def _recommendation_list_to_matrix(recommended_items_batch_list, max_cutoff):
+    """
+    Stores the recommendation lists of a batch of users, which may have different lengths, in a single matrix.
+    :param recommended_items_batch_list:    list of recommendation lists
+    :param max_cutoff:                      lists are truncated at max_cutoff
+    :return recommended_items:              (n_users, max_cutoff) matrix of item ids, padded with 0 after the end of each list
+    :return recommended_mask:               (n_users, max_cutoff) boolean matrix, False for the padding
+    """
+
+    n_recommended = np.array([min(len(user_list), max_cutoff) for user_list in recommended_items_batch_list], dtype=np.int64)
+
+    recommended_mask = np.arange(max_cutoff)[None, :] < n_recommended[:, None]
+    recommended_items = np.zeros((len(recommended_items_batch_list), max_cutoff), dtype=np.int64)
+
+    if n_recommended.sum() > 0:
+        recommended_items[recommended_mask] = np.concatenate([np.asarray(user_list[:max_cutoff], dtype=np.int64)
+                                                              for user_list in recommended_items_batch_list])
+
+    return recommended_items, recommended_mask
+
+
+
 class Evaluator(object):
     """Abstract Evaluator"""
 
@@ -331,6 +355,56 @@ class Evaluator(object):
 
 
 
+    def _get_batch_relevance(self, test_user_batch_array, recommended_items, recommended_mask):
+        """
+        Looks up the test data of a batch of users with vectorized operations on URM_test
+        :param test_user_batch_array:
+        :param recommended_items:       (n_users, max_cutoff) matrix of recommended item ids
+        :param recommended_mask:        (n_users, max_cutoff) boolean matrix, False for the padding
+        :return is_relevant:            (n_users, max_cutoff) boolean matrix, True if the recommended item is in the test data
+        :return rank_scores:            (n_users, max_cutoff) test relevance of each recommended item, 0.0 if not relevant
+        :return ideal_scores:           (n_users, max_cutoff) test relevances of each user sorted in descending order
+        :return n_relevant_items:       (n_users,) number of test items of each user
+        """
+
+        assert self.URM_test.getformat() == "csr", "Evaluator_Base_Class: URM_test is not CSR, this will cause errors in getting relevant items"
+
+        n_batch_users, max_cutoff = recommended_items.shape
+
+        URM_test_batch = self.URM_test[test_user_batch_array]
+        n_relevant_items = np.ediff1d(URM_test_batch.indptr)
+        test_rows = np.repeat(np.arange(n_batch_users, dtype=np.int64), n_relevant_items)
+
+        # Each (user, item) couple is identified by a single key, sorting the test keys
+        # allows to search all the recommended ones at once
+        test_keys = test_rows * self.n_items + URM_test_batch.indices
+        test_keys_sorting = np.argsort(test_keys, kind="stable")
+        test_keys = test_keys[test_keys_sorting]
+        test_ratings = URM_test_batch.data[test_keys_sorting].astype(np.float64)
+
+        recommended_keys = np.arange(n_batch_users, dtype=np.int64)[:, None] * self.n_items + recommended_items
+        recommended_keys_position = np.searchsorted(test_keys, recommended_keys)
+        recommended_keys_position = np.minimum(recommended_keys_position, max(len(test_keys) - 1, 0))
+
+        rank_scores = np.zeros((n_batch_users, max_cutoff), dtype=np.float64)
+        is_relevant = np.zeros((n_batch_users, max_cutoff), dtype=bool)
+
+        if len(test_keys) > 0:
+            is_relevant = np.logical_and(test_keys[recommended_keys_position] == recommended_keys, recommended_mask)
+            rank_scores[is_relevant] = test_ratings[recommended_keys_position[is_relevant]]
+
+        # Sort the ratings of each user in descending order and keep the first max_cutoff
+        ideal_sorting = np.lexsort((-URM_test_batch.data, test_rows))
+        ideal_position = np.arange(len(test_rows)) - URM_test_batch.indptr[test_rows]
+        ideal_position_mask = ideal_position < max_cutoff
+
+        ideal_scores = np.zeros((n_batch_users, max_cutoff), dtype=np.float64)
+        ideal_scores[test_rows[ideal_position_mask], ideal_position[ideal_position_mask]] = URM_test_batch.data[ideal_sorting][ideal_position_mask]
+
+        return is_relevant, rank_scores, ideal_scores, n_relevant_items
+
+
+
     def _compute_metrics_on_recommendation_list(self, test_user_batch_array, recommended_items_batch_list, scores_batch, results_dict):
 
         assert len(recommended_items_batch_list) == len(test_user_batch_array), "{}: recommended_items_batch_list contained recommendations for {} users, expected was {}".format(
@@ -343,65 +417,66 @@ class Evaluator(object):
             self.EVALUATOR_NAME, scores_batch.shape[1], self.n_items)
 
 
-        # Compute recommendation quality for each user in batch
-        for batch_user_index in range(len(recommended_items_batch_list)):
+        test_user_batch_array = np.array(test_user_batch_array)
 
-            test_user = test_user_batch_array[batch_user_index]
+        # Compute recommendation quality for all users in batch at once, lists are stored in a
+        # (n_users, max_cutoff) matrix padded after the end of each list and masked via recommended_mask
+        recommended_items, recommended_mask = _recommendation_list_to_matrix(recommended_items_batch_list, self.max_cutoff)
+        is_relevant, rank_scores, ideal_scores, n_relevant_items = self._get_batch_relevance(test_user_batch_array, recommended_items, recommended_mask)
 
-            relevant_items = self.get_user_relevant_items(test_user)
+        self._n_users_evaluated += len(test_user_batch_array)
 
-            # Add the RMSE to the global object, no need to loop through the various cutoffs
-            # This repository is not designed to ensure proper RMSE optimization
-            # relevant_items_rating = self.get_user_test_ratings(test_user)
-            #
-            # all_items_predicted_ratings = scores_batch[batch_user_index]
-            # global_RMSE_object = results_dict[self.cutoff_list[0]][EvaluatorMetrics.RMSE.value]
-            # global_RMSE_object.add_recommendations(all_items_predicted_ratings, relevant_items, relevant_items_rating)
+        for cutoff in self.cutoff_list:
 
-            # Being the URM CSR, the indices are the non-zero column indexes
-            recommended_items = recommended_items_batch_list[batch_user_index]
-            is_relevant = np.in1d(recommended_items, relevant_items, assume_unique=True)
+            results_current_cutoff = results_dict[cutoff]
 
-            self._n_users_evaluated += 1
+            is_relevant_current_cutoff = is_relevant[:, 0:cutoff]
+            recommended_items_current_cutoff = recommended_items[:, 0:cutoff]
+            recommended_mask_current_cutoff = recommended_mask[:, 0:cutoff]
+            n_recommended_current_cutoff = np.sum(recommended_mask_current_cutoff, axis=1)
 
-            for cutoff in self.cutoff_list:
+            results_current_cutoff[EvaluatorMetrics.PRECISION.value]            += np.sum(precision_batch(is_relevant_current_cutoff, n_recommended_current_cutoff))
+            results_current_cutoff[EvaluatorMetrics.PRECISION_RECALL_MIN_DEN.value]   += np.sum(precision_recall_min_denominator_batch(is_relevant_current_cutoff, n_recommended_current_cutoff, n_relevant_items))
+            results_current_cutoff[EvaluatorMetrics.RECALL.value]               += np.sum(recall_batch(is_relevant_current_cutoff, n_relevant_items))
+            results_current_cutoff[EvaluatorMetrics.NDCG.value]                 += np.sum(ndcg_batch(rank_scores[:, 0:cutoff], ideal_scores[:, 0:cutoff]))
+            results_current_cutoff[EvaluatorMetrics.ARHR.value]                 += np.sum(arhr_all_hits_batch(is_relevant_current_cutoff))
+
+            results_current_cutoff[EvaluatorMetrics.MRR.value].add_recommendations_batch(is_relevant_current_cutoff)
+            results_current_cutoff[EvaluatorMetrics.MAP.value].add_recommendations_batch(is_relevant_current_cutoff, n_recommended_current_cutoff, n_relevant_items)
+            results_current_cutoff[EvaluatorMetrics.MAP_MIN_DEN.value].add_recommendations_batch(is_relevant_current_cutoff, n_recommended_current_cutoff, n_relevant_items)
+            results_current_cutoff[EvaluatorMetrics.HIT_RATE.value].add_recommendations_batch(is_relevant_current_cutoff)
+
+            results_current_cutoff[EvaluatorMetrics.NOVELTY.value].add_recommendations_batch(recommended_items_current_cutoff, recommended_mask_current_cutoff)
+            results_current_cutoff[EvaluatorMetrics.AVERAGE_POPULARITY.value].add_recommendations_batch(recommended_items_current_cutoff, recommended_mask_current_cutoff)
+            results_current_cutoff[EvaluatorMetrics.DIVERSITY_GINI.value].add_recommendations_batch(recommended_items_current_cutoff, recommended_mask_current_cutoff)
+            results_current_cutoff[EvaluatorMetrics.SHANNON_ENTROPY.value].add_recommendations_batch(recommended_items_current_cutoff, recommended_mask_current_cutoff)
+            results_current_cutoff[EvaluatorMetrics.COVERAGE_ITEM.value].add_recommendations_batch(recommended_items_current_cutoff, recommended_mask_current_cutoff)
+            results_current_cutoff[EvaluatorMetrics.COVERAGE_ITEM_HIT.value].add_recommendations_batch(recommended_items_current_cutoff, is_relevant_current_cutoff)
+            results_current_cutoff[EvaluatorMetrics.COVERAGE_USER.value].add_recommendations_batch(recommended_mask_current_cutoff, test_user_batch_array)
+            results_current_cutoff[EvaluatorMetrics.COVERAGE_USER_HIT.value].add_recommendations_batch(is_relevant_current_cutoff, test_user_batch_array)
+            results_current_cutoff[EvaluatorMetrics.DIVERSITY_MEAN_INTER_LIST.value].add_recommendations_batch(recommended_items_current_cutoff, recommended_mask_current_cutoff)
+            results_current_cutoff[EvaluatorMetrics.DIVERSITY_HERFINDAHL.value].add_recommendations_batch(recommended_items_current_cutoff, recommended_mask_current_cutoff)
+
+            results_current_cutoff[EvaluatorMetrics.RATIO_SHANNON_ENTROPY.value].add_recommendations_batch(recommended_items_current_cutoff, recommended_mask_current_cutoff)
+            results_current_cutoff[EvaluatorMetrics.RATIO_DIVERSITY_HERFINDAHL.value].add_recommendations_batch(recommended_items_current_cutoff, recommended_mask_current_cutoff)
+            results_current_cutoff[EvaluatorMetrics.RATIO_DIVERSITY_GINI.value].add_recommendations_batch(recommended_items_current_cutoff, recommended_mask_current_cutoff)
+            results_current_cutoff[EvaluatorMetrics.RATIO_NOVELTY.value].add_recommendations_batch(recommended_items_current_cutoff, recommended_mask_current_cutoff)
+            results_current_cutoff[EvaluatorMetrics.RATIO_AVERAGE_POPULARITY.value].add_recommendations_batch(recommended_items_current_cutoff, recommended_mask_current_cutoff)
+
+            # The diversity object is user-provided and only supports one list at a time
+            if EvaluatorMetrics.DIVERSITY_SIMILARITY.value in results_current_cutoff:
+                for batch_user_index in range(len(test_user_batch_array)):
+                    user_recommended_items = recommended_items_current_cutoff[batch_user_index, recommended_mask_current_cutoff[batch_user_index]]
+                    results_current_cutoff[EvaluatorMetrics.DIVERSITY_SIMILARITY.value].add_recommendations(user_recommended_items)
+
+
+        self._print_progress()
+
+        return results_dict
 
-                results_current_cutoff = results_dict[cutoff]
 
-                is_relevant_current_cutoff = is_relevant[0:cutoff]
-                recommended_items_current_cutoff = recommended_items[0:cutoff]
-
-                results_current_cutoff[EvaluatorMetrics.PRECISION.value]            += precision(is_relevant_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.PRECISION_RECALL_MIN_DEN.value]   += precision_recall_min_denominator(is_relevant_current_cutoff, len(relevant_items))
-                results_current_cutoff[EvaluatorMetrics.RECALL.value]               += recall(is_relevant_current_cutoff, relevant_items)
-                results_current_cutoff[EvaluatorMetrics.NDCG.value]                 += ndcg(recommended_items_current_cutoff, relevant_items, relevance=self.get_user_test_ratings(test_user), at=cutoff)
-                results_current_cutoff[EvaluatorMetrics.ARHR.value]                 += arhr_all_hits(is_relevant_current_cutoff)
-
-                results_current_cutoff[EvaluatorMetrics.MRR.value].add_recommendations(is_relevant_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.MAP.value].add_recommendations(is_relevant_current_cutoff, relevant_items)
-                results_current_cutoff[EvaluatorMetrics.MAP_MIN_DEN.value].add_recommendations(is_relevant_current_cutoff, relevant_items)
-                results_current_cutoff[EvaluatorMetrics.HIT_RATE.value].add_recommendations(is_relevant_current_cutoff)
-
-                results_current_cutoff[EvaluatorMetrics.NOVELTY.value].add_recommendations(recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.AVERAGE_POPULARITY.value].add_recommendations(recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.DIVERSITY_GINI.value].add_recommendations(recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.SHANNON_ENTROPY.value].add_recommendations(recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.COVERAGE_ITEM.value].add_recommendations(recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.COVERAGE_ITEM_HIT.value].add_recommendations(recommended_items_current_cutoff, is_relevant_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.COVERAGE_USER.value].add_recommendations(recommended_items_current_cutoff, test_user)
-                results_current_cutoff[EvaluatorMetrics.COVERAGE_USER_HIT.value].add_recommendations(is_relevant_current_cutoff, test_user)
-                results_current_cutoff[EvaluatorMetrics.DIVERSITY_MEAN_INTER_LIST.value].add_recommendations(recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.DIVERSITY_HERFINDAHL.value].add_recommendations(recommended_items_current_cutoff)
-
-                results_current_cutoff[EvaluatorMetrics.RATIO_SHANNON_ENTROPY.value].add_recommendations(recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.RATIO_DIVERSITY_HERFINDAHL.value].add_recommendations(recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.RATIO_DIVERSITY_GINI.value].add_recommendations(recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.RATIO_NOVELTY.value].add_recommendations(recommended_items_current_cutoff)
-                results_current_cutoff[EvaluatorMetrics.RATIO_AVERAGE_POPULARITY.value].add_recommendations(recommended_items_current_cutoff)
-
-                if EvaluatorMetrics.DIVERSITY_SIMILARITY.value in results_current_cutoff:
-                    results_current_cutoff[EvaluatorMetrics.DIVERSITY_SIMILARITY.value].add_recommendations(recommended_items_current_cutoff)
 
+    def _print_progress(self):
 
         if time.time() - self._start_time_print > 300 or self._n_users_evaluated==len(self.users_to_evaluate):
 
@@ -420,9 +495,6 @@ class Evaluator(object):
             self._start_time_print = time.time()
 
 
-        return results_dict
-
-
 
 
 
@@ -437,7 +509,12 @@ class EvaluatorHoldout(Evaluator):
                  diversity_object = None,
                  ignore_items = None,
                  ignore_users = None,
-                 verbose=True):
+                 verbose=True,
+                 item_chunk_size = None):
+        """
+        :param item_chunk_size:     if not None the recommendations are computed item_chunk_size items at a time,
+                                        which allows larger user blocks for big catalogs
+        """
 
 
         super(EvaluatorHoldout, self).__init__(URM_test_list, cutoff_list,
@@ -446,19 +523,13 @@ class EvaluatorHoldout(Evaluator):
                                                ignore_items = ignore_items, ignore_users = ignore_users,
                                                verbose = verbose)
 
+        self.item_chunk_size = item_chunk_size
 
 
 
 
-    def _run_evaluation_on_selected_users(self, recommender_object, users_to_evaluate, block_size = None):
 
-        if block_size is None:
-            # Reduce block size if estimated memory requirement exceeds 1 GB
-            block_size = min([
-                1000,
-                int(0.25 * 1e9 * 8 / 64 / self.n_items),
-                len(users_to_evaluate),
-            ])
+    def _run_evaluation_on_selected_users(self, recommender_object, users_to_evaluate, block_size = None):
 
         results_dict = _create_empty_metrics_dict(self.cutoff_list,
                                                   self.n_items, self.n_users,
@@ -472,6 +543,31 @@ class EvaluatorHoldout(Evaluator):
         if self.ignore_items_flag:
             recommender_object.set_items_to_ignore(self.ignore_items_ID)
 
+        return self._run_evaluation_on_user_batches(recommender_object, users_to_evaluate, results_dict, block_size = block_size)
+
+
+
+    def _run_evaluation_on_user_batches(self, recommender_object, users_to_evaluate, results_dict, block_size = None):
+
+        recommend_kwargs = {}
+        n_items_in_memory = self.n_items
+
+        if self.item_chunk_size is not None:
+            recommend_kwargs["item_chunk_size"] = self.item_chunk_size
+
+            # Only a chunk of items and the current top cutoff are kept in memory for each user, unless the recommender
+            # uses the default _compute_item_score_chunks, which computes the scores of all items at once
+            if type(recommender_object)._compute_item_score_chunks is not BaseRecommender._compute_item_score_chunks:
+                n_items_in_memory = min(self.n_items, self.item_chunk_size + self.max_cutoff)
+
+        if block_size is None:
+            # Reduce block size if estimated memory requirement exceeds 1 GB
+            block_size = min([
+                1000,
+                int(0.25 * 1e9 * 8 / 64 / n_items_in_memory),
+                len(users_to_evaluate),
+            ])
+
         # Start from -block_size to ensure it to be 0 at the first block
         user_batch_start = 0
         user_batch_end = 0
@@ -490,7 +586,8 @@ class EvaluatorHoldout(Evaluator):
                                                                       cutoff = self.max_cutoff,
                                                                       remove_top_pop_flag=False,
                                                                       remove_custom_items_flag=self.ignore_items_flag,
-                                                                      return_scores = True
+                                                                      return_scores = True,
+                                                                      **recommend_kwargs
                                                                      )
 
             results_dict = self._compute_metrics_on_recommendation_list(test_user_batch_array = test_user_batch_array,
@@ -504,6 +601,131 @@ class EvaluatorHoldout(Evaluator):
 
 
 
+# The evaluator, the recommender and the empty metrics are inherited by the worker processes via fork (copy-on-write)
+# rather than being pickled for each shard of users
+_PARALLEL_EVALUATION_CONTEXT = {}
+
+
+def _run_evaluation_on_users_shard(users_shard):
+
+    evaluator = _PARALLEL_EVALUATION_CONTEXT["evaluator"]
+    recommender_object = _PARALLEL_EVALUATION_CONTEXT["recommender_object"]
+    block_size = _PARALLEL_EVALUATION_CONTEXT["block_size"]
+
+    # Progress is printed by the main process only
+    evaluator.verbose = False
+    evaluator._n_users_evaluated = 0
+
+    results_dict = copy.deepcopy(_PARALLEL_EVALUATION_CONTEXT["empty_results_dict"])
+    results_dict = evaluator._run_evaluation_on_user_batches(recommender_object, users_shard, results_dict, block_size = block_size)
+
+    return results_dict, evaluator._n_users_evaluated
+
+
+
+def _merge_metrics_dict(results_dict, other_results_dict):
+    """
+    Merges the partial metrics computed on a different set of users into results_dict
+    :param results_dict:
+    :param other_results_dict:
+    :return:
+    """
+
+    for cutoff in results_dict.keys():
+        results_current_cutoff = results_dict[cutoff]
+
+        for key, value in results_current_cutoff.items():
+            if isinstance(value, _Metrics_Object):
+                value.merge_with_other(other_results_dict[cutoff][key])
+            else:
+                results_current_cutoff[key] = value + other_results_dict[cutoff][key]
+
+    return results_dict
+
+
+
+class EvaluatorHoldoutParallel(EvaluatorHoldout):
+    """EvaluatorHoldoutParallel
+
+    Evaluates disjoint shards of users in a pool of processes and merges their metrics.
+    Requires the fork start method, otherwise the users are evaluated sequentially.
+    Daemonic processes, e.g., Dask workers, cannot have children and evaluate the users sequentially as well.
+    """
+
+    EVALUATOR_NAME = "EvaluatorHoldoutParallel"
+
+    def __init__(self, URM_test_list, cutoff_list, min_ratings_per_user=1, exclude_seen=True,
+                 diversity_object = None,
+                 ignore_items = None,
+                 ignore_users = None,
+                 verbose=True,
+                 item_chunk_size = None,
+                 n_workers = None,
+                 n_shards_per_worker = 4):
+        """
+        :param n_workers:               number of processes, if None all the available cores are used
+        :param n_shards_per_worker:     the users are split in n_workers*n_shards_per_worker shards to balance the load
+        """
+
+        super(EvaluatorHoldoutParallel, self).__init__(URM_test_list, cutoff_list,
+                                                       diversity_object = diversity_object,
+                                                       min_ratings_per_user =min_ratings_per_user, exclude_seen=exclude_seen,
+                                                       ignore_items = ignore_items, ignore_users = ignore_users,
+                                                       verbose = verbose,
+                                                       item_chunk_size = item_chunk_size)
+
+        self.n_workers = multiprocessing.cpu_count() if n_workers is None else n_workers
+        self.n_shards_per_worker = n_shards_per_worker
+
+
+
+    def _run_evaluation_on_selected_users(self, recommender_object, users_to_evaluate, block_size = None):
+
+        n_workers = min(self.n_workers, len(users_to_evaluate))
+
+        # Daemonic processes, e.g., Dask workers, are not allowed to have children
+        if n_workers <= 1 or multiprocessing.current_process().daemon or "fork" not in multiprocessing.get_all_start_methods():
+            return super(EvaluatorHoldoutParallel, self)._run_evaluation_on_selected_users(recommender_object, users_to_evaluate, block_size = block_size)
+
+        results_dict = _create_empty_metrics_dict(self.cutoff_list,
+                                                  self.n_items, self.n_users,
+                                                  recommender_object.get_URM_train(),
+                                                  self.URM_test,
+                                                  self.ignore_items_ID,
+                                                  self.ignore_users_ID,
+                                                  self.diversity_object)
+
+        if self.ignore_items_flag:
+            recommender_object.set_items_to_ignore(self.ignore_items_ID)
+
+        users_shard_list = np.array_split(np.array(users_to_evaluate), n_workers * self.n_shards_per_worker)
+        users_shard_list = [users_shard for users_shard in users_shard_list if len(users_shard) > 0]
+
+        _PARALLEL_EVALUATION_CONTEXT.update({
+            "evaluator": self,
+            "recommender_object": recommender_object,
+            "empty_results_dict": results_dict,
+            "block_size": block_size,
+        })
+
+        try:
+            with multiprocessing.get_context("fork").Pool(processes=n_workers) as pool:
+
+                # The empty metrics have been copied in the workers when the pool was created, the merged results can use the same object
+                for shard_results_dict, shard_n_users_evaluated in pool.imap_unordered(_run_evaluation_on_users_shard, users_shard_list):
+
+                    results_dict = _merge_metrics_dict(results_dict, shard_results_dict)
+                    self._n_users_evaluated += shard_n_users_evaluated
+                    self._print_progress()
+
+        finally:
+            _PARALLEL_EVALUATION_CONTEXT.clear()
+
+        return results_dict
+
+
+
+
 class EvaluatorNegativeItemSample(Evaluator):
     """EvaluatorNegativeItemSample"""
 
@@ -550,9 +772,112 @@ class EvaluatorNegativeItemSample(Evaluator):
 
 
 
-    def _run_evaluation_on_selected_users(self, recommender_object, users_to_evaluate, block_size = None):
+    def _recommend_items_to_rank(self, recommender_object, test_user_batch_array):
+        """
+        Ranks the items_to_rank of a batch of users. The scores of the union of the items to rank of the batch are
+        computed at once, then the (user, item) couples are ranked with a segmented sort by user and decreasing score.
+        Recommenders that override recommend are ranked through it, as they are in any other evaluator.
+        :param recommender_object:
+        :param test_user_batch_array:
+        :return recommended_items_batch_list:   list of recommendation lists of at most max_cutoff items
+        :return scores_batch:                   sparse (len(test_user_batch_array), n_items) matrix with the scores of the recommended items
+        """
+
+        if type(recommender_object).recommend is not BaseRecommender.recommend:
+            return self._recommend_items_to_rank_with_recommend(recommender_object, test_user_batch_array)
+
+        URM_items_to_rank_batch = self.URM_items_to_rank[test_user_batch_array]
+        URM_items_to_rank_batch.sort_indices()
 
+        candidate_rows = np.repeat(np.arange(len(test_user_batch_array)), np.ediff1d(URM_items_to_rank_batch.indptr))
+        candidate_items = URM_items_to_rank_batch.indices
+
+        items_to_compute = np.unique(candidate_items)
+
+        item_id_array_list, item_scores_list = [], []
+
+        for item_id_array, item_scores in recommender_object._compute_item_score_chunks(test_user_batch_array,
+                                                                                        items_to_compute = items_to_compute,
+                                                                                        item_chunk_size = max(len(items_to_compute), 1)):
+            item_id_array_list.append(item_id_array)
+            item_scores_list.append(item_scores)
+
+        if len(item_id_array_list) > 0:
+            item_id_array = np.concatenate(item_id_array_list)
+            item_scores = np.hstack(item_scores_list)
+        else:
+            item_id_array = np.array([], dtype=np.int64)
+            item_scores = np.zeros((len(test_user_batch_array), 0), dtype=np.float32)
 
+        # Gather the score of each (user, candidate item) couple
+        item_id_array_sorting = np.argsort(item_id_array)
+        candidate_columns = item_id_array_sorting[np.searchsorted(item_id_array, candidate_items, sorter=item_id_array_sorting)]
+        candidate_scores = np.asarray(item_scores[candidate_rows, candidate_columns], dtype=np.float64)
+
+        if self.exclude_seen:
+            URM_train_batch = sps.csr_matrix(recommender_object.URM_train[test_user_batch_array])
+            URM_train_batch.sort_indices()
+            seen_keys = np.repeat(np.arange(len(test_user_batch_array), dtype=np.int64), np.ediff1d(URM_train_batch.indptr)) * self.n_items + URM_train_batch.indices
+            candidate_keys = candidate_rows.astype(np.int64) * self.n_items + candidate_items
+            candidate_scores[np.isin(candidate_keys, seen_keys, assume_unique=True)] = -np.inf
+
+        if self.ignore_items_flag:
+            candidate_scores[np.isin(candidate_items, recommender_object.items_to_ignore_ID)] = -np.inf
+
+        # Segmented sort, by user and then by decreasing score
+        candidate_sorting = np.lexsort((-candidate_scores, candidate_rows))
+        candidate_rows = candidate_rows[candidate_sorting]
+        candidate_items = candidate_items[candidate_sorting]
+        candidate_scores = candidate_scores[candidate_sorting]
+
+        # Keep the first cutoff candidates of each user, removing the ones with -inf score as recommend does
+        cutoff = min(self.max_cutoff, self.n_items - 1)
+        candidate_position = np.arange(len(candidate_rows)) - URM_items_to_rank_batch.indptr[candidate_rows]
+        candidate_mask = np.logical_and(candidate_position < cutoff, np.logical_not(np.isinf(candidate_scores)))
+
+        recommended_items = candidate_items[candidate_mask]
+        recommended_items_batch_list = np.split(recommended_items, np.cumsum(np.bincount(candidate_rows[candidate_mask], minlength=len(test_user_batch_array)))[:-1])
+        recommended_items_batch_list = [user_recommended_items.tolist() for user_recommended_items in recommended_items_batch_list]
+
+        scores_batch = sps.csr_matrix((candidate_scores[candidate_mask], (candidate_rows[candidate_mask], recommended_items)),
+                                      shape=(len(test_user_batch_array), self.n_items))
+
+        return recommended_items_batch_list, scores_batch
+
+
+
+    def _recommend_items_to_rank_with_recommend(self, recommender_object, test_user_batch_array):
+        """
+        Ranks the items_to_rank of each user of the batch with its own call to recommend, for the recommenders
+        that override it and therefore cannot be ranked from the item scores
+        :param recommender_object:
+        :param test_user_batch_array:
+        :return recommended_items_batch_list:
+        :return scores_batch:
+        """
+
+        recommended_items_batch_list = []
+        scores_batch_list = []
+
+        for test_user in test_user_batch_array:
+
+            recommended_items, all_items_predicted_ratings = recommender_object.recommend(np.atleast_1d(test_user),
+                                                                                          remove_seen_flag=self.exclude_seen,
+                                                                                          cutoff = self.max_cutoff,
+                                                                                          remove_top_pop_flag=False,
+                                                                                          items_to_compute = self._get_user_specific_items_to_compute(test_user),
+                                                                                          remove_custom_items_flag=self.ignore_items_flag,
+                                                                                          return_scores = True
+                                                                                          )
+
+            recommended_items_batch_list.append(recommended_items[0])
+            scores_batch_list.append(sps.csr_matrix(all_items_predicted_ratings))
+
+        return recommended_items_batch_list, sps.vstack(scores_batch_list, format="csr")
+
+
+
+    def _run_evaluation_on_selected_users(self, recommender_object, users_to_evaluate, block_size = None):
 
         results_dict = _create_empty_metrics_dict(self.cutoff_list,
                                                   self.n_items, self.n_users,
@@ -568,23 +893,28 @@ class EvaluatorNegativeItemSample(Evaluator):
 
 
 
-        for test_user in users_to_evaluate:
+        if block_size is None:
+            # Reduce block size if estimated memory requirement exceeds 1 GB
+            block_size = min([
+                1000,
+                int(0.25 * 1e9 * 8 / 64 / self.n_items),
+                len(users_to_evaluate),
+            ])
 
-            items_to_compute = self._get_user_specific_items_to_compute(test_user)
+        user_batch_start = 0
 
-            recommended_items, all_items_predicted_ratings = recommender_object.recommend(np.atleast_1d(test_user),
-                                                              remove_seen_flag=self.exclude_seen,
-                                                              cutoff = self.max_cutoff,
-                                                              remove_top_pop_flag=False,
-                                                              items_to_compute = items_to_compute,
-                                                              remove_custom_items_flag=self.ignore_items_flag,
-                                                              return_scores = True
-                                                             )
-
-
-            results_dict = self._compute_metrics_on_recommendation_list(test_user_batch_array = [test_user],
-                                                         recommended_items_batch_list = recommended_items,
-                                                         scores_batch = all_items_predicted_ratings,
+        while user_batch_start < len(users_to_evaluate):
+
+            user_batch_end = min(user_batch_start + block_size, len(users_to_evaluate))
+
+            test_user_batch_array = np.array(users_to_evaluate[user_batch_start:user_batch_end])
+            user_batch_start = user_batch_end
+
+            recommended_items_batch_list, scores_batch = self._recommend_items_to_rank(recommender_object, test_user_batch_array)
+
+            results_dict = self._compute_metrics_on_recommendation_list(test_user_batch_array = test_user_batch_array,
+                                                         recommended_items_batch_list = recommended_items_batch_list,
+                                                         scores_batch = scores_batch,
                                                          results_dict = results_dict)
 
 
@@ -49,11 +49,15 @@ class MAP(_Metrics_Object):
         self.cumulative_AP += average_precision(is_relevant)
         self.n_users += 1
 
+    def add_recommendations_batch(self, is_relevant, n_recommended, n_pos_items):
+        self.cumulative_AP += np.sum(average_precision_batch(is_relevant, n_recommended))
+        self.n_users += is_relevant.shape[0]
+
     def get_metric_value(self):
         return self.cumulative_AP/self.n_users
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is MAP, "MAP: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, MAP), "MAP: attempting to merge with a metric object of different type"
 
         self.cumulative_AP += other_metric_object.cumulative_AP
         self.n_users += other_metric_object.n_users
@@ -73,6 +77,26 @@ def average_precision(is_relevant):
 
 
 
+def _precision_at_k_batch(is_relevant):
+    return is_relevant * np.cumsum(is_relevant, axis=1, dtype=np.float64) / (1 + np.arange(is_relevant.shape[1]))
+
+
+def average_precision_batch(is_relevant, n_recommended):
+    """
+    Vectorized average_precision over a (n_users, cutoff) boolean matrix whose rows are padded with False
+    after the n_recommended[user] valid positions
+    """
+
+    sum_p_at_k = np.sum(_precision_at_k_batch(is_relevant), axis=1)
+
+    a_p = np.zeros(is_relevant.shape[0], dtype=np.float64)
+    np.divide(sum_p_at_k, n_recommended, out=a_p, where=n_recommended > 0)
+
+    assert np.all(0 <= a_p) and np.all(a_p <= 1), a_p
+    return a_p
+
+
+
 
 class MAP_MIN_DEN(_Metrics_Object):
     """
@@ -90,11 +114,15 @@ class MAP_MIN_DEN(_Metrics_Object):
         self.cumulative_AP += average_precision_min_denominator(is_relevant, pos_items)
         self.n_users += 1
 
+    def add_recommendations_batch(self, is_relevant, n_recommended, n_pos_items):
+        self.cumulative_AP += np.sum(average_precision_min_denominator_batch(is_relevant, n_recommended, n_pos_items))
+        self.n_users += is_relevant.shape[0]
+
     def get_metric_value(self):
         return self.cumulative_AP/self.n_users
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is MAP_MIN_DEN, "MAP_MIN_DEN: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, MAP_MIN_DEN), "MAP_MIN_DEN: attempting to merge with a metric object of different type"
 
         self.cumulative_AP += other_metric_object.cumulative_AP
         self.n_users += other_metric_object.n_users
@@ -113,6 +141,17 @@ def average_precision_min_denominator(is_relevant, pos_items):
     return a_p
 
 
+def average_precision_min_denominator_batch(is_relevant, n_recommended, n_pos_items):
+
+    sum_p_at_k = np.sum(_precision_at_k_batch(is_relevant), axis=1)
+
+    a_p = np.zeros(is_relevant.shape[0], dtype=np.float64)
+    np.divide(sum_p_at_k, np.minimum(n_pos_items, n_recommended), out=a_p, where=n_recommended > 0)
+
+    assert np.all(0 <= a_p) and np.all(a_p <= 1), a_p
+    return a_p
+
+
 
 class MRR(_Metrics_Object):
     """
@@ -130,11 +169,15 @@ class MRR(_Metrics_Object):
         self.cumulative_RR += rr(is_relevant)
         self.n_users += 1
 
+    def add_recommendations_batch(self, is_relevant):
+        self.cumulative_RR += np.sum(rr_batch(is_relevant))
+        self.n_users += is_relevant.shape[0]
+
     def get_metric_value(self):
         return self.cumulative_RR/self.n_users
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is MRR, "MRR: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, MRR), "MRR: attempting to merge with a metric object of different type"
 
         self.cumulative_RR += other_metric_object.cumulative_RR
         self.n_users += other_metric_object.n_users
@@ -156,6 +199,19 @@ def rr(is_relevant):
         return 0.0
 
 
+def rr_batch(is_relevant):
+    """
+    Reciprocal rank of the FIRST relevant item in each row of a (n_users, cutoff) boolean matrix (0 if none)
+    :param is_relevant: boolean matrix
+    :return:
+    """
+
+    has_hit = np.any(is_relevant, axis=1)
+    first_hit_rank = np.argmax(is_relevant, axis=1) + 1
+
+    return np.where(has_hit, 1. / first_hit_rank, 0.0)
+
+
 
 
 
@@ -180,6 +236,10 @@ class HIT_RATE(_Metrics_Object):
         self.cumulative_HR += np.any(is_relevant)
         self.n_users += 1
 
+    def add_recommendations_batch(self, is_relevant):
+        self.cumulative_HR += np.sum(np.any(is_relevant, axis=1))
+        self.n_users += is_relevant.shape[0]
+
     def get_metric_value(self):
         if self.n_users == 0:
             return 0.0
@@ -187,7 +247,7 @@ class HIT_RATE(_Metrics_Object):
         return self.cumulative_HR/self.n_users
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is HIT_RATE, "HR: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, HIT_RATE), "HR: attempting to merge with a metric object of different type"
 
         self.cumulative_HR += other_metric_object.cumulative_HR
         self.n_users += other_metric_object.n_users
@@ -209,6 +269,15 @@ def arhr_all_hits(is_relevant):
     return arhr_score
 
 
+def arhr_all_hits_batch(is_relevant):
+
+    p_reciprocal = 1/np.arange(1,is_relevant.shape[1]+1, 1.0, dtype=np.float64)
+    arhr_score = is_relevant.dot(p_reciprocal)
+
+    assert not np.any(np.isnan(arhr_score)), "ARHR_all_hits is NaN"
+    return arhr_score
+
+
 def precision(is_relevant):
 
     if len(is_relevant) == 0:
@@ -220,6 +289,15 @@ def precision(is_relevant):
     return precision_score
 
 
+def precision_batch(is_relevant, n_recommended):
+
+    precision_score = np.zeros(is_relevant.shape[0], dtype=np.float64)
+    np.divide(np.sum(is_relevant, axis=1, dtype=np.float64), n_recommended, out=precision_score, where=n_recommended > 0)
+
+    assert np.all(0 <= precision_score) and np.all(precision_score <= 1), precision_score
+    return precision_score
+
+
 def precision_recall_min_denominator(is_relevant, n_test_items):
 
     if len(is_relevant) == 0:
@@ -231,6 +309,16 @@ def precision_recall_min_denominator(is_relevant, n_test_items):
     return precision_score
 
 
+def precision_recall_min_denominator_batch(is_relevant, n_recommended, n_test_items):
+
+    precision_score = np.zeros(is_relevant.shape[0], dtype=np.float64)
+    np.divide(np.sum(is_relevant, axis=1, dtype=np.float64), np.minimum(n_test_items, n_recommended),
+              out=precision_score, where=n_recommended > 0)
+
+    assert np.all(0 <= precision_score) and np.all(precision_score <= 1), precision_score
+    return precision_score
+
+
 
 def recall(is_relevant, pos_items):
 
@@ -240,6 +328,14 @@ def recall(is_relevant, pos_items):
     return recall_score
 
 
+def recall_batch(is_relevant, n_pos_items):
+
+    recall_score = np.sum(is_relevant, axis=1, dtype=np.float64) / n_pos_items
+
+    assert np.all(0 <= recall_score) and np.all(recall_score <= 1), recall_score
+    return recall_score
+
+
 
 
 def ndcg(ranked_list, pos_items, relevance=None, at=None):
@@ -277,6 +373,30 @@ def dcg(scores):
                   dtype=np.float64)
 
 
+def ndcg_batch(rank_scores, ideal_scores):
+    """
+    Vectorized ndcg over a batch of users
+    :param rank_scores:     (n_users, cutoff) matrix with the relevance of the item in each position of the recommendation list,
+                                0.0 for non-relevant items and for the padding after the end of the list
+    :param ideal_scores:    (n_users, cutoff) matrix with the test relevances of each user sorted in descending order,
+                                padded with 0.0
+    :return:
+    """
+
+    rank_dcg = dcg_batch(rank_scores)
+    ideal_dcg = dcg_batch(ideal_scores)
+
+    ndcg_ = np.zeros(rank_scores.shape[0], dtype=np.float64)
+    np.divide(rank_dcg, ideal_dcg, out=ndcg_, where=np.logical_and(rank_dcg != 0.0, ideal_dcg != 0.0))
+
+    return ndcg_
+
+
+def dcg_batch(scores):
+    return np.sum(np.divide(np.power(2, scores) - 1, np.log2(np.arange(scores.shape[1], dtype=np.float64) + 2)),
+                  axis=1, dtype=np.float64)
+
+
 
 ####################################################################################################################
 ###############                 ERROR METRICS
@@ -353,6 +473,13 @@ class _Global_Item_Distribution_Counter(_Metrics_Object):
         if len(recommended_items_ids) > 0:
             self.recommended_counter[recommended_items_ids] += 1
 
+    def add_recommendations_batch(self, recommended_items, recommended_mask):
+        """
+        :param recommended_items:   (n_users, cutoff) matrix of recommended item ids
+        :param recommended_mask:    (n_users, cutoff) boolean matrix, False for the padding after the end of each list
+        """
+        self.recommended_counter += np.bincount(recommended_items[recommended_mask], minlength=len(self.recommended_counter))
+
     def _get_recommended_items_counter(self):
 
         recommended_counter = self.recommended_counter.copy()
@@ -406,6 +533,9 @@ class Coverage_Item_HIT(_Global_Item_Distribution_Counter):
     def add_recommendations(self, recommended_items_ids, is_relevant):
         super(Coverage_Item_HIT, self).add_recommendations(np.array(recommended_items_ids)[is_relevant])
 
+    def add_recommendations_batch(self, recommended_items, is_relevant):
+        super(Coverage_Item_HIT, self).add_recommendations_batch(recommended_items, is_relevant)
+
     def get_metric_value(self):
 
         recommended_mask = self._get_recommended_items_counter() > 0
@@ -431,6 +561,13 @@ class Items_In_GT(_Metrics_Object):
     def add_recommendations(self, recommended_items_ids):
         pass
 
+    def add_recommendations_batch(self, recommended_items, recommended_mask):
+        pass
+
+    def merge_with_other(self, other_metric_object):
+        # The ground truth does not depend on the recommendations, nothing to merge
+        assert isinstance(other_metric_object, Items_In_GT), "Items_In_GT: attempting to merge with a metric object of different type"
+
     def get_metric_value(self):
 
         in_GT_mask = self.interaction_in_GT_counter > 0
@@ -456,6 +593,13 @@ class Users_In_GT(_Metrics_Object):
     def add_recommendations(self, recommended_items_ids):
         pass
 
+    def add_recommendations_batch(self, recommended_items, recommended_mask):
+        pass
+
+    def merge_with_other(self, other_metric_object):
+        # The ground truth does not depend on the recommendations, nothing to merge
+        assert isinstance(other_metric_object, Users_In_GT), "Users_In_GT: attempting to merge with a metric object of different type"
+
     def get_metric_value(self):
 
         in_GT_mask = self.interaction_in_GT_counter > 0
@@ -486,11 +630,14 @@ class Coverage_User(_Metrics_Object):
     def add_recommendations(self, recommended_items_ids, user_id):
         self.users_mask[user_id] = len(recommended_items_ids)>0
 
+    def add_recommendations_batch(self, recommended_mask, user_id_array):
+        self.users_mask[user_id_array] = np.any(recommended_mask, axis=1)
+
     def get_metric_value(self):
         return self.users_mask.sum()/(len(self.users_mask)-self.n_ignore_users)
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is Coverage_User, "Coverage_User: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, Coverage_User), "Coverage_User: attempting to merge with a metric object of different type"
 
         self.users_mask = np.logical_or(self.users_mask, other_metric_object.users_mask)
 
@@ -515,11 +662,14 @@ class Coverage_User_HIT(_Metrics_Object):
     def add_recommendations(self, is_relevant, user_id):
         self.users_mask[user_id] = np.any(is_relevant)
 
+    def add_recommendations_batch(self, is_relevant, user_id_array):
+        self.users_mask[user_id_array] = np.any(is_relevant, axis=1)
+
     def get_metric_value(self):
         return self.users_mask.sum()/(len(self.users_mask)-self.n_ignore_users)
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is Coverage_User, "Coverage_User_HIT: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, Coverage_User_HIT), "Coverage_User_HIT: attempting to merge with a metric object of different type"
 
         self.users_mask = np.logical_or(self.users_mask, other_metric_object.users_mask)
 
@@ -783,6 +933,18 @@ class Novelty(_Metrics_Object):
             self.novelty += np.sum(-np.log2(probability)/self.n_items)
 
 
+    def add_recommendations_batch(self, recommended_items, recommended_mask):
+
+        self.n_evaluated_users += recommended_items.shape[0]
+
+        recommended_items_popularity = self.item_popularity[recommended_items[recommended_mask]]
+
+        probability = recommended_items_popularity/self.n_interactions
+        probability = probability[probability!=0]
+
+        self.novelty += np.sum(-np.log2(probability)/self.n_items)
+
+
     def get_metric_value(self):
 
         if self.n_evaluated_users == 0:
@@ -791,7 +953,7 @@ class Novelty(_Metrics_Object):
         return self.novelty/self.n_evaluated_users
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is Novelty, "Novelty: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, Novelty), "Novelty: attempting to merge with a metric object of different type"
 
         self.novelty = self.novelty + other_metric_object.novelty
         self.n_evaluated_users = self.n_evaluated_users + other_metric_object.n_evaluated_users
@@ -823,6 +985,9 @@ class Ratio_Novelty(_Metrics_Object):
     def add_recommendations(self, recommended_items_ids):
         self.novelty_object_recommendations.add_recommendations(recommended_items_ids)
 
+    def add_recommendations_batch(self, recommended_items, recommended_mask):
+        self.novelty_object_recommendations.add_recommendations_batch(recommended_items, recommended_mask)
+
 
     def get_metric_value(self):
 
@@ -834,7 +999,7 @@ class Ratio_Novelty(_Metrics_Object):
 
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is Ratio_Novelty, "Ratio_Novelty: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, Ratio_Novelty), "Ratio_Novelty: attempting to merge with a metric object of different type"
 
         self.novelty_object_recommendations.merge_with_other(other_metric_object.novelty_object_recommendations)
 
@@ -872,6 +1037,16 @@ class AveragePopularity(_Metrics_Object):
             self.cumulative_popularity += np.sum(recommended_items_popularity)/len(recommended_items_ids)
 
 
+    def add_recommendations_batch(self, recommended_items, recommended_mask):
+
+        self.n_evaluated_users += recommended_items.shape[0]
+
+        n_recommended = np.sum(recommended_mask, axis=1)
+        recommended_items_popularity = np.sum(self.item_popularity_normalized[recommended_items] * recommended_mask, axis=1)
+
+        self.cumulative_popularity += np.sum(recommended_items_popularity[n_recommended > 0]/n_recommended[n_recommended > 0])
+
+
     def get_metric_value(self):
 
         if self.n_evaluated_users == 0:
@@ -880,7 +1055,7 @@ class AveragePopularity(_Metrics_Object):
         return self.cumulative_popularity/self.n_evaluated_users
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is Novelty, "AveragePopularity: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, AveragePopularity), "AveragePopularity: attempting to merge with a metric object of different type"
 
         self.cumulative_popularity = self.cumulative_popularity + other_metric_object.cumulative_popularity
         self.n_evaluated_users = self.n_evaluated_users + other_metric_object.n_evaluated_users
@@ -911,6 +1086,9 @@ class Ratio_AveragePopularity(_Metrics_Object):
     def add_recommendations(self, recommended_items_ids):
         self.average_popularity_recommendations.add_recommendations(recommended_items_ids)
 
+    def add_recommendations_batch(self, recommended_items, recommended_mask):
+        self.average_popularity_recommendations.add_recommendations_batch(recommended_items, recommended_mask)
+
 
     def get_metric_value(self):
 
@@ -922,9 +1100,9 @@ class Ratio_AveragePopularity(_Metrics_Object):
 
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is Ratio_AveragePopularity, "Ratio_AveragePopularity: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, Ratio_AveragePopularity), "Ratio_AveragePopularity: attempting to merge with a metric object of different type"
 
-        self.average_popularity_recommendations.merge_with_other(other_metric_object.novelty_object_recommendations)
+        self.average_popularity_recommendations.merge_with_other(other_metric_object.average_popularity_recommendations)
 
 
 
@@ -979,7 +1157,7 @@ class Diversity_similarity(_Metrics_Object):
         return self.diversity/self.n_evaluated_users
 
     def merge_with_other(self, other_metric_object):
-        assert other_metric_object is Diversity_similarity, "Diversity: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, Diversity_similarity), "Diversity: attempting to merge with a metric object of different type"
 
         self.diversity = self.diversity + other_metric_object.diversity
         self.n_evaluated_users = self.n_evaluated_users + other_metric_object.n_evaluated_users
@@ -1072,6 +1250,13 @@ class Diversity_MeanInterList(_Metrics_Object):
             self.recommended_counter[recommended_items_ids] += 1
 
 
+    def add_recommendations_batch(self, recommended_items, recommended_mask):
+
+        assert recommended_items.shape[1] <= self.cutoff, "Diversity_MeanInterList: recommended list is contains more elements than cutoff"
+
+        self.n_evaluated_users += recommended_items.shape[0]
+        self.recommended_counter += np.bincount(recommended_items[recommended_mask], minlength=len(self.recommended_counter))
+
 
 
     def get_metric_value(self):
@@ -1102,7 +1287,7 @@ class Diversity_MeanInterList(_Metrics_Object):
 
     def merge_with_other(self, other_metric_object):
 
-        assert other_metric_object is Diversity_MeanInterList, "Diversity_MeanInterList: attempting to merge with a metric object of different type"
+        assert isinstance(other_metric_object, Diversity_MeanInterList), "Diversity_MeanInterList: attempting to merge with a metric object of different type"
 
         assert np.all(self.recommended_counter >= 0.0), "Diversity_MeanInterList: self.recommended_counter contains negative counts"
         assert np.all(other_metric_object.recommended_counter >= 0.0), "Diversity_MeanInterList: other.recommended_counter contains negative counts"
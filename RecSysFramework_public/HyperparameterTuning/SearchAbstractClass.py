@@ -359,6 +359,38 @@ class SearchAbstractClass(object):
         return recommender_instance, train_time
 
 
+    def _fit_and_evaluate_on_validation(self, current_fit_hyperparameters):
+        """
+        Fit a new model with the given hyperparameter configuration and evaluate it on the validation set
+        :param current_fit_hyperparameters:
+        :return: recommender_instance, result_df, train_time, evaluation_time
+        """
+
+        recommender_instance, train_time = self._fit_model(current_fit_hyperparameters)
+        start_time = time.time()
+
+        # Evaluate recommender and get results for the first cutoff
+        result_df, _ = self.evaluator_validation.evaluateRecommender(recommender_instance)
+
+        evaluation_time = time.time() - start_time
+
+        return recommender_instance, result_df, train_time, evaluation_time
+
+
+    def _evaluate_recommender_on_test(self, recommender_instance):
+        """
+        Evaluate the model on the test set
+        :param recommender_instance:
+        :return: result_df_test, evaluation_test_time
+        """
+
+        start_time = time.time()
+        result_df_test, _ = self.evaluator_test.evaluateRecommender(recommender_instance)
+        evaluation_test_time = time.time() - start_time
+
+        return result_df_test, evaluation_test_time
+
+
     def _evaluate_on_validation(self, current_fit_hyperparameters, was_already_evaluated_flag, was_already_evaluated_index):
         """
         Fit and evaluate model with the given hyperparameter configuration on the validation set, or
@@ -378,13 +410,7 @@ class SearchAbstractClass(object):
             for key in current_fit_hyperparameters.keys():
                 self.metadata_dict["hyperparameters_df"].loc[self.model_counter,key] = current_fit_hyperparameters[key]
 
-            recommender_instance, train_time = self._fit_model(current_fit_hyperparameters)
-            start_time = time.time()
-
-            # Evaluate recommender and get results for the first cutoff
-            result_df, _ = self.evaluator_validation.evaluateRecommender(recommender_instance)
-
-            evaluation_time = time.time() - start_time
+            recommender_instance, result_df, train_time, evaluation_time = self._fit_and_evaluate_on_validation(current_fit_hyperparameters)
 
             # If the recommender uses Earlystopping, get the selected number of epochs instead of the maximum
             if isinstance(recommender_instance, Incremental_Training_Early_Stopping):
@@ -429,9 +455,7 @@ class SearchAbstractClass(object):
             evaluation_test_time = self.metadata_dict["time_df"].loc[was_already_evaluated_index, "test"]
 
         else:
-            start_time = time.time()
-            result_df_test, _ = self.evaluator_test.evaluateRecommender(recommender_instance)
-            evaluation_test_time = time.time() - start_time
+            result_df_test, evaluation_test_time = self._evaluate_recommender_on_test(recommender_instance)
 
 
         result_string = get_result_string_df(result_df_test)
@@ -6,14 +6,18 @@ Created on 14/12/18
 @author: Emanuele Chioso, Anonymous
 """
 
-from skopt import gp_minimize
+from skopt import gp_minimize, Optimizer
+from skopt.utils import cook_estimator, normalize_dimensions
+from sklearn.utils import check_random_state
 import pandas as pd
 import numpy as np
-import time, os
+import time, os, shutil, tempfile, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from skopt.space import Real, Integer, Categorical
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 
 from HyperparameterTuning.SearchAbstractClass import SearchAbstractClass
+from Recommenders.Incremental_Training_Early_Stopping import Incremental_Training_Early_Stopping
 import traceback
 
 def _extend_dataframe(initial_dataframe, new_rows):
@@ -36,6 +40,72 @@ def _extend_dataframe(initial_dataframe, new_rows):
     return extended_dataframe
 
 
+# Search object shared with the worker processes created via fork, so that the recommender data and evaluators
+# do not have to be pickled for every case
+_PARALLEL_SEARCH_CONTEXT = {}
+
+
+class _ParallelCaseRecommender(Incremental_Training_Early_Stopping):
+    """
+    Stands for a recommender fitted and evaluated in a worker process. It provides the results computed by the worker
+    and copies the model the worker saved in a temporary folder when saving it
+    """
+
+    def __init__(self, result_df, train_time, evaluation_time, result_df_test, evaluation_test_time,
+                 early_stopping_epochs_dict, model_folder_path):
+        super(_ParallelCaseRecommender, self).__init__()
+
+        self.result_df = result_df
+        self.train_time = train_time
+        self.evaluation_time = evaluation_time
+        self.result_df_test = result_df_test
+        self.evaluation_test_time = evaluation_test_time
+        self.early_stopping_epochs_dict = early_stopping_epochs_dict
+        self.model_folder_path = model_folder_path
+
+    def get_early_stopping_final_epochs_dict(self):
+        return self.early_stopping_epochs_dict
+
+    def save_model(self, folder_path, file_name = None):
+
+        assert self.model_folder_path is not None, "_ParallelCaseRecommender: the model was not saved by the worker"
+
+        # The worker saved all the model files with the prefix "model"
+        for model_file_name in os.listdir(self.model_folder_path):
+            shutil.copyfile(os.path.join(self.model_folder_path, model_file_name),
+                            folder_path + file_name + model_file_name[len("model"):])
+
+
+def _fit_and_evaluate_case(current_fit_hyperparameters, model_folder_path):
+    """
+    Fits and evaluates a configuration in a worker process, the evaluation on the test data is computed when it may
+    be needed, since whether the configuration is the best one is only known when its result is merged
+    :return: the results and times wrapped in a _ParallelCaseRecommender
+    """
+
+    search = _PARALLEL_SEARCH_CONTEXT["search"]
+
+    recommender_instance, result_df, train_time, evaluation_time = super(SearchBayesianSkopt, search)._fit_and_evaluate_on_validation(current_fit_hyperparameters)
+
+    result_df_test, evaluation_test_time = None, None
+
+    if search.evaluate_on_test in ["all", "best"]:
+        result_df_test, evaluation_test_time = super(SearchBayesianSkopt, search)._evaluate_recommender_on_test(recommender_instance)
+
+    early_stopping_epochs_dict = {}
+    if isinstance(recommender_instance, Incremental_Training_Early_Stopping):
+        early_stopping_epochs_dict = recommender_instance.get_early_stopping_final_epochs_dict()
+
+    if search.save_model in ["all", "best"]:
+        recommender_instance.save_model(model_folder_path, file_name = "model")
+    else:
+        model_folder_path = None
+
+    return _ParallelCaseRecommender(result_df, train_time, evaluation_time, result_df_test, evaluation_test_time,
+                                    early_stopping_epochs_dict, model_folder_path)
+
+
+
 class TimeoutError(Exception):
     def __init__(self, max_total_time_seconds, current_total_time):
         max_total_time_seconds_value, max_total_time_seconds_unit = seconds_to_biggest_unit(max_total_time_seconds)
@@ -101,6 +171,8 @@ class SearchBayesianSkopt(SearchAbstractClass):
         self.noise = noise
         self.x0 = x0
         self.y0 = y0
+        # Strategy used to propose several points at once when the cases are evaluated in parallel
+        self.liar_strategy = "cl_min"
 
 
 
@@ -258,6 +330,7 @@ class SearchBayesianSkopt(SearchAbstractClass):
                evaluate_on_test = "best",
                max_total_time = None,
                terminate_on_memory_error = True,
+               n_parallel_cases = 1,
                ):
         """
 
@@ -275,6 +348,10 @@ class SearchBayesianSkopt(SearchAbstractClass):
                                     "last"  save only last, if present
         :param save_metadata:
         :param recommender_input_args_last_test:
+        :param n_parallel_cases:    number of configurations proposed at each round with the constant liar strategy,
+                                    fitted and evaluated in parallel worker processes. If 1 the cases are explored
+                                    sequentially with gp_minimize, as they are in daemonic processes, e.g., Dask workers,
+                                    or if the fork start method is not available
         :return:
         """
 
@@ -300,6 +377,13 @@ class SearchBayesianSkopt(SearchAbstractClass):
         self.n_calls = n_cases
         self.n_jobs = 1
         self.n_loaded_counter = 0
+        self.n_parallel_cases = n_parallel_cases
+        self._parallel_case_future = None
+
+        # Daemonic processes, e.g., Dask workers, are not allowed to have children
+        if self.n_parallel_cases > 1 and (multiprocessing.current_process().daemon or "fork" not in multiprocessing.get_all_start_methods()):
+            self._print("{}: Worker processes not available, the cases will be explored sequentially".format(self.ALGORITHM_NAME))
+            self.n_parallel_cases = 1
 
         self.max_total_time = max_total_time
 
@@ -333,7 +417,10 @@ class SearchBayesianSkopt(SearchAbstractClass):
                 self.n_loaded_counter = self.model_counter
 
 
-            if self.n_calls - self.model_counter > 0:
+            if self.n_calls - self.model_counter > 0 and self.n_parallel_cases > 1:
+                self._search_parallel_cases()
+
+            elif self.n_calls - self.model_counter > 0:
                 # When resuming an incomplete search the gp_minimize will continue to tell you "Evaluating function at random point" instead
                 # of "Searching for the next optimal point". This may be due to a bug in the print rather than the underlying process
                 # https://github.com/scikit-optimize/scikit-optimize/issues/949
@@ -396,14 +483,115 @@ class SearchBayesianSkopt(SearchAbstractClass):
 
 
 
-    def _objective_function_list_input(self, current_fit_hyperparameters_list_of_values):
+    def _search_parallel_cases(self):
+        """
+        Explores the remaining cases in rounds of n_parallel_cases configurations, proposed by the ask and tell interface
+        of the skopt Optimizer with the constant liar strategy and fitted in parallel by a pool of processes.
+        The results are merged in the order of the proposed configurations with _objective_function, so the metadata,
+        the resume and the check of already evaluated configurations behave as in the sequential search
+        :return:
         """
-        This function parses the hyperparameter list provided by the gp_minimize function into a dictionary that
-        can be used for the fitting of the model and provided to the objective function defined in the abstract class
 
-        This function also checks if the search should be interrupted if the time has expired or no valid config has been found
+        rng = check_random_state(self.random_state)
+        space = normalize_dimensions(self.hyperparams_values)
 
-        :param current_fit_hyperparameters_list_of_values:
+        n_initial_points = max(0, self.n_random_starts - self.model_counter)
+
+        optimizer = Optimizer(space,
+                              base_estimator = cook_estimator("GP", space = space,
+                                                              random_state = rng.randint(0, np.iinfo(np.int32).max),
+                                                              noise = self.noise),
+                              n_initial_points = n_initial_points + (len(self.x0) if self.x0 is not None else 0),
+                              initial_point_generator = "random",
+                              acq_func = self.acq_func,
+                              acq_optimizer = self.acq_optimizer,
+                              random_state = rng,
+                              acq_optimizer_kwargs = {"n_points": self.n_point,
+                                                      "n_restarts_optimizer": self.n_restarts_optimizer,
+                                                      "n_jobs": self.n_jobs},
+                              acq_func_kwargs = {"xi": self.xi, "kappa": self.kappa})
+
+        if self.x0 is not None:
+            optimizer.tell(self.x0, self.y0)
+
+        # Each worker saves its model in a subfolder, which is copied if the case has to be saved
+        parallel_cases_folder_path = tempfile.mkdtemp(prefix = self.output_file_name_root + "_parallel_cases_",
+                                                      dir = self.output_folder_path)
+
+        _PARALLEL_SEARCH_CONTEXT["search"] = self
+
+        try:
+            with ProcessPoolExecutor(max_workers = self.n_parallel_cases, mp_context = multiprocessing.get_context("fork")) as executor:
+
+                while self.model_counter < self.n_calls:
+
+                    self._check_total_time()
+
+                    n_cases_round = int(min(self.n_parallel_cases, self.n_calls - self.model_counter))
+                    hyperparameters_list_round = optimizer.ask(n_points = n_cases_round, strategy = self.liar_strategy)
+
+                    # Already evaluated configurations are not fitted again, they are loaded when merged.
+                    # The same holds for configurations proposed more than once in the round, which are fitted only
+                    # the first time and are found as already evaluated when the following ones are merged
+                    case_future_list = []
+                    hyperparameters_submitted_round = set()
+
+                    for case_index, current_fit_hyperparameters_list_of_values in enumerate(hyperparameters_list_round):
+                        current_fit_hyperparameters_dict = dict(zip(self.hyperparams_names, current_fit_hyperparameters_list_of_values))
+                        was_already_evaluated_flag, _ = self._was_already_evaluated_check(current_fit_hyperparameters_dict)
+
+                        was_already_submitted_flag = tuple(current_fit_hyperparameters_list_of_values) in hyperparameters_submitted_round
+                        hyperparameters_submitted_round.add(tuple(current_fit_hyperparameters_list_of_values))
+
+                        if was_already_evaluated_flag or was_already_submitted_flag:
+                            case_future_list.append(None)
+                        else:
+                            model_folder_path = os.path.join(parallel_cases_folder_path, "case_{}".format(self.model_counter + case_index), "")
+                            os.makedirs(model_folder_path)
+                            case_future_list.append(executor.submit(_fit_and_evaluate_case, current_fit_hyperparameters_dict, model_folder_path))
+
+                    result_list_round = []
+
+                    for current_fit_hyperparameters_list_of_values, case_future in zip(hyperparameters_list_round, case_future_list):
+                        self._parallel_case_future = case_future
+                        result_list_round.append(self._objective_function_list_input(current_fit_hyperparameters_list_of_values, check_total_time = False))
+                        self._parallel_case_future = None
+
+                    optimizer.tell(hyperparameters_list_round, result_list_round)
+
+                    shutil.rmtree(parallel_cases_folder_path)
+                    os.makedirs(parallel_cases_folder_path)
+
+        finally:
+            self._parallel_case_future = None
+            _PARALLEL_SEARCH_CONTEXT.clear()
+            shutil.rmtree(parallel_cases_folder_path, ignore_errors = True)
+
+
+
+    def _fit_and_evaluate_on_validation(self, current_fit_hyperparameters):
+
+        # In the parallel search the case has already been fitted and evaluated by a worker
+        if self._parallel_case_future is not None:
+            recommender_instance = self._parallel_case_future.result()
+            return recommender_instance, recommender_instance.result_df, recommender_instance.train_time, recommender_instance.evaluation_time
+
+        return super(SearchBayesianSkopt, self)._fit_and_evaluate_on_validation(current_fit_hyperparameters)
+
+
+
+    def _evaluate_recommender_on_test(self, recommender_instance):
+
+        if isinstance(recommender_instance, _ParallelCaseRecommender):
+            return recommender_instance.result_df_test, recommender_instance.evaluation_test_time
+
+        return super(SearchBayesianSkopt, self)._evaluate_recommender_on_test(recommender_instance)
+
+
+
+    def _check_total_time(self):
+        """
+        Checks if the search should be interrupted because the time has expired
         :return:
         """
 
@@ -422,6 +610,22 @@ class SearchBayesianSkopt(SearchAbstractClass):
                 raise TimeoutError(self.max_total_time, total_current_time + estimated_last_time)
 
 
+
+    def _objective_function_list_input(self, current_fit_hyperparameters_list_of_values, check_total_time = True):
+        """
+        This function parses the hyperparameter list provided by the gp_minimize function into a dictionary that
+        can be used for the fitting of the model and provided to the objective function defined in the abstract class
+
+        This function also checks if the search should be interrupted if the time has expired or no valid config has been found
+
+        :param current_fit_hyperparameters_list_of_values:
+        :param check_total_time:    the parallel search checks the time before proposing each round of cases instead
+        :return:
+        """
+
+        if check_total_time:
+            self._check_total_time()
+
         current_fit_hyperparameters_dict = dict(zip(self.hyperparams_names, current_fit_hyperparameters_list_of_values))
         result = self._objective_function(current_fit_hyperparameters_dict)
 
@@ -430,4 +634,3 @@ class SearchBayesianSkopt(SearchAbstractClass):
              raise NoValidConfigError()
 
         return result
-
@@ -411,7 +411,8 @@ def run_KNNRecommender_on_similarity_type(similarity_type, hyperparameterSearch,
                                           allow_weighting = False,
                                           allow_bias_ICM = False,
                                           allow_bias_URM = False,
-                                          recommender_input_args_last_test = None):
+                                          recommender_input_args_last_test = None,
+                                          n_parallel_cases = 1):
 
     original_hyperparameter_search_space = hyperparameter_search_space
 
@@ -464,7 +465,8 @@ def run_KNNRecommender_on_similarity_type(similarity_type, hyperparameterSearch,
                            output_file_name_root = output_file_name_root + "_" + similarity_type,
                            metric_to_optimize = metric_to_optimize,
                            cutoff_to_optimize = cutoff_to_optimize,
-                           recommender_input_args_last_test = recommender_input_args_last_test)
+                           recommender_input_args_last_test = recommender_input_args_last_test,
+                           n_parallel_cases = n_parallel_cases)
 
 
 
@@ -588,7 +590,8 @@ def runHyperparameterSearch_Collaborative(recommender_class, URM_train, URM_trai
                                           evaluator_validation = None, evaluator_test = None, evaluator_validation_earlystopping = None,
                                           metric_to_optimize = None, cutoff_to_optimize = None,
                                           output_folder_path ="result_experiments/", parallelizeKNN = True,
-                                          allow_weighting = True, allow_bias_URM=False, allow_dropout_MF = False, similarity_type_list = None):
+                                          allow_weighting = True, allow_bias_URM=False, allow_dropout_MF = False, similarity_type_list = None,
+                                          n_parallel_cases = 1):
     """
     This function performs the hyperparameter optimization for a collaborative recommender
 
@@ -612,6 +615,7 @@ def runHyperparameterSearch_Collaborative(recommender_class, URM_train, URM_trai
     :param allow_bias_URM:      Boolean value, if True it enables the use of bias to shift the values of the URM
     :param allow_dropout_MF:    Boolean value, if True it enables the use of dropout on the latent factors of MF algorithms
     :param similarity_type_list: List of strings with the similarity heuristics to be used for the KNNs
+    :param n_parallel_cases:    Number of hyperparameter sets fitted in parallel worker processes at each round, see HyperparameterTuning/SearchBayesianSkopt for details
     """
 
 
@@ -717,7 +721,8 @@ def runHyperparameterSearch_Collaborative(recommender_class, URM_train, URM_trai
                                                            cutoff_to_optimize = cutoff_to_optimize,
                                                            allow_weighting = allow_weighting,
                                                            allow_bias_URM = allow_bias_URM,
-                                                           recommender_input_args_last_test = recommender_input_args_last_test)
+                                                           recommender_input_args_last_test = recommender_input_args_last_test,
+                                                           n_parallel_cases = n_parallel_cases)
 
 
 
@@ -967,11 +972,15 @@ def runHyperparameterSearch_Collaborative(recommender_class, URM_train, URM_trai
                 "alpha": Real(low = 1e-3, high = 1.0, prior = 'uniform'),
             }
 
+            # The folder is shared by all the fits of the search, also when they run in parallel processes,
+            # each fit starts from the coefficients saved by the previous one
             recommender_input_args = SearchInputRecommenderArgs(
                 CONSTRUCTOR_POSITIONAL_ARGS = [URM_train],
                 CONSTRUCTOR_KEYWORD_ARGS = {},
                 FIT_POSITIONAL_ARGS = [],
-                FIT_KEYWORD_ARGS = {},
+                FIT_KEYWORD_ARGS = {"precompute_gram": True,
+                                    "warm_start_folder_path": os.path.join(output_folder_path, output_file_name_root + "_warm_start/")}
+                                    if recommender_class is MultiThreadSLIM_SLIMElasticNetRecommender else {},
                 EARLYSTOPPING_KEYWORD_ARGS = {},
             )
 
@@ -1091,7 +1100,8 @@ def runHyperparameterSearch_Collaborative(recommender_class, URM_train, URM_trai
                                output_file_name_root = output_file_name_root,
                                metric_to_optimize = metric_to_optimize,
                                cutoff_to_optimize = cutoff_to_optimize,
-                               recommender_input_args_last_test = recommender_input_args_last_test)
+                               recommender_input_args_last_test = recommender_input_args_last_test,
+                               n_parallel_cases = n_parallel_cases)
 
 
 
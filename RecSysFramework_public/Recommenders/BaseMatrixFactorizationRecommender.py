@@ -7,8 +7,9 @@ Created on 16/09/2017
 """
 
 from Recommenders.BaseRecommender import BaseRecommender
-from Recommenders.DataIO import DataIO
+from Recommenders.Recommender_utils import check_matrix
 import numpy as np
+import scipy.sparse as sps
 
 
 
@@ -20,10 +21,14 @@ class BaseMatrixFactorizationRecommender(BaseRecommender):
     The prediction for cold users will always be -inf for ALL items
     """
 
+    # Relative l2 regularization of the least squares fold-in of users, see _fold_in_user_factors
+    FOLD_IN_L2_REG = 1e-3
+
     def __init__(self, URM_train, verbose=True):
         super(BaseMatrixFactorizationRecommender, self).__init__(URM_train, verbose=verbose)
 
         self.use_bias = False
+        self._USER_factors_buffer = None
 
 
 
@@ -70,6 +75,156 @@ class BaseMatrixFactorizationRecommender(BaseRecommender):
         return item_scores
 
 
+    def _compute_item_score_chunks(self, user_id_array, items_to_compute = None, item_chunk_size = 10000):
+        """
+        Computes the scores one chunk of items at a time using only the factors of the items in the chunk
+        :param user_id_array:
+        :param items_to_compute:
+        :param item_chunk_size:
+        :return:
+        """
+
+        assert self.USER_factors.shape[1] == self.ITEM_factors.shape[1], \
+            "{}: User and Item factors have inconsistent shape".format(self.RECOMMENDER_NAME)
+
+        assert self.USER_factors.shape[0] > np.max(user_id_array),\
+                "{}: Cold users not allowed. Users in trained model are {}, requested prediction for users up to {}".format(
+                self.RECOMMENDER_NAME, self.USER_factors.shape[0], np.max(user_id_array))
+
+        USER_factors_batch = self.USER_factors[user_id_array]
+
+        for item_id_array in self._get_item_chunks(items_to_compute, item_chunk_size):
+
+            item_scores = np.dot(USER_factors_batch, self.ITEM_factors[item_id_array,:].T)
+
+            if self.use_bias:
+                item_scores += self.ITEM_bias[item_id_array] + self.GLOBAL_bias
+                item_scores = (item_scores.T + self.USER_bias[user_id_array]).T
+
+            yield item_id_array, item_scores
+
+
+    #########################################################################################################
+    ##########                                                                                     ##########
+    ##########                                   FOLD-IN USERS                                     ##########
+    ##########                                                                                     ##########
+    #########################################################################################################
+
+
+    def fold_in_users(self, URM_users, user_id_array = None, batch_size = 10000):
+        """
+        Computes the latent factors of new users, or of existing users whose profile changed, from their interactions
+        keeping the trained ITEM_factors fixed, so they can be scored without retraining the model.
+        New users are appended after the existing ones. The profiles are also added to URM_train,
+        so that their seen items are removed from the recommendations.
+
+        :param URM_users:       sparse matrix |users|x|n_items| with the interactions (or impressions) of the users
+        :param user_id_array:   ids of the existing users whose profile is replaced, if None the users are new
+        :param batch_size:      number of users whose latent factors are computed at once
+        :return:                ids of the users
+        """
+
+        assert not self.use_bias, "{}: Fold-in of users is not supported for models with bias".format(self.RECOMMENDER_NAME)
+
+        URM_users = check_matrix(URM_users, 'csr', dtype=np.float32)
+        URM_users.eliminate_zeros()
+
+        assert URM_users.shape[1] == self.n_items, \
+            "{}: Fold-in profiles have {} items, while the model has {}".format(self.RECOMMENDER_NAME, URM_users.shape[1], self.n_items)
+
+        n_users_fold_in = URM_users.shape[0]
+        USER_factors_fold_in = np.zeros((n_users_fold_in, self.ITEM_factors.shape[1]), dtype=self.USER_factors.dtype)
+
+        for start_user in range(0, n_users_fold_in, batch_size):
+            end_user = min(start_user + batch_size, n_users_fold_in)
+            USER_factors_fold_in[start_user:end_user, :] = self._fold_in_user_factors(URM_users[start_user:end_user])
+
+        if user_id_array is None:
+            user_id_array = np.arange(self.n_users, self.n_users + n_users_fold_in, dtype=np.int32)
+            self._append_user_factors(USER_factors_fold_in)
+            URM_train = sps.vstack([self.URM_train, URM_users], format="csr")
+
+        else:
+            user_id_array = np.array(user_id_array, dtype=np.int32)
+
+            assert len(user_id_array) == n_users_fold_in, "{}: Fold-in user_id_array has {} users, while the profiles are {}".format(
+                self.RECOMMENDER_NAME, len(user_id_array), n_users_fold_in)
+
+            self.USER_factors[user_id_array, :] = USER_factors_fold_in
+
+            # Replace the profiles in URM_train by removing the previous rows and adding the new ones in their place
+            keep_user_mask = np.ones(self.n_users, dtype=np.float32)
+            keep_user_mask[user_id_array] = 0.0
+
+            fold_in_position = sps.csr_matrix((np.ones(n_users_fold_in, dtype=np.float32), (user_id_array, np.arange(n_users_fold_in))),
+                                              shape=(self.n_users, n_users_fold_in))
+
+            URM_train = sps.diags(keep_user_mask).dot(self.URM_train) + fold_in_position.dot(URM_users)
+
+        self.URM_train = check_matrix(URM_train, 'csr', dtype=np.float32)
+        self.URM_train.eliminate_zeros()
+
+        self.n_users = self.URM_train.shape[0]
+        self._cold_user_mask = np.ediff1d(self.URM_train.indptr) == 0
+
+        return user_id_array
+
+
+
+    def _fold_in_user_factors(self, URM_users):
+        """
+        Computes the latent factors of the users as the ridge regression solution of URM_users = USER_factors * ITEM_factors^T
+        with the ITEM_factors fixed. Models with a different loss should override this, or refuse the fold-in.
+        The l2 regularization is FOLD_IN_L2_REG times the average squared norm of the item factors, so that it does not
+        depend on their scale. For an orthonormal ITEM_factors, as in PureSVD, this is the projection
+        URM_users * ITEM_factors / (1 + FOLD_IN_L2_REG)
+        :param URM_users:   sparse matrix |users|x|n_items|
+        :return:            |users|x|n_factors|
+        """
+
+        YtY = self.ITEM_factors.T.dot(self.ITEM_factors)
+        YtR = URM_users.dot(self.ITEM_factors).T
+
+        l2_reg = self.FOLD_IN_L2_REG * np.trace(YtY) / YtY.shape[0]
+
+        return np.linalg.solve(YtY + l2_reg * np.eye(YtY.shape[0], dtype=YtY.dtype), YtR).T
+
+
+
+    def _get_fold_in_hyperparameters(self):
+        """
+        Hyperparameters, other than the latent factors, that _fold_in_user_factors needs. They are saved with the model
+        so that users can be folded in a model restored with load_model
+        :return:    dictionary attribute name -> value
+        """
+        return {}
+
+
+
+    def _append_user_factors(self, USER_factors_new):
+        """
+        Appends the factors of new users to USER_factors, which is a view on a buffer that grows geometrically,
+        so that appending a few users at a time does not copy all the existing factors every time
+        :param USER_factors_new:
+        """
+
+        n_users = self.USER_factors.shape[0]
+        n_users_new = n_users + USER_factors_new.shape[0]
+
+        # The buffer is not valid anymore if fit or load_model replaced the USER_factors
+        if self._USER_factors_buffer is None or self.USER_factors.base is not self._USER_factors_buffer or \
+                len(self._USER_factors_buffer) < n_users_new:
+
+            capacity = max(n_users_new, 2*n_users)
+            USER_factors_buffer = np.zeros((capacity, self.USER_factors.shape[1]), dtype=self.USER_factors.dtype)
+            USER_factors_buffer[:n_users, :] = self.USER_factors
+            self._USER_factors_buffer = USER_factors_buffer
+
+        self._USER_factors_buffer[n_users:n_users_new, :] = USER_factors_new
+        self.USER_factors = self._USER_factors_buffer[:n_users_new]
+
+
+
     #########################################################################################################
     ##########                                                                                     ##########
     ##########                                LOAD AND SAVE                                        ##########
@@ -95,7 +250,9 @@ class BaseMatrixFactorizationRecommender(BaseRecommender):
             data_dict_to_save["USER_bias"] = self.USER_bias
             data_dict_to_save["GLOBAL_bias"] = self.GLOBAL_bias
 
-        dataIO = DataIO(folder_path=folder_path)
+        data_dict_to_save.update(self._get_fold_in_hyperparameters())
+
+        dataIO = self._get_DataIO(folder_path=folder_path)
         dataIO.save_data(file_name=file_name, data_dict_to_save = data_dict_to_save)
 
 
@@ -6,6 +6,7 @@
 """
 
 import numpy as np
+import scipy.sparse as sps
 from Recommenders.DataIO import DataIO
 from Recommenders.Recommender_utils import check_matrix
 
@@ -15,6 +16,10 @@ class BaseRecommender(object):
 
     RECOMMENDER_NAME = "Recommender_Base_Class"
 
+    # If False save_model writes uncompressed archives, whose arrays are memory-mapped by load_model so the processes
+    # loading the same model share its pages, see DataIO. If None the default of DataIO is used
+    SAVE_MODEL_COMPRESS = None
+
     def __init__(self, URM_train, verbose=True):
 
         super(BaseRecommender, self).__init__()
@@ -127,8 +132,104 @@ class BaseRecommender(object):
         raise NotImplementedError("BaseRecommender: compute_item_score not assigned for current recommender, unable to compute prediction scores")
 
 
+    def _get_item_chunks(self, items_to_compute = None, item_chunk_size = 10000):
+        """
+        Splits the items whose scores are to be computed in chunks of at most item_chunk_size items
+        :param items_to_compute:    array containing the items whose scores are to be computed. If None, all items are used
+        :param item_chunk_size:
+        :return:                    generator of item id arrays
+        """
+
+        if items_to_compute is None:
+            for item_start in range(0, self.n_items, item_chunk_size):
+                yield np.arange(item_start, min(item_start + item_chunk_size, self.n_items))
+
+        else:
+            items_to_compute = np.unique(items_to_compute)
+
+            for item_start in range(0, len(items_to_compute), item_chunk_size):
+                yield items_to_compute[item_start:item_start + item_chunk_size]
+
+
+    def _compute_item_score_chunks(self, user_id_array, items_to_compute = None, item_chunk_size = 10000):
+        """
+        Computes the scores one chunk of items at a time, items not in items_to_compute are never returned.
+        This default implementation computes all the scores at once and slices them, recommenders that can compute
+        the scores of a subset of items without the whole (len(user_id_array), n_items) matrix should override it.
+
+        :param user_id_array:       array containing the user indices whose recommendations need to be computed
+        :param items_to_compute:    array containing the items whose scores are to be computed. If None, all items are computed
+        :param item_chunk_size:     maximum number of items in each chunk
+        :return:                    generator of (item_id_array, item_scores) with item_scores (len(user_id_array), len(item_id_array)),
+                                        item_scores may be modified by the caller
+        """
+
+        item_scores = self._compute_item_score(user_id_array, items_to_compute=items_to_compute)
+
+        for item_id_array in self._get_item_chunks(items_to_compute, item_chunk_size):
+            yield item_id_array, item_scores[:, item_id_array]
+
+
+    def _compute_top_k_streaming(self, user_id_array, cutoff, remove_seen_flag = True, items_to_compute = None,
+                                 remove_top_pop_flag = False, remove_custom_items_flag = False, item_chunk_size = 10000):
+        """
+        Selects the cutoff items with the highest score merging the best items found so far with each chunk
+        returned by _compute_item_score_chunks, the peak memory is len(user_id_array) x (item_chunk_size + cutoff)
+        :return ranking:            (len(user_id_array), cutoff) array of item ids sorted by decreasing score, -1 if less than cutoff items are available
+        :return ranking_scores:     (len(user_id_array), cutoff) array of the scores of the ranked items, -np.inf for the missing ones
+        """
+
+        # CSC allows to extract the seen items of each chunk without scanning the whole user profiles
+        URM_train_batch = self.URM_train[user_id_array].tocsc() if remove_seen_flag else None
+
+        ranking = np.full((len(user_id_array), 0), -1, dtype=np.int64)
+        ranking_scores = None
+
+        for item_id_array, item_scores in self._compute_item_score_chunks(user_id_array, items_to_compute=items_to_compute,
+                                                                          item_chunk_size=item_chunk_size):
+
+            if remove_seen_flag:
+                seen_user_index, seen_item_index = URM_train_batch[:, item_id_array].nonzero()
+                item_scores[seen_user_index, seen_item_index] = -np.inf
+
+            if remove_top_pop_flag:
+                item_scores[:, np.isin(item_id_array, self.filterTopPop_ItemsID)] = -np.inf
+
+            if remove_custom_items_flag:
+                item_scores[:, np.isin(item_id_array, self.items_to_ignore_ID)] = -np.inf
+
+            if ranking_scores is None:
+                ranking_scores = np.full((len(user_id_array), 0), -np.inf, dtype=item_scores.dtype)
+
+            candidate_items = np.hstack((ranking, np.broadcast_to(item_id_array, item_scores.shape)))
+            candidate_scores = np.hstack((ranking_scores, item_scores))
+
+            if candidate_scores.shape[1] > cutoff:
+                candidate_partition = (-candidate_scores).argpartition(cutoff, axis=1)[:, 0:cutoff]
+                candidate_items = np.take_along_axis(candidate_items, candidate_partition, axis=1)
+                candidate_scores = np.take_along_axis(candidate_scores, candidate_partition, axis=1)
+
+            ranking, ranking_scores = candidate_items, candidate_scores
+
+        if ranking_scores is None:
+            ranking_scores = np.full((len(user_id_array), 0), -np.inf, dtype=np.float32)
+
+        ranking_sorting = np.argsort(-ranking_scores, axis=1)
+        ranking = np.take_along_axis(ranking, ranking_sorting, axis=1)
+        ranking_scores = np.take_along_axis(ranking_scores, ranking_sorting, axis=1)
+
+        return ranking, ranking_scores
+
+
     def recommend(self, user_id_array, cutoff = None, remove_seen_flag=True, items_to_compute = None,
-                  remove_top_pop_flag = False, remove_custom_items_flag = False, return_scores = False):
+                  remove_top_pop_flag = False, remove_custom_items_flag = False, return_scores = False,
+                  item_chunk_size = None):
+        """
+        :param item_chunk_size:     if None the scores of all items are computed at once, otherwise they are computed
+                                        item_chunk_size items at a time keeping only the running top cutoff items.
+                                        In this case the scores returned with return_scores are a sparse matrix
+                                        containing only the scores of the recommended items.
+        """
 
         # If is a scalar transform it in a 1-cell array
         if np.isscalar(user_id_array):
@@ -142,6 +243,16 @@ class BaseRecommender(object):
 
         cutoff = min(cutoff, self.URM_train.shape[1] - 1)
 
+        if item_chunk_size is not None:
+            ranking, ranking_scores = self._compute_top_k_streaming(user_id_array, cutoff,
+                                                                    remove_seen_flag = remove_seen_flag,
+                                                                    items_to_compute = items_to_compute,
+                                                                    remove_top_pop_flag = remove_top_pop_flag,
+                                                                    remove_custom_items_flag = remove_custom_items_flag,
+                                                                    item_chunk_size = item_chunk_size)
+
+            return self._format_ranking(user_id_array, ranking, ranking_scores, single_user, return_scores, scores_batch = None)
+
         # Compute the scores using the model-specific function
         # Vectorize over all users in user_id_array
         scores_batch = self._compute_item_score(user_id_array, items_to_compute=items_to_compute)
@@ -180,6 +291,13 @@ class BaseRecommender(object):
         relevant_items_partition_original_value = scores_batch[np.arange(scores_batch.shape[0])[:, None], relevant_items_partition]
         relevant_items_partition_sorting = np.argsort(-relevant_items_partition_original_value, axis=1)
         ranking = relevant_items_partition[np.arange(relevant_items_partition.shape[0])[:, None], relevant_items_partition_sorting]
+        ranking_scores = scores_batch[np.arange(ranking.shape[0])[:, None], ranking]
+
+        return self._format_ranking(user_id_array, ranking, ranking_scores, single_user, return_scores, scores_batch = scores_batch)
+
+
+
+    def _format_ranking(self, user_id_array, ranking, ranking_scores, single_user, return_scores, scores_batch = None):
 
         ranking_list = [None] * ranking.shape[0]
 
@@ -187,7 +305,7 @@ class BaseRecommender(object):
         # Since -inf is a flag to indicate an item to remove
         for user_index in range(len(user_id_array)):
             user_recommendation_list = ranking[user_index]
-            user_item_scores = scores_batch[user_index, user_recommendation_list]
+            user_item_scores = ranking_scores[user_index]
 
             not_inf_scores_mask = np.logical_not(np.isinf(user_item_scores))
 
@@ -202,6 +320,13 @@ class BaseRecommender(object):
 
 
         if return_scores:
+            if scores_batch is None:
+                # Only the scores of the recommended items are available
+                not_inf_scores_mask = np.logical_not(np.isinf(ranking_scores))
+                scores_batch = sps.csr_matrix((ranking_scores[not_inf_scores_mask],
+                                               (np.nonzero(not_inf_scores_mask)[0], ranking[not_inf_scores_mask])),
+                                              shape=(len(user_id_array), self.n_items))
+
             return ranking_list, scores_batch
 
         else:
@@ -217,6 +342,15 @@ class BaseRecommender(object):
 
 
 
+    def _get_DataIO(self, folder_path):
+        """
+        Returns the DataIO save_model and load_model use, see SAVE_MODEL_COMPRESS
+        :param folder_path:
+        :return:
+        """
+        return DataIO(folder_path=folder_path, compress=self.SAVE_MODEL_COMPRESS)
+
+
     def save_model(self, folder_path, file_name = None):
         raise NotImplementedError("BaseRecommender: save_model not implemented")
 
@@ -230,7 +364,7 @@ class BaseRecommender(object):
 
         self._print("Loading model from file '{}'".format(folder_path + file_name))
 
-        dataIO = DataIO(folder_path=folder_path)
+        dataIO = self._get_DataIO(folder_path=folder_path)
         data_dict = dataIO.load_data(file_name=file_name)
 
         for attrib_name in data_dict.keys():
@@ -7,7 +7,6 @@ Created on 16/09/2017
 """
 
 from Recommenders.BaseRecommender import BaseRecommender
-from Recommenders.DataIO import DataIO
 import numpy as np
 
 
@@ -54,7 +53,7 @@ class BaseSimilarityMatrixRecommender(BaseRecommender):
 
         data_dict_to_save = {"W_sparse": self.W_sparse}
 
-        dataIO = DataIO(folder_path=folder_path)
+        dataIO = self._get_DataIO(folder_path=folder_path)
         dataIO.save_data(file_name=file_name, data_dict_to_save = data_dict_to_save)
 
         self._print("Saving complete")
@@ -92,6 +91,26 @@ class BaseItemSimilarityMatrixRecommender(BaseSimilarityMatrixRecommender):
         return item_scores
 
 
+    def _compute_item_score_chunks(self, user_id_array, items_to_compute=None, item_chunk_size=10000):
+        """
+        Computes the sparse scores once and densifies them one chunk of items at a time
+        :param user_id_array:
+        :param items_to_compute:
+        :param item_chunk_size:
+        :return:
+        """
+
+        self._check_format()
+
+        user_profile_array = self.URM_train[user_id_array]
+
+        # The sparse scores are converted to CSC to extract the columns of each chunk efficiently
+        item_scores_all = user_profile_array.dot(self.W_sparse).tocsc()
+
+        for item_id_array in self._get_item_chunks(items_to_compute, item_chunk_size):
+            yield item_id_array, item_scores_all[:, item_id_array].toarray()
+
+
 class BaseUserSimilarityMatrixRecommender(BaseSimilarityMatrixRecommender):
 
     def _compute_item_score(self, user_id_array, items_to_compute=None):
@@ -114,3 +133,23 @@ class BaseUserSimilarityMatrixRecommender(BaseSimilarityMatrixRecommender):
             item_scores = user_weights_array.dot(self.URM_train).toarray()
 
         return item_scores
+
+
+    def _compute_item_score_chunks(self, user_id_array, items_to_compute=None, item_chunk_size=10000):
+        """
+        Computes the sparse scores once and densifies them one chunk of items at a time
+        :param user_id_array:
+        :param items_to_compute:
+        :param item_chunk_size:
+        :return:
+        """
+
+        self._check_format()
+
+        user_weights_array = self.W_sparse[user_id_array]
+
+        # The sparse scores are converted to CSC to extract the columns of each chunk efficiently
+        item_scores_all = user_weights_array.dot(self.URM_train).tocsc()
+
+        for item_id_array in self._get_item_chunks(items_to_compute, item_chunk_size):
+            yield item_id_array, item_scores_all[:, item_id_array].toarray()
@@ -6,7 +6,7 @@ Created on 27/04/2019
 @author: Anonymous
 """
 
-import os, json, zipfile, shutil, platform, warnings
+import os, json, zipfile, shutil, platform, warnings, struct
 
 import scipy.sparse as sps
 from pandas import DataFrame
@@ -32,20 +32,123 @@ def json_not_serializable_handler(o):
 
 
 
+# Local file header of a zip member as defined by the zip specification, the lengths of the file name and of the
+# extra field are its last two values
+_ZIP_LOCAL_HEADER_STRUCT = "<4s2B4HL2L2H"
+_ZIP_LOCAL_HEADER_SIZE = struct.calcsize(_ZIP_LOCAL_HEADER_STRUCT)
+_ZIP_LOCAL_HEADER_SIGNATURE = b"PK\003\004"
+
+
+def _get_zip_member_data_offset(file, zip_info, zip_offset = 0):
+    """
+    Returns the position in the file where the data of a zip member begins, after its local header.
+    Returns None if the local header cannot be read, in that case the member must be extracted
+    :param file:        file object containing the archive
+    :param zip_info:    ZipInfo of the member
+    :param zip_offset:  position of the archive in the file, if it is itself a member of another archive
+    :return:
+    """
+
+    file.seek(zip_offset + zip_info.header_offset)
+    file_header = file.read(_ZIP_LOCAL_HEADER_SIZE)
+
+    if len(file_header) != _ZIP_LOCAL_HEADER_SIZE or file_header[:4] != _ZIP_LOCAL_HEADER_SIGNATURE:
+        return None
+
+    file_header = struct.unpack(_ZIP_LOCAL_HEADER_STRUCT, file_header)
+
+    return zip_offset + zip_info.header_offset + _ZIP_LOCAL_HEADER_SIZE + file_header[-2] + file_header[-1]
+
+
+
+def _memmap_npy(file_path, data_offset, mmap_mode):
+    """
+    Memory-maps the .npy array stored at data_offset in the file
+    :param file_path:
+    :param data_offset:
+    :param mmap_mode:
+    :return:
+    """
+
+    with open(file_path, "rb") as file:
+        file.seek(data_offset)
+        version = np.lib.format.read_magic(file)
+
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+
+        array_offset = file.tell()
+
+    if np.prod(shape) == 0:
+        return np.zeros(shape, dtype=dtype, order="F" if fortran_order else "C")
+
+    return np.memmap(file_path, dtype=dtype, mode=mmap_mode, shape=shape,
+                     order="F" if fortran_order else "C", offset=array_offset)
+
+
+
+def _write_aligned_zip(zip_file_path, folder_path, alignment):
+    """
+    Writes all files in the folder into an uncompressed zip archive, padding the extra field of the local headers
+    so that the data of each member begins at a multiple of alignment.
+    The padding is computed from the length of the local header zipfile writes, if it differs the archive is still
+    valid and its members are still memory-mapped, only not aligned
+    :param zip_file_path:
+    :param folder_path:
+    :param alignment:
+    :return:
+    """
+
+    with open(zip_file_path, "wb") as zip_file, zipfile.ZipFile(zip_file, 'w', compression=zipfile.ZIP_STORED) as myzip:
+        for file_to_store in sorted(os.listdir(folder_path)):
+
+            zip_info = zipfile.ZipInfo.from_file(folder_path + file_to_store, arcname = file_to_store)
+            zip_info.compress_type = zipfile.ZIP_STORED
+
+            # Zipfile adds the zip64 extra field to the local header of large files
+            zip64_extra_length = 20 if zip_info.file_size * 1.05 > zipfile.ZIP64_LIMIT else 0
+
+            # The next local header is written at the end of the file, after the previous member
+            header_length = _ZIP_LOCAL_HEADER_SIZE + len(zip_info.filename.encode("utf-8")) + zip64_extra_length + 4
+            padding_length = -(zip_file.tell() + header_length) % alignment
+
+            # 0xD935 is the id of the alignment extra field used by zipalign
+            zip_info.extra = struct.pack("<HH", 0xD935, padding_length) + bytes(padding_length)
+
+            with open(folder_path + file_to_store, "rb") as source_file, myzip.open(zip_info, "w") as destination_file:
+                shutil.copyfileobj(source_file, destination_file, 2**24)
+
+
+
 class DataIO(object):
-    """ DataIO"""
+    """
+    DataIO
+
+    Saves and loads dictionaries of attributes as zip archives. By default the archive is compressed, if compress is False
+    the members are stored uncompressed and aligned to the memory page size. When loading such an archive the numpy arrays
+    and sparse matrices are memory-mapped directly from it, without extracting them, and the processes loading the same
+    archive share its pages.
+    """
 
     _DEFAULT_TEMP_FOLDER = ".temp"
 
+    # Default for the compress argument, if False all archives are saved uncompressed
+    DEFAULT_COMPRESS = True
+
+    _MEMBER_ALIGNMENT = 4096
+
     # _MAX_PATH_LENGTH_LINUX = 4096
     _MAX_PATH_LENGTH_WINDOWS = 255
 
-    def __init__(self, folder_path):
+    def __init__(self, folder_path, compress = None):
         super(DataIO, self).__init__()
 
         self._is_windows = platform.system() == "Windows"
 
         self.folder_path = folder_path
+        self.compress = self.DEFAULT_COMPRESS if compress is None else compress
         self._key_string_alert_done = False
 
         # if self._is_windows:
@@ -101,6 +204,81 @@ class DataIO(object):
         return dict_to_save_key_str
 
 
+    def _save_npz_aligned(self, file_path, sparse_matrix):
+        """
+        Saves the sparse matrix in the same format as sps.save_npz, but uncompressed and with aligned members
+        so that its arrays can be memory-mapped
+        :param file_path:
+        :param sparse_matrix:
+        :return:
+        """
+
+        arrays_folder = file_path + ".arrays/"
+        os.makedirs(arrays_folder)
+
+        arrays_dict = {"format": np.array(sparse_matrix.format.encode("ascii")),
+                       "shape": np.array(sparse_matrix.shape),
+                       "data": sparse_matrix.data}
+
+        if sparse_matrix.format in ("csc", "csr", "bsr"):
+            arrays_dict.update(indices=sparse_matrix.indices, indptr=sparse_matrix.indptr)
+        elif sparse_matrix.format == "dia":
+            arrays_dict.update(offsets=sparse_matrix.offsets)
+        elif sparse_matrix.format == "coo":
+            arrays_dict.update(row=sparse_matrix.row, col=sparse_matrix.col)
+        else:
+            raise NotImplementedError("Save is not implemented for sparse matrix of format {}.".format(sparse_matrix.format))
+
+        for array_name, array in arrays_dict.items():
+            np.save(arrays_folder + array_name + ".npy", array, allow_pickle=False)
+
+        _write_aligned_zip(file_path + ".npz", arrays_folder, self._MEMBER_ALIGNMENT)
+
+        shutil.rmtree(arrays_folder, ignore_errors=True)
+
+
+
+    def _memmap_npz(self, zip_file_path, dataFile, zip_info, mmap_mode):
+        """
+        Memory-maps the arrays of a sparse matrix stored uncompressed in the archive.
+        Returns None if the arrays are compressed or their position cannot be read, so they cannot be memory-mapped
+        :return:
+        """
+
+        with dataFile.open(zip_info) as npz_file, zipfile.ZipFile(npz_file) as npz_zip:
+            npz_info_list = npz_zip.infolist()
+
+        if any(npz_info.compress_type != zipfile.ZIP_STORED for npz_info in npz_info_list):
+            return None
+
+        with open(zip_file_path, "rb") as file:
+            npz_offset = _get_zip_member_data_offset(file, zip_info)
+
+            if npz_offset is None:
+                return None
+
+            array_offset_dict = {npz_info.filename[:-4]: _get_zip_member_data_offset(file, npz_info, zip_offset = npz_offset) for npz_info in npz_info_list}
+
+        if any(array_offset is None for array_offset in array_offset_dict.values()):
+            return None
+
+        loaded = {array_name: _memmap_npy(zip_file_path, array_offset, mmap_mode) for array_name, array_offset in array_offset_dict.items()}
+
+        matrix_format = loaded["format"].item()
+        matrix_format = matrix_format.decode("ascii") if isinstance(matrix_format, bytes) else matrix_format
+        shape = tuple(loaded["shape"].tolist())
+
+        matrix_class = getattr(sps, "{}_matrix".format(matrix_format))
+
+        if matrix_format in ("csc", "csr", "bsr"):
+            return matrix_class((loaded["data"], loaded["indices"], loaded["indptr"]), shape=shape)
+        elif matrix_format == "dia":
+            return matrix_class((loaded["data"], loaded["offsets"]), shape=shape)
+        else:
+            return matrix_class((loaded["data"], (loaded["row"], loaded["col"])), shape=shape)
+
+
+
     def save_data(self, file_name, data_dict_to_save):
 
         # If directory does not exist, create with .temp_model_folder
@@ -135,7 +313,10 @@ class DataIO(object):
 
 
                 elif isinstance(attrib_data, sps.spmatrix):
-                    sps.save_npz(current_file_path, attrib_data)
+                    if self.compress:
+                        sps.save_npz(current_file_path, attrib_data)
+                    else:
+                        self._save_npz_aligned(current_file_path, attrib_data)
 
                 elif isinstance(attrib_data, np.ndarray):
                     # allow_pickle is FALSE to prevent using pickle and ensure portability
@@ -150,7 +331,7 @@ class DataIO(object):
                     except TypeError:
 
                         if isinstance(attrib_data, dict):
-                            dataIO = DataIO(folder_path = current_temp_folder)
+                            dataIO = DataIO(folder_path = current_temp_folder, compress = self.compress)
                             dataIO.save_data(file_name = attrib_name, data_dict_to_save=attrib_data)
 
                         else:
@@ -182,9 +363,12 @@ class DataIO(object):
 
 
 
-            with zipfile.ZipFile(self.folder_path + file_name + ".temp", 'w', compression=zipfile.ZIP_DEFLATED) as myzip:
-                for file_to_compress in os.listdir(current_temp_folder):
-                    myzip.write(current_temp_folder + file_to_compress, arcname = file_to_compress)
+            if self.compress:
+                with zipfile.ZipFile(self.folder_path + file_name + ".temp", 'w', compression=zipfile.ZIP_DEFLATED) as myzip:
+                    for file_to_compress in os.listdir(current_temp_folder):
+                        myzip.write(current_temp_folder + file_to_compress, arcname = file_to_compress)
+            else:
+                _write_aligned_zip(self.folder_path + file_name + ".temp", current_temp_folder, self._MEMBER_ALIGNMENT)
 
             # Replace file only after the new archive has been successfully created
             # Prevents accidental deletion of previous versions of the file if the current write fails
@@ -201,14 +385,25 @@ class DataIO(object):
 
 
 
-    def load_data(self, file_name):
+    def load_data(self, file_name, mmap_mode = "c"):
+        """
+        Loads the data, the numpy arrays and sparse matrices stored uncompressed are memory-mapped
+        :param file_name:
+        :param mmap_mode:   mode of the memory-mapped arrays, see np.memmap. The default "c" is copy-on-write, so
+                            the arrays can be modified in memory without altering the file.
+                            If None all data is loaded in memory
+        :return:
+        """
 
         if file_name[-4:] != ".zip":
             file_name += ".zip"
 
-        dataFile = zipfile.ZipFile(self.folder_path + file_name)
+        zip_file_path = self.folder_path + file_name
+        dataFile = zipfile.ZipFile(zip_file_path)
 
-        dataFile.testzip()
+        # Checking the CRC requires reading the whole archive, which memory-mapping avoids
+        if mmap_mode is None or any(zip_info.compress_type != zipfile.ZIP_STORED for zip_info in dataFile.infolist()):
+            dataFile.testzip()
 
         current_temp_folder = self._get_temp_folder(file_name)
 
@@ -224,16 +419,34 @@ class DataIO(object):
 
             data_dict_loaded = {}
 
-            for file_name in dataFile.namelist():
+            for zip_info in dataFile.infolist():
+
+                file_name = zip_info.filename
 
                 # Discard auxiliary data structures
                 if file_name.startswith("."):
                     continue
 
-                decompressed_file_path = dataFile.extract(file_name, path = current_temp_folder)
                 file_extension = file_name.split(".")[-1]
                 attrib_name = file_name[:-len(file_extension)-1]
 
+                if mmap_mode is not None and zip_info.compress_type == zipfile.ZIP_STORED and file_extension in ["npy", "npz"]:
+
+                    if file_extension == "npy":
+                        with open(zip_file_path, "rb") as file:
+                            data_offset = _get_zip_member_data_offset(file, zip_info)
+
+                        attrib_data = None if data_offset is None else _memmap_npy(zip_file_path, data_offset, mmap_mode)
+                    else:
+                        attrib_data = self._memmap_npz(zip_file_path, dataFile, zip_info, mmap_mode)
+
+                    # If the member cannot be memory-mapped it is extracted and loaded in memory
+                    if attrib_data is not None:
+                        data_dict_loaded[attrib_name] = attrib_data
+                        continue
+
+                decompressed_file_path = dataFile.extract(file_name, path = current_temp_folder)
+
                 if file_extension == "csv":
                     # Compatibility with previous version
                     attrib_data = pd.read_csv(decompressed_file_path, index_col=False)
@@ -249,8 +462,9 @@ class DataIO(object):
                     attrib_data = np.load(decompressed_file_path, allow_pickle=False)
 
                 elif file_extension == "zip":
+                    # The nested archive is extracted in the temporary folder, so it is loaded in memory
                     dataIO = DataIO(folder_path = current_temp_folder)
-                    attrib_data = dataIO.load_data(file_name = file_name)
+                    attrib_data = dataIO.load_data(file_name = file_name, mmap_mode = None)
 
                 elif file_extension == "json":
                     with open(decompressed_file_path, "r") as json_file:
@@ -342,6 +556,85 @@ class MyTestCase(unittest.TestCase):
         self.assertTrue(original_data_dict['nested_dict']["A"] == loaded_data_dict['nested_dict']["A"])
         self.assertTrue(np.array_equal(original_data_dict['nested_dict']["B"].toarray(), loaded_data_dict['nested_dict']["B"].toarray()))
 
+
+    def test_save_and_load_uncompressed(self):
+
+        sps_random = random(100, 400, density=0.25, format="csr", dtype=np.float32)
+
+        original_data_dict = {
+                        "sps_random": sps_random.copy(),
+                        "sps_random_coo": sps_random.tocoo(),
+                        "dense_array": np.random.rand(50, 20),
+                        "fortran_array": np.asfortranarray(np.random.rand(50, 20)),
+                        "result_folder_path": "this is just a string",
+                        "nested_dict": {"A": "a", "B": sps_random.copy()}
+                        }
+
+        dataIO = DataIO("_test_DataIO/", compress = False)
+        dataIO.save_data(file_name="test_DataIO", data_dict_to_save=original_data_dict)
+
+        # The data of all members begins at a multiple of the alignment
+        with zipfile.ZipFile("_test_DataIO/test_DataIO.zip") as dataFile, open("_test_DataIO/test_DataIO.zip", "rb") as file:
+            for zip_info in dataFile.infolist():
+                self.assertEqual(zip_info.compress_type, zipfile.ZIP_STORED)
+                self.assertEqual(_get_zip_member_data_offset(file, zip_info) % DataIO._MEMBER_ALIGNMENT, 0)
+
+        loaded_data_dict = dataIO.load_data(file_name="test_DataIO")
+        loaded_data_dict_in_memory = dataIO.load_data(file_name="test_DataIO", mmap_mode = None)
+
+        self.assertTrue(isinstance(loaded_data_dict["dense_array"], np.memmap))
+        self.assertFalse(isinstance(loaded_data_dict_in_memory["dense_array"], np.memmap))
+
+        for data_dict in [loaded_data_dict, loaded_data_dict_in_memory]:
+            self.assertEqual(original_data_dict.keys(), data_dict.keys())
+
+            for attrib_name in ["sps_random", "sps_random_coo"]:
+                self.assertEqual(original_data_dict[attrib_name].format, data_dict[attrib_name].format)
+                self.assertEqual(original_data_dict[attrib_name].dtype, data_dict[attrib_name].dtype)
+                self.assertTrue(np.array_equal(original_data_dict[attrib_name].toarray(), data_dict[attrib_name].toarray()))
+
+            self.assertTrue(np.array_equal(original_data_dict["dense_array"], data_dict["dense_array"]))
+            self.assertTrue(np.array_equal(original_data_dict["fortran_array"], data_dict["fortran_array"]))
+            self.assertTrue(original_data_dict['result_folder_path'] == data_dict['result_folder_path'])
+            self.assertTrue(np.array_equal(original_data_dict['nested_dict']["B"].toarray(), data_dict['nested_dict']["B"].toarray()))
+
+        # The memory-mapped arrays are copy-on-write, changing them does not alter the file
+        loaded_data_dict["dense_array"][0, 0] = -1.0
+        loaded_data_dict["sps_random"].data[0] = -1.0
+
+        loaded_data_dict = dataIO.load_data(file_name="test_DataIO")
+
+        shutil.rmtree("_test_DataIO/", ignore_errors=True)
+
+        self.assertEqual(loaded_data_dict["dense_array"][0, 0], original_data_dict["dense_array"][0, 0])
+        self.assertEqual(loaded_data_dict["sps_random"].data[0], original_data_dict["sps_random"].data[0])
+
+
+    def test_load_uncompressed_unreadable_header(self):
+
+        from unittest import mock
+
+        sps_random = random(100, 400, density=0.25, format="csr", dtype=np.float32)
+
+        original_data_dict = {
+                        "sps_random": sps_random.copy(),
+                        "dense_array": np.random.rand(50, 20),
+                        }
+
+        dataIO = DataIO("_test_DataIO/", compress = False)
+        dataIO.save_data(file_name="test_DataIO", data_dict_to_save=original_data_dict)
+
+        # If the local headers cannot be read the members are extracted and loaded in memory
+        with mock.patch(__name__ + "._get_zip_member_data_offset", return_value = None):
+            loaded_data_dict = dataIO.load_data(file_name="test_DataIO")
+
+        shutil.rmtree("_test_DataIO/", ignore_errors=True)
+
+        self.assertFalse(isinstance(loaded_data_dict["dense_array"], np.memmap))
+        self.assertTrue(np.array_equal(original_data_dict["dense_array"], loaded_data_dict["dense_array"]))
+        self.assertTrue(np.array_equal(original_data_dict["sps_random"].toarray(), loaded_data_dict["sps_random"].toarray()))
+
+
 if __name__ == '__main__':
 
     unittest.main()
@@ -7,15 +7,14 @@ Created on 23/10/17
 """
 
 from Recommenders.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
-from Recommenders.Recommender_utils import similarityMatrixTopK, check_matrix
+from Recommenders.Recommender_utils import check_matrix
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 from sklearn.preprocessing import normalize
 import numpy as np
 import time
+import scipy.linalg
 import scipy.sparse as sps
 
-from Recommenders.Similarity.Compute_Similarity import Compute_Similarity
-
 
 class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
     """ EASE_R_Recommender
@@ -38,7 +37,19 @@ class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
         super(EASE_R_Recommender, self).__init__(URM_train)
         self.sparse_threshold_quota = sparse_threshold_quota
 
-    def fit(self, topK=None, l2_norm = 1e3, normalize_matrix = False, verbose = True):
+    def fit(self, topK=None, l2_norm = 1e3, normalize_matrix = False, verbose = True, block_max_values = 2**24):
+        """
+        The model is computed in float32 in a single dense n_items x n_items matrix: the Grahm matrix is built one
+        block of rows at a time, inverted in place with a Cholesky decomposition and then scaled in place.
+        If topK is given the selected values of each block are extracted from the inverse, so the full dense
+        model is never built
+        :param topK:
+        :param l2_norm:
+        :param normalize_matrix:
+        :param verbose:
+        :param block_max_values:    maximum number of values of each dense block of rows
+        :return:
+        """
 
         self.verbose = verbose
 
@@ -51,52 +62,150 @@ class EASE_R_Recommender(BaseItemSimilarityMatrixRecommender):
             self.URM_train = normalize(self.URM_train, norm='l2', axis=0)
             self.URM_train = sps.csr_matrix(self.URM_train)
 
+        n_items = self.URM_train.shape[1]
+        block_size = max(1, block_max_values // n_items)
 
-        # Grahm matrix is X^t X, compute dot product
-        similarity = Compute_Similarity(self.URM_train, shrink=0, topK=self.URM_train.shape[1], normalize=False, similarity = "cosine")
-        grahm_matrix = similarity.compute_similarity().toarray()
+        P = self._compute_grahm_matrix(l2_norm, block_size)
 
-        diag_indices = np.diag_indices(grahm_matrix.shape[0])
+        # Inverse of the Grahm matrix, Cholesky requires it to be positive definite
+        P, info = self._cholesky_inverse(P, block_size)
 
-        # The Compute_Similarity object ensures the diagonal of the similarity matrix is zero
-        # in this case we need the diagonal as well, which is just the item popularity
-        item_popularity = np.ediff1d(self.URM_train.tocsc().indptr)
-        grahm_matrix[diag_indices] = item_popularity + l2_norm
+        if info != 0:
+            self._print("Grahm matrix is not positive definite, using the general inverse.")
+            P = scipy.linalg.inv(self._compute_grahm_matrix(l2_norm, block_size), overwrite_a=True, check_finite=False)
 
-        P = np.linalg.inv(grahm_matrix)
+        P_diag = np.diag(P).copy()
 
-        B = P / (-np.diag(P))
+        if topK is None:
+            # B = P / (-diag(P)), in place
+            B = P
+            np.divide(B, -P_diag, out=B)
+            B[np.diag_indices(n_items)] = 0.0
 
-        B[diag_indices] = 0.0
+        else:
+            B = self._get_topK_from_inverse(P, P_diag, topK, block_size)
 
+        del P
 
         new_time_value, new_time_unit = seconds_to_biggest_unit(time.time()-start_time)
         self._print("Fitting model... done in {:.2f} {}".format( new_time_value, new_time_unit))
 
         # Check if the matrix should be saved in a sparse or dense format
         # The matrix is sparse, regardless of the presence of the topK, if nonzero cells are less than sparse_threshold_quota %
-        if topK is not None:
-            B = similarityMatrixTopK(B, k = topK, verbose = False)
-
-
         if self._is_content_sparse_check(B):
             self._print("Detected model matrix to be sparse, changing format.")
             self.W_sparse = check_matrix(B, format='csr', dtype=np.float32)
 
         else:
-            self.W_sparse = check_matrix(B, format='npy', dtype=np.float32)
+            self.W_sparse = B if isinstance(B, np.ndarray) else check_matrix(B, format='npy', dtype=np.float32)
             self._W_sparse_format_checked = True
             self._compute_item_score = self._compute_score_W_dense
-        #
-        #
-        # if topK is None:
-        #     self.W_sparse = B
-        #     self._W_sparse_format_checked = True
-        #     self._compute_item_score = self._compute_score_W_dense
-        #
-        # else:
-        #     self.W_sparse = similarityMatrixTopK(B, k = topK, verbose = False)
-        #     self.W_sparse = sps.csr_matrix(self.W_sparse)
+
+
+
+    def _compute_grahm_matrix(self, l2_norm, block_size):
+        """
+        Computes the Grahm matrix X^t X in float32, one block of rows at a time, with the regularization on the diagonal
+        :param l2_norm:
+        :param block_size:
+        :return:
+        """
+
+        URM_train = check_matrix(self.URM_train, format='csr', dtype=np.float32)
+        URM_train_csc = URM_train.tocsc()
+
+        n_items = URM_train.shape[1]
+        grahm_matrix = np.zeros((n_items, n_items), dtype=np.float32)
+
+        for start_item in range(0, n_items, block_size):
+            end_item = min(start_item + block_size, n_items)
+            URM_train_csc[:, start_item:end_item].T.dot(URM_train).toarray(out = grahm_matrix[start_item:end_item])
+
+        # The diagonal is the item popularity
+        item_popularity = np.ediff1d(URM_train_csc.indptr)
+        grahm_matrix[np.diag_indices(n_items)] = item_popularity + l2_norm
+
+        return grahm_matrix
+
+
+
+    def _cholesky_inverse(self, grahm_matrix, block_size):
+        """
+        Computes the inverse of the symmetric positive definite matrix with a Cholesky decomposition, overwriting it.
+        The matrix is C-contiguous and symmetric, so its transpose is the Fortran-contiguous array LAPACK works on in place
+        :param grahm_matrix:
+        :param block_size:
+        :return: the inverse and the LAPACK info, positive if the matrix is not positive definite
+        """
+
+        cholesky, info = scipy.linalg.lapack.spotrf(grahm_matrix.T, lower=False, clean=False, overwrite_a=True)
+
+        if info != 0:
+            return None, info
+
+        inverse, info = scipy.linalg.lapack.spotri(cholesky, lower=False, overwrite_c=True)
+
+        if info != 0:
+            return None, info
+
+        # Only the lower triangle of inverse.T is computed, copy it in the upper one
+        inverse = inverse.T
+        n_items = inverse.shape[0]
+
+        for start_item in range(0, n_items, block_size):
+            end_item = min(start_item + block_size, n_items)
+
+            diagonal_block = np.tril(inverse[start_item:end_item, start_item:end_item])
+            inverse[start_item:end_item, start_item:end_item] = diagonal_block + np.tril(diagonal_block, -1).T
+            inverse[start_item:end_item, end_item:] = inverse[end_item:, start_item:end_item].T
+
+        return inverse, info
+
+
+
+    def _get_topK_from_inverse(self, P, P_diag, topK, block_size):
+        """
+        Selects the topK values of each column of B = P / (-diag(P)), one block at a time.
+        Since P is symmetric, the columns of B are the rows of P divided by their diagonal element.
+        The selection is the same as the one of similarityMatrixTopK
+        :param P:
+        :param P_diag:
+        :param topK:
+        :param block_size:
+        :return:
+        """
+
+        n_items = P.shape[0]
+        topK = min(topK, n_items)
+
+        data_list, rows_indices_list, cols_nnz_list = [], [], []
+
+        for start_item in range(0, n_items, block_size):
+            end_item = min(start_item + block_size, n_items)
+            block_items = np.arange(start_item, end_item)
+
+            B_block = P[start_item:end_item] / -P_diag[start_item:end_item, None]
+            B_block[block_items - start_item, block_items] = 0.0
+
+            # Zero values are not selected
+            B_block[B_block == 0.0] = -np.inf
+
+            top_k_idx = np.argpartition(-B_block, topK-1, axis=1)[:, :topK]
+            top_k_idx.sort(axis=1)
+            top_k_data = np.take_along_axis(B_block, top_k_idx, axis=1)
+
+            is_nonzero = np.isfinite(top_k_data)
+
+            data_list.append(top_k_data[is_nonzero])
+            rows_indices_list.append(top_k_idx[is_nonzero])
+            cols_nnz_list.append(is_nonzero.sum(axis=1))
+
+        cols_indptr = np.zeros(n_items + 1, dtype=np.int64)
+        np.cumsum(np.concatenate(cols_nnz_list), out=cols_indptr[1:])
+
+        return sps.csc_matrix((np.concatenate(data_list), np.concatenate(rows_indices_list), cols_indptr),
+                              shape=(n_items, n_items), dtype=np.float32)
+
 
 
     def _is_content_sparse_check(self, matrix):
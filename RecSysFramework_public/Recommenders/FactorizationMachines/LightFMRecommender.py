@@ -8,7 +8,6 @@ Created on 11/07/2021
 
 from Recommenders.Incremental_Training_Early_Stopping import Incremental_Training_Early_Stopping
 from Recommenders.BaseRecommender import BaseRecommender
-from Recommenders.DataIO import DataIO
 from Recommenders.BaseCBFRecommender import BaseItemCBFRecommender, BaseUserCBFRecommender
 from lightfm import LightFM
 import numpy as np
@@ -132,6 +131,12 @@ class _BaseLightFMWrapper(BaseRecommender, Incremental_Training_Early_Stopping):
         self.lightFM_model_best = deepcopy(self.lightFM_model)
 
 
+    def _get_validation_snapshot(self):
+        snapshot = self._copy_model_for_validation()
+        snapshot.lightFM_model = deepcopy(self.lightFM_model)
+        return snapshot
+
+
     def _run_epoch(self, num_epoch):
 
         self.lightFM_model = self.lightFM_model.fit_partial(self.URM_train,
@@ -166,7 +171,7 @@ class _BaseLightFMWrapper(BaseRecommender, Incremental_Training_Early_Stopping):
                             }
 
 
-        dataIO = DataIO(folder_path=folder_path)
+        dataIO = self._get_DataIO(folder_path=folder_path)
         dataIO.save_data(file_name=file_name, data_dict_to_save = data_dict_to_save)
 
         self._print("Saving complete")
@@ -181,7 +186,7 @@ class _BaseLightFMWrapper(BaseRecommender, Incremental_Training_Early_Stopping):
 
         self._print("Loading model from file '{}'".format(folder_path + file_name))
 
-        dataIO = DataIO(folder_path=folder_path)
+        dataIO = self._get_DataIO(folder_path=folder_path)
         data_dict = dataIO.load_data(file_name=file_name)
 
         self.lightFM_model = LightFM()
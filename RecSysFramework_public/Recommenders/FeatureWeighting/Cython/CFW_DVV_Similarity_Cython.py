@@ -9,7 +9,6 @@ Created on 10/2017
 import sys, time
 import numpy as np
 import scipy.sparse as sps
-from Recommenders.DataIO import DataIO
 
 from Recommenders.BaseCBFRecommender import BaseItemCBFRecommender
 from Recommenders.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
@@ -417,7 +416,7 @@ class CFW_DVV_Similarity_Cython(BaseItemCBFRecommender, BaseItemSimilarityMatrix
             "W_sparse":self.W_sparse
         }
 
-        dataIO = DataIO(folder_path=folder_path)
+        dataIO = self._get_DataIO(folder_path=folder_path)
         dataIO.save_data(file_name=file_name, data_dict_to_save = data_dict_to_save)
 
         print("{}: Saving complete".format(self.RECOMMENDER_NAME))
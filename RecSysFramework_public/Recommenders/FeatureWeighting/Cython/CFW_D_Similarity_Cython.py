@@ -18,7 +18,6 @@ from Recommenders.Similarity.Compute_Similarity import Compute_Similarity
 from CythonCompiler.run_compile_subprocess import run_compile_subprocess
 import time, sys
 import numpy as np
-from Recommenders.DataIO import DataIO
 
 
 
@@ -419,7 +418,7 @@ class CFW_D_Similarity_Cython(BaseItemCBFRecommender, BaseItemSimilarityMatrixRe
             "normalize_similarity":self.normalize_similarity
         }
 
-        dataIO = DataIO(folder_path=folder_path)
+        dataIO = self._get_DataIO(folder_path=folder_path)
         dataIO.save_data(file_name=file_name, data_dict_to_save = data_dict_to_save)
 
 
@@ -6,7 +6,6 @@ Created on 03/02/2018
 
 
 from Recommenders.Similarity.Compute_Similarity import Compute_Similarity
-from Recommenders.DataIO import DataIO
 from Recommenders.BaseCBFRecommender import BaseItemCBFRecommender
 from Recommenders.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
 from Recommenders.Incremental_Training_Early_Stopping import Incremental_Training_Early_Stopping
@@ -293,7 +292,7 @@ class FBSM_Rating_Cython(BaseItemCBFRecommender, BaseItemSimilarityMatrixRecomme
             "W_sparse":self.W_sparse
         }
 
-        dataIO = DataIO(folder_path=folder_path)
+        dataIO = self._get_DataIO(folder_path=folder_path)
         dataIO.save_data(file_name=file_name, data_dict_to_save = data_dict_to_save)
 
         print("{}: Saving complete".format(self.RECOMMENDER_NAME))
@@ -10,7 +10,6 @@ from Recommenders.BaseCBFRecommender import BaseItemCBFRecommender
 from Recommenders.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
 from Recommenders.Incremental_Training_Early_Stopping import Incremental_Training_Early_Stopping
 from Recommenders.Recommender_utils import check_matrix
-from Recommenders.DataIO import DataIO
 from CythonCompiler.run_compile_subprocess import run_compile_subprocess
 
 import time, sys
@@ -383,7 +382,7 @@ class HP3_Similarity_Cython(BaseItemCBFRecommender, BaseItemSimilarityMatrixReco
             "W_sparse":self.W_sparse
         }
 
-        dataIO = DataIO(folder_path=folder_path)
+        dataIO = self._get_DataIO(folder_path=folder_path)
         dataIO.save_data(file_name=file_name, data_dict_to_save = data_dict_to_save)
 
 
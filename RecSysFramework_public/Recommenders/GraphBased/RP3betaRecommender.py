@@ -8,11 +8,113 @@ import numpy as np
 import scipy.sparse as sps
 
 from sklearn.preprocessing import normalize
-from Recommenders.Recommender_utils import check_matrix, similarityMatrixTopK
+from Recommenders.Recommender_utils import check_matrix
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 
 from Recommenders.BaseSimilarityMatrixRecommender import BaseItemSimilarityMatrixRecommender
 import time, sys
+import multiprocessing
+
+
+
+def _top_k_of_sparse_rows(matrix, topK):
+    """
+    Selects the topK values of each row of a csr matrix among its non-zero values, which are padded to the length of
+    the longest row, so the dense array is |rows| x |longest row| instead of |rows| x |columns|
+    :param matrix:              csr matrix with canonical rows
+    :param topK:
+    :return: top_k_idx, top_k_values arrays of shape (n_rows, topK), rows with less than topK values are padded with zeros
+    """
+
+    n_rows = matrix.shape[0]
+    row_length = np.ediff1d(matrix.indptr)
+    row_index = np.repeat(np.arange(n_rows), row_length)
+    position_in_row = np.arange(matrix.nnz) - np.repeat(matrix.indptr[:-1], row_length)
+
+    # The padding is -inf, so it is selected only in the rows with less than topK values
+    padded_values = np.full((n_rows, max(topK, row_length.max(initial=0))), -np.inf, dtype=np.float32)
+    padded_values[row_index, position_in_row] = matrix.data
+
+    padded_indices = np.zeros(padded_values.shape, dtype=np.int32)
+    padded_indices[row_index, position_in_row] = matrix.indices
+
+    top_k_position = (-padded_values).argpartition(topK-1, axis=1)[:, 0:topK]
+    top_k_values = np.take_along_axis(padded_values, top_k_position, axis=1)
+    top_k_values[np.isneginf(top_k_values)] = 0
+
+    return np.take_along_axis(padded_indices, top_k_position, axis=1), top_k_values
+
+
+
+def _compute_block_top_k(Piu_block, Pui, degree, block_start_row, topK):
+    """
+    Computes the rows of the similarity Piu_block * Pui weighted by the item degree and selects their topK
+    The rows are kept sparse, the topK is selected only among their non-zero values
+    :param Piu_block:           rows of Piu of the items in the block
+    :param Pui:
+    :param degree:              item degree, to penalize popular items
+    :param block_start_row:     item of the first row of the block
+    :param topK:
+    :return: top_k_idx, top_k_values arrays of shape (block size, topK), values may contain zeros
+    """
+
+    similarity_block = check_matrix(Piu_block * Pui, format='csr', dtype=np.float32)
+    similarity_block.data *= degree[similarity_block.indices]
+
+    row_index = np.repeat(np.arange(similarity_block.shape[0]), np.ediff1d(similarity_block.indptr))
+    similarity_block.data[similarity_block.indices == row_index + block_start_row] = 0
+
+    return _top_k_of_sparse_rows(similarity_block, topK)
+
+
+
+def _similarity_matrix_top_k(W_sparse, topK, block_dim):
+    """
+    Keeps the topK values of each column, as similarityMatrixTopK, selecting them for blocks of block_dim columns at once
+    :return: csr matrix
+    """
+
+    n_items = W_sparse.shape[1]
+
+    # The csc of W has the same arrays of the csr of its transpose, whose rows are the columns of W
+    W_sparse = check_matrix(W_sparse, format='csc', dtype=np.float32)
+    W_sparse.sort_indices()
+    W_transpose = sps.csr_matrix((W_sparse.data, W_sparse.indices, W_sparse.indptr), shape=(n_items, n_items))
+
+    rows = np.zeros(n_items * topK, dtype=np.int32)
+    cols = np.repeat(np.arange(n_items, dtype=np.int32), topK)
+    values = np.zeros(n_items * topK, dtype=np.float32)
+
+    for block_start_col in range(0, n_items, block_dim):
+        top_k_idx, top_k_values = _top_k_of_sparse_rows(W_transpose[block_start_col:block_start_col + block_dim, :], topK)
+
+        rows[block_start_col * topK:block_start_col * topK + top_k_idx.size] = top_k_idx.ravel()
+        values[block_start_col * topK:block_start_col * topK + top_k_idx.size] = top_k_values.ravel()
+
+    W_sparse = sps.csr_matrix((values, (rows, cols)), shape=(n_items, n_items))
+    W_sparse.eliminate_zeros()
+
+    return W_sparse
+
+
+
+# Matrices used by the worker processes, they are inherited when the pool forks so they are not pickled
+_PARALLEL_FIT_CONTEXT = {}
+
+
+def _compute_block_top_k_shard(block_start_row):
+
+    Piu = _PARALLEL_FIT_CONTEXT["Piu"]
+    block_dim = _PARALLEL_FIT_CONTEXT["block_dim"]
+
+    top_k_idx, top_k_values = _compute_block_top_k(Piu[block_start_row:block_start_row + block_dim, :],
+                                                   _PARALLEL_FIT_CONTEXT["Pui"],
+                                                   _PARALLEL_FIT_CONTEXT["degree"],
+                                                   block_start_row,
+                                                   _PARALLEL_FIT_CONTEXT["topK"])
+
+    return block_start_row, top_k_idx.astype(np.int32), top_k_values.astype(np.float32)
+
 
 class RP3betaRecommender(BaseItemSimilarityMatrixRecommender):
     """ RP3beta recommender """
@@ -28,7 +130,14 @@ class RP3betaRecommender(BaseItemSimilarityMatrixRecommender):
                                                                                         self.beta, self.min_rating, self.topK,
                                                                                         self.implicit, self.normalize_similarity)
 
-    def fit(self, alpha=1., beta=0.6, min_rating=0, topK=100, implicit=False, normalize_similarity=True):
+    def fit(self, alpha=1., beta=0.6, min_rating=0, topK=100, implicit=False, normalize_similarity=True,
+            n_workers=1, block_dim=200):
+        """
+        :param n_workers:   number of processes computing the blocks of rows of the similarity, if None the number
+                            of cpus is used. The processes are forked, if fork is not available the fit is sequential
+        :param block_dim:   number of rows of the similarity computed at once, the topK of each block is selected on a dense
+                            block_dim x |longest row of the block| array, at most block_dim x n_items
+        """
 
         self.alpha = alpha
         self.beta = beta
@@ -58,7 +167,7 @@ class RP3betaRecommender(BaseItemSimilarityMatrixRecommender):
         # Some rows might be zero, make sure their degree remains zero
         X_bool_sum = np.array(X_bool.sum(axis=1)).ravel()
 
-        degree = np.zeros(self.URM_train.shape[1])
+        degree = np.zeros(self.URM_train.shape[1], dtype=np.float32)
 
         nonZeroMask = X_bool_sum!=0.0
 
@@ -75,81 +184,87 @@ class RP3betaRecommender(BaseItemSimilarityMatrixRecommender):
 
         # Final matrix is computed as Pui * Piu * Pui
         # Multiplication unpacked for memory usage reasons
-        block_dim = 200
-        d_t = Piu
+        n_items = Pui.shape[1]
+        d_t = check_matrix(Piu, format='csr')
+        topK_block = min(self.topK, n_items)
 
+        if n_workers is None:
+            n_workers = multiprocessing.cpu_count()
 
-        # Use array as it reduces memory requirements compared to lists
-        dataBlock = 10000000
-
-        rows = np.zeros(dataBlock, dtype=np.int32)
-        cols = np.zeros(dataBlock, dtype=np.int32)
-        values = np.zeros(dataBlock, dtype=np.float32)
-
-        numCells = 0
-
+        # Each row keeps at most topK values, the buffers are written one block of rows at a time
+        # The entries of rows with less than topK non-zero values remain zero and are removed afterwards
+        rows = np.repeat(np.arange(n_items, dtype=np.int32), topK_block)
+        cols = np.zeros(n_items * topK_block, dtype=np.int32)
+        values = np.zeros(n_items * topK_block, dtype=np.float32)
 
         start_time = time.time()
         start_time_printBatch = start_time
+        processed_rows = 0
 
-        for current_block_start_row in range(0, Pui.shape[1], block_dim):
-
-            if current_block_start_row + block_dim > Pui.shape[1]:
-                block_dim = Pui.shape[1] - current_block_start_row
-
-            similarity_block = d_t[current_block_start_row:current_block_start_row + block_dim, :] * Pui
-            similarity_block = similarity_block.toarray()
-
-            for row_in_block in range(block_dim):
-                row_data = np.multiply(similarity_block[row_in_block, :], degree)
-                row_data[current_block_start_row + row_in_block] = 0
+        def _store_block(block_start_row, top_k_idx, top_k_values):
+            start_pos = block_start_row * topK_block
+            end_pos = start_pos + top_k_idx.size
 
-                best = row_data.argsort()[::-1][:self.topK]
+            cols[start_pos:end_pos] = top_k_idx.ravel()
+            values[start_pos:end_pos] = top_k_values.ravel()
 
-                notZerosMask = row_data[best] != 0.0
-
-                values_to_add = row_data[best][notZerosMask]
-                cols_to_add = best[notZerosMask]
-
-                for index in range(len(values_to_add)):
-
-                    if numCells == len(rows):
-                        rows = np.concatenate((rows, np.zeros(dataBlock, dtype=np.int32)))
-                        cols = np.concatenate((cols, np.zeros(dataBlock, dtype=np.int32)))
-                        values = np.concatenate((values, np.zeros(dataBlock, dtype=np.float32)))
-
-
-                    rows[numCells] = current_block_start_row + row_in_block
-                    cols[numCells] = cols_to_add[index]
-                    values[numCells] = values_to_add[index]
-
-                    numCells += 1
+            return top_k_idx.shape[0]
 
+        def _print_progress(start_time_printBatch):
 
             if time.time() - start_time_printBatch > 300:
                 new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
 
                 self._print("Similarity column {} ({:4.1f}%), {:.2f} column/sec. Elapsed time {:.2f} {}".format(
-                     current_block_start_row + block_dim,
-                    100.0 * float( current_block_start_row + block_dim) / Pui.shape[1],
-                    float( current_block_start_row + block_dim) / (time.time() - start_time),
+                     processed_rows,
+                    100.0 * float(processed_rows) / n_items,
+                    float(processed_rows) / (time.time() - start_time),
                     new_time_value, new_time_unit))
 
-
                 sys.stdout.flush()
                 sys.stderr.flush()
 
                 start_time_printBatch = time.time()
 
+            return start_time_printBatch
+
+        block_start_row_list = list(range(0, n_items, block_dim)) if topK_block > 0 else []
+
+        if n_workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+
+            _PARALLEL_FIT_CONTEXT.update({
+                "Piu": d_t,
+                "Pui": Pui,
+                "degree": degree,
+                "block_dim": block_dim,
+                "topK": topK_block,
+            })
+
+            try:
+                with multiprocessing.get_context("fork").Pool(processes=n_workers) as pool:
+                    for block_start_row, top_k_idx, top_k_values in pool.imap_unordered(_compute_block_top_k_shard, block_start_row_list):
+                        processed_rows += _store_block(block_start_row, top_k_idx, top_k_values)
+                        start_time_printBatch = _print_progress(start_time_printBatch)
+            finally:
+                _PARALLEL_FIT_CONTEXT.clear()
+
+        else:
+            for block_start_row in block_start_row_list:
+                top_k_idx, top_k_values = _compute_block_top_k(d_t[block_start_row:block_start_row + block_dim, :], Pui,
+                                                               degree, block_start_row, topK_block)
+                processed_rows += _store_block(block_start_row, top_k_idx, top_k_values)
+                start_time_printBatch = _print_progress(start_time_printBatch)
+
 
-        self.W_sparse = sps.csr_matrix((values[:numCells], (rows[:numCells], cols[:numCells])), shape=(Pui.shape[1], Pui.shape[1]))
+        self.W_sparse = sps.csr_matrix((values, (rows, cols)), shape=(n_items, n_items))
+        self.W_sparse.eliminate_zeros()
 
         if self.normalize_similarity:
             self.W_sparse = normalize(self.W_sparse, norm='l1', axis=1)
 
 
         if self.topK != False:
-            self.W_sparse = similarityMatrixTopK(self.W_sparse, k=self.topK)
+            self.W_sparse = _similarity_matrix_top_k(self.W_sparse, min(self.topK, n_items), block_dim)
 
 
         self.W_sparse = check_matrix(self.W_sparse, format='csr')
\ No newline at end of file
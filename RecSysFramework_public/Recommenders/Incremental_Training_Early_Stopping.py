@@ -6,12 +6,26 @@ Created on 06/07/2018
 @author: Anonymous
 """
 
-import time, sys
+import time, sys, copy
+import multiprocessing
 import numpy as np
+import scipy.sparse as sps
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from Recommenders.BaseTempFolder import BaseTempFolder
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
 
 
+_validation_process_evaluator = None
+
+def _init_validation_process(evaluator_object):
+    global _validation_process_evaluator
+    _validation_process_evaluator = evaluator_object
+
+def _evaluate_in_validation_process(snapshot):
+    return _validation_process_evaluator.evaluateRecommender(snapshot)
+
+
+
 class Incremental_Training_Early_Stopping(object):
     """
     This class provides a function which trains a model applying early stopping
@@ -33,9 +47,17 @@ class Incremental_Training_Early_Stopping(object):
     _train_with_early_stopping(.)               : Function that executes the training, validation and early stopping by using the previously implemented functions
 
 
+    _get_validation_snapshot(self)              : optional, returns a copy of the current model to be evaluated in background, see validation_async
+                                                  Only the models implementing it support validation_async
+
+
 
     """
 
+    # If True the validation snapshot is evaluated in a child process rather than in a thread, for models whose epochs
+    # hold the GIL (e.g., Cython epochs) and would not run in parallel with the validation. The snapshot must be picklable
+    VALIDATION_ASYNC_IN_PROCESS = False
+
     def __init__(self):
         super(Incremental_Training_Early_Stopping, self).__init__()
 
@@ -88,10 +110,56 @@ class Incremental_Training_Early_Stopping(object):
 
 
 
+    def _get_validation_snapshot(self):
+        """
+        This function is called when the validation is asynchronous, after _prepare_model_for_validation, and returns a copy
+        of the current model that is evaluated in background while the next epochs update the model.
+        It is not implemented by default because a generic copy is not safe for every model (e.g., a model sharing a
+        TensorFlow session), models whose state can be copied should implement it, see _copy_model_for_validation
+        :return:
+        """
+        raise NotImplementedError()
+
+
+    def _copy_model_for_validation(self):
+        """
+        Returns a copy of the model sharing its attributes except numpy arrays and sparse matrices, which are copied because
+        the epochs may update them in place. URM_train is shared because the training does not change it.
+        It is a valid _get_validation_snapshot only for models whose whole state is in numpy arrays and sparse matrices
+        :return:
+        """
+
+        snapshot = copy.copy(self)
+
+        for attribute_name, attribute_value in self.__dict__.items():
+            if attribute_name != "URM_train" and (isinstance(attribute_value, np.ndarray) or sps.issparse(attribute_value)):
+                setattr(snapshot, attribute_name, attribute_value.copy())
+
+        return snapshot
+
+
+    def _update_best_model_from_snapshot(self, snapshot):
+        """
+        Updates the best model with the one of a validation snapshot, by calling _update_best_model on the snapshot
+        and copying into the model the attributes it sets
+        :param snapshot:
+        :return:
+        """
+
+        snapshot_attributes = dict(snapshot.__dict__)
+        snapshot._update_best_model()
+
+        for attribute_name, attribute_value in snapshot.__dict__.items():
+            if attribute_name not in snapshot_attributes or snapshot_attributes[attribute_name] is not attribute_value:
+                setattr(self, attribute_name, attribute_value)
+
+
+
     def _train_with_early_stopping(self, epochs_max, epochs_min = 0,
                                    validation_every_n = None, stop_on_validation = False,
                                    validation_metric = None, lower_validations_allowed = None, evaluator_object = None,
-                                   algorithm_name = "Incremental_Training_Early_Stopping"):
+                                   algorithm_name = "Incremental_Training_Early_Stopping",
+                                   validation_async = False):
         """
 
         :param epochs_max:                  max number of epochs the training will last
@@ -103,6 +171,12 @@ class Incremental_Training_Early_Stopping(object):
         :param evaluator_object:            evaluator instance used to compute the validation metrics.
                                                 If multiple cutoffs are available, the first one is used
         :param algorithm_name:              name of the algorithm to be displayed in the output updates
+        :param validation_async:            [True/False] whether to evaluate a snapshot of the model in a background thread
+                                                (or process, see VALIDATION_ASYNC_IN_PROCESS) while the next epochs are trained.
+                                                Requires the model to implement _get_validation_snapshot. The best model and the early stopping are
+                                                updated when the results arrive, so the training may run some epochs
+                                                after the one where convergence is reached. Only one validation runs at a time,
+                                                if the previous one has not finished when a new one is due, the training waits for it
         :return: -
 
 
@@ -172,58 +246,126 @@ class Incremental_Training_Early_Stopping(object):
 
         epochs_current = 0
 
-        while epochs_current < epochs_max and not convergence:
+        assert not validation_async or type(self)._get_validation_snapshot is not Incremental_Training_Early_Stopping._get_validation_snapshot,\
+            "{}: validation_async requires the model to implement _get_validation_snapshot".format(algorithm_name)
 
-            self._run_epoch(epochs_current)
+        validation_executor = None
+        evaluate_snapshot = None
 
-            # If no validation required, always keep the latest
-            if evaluator_object is None:
+        if validation_async and evaluator_object is not None:
 
-                self.epochs_best = epochs_current
+            if not self.VALIDATION_ASYNC_IN_PROCESS:
+                validation_executor = ThreadPoolExecutor(max_workers=1)
+                evaluate_snapshot = evaluator_object.evaluateRecommender
 
-            # Determine whether a validaton step is required
-            elif (epochs_current + 1) % validation_every_n == 0:
+            # Daemonic processes, e.g., Dask workers, are not allowed to have children
+            elif multiprocessing.current_process().daemon or "fork" not in multiprocessing.get_all_start_methods():
+                print("{}: Validation process not available, the validation will not be asynchronous".format(algorithm_name))
 
-                print("{}: Validation begins...".format(algorithm_name))
+            else:
+                # The evaluator is inherited by the forked process, only the snapshots are pickled
+                validation_executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork"),
+                                                          initializer=_init_validation_process, initargs=(evaluator_object,))
+                evaluate_snapshot = _evaluate_in_validation_process
 
-                self._prepare_model_for_validation()
+        # Background validation not yet processed, as (epochs_validated, snapshot, future)
+        validation_pending = None
 
-                # If the evaluator validation has multiple cutoffs, choose the first one
-                results_run, results_run_string = evaluator_object.evaluateRecommender(self)
-                current_metric_value = results_run.iloc[0][validation_metric]
 
-                print("{}: {}".format(algorithm_name, results_run_string))
+        def _process_validation_results(model, epochs_validated, results_run, results_run_string):
+            """
+            Updates the best model and the early stopping with the results of the model trained for epochs_validated
+            :return: whether the convergence is reached
+            """
 
-                # Update optimal model
-                if not np.isfinite(current_metric_value):
-                    if isinstance(self, BaseTempFolder):
-                        # If the recommender uses BaseTempFolder, clean the temp folder
-                        self._clean_temp_folder(temp_file_folder=self.temp_file_folder)
+            nonlocal lower_validatons_count
 
-                    assert False, "{}: metric value is not a finite number, terminating!".format(self.RECOMMENDER_NAME)
+            current_metric_value = results_run.iloc[0][validation_metric]
 
+            print("{}: {}".format(algorithm_name, results_run_string))
 
-                if self.best_validation_metric is None or self.best_validation_metric < current_metric_value:
+            # Update optimal model
+            if not np.isfinite(current_metric_value):
+                if isinstance(self, BaseTempFolder):
+                    # If the recommender uses BaseTempFolder, clean the temp folder
+                    self._clean_temp_folder(temp_file_folder=self.temp_file_folder)
 
-                    print("{}: New best model found! Updating.".format(algorithm_name))
-                    self.best_validation_metric = current_metric_value
-                    self._update_best_model()
+                assert False, "{}: metric value is not a finite number, terminating!".format(self.RECOMMENDER_NAME)
+
+
+            if self.best_validation_metric is None or self.best_validation_metric < current_metric_value:
 
-                    self.epochs_best = epochs_current +1
-                    lower_validatons_count = 0
+                print("{}: New best model found! Updating.".format(algorithm_name))
+                self.best_validation_metric = current_metric_value
 
+                if model is self:
+                    self._update_best_model()
                 else:
-                    lower_validatons_count += 1
+                    self._update_best_model_from_snapshot(model)
+
+                self.epochs_best = epochs_validated
+                lower_validatons_count = 0
+
+            else:
+                lower_validatons_count += 1
+
+
+            if stop_on_validation and lower_validatons_count >= lower_validations_allowed and epochs_validated - 1 >= epochs_min:
+
+                elapsed_time = time.time() - start_time
+                new_time_value, new_time_unit = seconds_to_biggest_unit(elapsed_time)
+
+                print("{}: Convergence reached! Terminating at epoch {}. Best value for '{}' at epoch {} is {:.4f}. Elapsed time {:.2f} {}".format(
+                    algorithm_name, epochs_current+1, validation_metric, self.epochs_best, self.best_validation_metric, new_time_value, new_time_unit))
+
+                return True
+
+            return False
+
+
+        def _process_validation_pending():
+
+            epochs_validated, snapshot, future = validation_pending
+            results_run, results_run_string = future.result()
 
+            return _process_validation_results(snapshot, epochs_validated, results_run, results_run_string)
 
-                if stop_on_validation and lower_validatons_count >= lower_validations_allowed and epochs_current >= epochs_min:
-                    convergence = True
 
-                    elapsed_time = time.time() - start_time
-                    new_time_value, new_time_unit = seconds_to_biggest_unit(elapsed_time)
+        while epochs_current < epochs_max and not convergence:
+
+            self._run_epoch(epochs_current)
+
+            # If no validation required, always keep the latest
+            if evaluator_object is None:
+
+                self.epochs_best = epochs_current
+
+            # Determine whether a validaton step is required
+            elif (epochs_current + 1) % validation_every_n == 0:
+
+                # Only one validation at a time, wait for the previous one
+                if validation_pending is not None:
+                    convergence = _process_validation_pending()
+                    validation_pending = None
+
+                if not convergence:
+                    print("{}: Validation begins...".format(algorithm_name))
+
+                    self._prepare_model_for_validation()
 
-                    print("{}: Convergence reached! Terminating at epoch {}. Best value for '{}' at epoch {} is {:.4f}. Elapsed time {:.2f} {}".format(
-                        algorithm_name, epochs_current+1, validation_metric, self.epochs_best, self.best_validation_metric, new_time_value, new_time_unit))
+                    if validation_executor is None:
+                        # If the evaluator validation has multiple cutoffs, choose the first one
+                        results_run, results_run_string = evaluator_object.evaluateRecommender(self)
+                        convergence = _process_validation_results(self, epochs_current + 1, results_run, results_run_string)
+
+                    else:
+                        snapshot = self._get_validation_snapshot()
+                        validation_pending = (epochs_current + 1, snapshot, validation_executor.submit(evaluate_snapshot, snapshot))
+
+            # Process the background validation as soon as it is done
+            if validation_pending is not None and validation_pending[2].done() and not convergence:
+                convergence = _process_validation_pending()
+                validation_pending = None
 
 
             elapsed_time = time.time() - start_time
@@ -237,6 +379,13 @@ class Incremental_Training_Early_Stopping(object):
             sys.stdout.flush()
             sys.stderr.flush()
 
+        # The last background validation may still change the best model
+        if validation_pending is not None:
+            convergence = _process_validation_pending()
+
+        if validation_executor is not None:
+            validation_executor.shutdown()
+
         # If no validation required, keep the latest
         if evaluator_object is None:
 
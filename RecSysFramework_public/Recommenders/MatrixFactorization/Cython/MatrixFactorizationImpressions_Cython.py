@@ -20,6 +20,9 @@ class _MatrixFactorization_Cython(BaseMatrixFactorizationRecommender, Incrementa
 
     RECOMMENDER_NAME = "MatrixFactorization_Cython_Recommender"
 
+    # The Cython epochs hold the GIL
+    VALIDATION_ASYNC_IN_PROCESS = True
+
 
     def __init__(self, URM_train, URM_impressions = None,
                  verbose = True, algorithm_name = "MF_BPR"):
@@ -151,11 +154,26 @@ class _MatrixFactorization_Cython(BaseMatrixFactorizationRecommender, Incrementa
             self.GLOBAL_bias_best = self.GLOBAL_bias
 
 
+    def _get_validation_snapshot(self):
+        # The snapshot is evaluated in a child process and needs only the factors, the Cython object is not picklable
+        snapshot = self._copy_model_for_validation()
+        snapshot.cythonEpoch = None
+        return snapshot
+
     def _run_epoch(self, num_epoch):
        self.cythonEpoch.epochIteration_Cython()
 
 
 
+    def _fold_in_user_factors(self, URM_users):
+
+        # BPR learns the factors with a ranking loss, which the least squares fold-in does not approximate
+        assert self.algorithm_name != "MF_BPR", "{}: Fold-in of users is not supported for models trained with BPR".format(self.RECOMMENDER_NAME)
+
+        return super(_MatrixFactorization_Cython, self)._fold_in_user_factors(URM_users)
+
+
+
 
 class MatrixFactorization_BPR_Cython(_MatrixFactorization_Cython):
     """
@@ -9,6 +9,9 @@ Created on 23/03/2019
 from Recommenders.BaseMatrixFactorizationRecommender import BaseMatrixFactorizationRecommender
 from Recommenders.Incremental_Training_Early_Stopping import Incremental_Training_Early_Stopping
 from Recommenders.Recommender_utils import check_matrix
+from concurrent.futures import ThreadPoolExecutor
+from threadpoolctl import threadpool_limits
+import multiprocessing
 import numpy as np
 
 
@@ -45,6 +48,8 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
             reg = 1e-3,
             init_mean=0.0,
             init_std=0.1,
+            n_workers=None,
+            batch_max_values=2**22,
             **earlystopping_kwargs):
         """
 
@@ -56,6 +61,10 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
         :param epsilon: epsilon used in log scaling only
         :param init_mean: mean used to initialize the latent factors
         :param init_std: standard deviation used to initialize the latent factors
+        :param n_workers: number of threads solving the batches of rows of each epoch, if None the number of cpus is used.
+                                    With more than one thread the BLAS of each thread is limited to a single thread
+        :param batch_max_values: maximum number of values of the padded latent factors of a batch of rows,
+                                    |rows| x |longest profile| x |n_factors|
         :return:
         """
 
@@ -67,12 +76,15 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
         self.alpha = alpha
         self.epsilon = epsilon
         self.reg = reg
+        self.confidence_scaling = confidence_scaling
+        self.n_workers = multiprocessing.cpu_count() if n_workers is None else n_workers
+        self.batch_max_values = batch_max_values
 
         self.USER_factors = self._init_factors(self.n_users, False)  # don't need values, will compute them
         self.ITEM_factors = self._init_factors(self.n_items)
 
 
-        self._build_confidence_matrix(confidence_scaling)
+        self._build_confidence_matrix()
 
 
         warm_user_mask = np.ediff1d(self.URM_train.indptr) > 0
@@ -81,7 +93,10 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
         self.warm_users = np.arange(0, self.n_users, dtype=np.int32)[warm_user_mask]
         self.warm_items = np.arange(0, self.n_items, dtype=np.int32)[warm_item_mask]
 
-        self.regularization_diagonal = np.diag(self.reg * np.ones(self.num_factors))
+        self.regularization_diagonal = np.diag(self.reg * np.ones(self.num_factors, dtype=np.float32))
+
+        self.warm_users_batches = self._get_row_batches(self.C.indptr, self.warm_users)
+        self.warm_items_batches = self._get_row_batches(self.C_csc.indptr, self.warm_items)
 
         self._update_best_model()
 
@@ -96,28 +111,33 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
 
 
 
-    def _build_confidence_matrix(self, confidence_scaling):
+    def _build_confidence_matrix(self):
 
-        if confidence_scaling == 'linear':
-            self.C = self._linear_scaling_confidence()
-        else:
-            self.C = self._log_scaling_confidence()
+        self.C = self._get_confidence_matrix(self.URM_train)
 
         self.C_csc= check_matrix(self.C.copy(), format="csc", dtype = np.float32)
 
 
 
 
-    def _linear_scaling_confidence(self):
+    def _get_confidence_matrix(self, URM):
+
+        if self.confidence_scaling == 'linear':
+            return self._linear_scaling_confidence(URM)
+        else:
+            return self._log_scaling_confidence(URM)
+
+
+    def _linear_scaling_confidence(self, URM):
 
-        C = check_matrix(self.URM_train, format="csr", dtype = np.float32)
+        C = check_matrix(URM, format="csr", dtype = np.float32)
         C.data = 1.0 + self.alpha*C.data
 
         return C
 
-    def _log_scaling_confidence(self):
+    def _log_scaling_confidence(self, URM):
 
-        C = check_matrix(self.URM_train, format="csr", dtype = np.float32)
+        C = check_matrix(URM, format="csr", dtype = np.float32)
         C.data = 1.0 + self.alpha * np.log(1.0 + C.data / self.epsilon)
 
         return C
@@ -133,6 +153,9 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
         self.USER_factors_best = self.USER_factors.copy()
         self.ITEM_factors_best = self.ITEM_factors.copy()
 
+    def _get_validation_snapshot(self):
+        return self._copy_model_for_validation()
+
 
     def _run_epoch(self, num_epoch):
 
@@ -140,30 +163,158 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
         # VV = n_factors x n_factors
         VV = self.ITEM_factors.T.dot(self.ITEM_factors)
 
-        for user_id in self.warm_users:
-            # get (positive i.e. non-zero scored) items for user
-
-            start_pos = self.C.indptr[user_id]
-            end_pos = self.C.indptr[user_id + 1]
-
-            user_profile = self.C.indices[start_pos:end_pos]
-            user_confidence = self.C.data[start_pos:end_pos]
-
-            self.USER_factors[user_id, :] = self._update_row(user_profile, user_confidence, self.ITEM_factors, VV)
+        self._update_rows(self.USER_factors, self.warm_users_batches, self.C, self.ITEM_factors, VV)
 
         # fit item factors
         # UU = n_factors x n_factors
         UU = self.USER_factors.T.dot(self.USER_factors)
 
-        for item_id in self.warm_items:
+        self._update_rows(self.ITEM_factors, self.warm_items_batches, self.C_csc, self.USER_factors, UU)
+
+
+
+    def _get_row_batches(self, indptr, rows):
+        """
+        Groups the rows in batches of rows with a similar number of interactions, so that they can be padded to the
+        same length with few padding values. Each batch has at most batch_max_values padded latent factors, unless it
+        contains a single row
+        :param indptr:  indptr of the compressed matrix in which rows are the users or items to group
+        :param rows:
+        :return: list of arrays of rows
+        """
+
+        profile_length = indptr[rows + 1] - indptr[rows]
+
+        sorting = np.argsort(profile_length, kind="stable")
+        rows = rows[sorting]
+        profile_length = profile_length[sorting]
+
+        row_batches = []
+        batch_start = 0
+
+        # The rows are sorted by length, so the padded values of a batch are |rows| x |length of the last row| x |n_factors|,
+        # which does not decrease while the batch grows
+        while batch_start < len(rows):
+            max_rows = max(1, self.batch_max_values // max(1, profile_length[batch_start] * self.num_factors))
+            batch_length = profile_length[batch_start:batch_start + max_rows]
+
+            padded_values = np.arange(1, len(batch_length) + 1) * batch_length * self.num_factors
+            batch_end = batch_start + max(1, np.searchsorted(padded_values, self.batch_max_values, side="right"))
+
+            row_batches.append(rows[batch_start:batch_end])
+            batch_start = batch_end
+
+        return row_batches
+
+
+
+    def _update_rows(self, factors, row_batches, C, Y, YtY):
+        """
+        Updates the latent factors of all the rows of the batches, each batch is solved at once and the batches are
+        solved by a pool of threads, since the matrix products and solvers release the GIL.
+        The BLAS is limited to one thread while the pool runs, otherwise each thread would start as many BLAS threads
+        as the cpus and oversubscribe them
+        :param factors:     latent factors to update, |n_rows|x|n_factors|
+        :param row_batches:
+        :param C:           confidence matrix, compressed along the rows
+        :param Y:           latent factors of the interactions, |n_columns|x|n_factors|
+        :param YtY:         |n_factors|x|n_factors|
+        """
+
+        def _update_batch(rows):
+            factors[rows, :] = self._update_rows_batch(rows, C, Y, YtY)
+
+        if self.n_workers <= 1:
+            for rows in row_batches:
+                _update_batch(rows)
+            return
+
+        with threadpool_limits(limits=1, user_api="blas"), ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            # Consume the iterator to raise the exceptions of the threads
+            list(executor.map(_update_batch, row_batches))
+
+
+
+    def _update_rows_batch(self, rows, C, Y, YtY):
+        """
+        Update latent factors for a batch of users or items, with the same rule of _update_row.
+        The profiles of the rows are padded to the same length with zero confidence, so that
+        (YtY + Yt*(Cu-I)*Y + reg*I) and Yt*Cu*p(u) are computed for all the rows with batched products and all the
+        systems are solved at once
+        :return: |rows|x|n_factors|
+        """
+
+        start_pos = C.indptr[rows]
+        profile_length = C.indptr[rows + 1] - start_pos
+        max_profile_length = profile_length.max()
+
+        # position of each interaction in the padded batch, rows x max_profile_length
+        padded_mask = np.arange(max_profile_length) < profile_length[:, None]
+        interaction_pos = (start_pos[:, None] + np.arange(max_profile_length))[padded_mask]
+
+        Y_interactions = np.zeros((len(rows), max_profile_length, self.num_factors), dtype=Y.dtype)
+        Y_interactions[padded_mask] = Y[C.indices[interaction_pos], :]
+
+        interaction_confidence = np.zeros((len(rows), max_profile_length), dtype=Y.dtype)
+        interaction_confidence[padded_mask] = C.data[interaction_pos]
+
+        # Padded values have zero confidence, so they must not be reduced by 1
+        interaction_confidence_minus_1 = np.zeros_like(interaction_confidence)
+        interaction_confidence_minus_1[padded_mask] = C.data[interaction_pos] - 1
+
+        Y_interactions_T = np.swapaxes(Y_interactions, 1, 2)
+
+        A = np.matmul(Y_interactions_T * interaction_confidence_minus_1[:, None, :], Y_interactions)
+        B = YtY + A + self.regularization_diagonal
+
+        b = np.matmul(Y_interactions_T, interaction_confidence[:, :, None])
+
+        return np.linalg.solve(B, b)[:, :, 0]
+
+
+
+    def _fold_in_user_factors(self, URM_users):
+        """
+        Computes the latent factors of the users with the same update of an epoch, using the trained ITEM_factors
+        :param URM_users:   sparse matrix |users|x|n_items|
+        :return:            |users|x|n_factors|
+        """
+
+        assert hasattr(self, "confidence_scaling"), \
+            "{}: Fold-in of users requires the confidence hyperparameters, which models saved before they were persisted do not have. Retrain and save the model again".format(self.RECOMMENDER_NAME)
+
+        C = self._get_confidence_matrix(URM_users.copy())
+        rows = np.arange(C.shape[0], dtype=np.int32)
+
+        USER_factors = np.zeros((C.shape[0], self.num_factors), dtype=self.ITEM_factors.dtype)
+        VV = self.ITEM_factors.T.dot(self.ITEM_factors)
+
+        self._update_rows(USER_factors, self._get_row_batches(C.indptr, rows), C, self.ITEM_factors, VV)
+
+        return USER_factors
+
+
+
+    def _get_fold_in_hyperparameters(self):
+        return {"num_factors": self.num_factors,
+                "confidence_scaling": self.confidence_scaling,
+                "alpha": self.alpha,
+                "epsilon": self.epsilon,
+                "reg": self.reg,
+                "batch_max_values": self.batch_max_values,
+                }
+
+
 
-            start_pos = self.C_csc.indptr[item_id]
-            end_pos = self.C_csc.indptr[item_id + 1]
+    def load_model(self, folder_path, file_name = None):
+        super(IALSRecommender, self).load_model(folder_path, file_name = file_name)
 
-            item_profile = self.C_csc.indices[start_pos:end_pos]
-            item_confidence = self.C_csc.data[start_pos:end_pos]
+        # Attributes derived from the saved hyperparameters, which are used to fold in users
+        if hasattr(self, "reg"):
+            self.regularization_diagonal = np.diag(self.reg * np.ones(self.num_factors, dtype=np.float32))
 
-            self.ITEM_factors[item_id, :] = self._update_row(item_profile, item_confidence, self.USER_factors, UU)
+        # Same default of fit, with the BLAS limited to one thread per worker
+        self.n_workers = multiprocessing.cpu_count()
 
 
 
@@ -204,10 +355,10 @@ class IALSRecommender(BaseMatrixFactorizationRecommender, Incremental_Training_E
     def _init_factors(self, num_factors, assign_values=True):
 
         if assign_values:
-            return self.num_factors**-0.5*np.random.random_sample((num_factors, self.num_factors))
+            return (self.num_factors**-0.5*np.random.random_sample((num_factors, self.num_factors))).astype(np.float32)
 
         else:
-            return np.empty((num_factors, self.num_factors))
+            return np.zeros((num_factors, self.num_factors), dtype=np.float32)
 
 
 
@@ -8,7 +8,8 @@ Created on 14/06/18
 
 from Recommenders.BaseMatrixFactorizationRecommender import BaseMatrixFactorizationRecommender
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
-from sklearn.decomposition import NMF
+from sklearn.decomposition import NMF, non_negative_factorization
+import numpy as np
 import time
 
 
@@ -73,4 +74,22 @@ class NMFRecommender(BaseMatrixFactorizationRecommender):
         self.USER_factors = nmf_solver.transform(self.URM_train)
 
         new_time_value, new_time_unit = seconds_to_biggest_unit(time.time()-start_time)
-        self._print("Computing NMF decomposition... done in {:.2f} {}".format( new_time_value, new_time_unit))
\ No newline at end of file
+        self._print("Computing NMF decomposition... done in {:.2f} {}".format( new_time_value, new_time_unit))
+
+
+
+    def _fold_in_user_factors(self, URM_users):
+        """
+        Computes the non-negative latent factors of the users keeping the trained ITEM_factors fixed
+        :param URM_users:   sparse matrix |users|x|n_items|
+        :return:            |users|x|n_factors|
+        """
+
+        USER_factors, _, _ = non_negative_factorization(URM_users,
+                                                        H = self.ITEM_factors.T.astype(URM_users.dtype),
+                                                        n_components = self.ITEM_factors.shape[1],
+                                                        update_H = False,
+                                                        solver = "cd",
+                                                        max_iter = 500)
+
+        return USER_factors
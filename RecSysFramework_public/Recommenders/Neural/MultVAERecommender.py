@@ -20,7 +20,6 @@ from Recommenders.Neural.architecture_utils import generate_autoencoder_architec
 from Recommenders.BaseRecommender import BaseRecommender
 from Recommenders.BaseTempFolder import BaseTempFolder
 from Recommenders.Incremental_Training_Early_Stopping import Incremental_Training_Early_Stopping
-from Recommenders.DataIO import DataIO
 
 
 
@@ -422,7 +421,7 @@ class MultVAERecommender(BaseRecommender, Incremental_Training_Early_Stopping, B
             # "chkpt_dir": self.chkpt_dir,
         }
 
-        dataIO = DataIO(folder_path=folder_path + file_name + "/")
+        dataIO = self._get_DataIO(folder_path=folder_path + file_name + "/")
         dataIO.save_data(file_name="fit_attributes", data_dict_to_save = data_dict_to_save)
 
         # Create a zip folder containing fit_attributes and saved session
@@ -463,7 +462,7 @@ class MultVAERecommender(BaseRecommender, Incremental_Training_Early_Stopping, B
                                   folder_path + file_name + "/",
                                   "zip")
 
-        dataIO = DataIO(folder_path=folder_path + file_name + "/")
+        dataIO = self._get_DataIO(folder_path=folder_path + file_name + "/")
         data_dict = dataIO.load_data(file_name="fit_attributes")
 
         for attrib_name in data_dict.keys():
@@ -8,7 +8,6 @@
 import numpy as np
 from Recommenders.BaseRecommender import BaseRecommender
 from Recommenders.Recommender_utils import check_matrix
-from Recommenders.DataIO import DataIO
 
 
 class TopPop(BaseRecommender):
@@ -52,7 +51,7 @@ class TopPop(BaseRecommender):
 
         data_dict_to_save = {"item_pop": self.item_pop}
 
-        dataIO = DataIO(folder_path=folder_path)
+        dataIO = self._get_DataIO(folder_path=folder_path)
         dataIO.save_data(file_name=file_name, data_dict_to_save = data_dict_to_save)
 
         self._print("Saving complete")
@@ -141,7 +140,7 @@ class GlobalEffects(BaseRecommender):
 
         data_dict_to_save = {"item_bias": self.item_bias}
 
-        dataIO = DataIO(folder_path=folder_path)
+        dataIO = self._get_DataIO(folder_path=folder_path)
         dataIO.save_data(file_name=file_name, data_dict_to_save = data_dict_to_save)
 
         self._print("Saving complete")
@@ -186,7 +185,7 @@ class Random(BaseRecommender):
 
         data_dict_to_save = {}
 
-        dataIO = DataIO(folder_path=folder_path)
+        dataIO = self._get_DataIO(folder_path=folder_path)
         dataIO.save_data(file_name=file_name, data_dict_to_save = data_dict_to_save)
 
         self._print("Saving complete")
@@ -51,6 +51,9 @@ class SLIM_BPR_Cython(BaseItemSimilarityMatrixRecommender, Incremental_Training_
 
     RECOMMENDER_NAME = "SLIM_BPR_Recommender"
 
+    # The Cython epochs hold the GIL
+    VALIDATION_ASYNC_IN_PROCESS = True
+
 
     def __init__(self, URM_train,
                  verbose = True,
@@ -169,6 +172,12 @@ class SLIM_BPR_Cython(BaseItemSimilarityMatrixRecommender, Incremental_Training_
     def _update_best_model(self):
         self.S_best = self.S_incremental.copy()
 
+    def _get_validation_snapshot(self):
+        # The snapshot is evaluated in a child process and needs only W_sparse, the Cython object is not picklable
+        snapshot = self._copy_model_for_validation()
+        snapshot.cythonEpoch = None
+        return snapshot
+
     def _run_epoch(self, num_epoch):
        self.cythonEpoch.epochIteration_Cython()
 
@@ -423,7 +423,7 @@ class NegHOSLIMRecommender(BaseItemSimilarityMatrixRecommender, Incremental_Trai
                              "threshold": self.threshold,
                             }
 
-        dataIO = DataIO(folder_path=folder_path)
+        dataIO = self._get_DataIO(folder_path=folder_path)
         dataIO.save_data(file_name=file_name, data_dict_to_save = data_dict_to_save)
 
         self._print("Saving complete")
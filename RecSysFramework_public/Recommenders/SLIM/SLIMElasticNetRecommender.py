@@ -153,6 +153,14 @@ class SLIMElasticNetRecommender(BaseItemSimilarityMatrixRecommender):
 
 from multiprocessing import Pool, cpu_count, shared_memory
 from functools import partial
+import os, tempfile
+
+try:
+    # Private coordinate descent solver of sklearn, if it is not available the ElasticNets are solved by sklearn
+    # ElasticNet on the URM, see MultiThreadSLIM_SLIMElasticNetRecommender.fit
+    from sklearn.linear_model._cd_fast import enet_coordinate_descent_gram
+except ImportError:
+    enet_coordinate_descent_gram = None
 
 
 def create_shared_memory(a):
@@ -162,10 +170,8 @@ def create_shared_memory(a):
     return shm
 
 
-@ignore_warnings(category=ConvergenceWarning)
-def _partial_fit(items, topK, alpha, l1_ratio, urm_shape, positive_only=True, shm_names=None, shm_shapes=None, shm_dtypes=None):
-
-    model = ElasticNet(
+def _get_ElasticNet(alpha, l1_ratio, positive_only):
+    return ElasticNet(
         alpha=alpha,
         l1_ratio=l1_ratio,
         positive=positive_only,
@@ -177,47 +183,221 @@ def _partial_fit(items, topK, alpha, l1_ratio, urm_shape, positive_only=True, sh
         tol=1e-4
     )
 
+
+def _attach_URM(shm_names, shm_shapes, shm_dtypes, urm_shape):
+    """
+    Attaches to the shared csc URM, whose data is copied so the columns set to zero are private
+    :return: the URM and the shared memory objects, which must be closed after the URM is released
+    """
+
     indptr_shm = shared_memory.SharedMemory(name=shm_names[0], create=False)
     indices_shm = shared_memory.SharedMemory(name=shm_names[1], create=False)
     data_shm = shared_memory.SharedMemory(name=shm_names[2], create=False)
 
+    # The columns are set to zero in place during the fit, so only the data is private to this process
     X_j = sps.csc_matrix((
             np.ndarray(shm_shapes[2], dtype=shm_dtypes[2], buffer=data_shm.buf).copy(),
             np.ndarray(shm_shapes[1], dtype=shm_dtypes[1], buffer=indices_shm.buf),
             np.ndarray(shm_shapes[0], dtype=shm_dtypes[0], buffer=indptr_shm.buf),
         ), shape=urm_shape)
 
-    values, rows, cols = [], [], []
+    return X_j, [indptr_shm, indices_shm, data_shm]
 
-    for currentItem in items:
 
-        y = X_j[:, currentItem].toarray()
+def _fit_item_sklearn(model, X_j, currentItem):
+    """
+    Fits the ElasticNet of an item with sklearn, setting its column of X_j to zero during the fit
+    :return: indices and values of the non-zero coefficients
+    """
+
+    y = X_j[:, currentItem].toarray()
+
+    backup = X_j.data[X_j.indptr[currentItem]:X_j.indptr[currentItem + 1]].copy()
+    X_j.data[X_j.indptr[currentItem]:X_j.indptr[currentItem + 1]] = 0.0
 
-        backup = X_j.data[X_j.indptr[currentItem]:X_j.indptr[currentItem + 1]]
-        X_j.data[X_j.indptr[currentItem]:X_j.indptr[currentItem + 1]] = 0.0
+    model.fit(X_j, y)
 
-        model.fit(X_j, y)
+    X_j.data[X_j.indptr[currentItem]:X_j.indptr[currentItem + 1]] = backup
 
-        nonzero_model_coef_index = model.sparse_coef_.indices
-        nonzero_model_coef_value = model.sparse_coef_.data
+    return model.sparse_coef_.indices, model.sparse_coef_.data
 
-        local_topK = min(len(nonzero_model_coef_value) - 1, topK)
 
+def _write_topK_coefficients(values, rows, currentItem, topK, nonzero_model_coef_index, nonzero_model_coef_value):
+    """
+    Writes the topK coefficients of an item in the output buffers, in the slots item*topK to (item+1)*topK
+    """
+
+    local_topK = min(len(nonzero_model_coef_value) - 1, topK)
+
+    if local_topK > 0:
         relevant_items_partition = (-nonzero_model_coef_value).argpartition(local_topK)[:local_topK]
         relevant_items_partition_sorting = np.argsort(-nonzero_model_coef_value[relevant_items_partition])
         ranking = relevant_items_partition[relevant_items_partition_sorting]
 
-        values.extend(nonzero_model_coef_value[ranking])
-        rows.extend(nonzero_model_coef_index[ranking])
-        cols.extend([currentItem] * len(ranking))
+        values[currentItem * topK:currentItem * topK + local_topK] = nonzero_model_coef_value[ranking]
+        rows[currentItem * topK:currentItem * topK + local_topK] = nonzero_model_coef_index[ranking]
+
+
+@ignore_warnings(category=ConvergenceWarning)
+def _partial_fit(items, topK, alpha, l1_ratio, urm_shape, positive_only=True, shm_names=None, shm_shapes=None, shm_dtypes=None,
+                 output_shm_names=None):
+    """
+    Fits the ElasticNet models of the given items and writes the topK coefficients of each item in the shared output
+    buffers, in the slots item*topK to (item+1)*topK
+    :return: number of items processed
+    """
+
+    model = _get_ElasticNet(alpha, l1_ratio, positive_only)
+
+    X_j, urm_shm_list = _attach_URM(shm_names, shm_shapes, shm_dtypes, urm_shape)
+
+    values_shm = shared_memory.SharedMemory(name=output_shm_names[0], create=False)
+    rows_shm = shared_memory.SharedMemory(name=output_shm_names[1], create=False)
+
+    values = np.ndarray(urm_shape[1] * topK, dtype=np.float32, buffer=values_shm.buf)
+    rows = np.ndarray(urm_shape[1] * topK, dtype=np.int32, buffer=rows_shm.buf)
+
+    for currentItem in items:
+
+        nonzero_model_coef_index, nonzero_model_coef_value = _fit_item_sklearn(model, X_j, currentItem)
+
+        _write_topK_coefficients(values, rows, currentItem, topK, nonzero_model_coef_index, nonzero_model_coef_value)
+
+    # The arrays must be released before closing the shared memory they point to
+    del X_j, values, rows
+
+    for shm in urm_shm_list + [values_shm, rows_shm]:
+        shm.close()
+
+    return len(items)
+
+
+
+
+@ignore_warnings(category=ConvergenceWarning)
+def _partial_fit_gram(items_and_warm_start, topK, alpha, l1_ratio, n_items, urm_shape, positive_only=True, gram_shm_names=None,
+                      gram_shm_shapes=None, gram_shm_dtypes=None, shm_names=None, shm_shapes=None, shm_dtypes=None,
+                      output_shm_names=None, max_iter=100, tol=1e-4, gram_block_size=2**24):
+    """
+    Solves the ElasticNet of the given items with coordinate descent on the shared item-item Gram matrix X^T X,
+    the objective is the same as the one of sklearn ElasticNet.
+
+    The coefficients of an item can be non-zero only for the items it co-occurs with, or that violate the optimality
+    conditions, so each ElasticNet is solved on the dense Gram of this working set, which is enlarged until no other
+    item violates the optimality conditions. The item itself is never part of the working set.
+    If the dense Gram of the working set has more than gram_block_size values, the ElasticNet of the item is solved
+    by sklearn on the shared URM instead, so the memory of each worker is bounded.
+
+    Writes the topK coefficients of each item in the shared output buffers, in the slots item*topK to (item+1)*topK
+    :param items_and_warm_start:    tuple of the items and of the csc n_items x len(items) initial coefficients,
+                                    None to start from zero
+    :return: number of items processed
+    """
+
+    items, W_warm_start = items_and_warm_start
+
+    # The l1 and l2 penalties are multiplied by n_samples as sklearn does
+    l1_reg = alpha * l1_ratio * urm_shape[0]
+    l2_reg = alpha * (1.0 - l1_ratio) * urm_shape[0]
+    max_working_set_size = int(np.sqrt(gram_block_size))
+
+    indptr_shm = shared_memory.SharedMemory(name=gram_shm_names[0], create=False)
+    indices_shm = shared_memory.SharedMemory(name=gram_shm_names[1], create=False)
+    data_shm = shared_memory.SharedMemory(name=gram_shm_names[2], create=False)
+
+    values_shm = shared_memory.SharedMemory(name=output_shm_names[0], create=False)
+    rows_shm = shared_memory.SharedMemory(name=output_shm_names[1], create=False)
+
+    # The Gram is symmetric, so its rows are also its columns
+    gram = sps.csr_matrix((
+            np.ndarray(gram_shm_shapes[2], dtype=gram_shm_dtypes[2], buffer=data_shm.buf),
+            np.ndarray(gram_shm_shapes[1], dtype=gram_shm_dtypes[1], buffer=indices_shm.buf),
+            np.ndarray(gram_shm_shapes[0], dtype=gram_shm_dtypes[0], buffer=indptr_shm.buf),
+        ), shape=(n_items, n_items))
+
+    values = np.ndarray(n_items * topK, dtype=np.float32, buffer=values_shm.buf)
+    rows = np.ndarray(n_items * topK, dtype=np.int32, buffer=rows_shm.buf)
+
+    # The URM is attached only if an item has a working set too large for its dense Gram
+    X_j, urm_shm_list = None, []
+    model = _get_ElasticNet(alpha, l1_ratio, positive_only)
+
+    rng = np.random.RandomState()
+
+    for item_index, currentItem in enumerate(items):
+
+        # q = X^T y, the column of the item in the Gram
+        q = gram[currentItem].toarray().ravel()
+
+        # The solver uses y only for its norm, which is the diagonal of the Gram
+        y_norm = np.array([np.sqrt(q[currentItem])], dtype=np.float32)
+        q[currentItem] = 0.0
 
-        X_j.data[X_j.indptr[currentItem]:X_j.indptr[currentItem + 1]] = backup
+        w = np.zeros(n_items, dtype=np.float32)
+        if W_warm_start is not None:
+            W_warm_start[:, item_index].toarray(out=w.reshape((-1, 1)))
+            w[currentItem] = 0.0
 
-    indptr_shm.close()
-    indices_shm.close()
-    data_shm.close()
+        working_set = np.union1d(np.flatnonzero(q), np.flatnonzero(w))
+        is_in_working_set = np.zeros(n_items, dtype=np.bool_)
+        is_in_working_set[working_set] = True
 
-    return values, rows, cols
+        while 0 < len(working_set) <= max_working_set_size:
+
+            # Dense Gram of the working set, built from its rows keeping only the columns in the working set
+            # The rows are densified a block at a time, each block has about gram_block_size values
+            gram_rows = gram[working_set]
+            gram_working_set = np.empty((len(working_set), len(working_set)), dtype=np.float32)
+
+            gram_block_rows = max(1, gram_block_size // n_items)
+
+            for start_row in range(0, len(working_set), gram_block_rows):
+                end_row = min(start_row + gram_block_rows, len(working_set))
+                gram_working_set[start_row:end_row] = gram_rows[start_row:end_row].toarray()[:, working_set]
+
+            w_working_set = np.ascontiguousarray(w[working_set])
+
+            w_working_set, _, _, _ = enet_coordinate_descent_gram(w_working_set, l1_reg, l2_reg, gram_working_set,
+                                                                  np.ascontiguousarray(q[working_set]), y_norm,
+                                                                  max_iter, tol, rng, True, positive_only)
+            w[working_set] = w_working_set
+
+            # The coefficients outside the working set are zero, they are optimal unless |q - X^T X w| > l1_reg
+            # Since q is zero outside the working set, this depends only on X^T X w
+            correlation = -gram_rows.T.dot(w_working_set)
+            correlation[is_in_working_set] = 0.0
+            correlation[currentItem] = 0.0
+
+            if not positive_only:
+                correlation = np.abs(correlation)
+
+            violating_items = np.flatnonzero(correlation > l1_reg)
+
+            if len(violating_items) == 0:
+                break
+
+            working_set = np.union1d(working_set, violating_items)
+            is_in_working_set[violating_items] = True
+
+        if len(working_set) > max_working_set_size:
+            if X_j is None:
+                X_j, urm_shm_list = _attach_URM(shm_names, shm_shapes, shm_dtypes, urm_shape)
+
+            nonzero_model_coef_index, nonzero_model_coef_value = _fit_item_sklearn(model, X_j, currentItem)
+
+        else:
+            nonzero_model_coef_index = np.flatnonzero(w)
+            nonzero_model_coef_value = w[nonzero_model_coef_index]
+
+        _write_topK_coefficients(values, rows, currentItem, topK, nonzero_model_coef_index, nonzero_model_coef_value)
+
+    # The arrays must be released before closing the shared memory they point to
+    del gram, X_j, values, rows
+
+    for shm in [indptr_shm, indices_shm, data_shm, values_shm, rows_shm] + urm_shm_list:
+        shm.close()
+
+    return len(items)
 
 
 
@@ -225,11 +405,26 @@ def _partial_fit(items, topK, alpha, l1_ratio, urm_shape, positive_only=True, sh
 class MultiThreadSLIM_SLIMElasticNetRecommender(SLIMElasticNetRecommender):
 
     def fit(self, alpha=1.0, l1_ratio=0.1, positive_only=True, topK=100,
-            verbose=True, workers=int(cpu_count()*0.3)):
+            verbose=True, workers=int(cpu_count()*0.3), precompute_gram=False, warm_start_folder_path=None):
+        """
+        :param precompute_gram:         if True the sparse item-item Gram matrix is computed once and shared by the
+                                        workers, which solve each ElasticNet on it with coordinate descent. The Gram
+                                        of an item whose working set is too large is not densified, its ElasticNet is
+                                        solved by sklearn on the URM. If False each ElasticNet is solved by sklearn
+        :param warm_start_folder_path:  folder shared across fits, e.g., all the fits of a hyperparameter search, also
+                                        when they run in different processes. The coefficients of each fit are saved
+                                        in it and the next fit with precompute_gram starts from them, so fits with
+                                        neighbouring alpha and l1_ratio converge in fewer iterations
+        """
 
         assert l1_ratio>= 0 and l1_ratio<=1, \
             "ElasticNet: l1_ratio must be between 0 and 1, provided value was {}".format(l1_ratio)
 
+        if precompute_gram and enet_coordinate_descent_gram is None:
+            self._print("Coordinate descent solver on the Gram matrix not available in this version of sklearn, "
+                        "ElasticNets will be solved on the URM")
+            precompute_gram = False
+
         self.alpha = alpha
         self.l1_ratio = l1_ratio
         self.positive_only = positive_only
@@ -239,42 +434,128 @@ class MultiThreadSLIM_SLIMElasticNetRecommender(SLIMElasticNetRecommender):
 
         self.URM_train = check_matrix(self.URM_train, 'csc', dtype=np.float32)
 
+        # The URM is also needed with the Gram, to solve the items whose working set is too large
         indptr_shm = create_shared_memory(self.URM_train.indptr)
         indices_shm = create_shared_memory(self.URM_train.indices)
         data_shm = create_shared_memory(self.URM_train.data)
 
-        _pfit = partial(_partial_fit, topK=self.topK, alpha=self.alpha, urm_shape=self.URM_train.shape,
-                        l1_ratio=self.l1_ratio, positive_only=self.positive_only,
-                        shm_names=[indptr_shm.name, indices_shm.name, data_shm.name],
-                        shm_shapes=[self.URM_train.indptr.shape, self.URM_train.indices.shape, self.URM_train.data.shape],
-                        shm_dtypes=[self.URM_train.indptr.dtype, self.URM_train.indices.dtype, self.URM_train.data.dtype])
+        input_shm_list = [indptr_shm, indices_shm, data_shm]
 
-        with Pool(processes=self.workers) as pool:
+        urm_shm_kwargs = dict(
+            shm_names=[indptr_shm.name, indices_shm.name, data_shm.name],
+            shm_shapes=[self.URM_train.indptr.shape, self.URM_train.indices.shape, self.URM_train.data.shape],
+            shm_dtypes=[self.URM_train.indptr.dtype, self.URM_train.indices.dtype, self.URM_train.data.dtype],
+        )
+
+        if precompute_gram:
+            gram = sps.csr_matrix(self.URM_train.T @ self.URM_train, dtype=np.float32)
+            gram.sort_indices()
+
+            gram_shm_list = [create_shared_memory(gram.indptr), create_shared_memory(gram.indices), create_shared_memory(gram.data)]
+            gram_shm_shapes = [gram.indptr.shape, gram.indices.shape, gram.data.shape]
+            gram_shm_dtypes = [gram.indptr.dtype, gram.indices.dtype, gram.data.dtype]
+            del gram
+
+            input_shm_list.extend(gram_shm_list)
+
+        # Workers write the topK coefficients of each item directly in the output buffers, the parent receives
+        # only the number of items processed. Slots of items with less than topK coefficients remain zero
+        values_shm = shared_memory.SharedMemory(create=True, size=self.n_items * self.topK * np.dtype(np.float32).itemsize)
+        rows_shm = shared_memory.SharedMemory(create=True, size=self.n_items * self.topK * np.dtype(np.int32).itemsize)
+
+        values = np.ndarray(self.n_items * self.topK, dtype=np.float32, buffer=values_shm.buf)
+        rows = np.ndarray(self.n_items * self.topK, dtype=np.int32, buffer=rows_shm.buf)
+        values[:] = 0.0
+        rows[:] = 0
+
+        pool_chunksize = 4
+        item_chunksize = 8
 
-            pool_chunksize = 4
-            item_chunksize = 8
+        itemchunks = np.array_split(np.arange(self.n_items), max(1, int(self.n_items / item_chunksize)))
+
+        if precompute_gram:
+            _pfit = partial(_partial_fit_gram, topK=self.topK, alpha=self.alpha, l1_ratio=self.l1_ratio,
+                            n_items=self.n_items, urm_shape=self.URM_train.shape, positive_only=self.positive_only,
+                            gram_shm_names=[shm.name for shm in gram_shm_list],
+                            gram_shm_shapes=gram_shm_shapes, gram_shm_dtypes=gram_shm_dtypes,
+                            output_shm_names=[values_shm.name, rows_shm.name], **urm_shm_kwargs)
+
+            W_warm_start = self._load_warm_start(warm_start_folder_path)
+
+            if W_warm_start is not None:
+                itemchunks = [(items, W_warm_start[:, items]) for items in itemchunks]
+            else:
+                itemchunks = [(items, None) for items in itemchunks]
+
+        else:
+            _pfit = partial(_partial_fit, topK=self.topK, alpha=self.alpha, urm_shape=self.URM_train.shape,
+                            l1_ratio=self.l1_ratio, positive_only=self.positive_only,
+                            output_shm_names=[values_shm.name, rows_shm.name], **urm_shm_kwargs)
+
+        with Pool(processes=self.workers) as pool:
 
-            itemchunks = np.array_split(np.arange(self.n_items), int(self.n_items / item_chunksize))
             if verbose:
                 pbar = tqdm(total=self.n_items)
 
-            # res contains a vector of (values, rows, cols) tuples
-            values, rows, cols = [], [], []
-            for values_, rows_, cols_ in pool.imap_unordered(_pfit, itemchunks, pool_chunksize):
-                values.extend(values_)
-                rows.extend(rows_)
-                cols.extend(cols_)
+            for n_processed_items in pool.imap_unordered(_pfit, itemchunks, pool_chunksize):
                 if verbose:
-                    pbar.update(item_chunksize)
+                    pbar.update(n_processed_items)
 
-        indptr_shm.close()
-        indices_shm.close()
-        data_shm.close()
+        # generate the sparse weight matrix, the constructor copies the data out of the shared buffers
+        cols = np.repeat(np.arange(self.n_items, dtype=np.int32), self.topK)
+        self.W_sparse = sps.csr_matrix((values, (rows, cols)), shape=(self.n_items, self.n_items), dtype=np.float32)
+        self.W_sparse.eliminate_zeros()
 
-        indptr_shm.unlink()
-        indices_shm.unlink()
-        data_shm.unlink()
+        del values, rows
+
+        for shm in input_shm_list + [values_shm, rows_shm]:
+            shm.close()
+            shm.unlink()
+
+        if warm_start_folder_path is not None:
+            self._save_warm_start(warm_start_folder_path)
 
-        # generate the sparse weight matrix
-        self.W_sparse = sps.csr_matrix((values, (rows, cols)), shape=(self.n_items, self.n_items), dtype=np.float32)
         self.URM_train = self.URM_train.tocsr()
+
+
+
+    _WARM_START_FILE_NAME = "SLIMElasticNet_warm_start.npz"
+
+    def _load_warm_start(self, warm_start_folder_path):
+        """
+        :return: the csc coefficients saved in the folder by a previous fit on the same items, None if there are none
+        """
+
+        if warm_start_folder_path is None:
+            return None
+
+        warm_start_file_path = os.path.join(warm_start_folder_path, self._WARM_START_FILE_NAME)
+
+        try:
+            W_warm_start = sps.load_npz(warm_start_file_path)
+        except (OSError, ValueError):
+            return None
+
+        if W_warm_start.shape != (self.n_items, self.n_items):
+            return None
+
+        return sps.csc_matrix(W_warm_start, dtype=np.float32)
+
+
+    def _save_warm_start(self, warm_start_folder_path):
+        """
+        Saves the coefficients in the folder. The file is written under a temporary name and then renamed, so
+        concurrent fits never read a partially written file
+        """
+
+        os.makedirs(warm_start_folder_path, exist_ok=True)
+
+        file_descriptor, temp_file_path = tempfile.mkstemp(suffix=".npz", dir=warm_start_folder_path)
+        os.close(file_descriptor)
+
+        try:
+            sps.save_npz(temp_file_path, self.W_sparse, compressed=False)
+            os.replace(temp_file_path, os.path.join(warm_start_folder_path, self._WARM_START_FILE_NAME))
+        except BaseException:
+            os.remove(temp_file_path)
+            raise
@@ -8,6 +8,8 @@ Created on 23/10/17
 
 import numpy as np
 import time, sys
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 import scipy.sparse as sps
 from Recommenders.Recommender_utils import check_matrix
 from Utils.seconds_to_biggest_unit import seconds_to_biggest_unit
@@ -203,19 +205,112 @@ class Compute_Similarity_Python:
 
 
 
-    def compute_similarity(self, start_col=None, end_col=None, block_size = 100):
+    def _normalize_block_weights(self, this_block_weights, column_index_array, sum_of_squared, sum_of_squared_to_alpha = None,
+                                 sum_of_squared_to_1_minus_alpha = None, denominator_max_values = 2**20):
+        """
+        Divide in place the similarities of the block by the denominator of the selected similarity.
+        The denominators are computed for chunks of the similarity columns, so that at most denominator_max_values
+        of them are allocated at a time instead of a second dense block
+        :param this_block_weights: similarities of the block, one row for each column of the block
+        :param column_index_array: columns of the block
+        """
+
+        this_block_size, n_columns = this_block_weights.shape
+        chunk_size = max(1, denominator_max_values // this_block_size)
+
+        for start_chunk in range(0, n_columns, chunk_size):
+
+            end_chunk = min(start_chunk + chunk_size, n_columns)
+            chunk_weights = this_block_weights[:, start_chunk:end_chunk]
+
+            # Apply normalization and shrinkage, ensure denominator != 0
+            if self.normalize:
+
+                if self.asymmetric_cosine:
+                    denominator = np.outer(sum_of_squared_to_alpha[column_index_array], sum_of_squared_to_1_minus_alpha[start_chunk:end_chunk]) + self.shrink + 1e-6
+                else:
+                    denominator = np.outer(sum_of_squared[column_index_array], sum_of_squared[start_chunk:end_chunk]) + self.shrink + 1e-6
+
+            # Apply the specific denominator for Tanimoto
+            elif self.tanimoto_coefficient:
+                denominator = sum_of_squared[column_index_array][:, None] + sum_of_squared[start_chunk:end_chunk] - chunk_weights + self.shrink + 1e-6
+
+            elif self.dice_coefficient:
+                denominator = sum_of_squared[column_index_array][:, None] + sum_of_squared[start_chunk:end_chunk] + self.shrink + 1e-6
+
+            elif self.tversky_coefficient:
+                denominator = chunk_weights + \
+                              (sum_of_squared[column_index_array][:, None] - chunk_weights)*self.tversky_alpha + \
+                              (sum_of_squared[start_chunk:end_chunk] - chunk_weights)*self.tversky_beta + self.shrink + 1e-6
+
+            chunk_weights /= denominator
+
+
+
+
+    def _compute_block_top_k(self, start_col_block, end_col_block, sum_of_squared, sum_of_squared_to_alpha = None,
+                             sum_of_squared_to_1_minus_alpha = None):
+        """
+        Compute the similarity of the columns in the block and select the TopK for all of them at once
+        :param start_col_block: first column of the block
+        :param end_col_block: column to stop before, end_col_block is excluded
+        :return: top_k_idx, top_k_values arrays of shape (block size, TopK)
+        """
+
+        # All data points for a given item
+        item_data = self.dataMatrix[:, start_col_block:end_col_block]
+        item_data = item_data.toarray()
+
+        # Compute item similarities
+        if self.use_row_weights:
+            this_block_weights = self.dataMatrix_weighted.T.dot(item_data)
+        else:
+            this_block_weights = self.dataMatrix.T.dot(item_data)
+
+        # Each row contains the weights of one column of the block
+        this_block_weights = np.ascontiguousarray(np.asarray(this_block_weights).T)
+        this_block_size = end_col_block - start_col_block
+
+        column_index_array = np.arange(start_col_block, end_col_block)
+        this_block_weights[np.arange(this_block_size), column_index_array] = 0.0
+
+        if self.normalize or self.tanimoto_coefficient or self.dice_coefficient or self.tversky_coefficient:
+            self._normalize_block_weights(this_block_weights, column_index_array, sum_of_squared,
+                                          sum_of_squared_to_alpha = sum_of_squared_to_alpha,
+                                          sum_of_squared_to_1_minus_alpha = sum_of_squared_to_1_minus_alpha)
+
+        # If no normalization or tanimoto is selected, apply only shrink
+        elif self.shrink != 0:
+            this_block_weights /= self.shrink
+
+
+        # Sort indices and select TopK for all the columns of the block
+        # Sorting is done in three steps. Faster then plain np.argsort for higher number of items
+        # - Partition the data to extract the set of relevant items
+        # - Sort only the relevant items
+        # - Get the original item index
+        block_row_index = np.arange(this_block_size)[:, None]
+        relevant_items_partition = (-this_block_weights).argpartition(self.TopK-1, axis=1)[:, 0:self.TopK]
+        relevant_items_partition_sorting = np.argsort(-this_block_weights[block_row_index, relevant_items_partition], axis=1)
+        top_k_idx = relevant_items_partition[block_row_index, relevant_items_partition_sorting]
+
+        return top_k_idx, this_block_weights[block_row_index, top_k_idx]
+
+
+
+
+    def compute_similarity(self, start_col=None, end_col=None, block_size = 100, n_workers = None):
         """
         Compute the similarity for the given dataset
         :param self:
         :param start_col: column to begin with
         :param end_col: column to stop before, end_col is excluded
+        :param n_workers: number of threads computing the blocks of columns, if None the number of cpus is used.
+                            Each thread holds a dense block of n_columns x block_size similarities and at most
+                            2**20 of their denominators
         :return:
         """
 
-        values = []
-        rows = []
-        cols = []
-
         start_time = time.time()
         start_time_print_batch = start_time
         processed_items = 0
@@ -242,6 +337,8 @@ class Compute_Similarity_Python:
         if not (self.tanimoto_coefficient or self.dice_coefficient or self.tversky_coefficient):
             sum_of_squared = np.sqrt(sum_of_squared)
 
+        sum_of_squared_to_alpha = None
+        sum_of_squared_to_1_minus_alpha = None
 
         if self.asymmetric_cosine:
             sum_of_squared_to_alpha = np.power(sum_of_squared + 1e-6, 2 * self.asymmetric_alpha)
@@ -259,106 +356,58 @@ class Compute_Similarity_Python:
         if end_col is not None and end_col>start_col_local and end_col<self.n_columns:
             end_col_local = end_col
 
+        if n_workers is None:
+            n_workers = multiprocessing.cpu_count()
 
 
+        # Preallocate the TopK of every column, the entries of columns with less than TopK non-zero similarities
+        # remain zero and are removed when building the sparse matrix
+        n_columns_local = end_col_local - start_col_local
 
-        start_col_block = start_col_local
+        values = np.zeros(n_columns_local * self.TopK, dtype=np.float32)
+        rows = np.zeros(n_columns_local * self.TopK, dtype=np.int32)
+        cols = np.zeros(n_columns_local * self.TopK, dtype=np.int32)
 
-        this_block_size = 0
 
-        # Compute all similarities for each item using vectorization
-        while start_col_block < end_col_local:
+        def _compute_block(start_col_block):
 
             # Compute block first and last column
             end_col_block = min(start_col_block + block_size, end_col_local)
-            this_block_size = end_col_block-start_col_block
-
-            # All data points for a given item
-            item_data = self.dataMatrix[:, start_col_block:end_col_block]
-            item_data = item_data.toarray()
-
-            # Compute item similarities
-            if self.use_row_weights:
-                this_block_weights = self.dataMatrix_weighted.T.dot(item_data)
-            else:
-                this_block_weights = self.dataMatrix.T.dot(item_data)
-
 
-            for col_index_in_block in range(this_block_size):
+            top_k_idx, top_k_values = self._compute_block_top_k(start_col_block, end_col_block, sum_of_squared,
+                                                                sum_of_squared_to_alpha = sum_of_squared_to_alpha,
+                                                                sum_of_squared_to_1_minus_alpha = sum_of_squared_to_1_minus_alpha)
 
-                if this_block_size == 1:
-                    this_column_weights = this_block_weights.ravel()
-                else:
-                    this_column_weights = this_block_weights[:,col_index_in_block]
-
-
-                columnIndex = col_index_in_block + start_col_block
-                this_column_weights[columnIndex] = 0.0
-
-                # Apply normalization and shrinkage, ensure denominator != 0
-                if self.normalize:
-
-                    if self.asymmetric_cosine:
-                        denominator = sum_of_squared_to_alpha[columnIndex] * sum_of_squared_to_1_minus_alpha + self.shrink + 1e-6
-                    else:
-                        denominator = sum_of_squared[columnIndex] * sum_of_squared + self.shrink + 1e-6
-
-                    this_column_weights = np.multiply(this_column_weights, 1 / denominator)
+            # Blocks write in disjoint slices of the preallocated arrays
+            start_pos = (start_col_block - start_col_local) * self.TopK
+            end_pos = (end_col_block - start_col_local) * self.TopK
 
+            values[start_pos:end_pos] = top_k_values.ravel()
+            rows[start_pos:end_pos] = top_k_idx.ravel()
+            cols[start_pos:end_pos] = np.repeat(np.arange(start_col_block, end_col_block), self.TopK)
 
-                # Apply the specific denominator for Tanimoto
-                elif self.tanimoto_coefficient:
-                    denominator = sum_of_squared[columnIndex] + sum_of_squared - this_column_weights + self.shrink + 1e-6
-                    this_column_weights = np.multiply(this_column_weights, 1 / denominator)
+            return end_col_block - start_col_block
 
-                elif self.dice_coefficient:
-                    denominator = sum_of_squared[columnIndex] + sum_of_squared + self.shrink + 1e-6
-                    this_column_weights = np.multiply(this_column_weights, 1 / denominator)
 
-                elif self.tversky_coefficient:
-                    denominator = this_column_weights + \
-                                  (sum_of_squared[columnIndex] - this_column_weights)*self.tversky_alpha + \
-                                  (sum_of_squared - this_column_weights)*self.tversky_beta + self.shrink + 1e-6
-                    this_column_weights = np.multiply(this_column_weights, 1 / denominator)
+        # The sparse-dense products and the partitions release the GIL, so the blocks are computed by a pool of threads
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
 
-                # If no normalization or tanimoto is selected, apply only shrink
-                elif self.shrink != 0:
-                    this_column_weights = this_column_weights/self.shrink
+            for this_block_size in executor.map(_compute_block, range(start_col_local, end_col_local, block_size)):
 
+                # Add previous block size
+                processed_items += this_block_size
 
+                if time.time() - start_time_print_batch >= 300 or processed_items == n_columns_local:
+                    column_per_sec = processed_items / (time.time() - start_time + 1e-9)
+                    new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
 
-                # Sort indices and select TopK
-                # Sorting is done in three steps. Faster then plain np.argsort for higher number of items
-                # - Partition the data to extract the set of relevant items
-                # - Sort only the relevant items
-                # - Get the original item index
-                relevant_items_partition = (-this_column_weights).argpartition(self.TopK-1)[0:self.TopK]
-                relevant_items_partition_sorting = np.argsort(-this_column_weights[relevant_items_partition])
-                top_k_idx = relevant_items_partition[relevant_items_partition_sorting]
+                    print("Similarity column {} ({:4.1f}%), {:.2f} column/sec. Elapsed time {:.2f} {}".format(
+                        processed_items, processed_items / n_columns_local * 100, column_per_sec, new_time_value, new_time_unit))
 
-                # Incrementally build sparse matrix, do not add zeros
-                notZerosMask = this_column_weights[top_k_idx] != 0.0
-                numNotZeros = np.sum(notZerosMask)
+                    sys.stdout.flush()
+                    sys.stderr.flush()
 
-                values.extend(this_column_weights[top_k_idx][notZerosMask])
-                rows.extend(top_k_idx[notZerosMask])
-                cols.extend(np.ones(numNotZeros) * columnIndex)
-
-            # Add previous block size
-            start_col_block += this_block_size
-            processed_items += this_block_size
-
-            if time.time() - start_time_print_batch >= 300 or end_col_block==end_col_local:
-                column_per_sec = processed_items / (time.time() - start_time + 1e-9)
-                new_time_value, new_time_unit = seconds_to_biggest_unit(time.time() - start_time)
-
-                print("Similarity column {} ({:4.1f}%), {:.2f} column/sec. Elapsed time {:.2f} {}".format(
-                    processed_items, processed_items / (end_col_local - start_col_local) * 100, column_per_sec, new_time_value, new_time_unit))
-
-                sys.stdout.flush()
-                sys.stderr.flush()
-
-                start_time_print_batch = time.time()
+                    start_time_print_batch = time.time()
 
 
         # End while on columns
@@ -367,4 +416,7 @@ class Compute_Similarity_Python:
                                   shape=(self.n_columns, self.n_columns),
                                   dtype=np.float32)
 
-        return W_sparse
\ No newline at end of file
+        # Do not keep zeros
+        W_sparse.eliminate_zeros()
+
+        return W_sparse
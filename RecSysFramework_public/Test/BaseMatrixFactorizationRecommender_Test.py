@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/2026
+
+@author: Anonymous
+"""
+
+import numpy as np
+import scipy.sparse as sps
+import unittest
+
+from Recommenders.Recommender_utils import check_matrix
+
+
+def _get_URM(n_users, n_items, random_seed):
+
+    URM = sps.random(n_users, n_items, density=0.1, format="csr", random_state=random_seed)
+    URM.data = np.random.default_rng(random_seed).integers(1, 6, URM.nnz).astype(np.float64)
+
+    return URM
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_fold_in_users_PureSVD(self):
+
+        from Recommenders.MatrixFactorization.PureSVDRecommender import PureSVDRecommender
+
+        n_users, n_items = 200, 80
+
+        URM_train = _get_URM(n_users, n_items, 42)
+        URM_new_users = _get_URM(30, n_items, 43)
+
+        recommender = PureSVDRecommender(URM_train, verbose=False)
+        recommender.fit(num_factors=10, random_seed=42)
+
+        user_id_array = recommender.fold_in_users(URM_new_users, batch_size=7)
+
+        assert np.array_equal(user_id_array, np.arange(n_users, n_users + 30))
+        assert recommender.n_users == n_users + 30
+        assert recommender.USER_factors.shape == (n_users + 30, 10)
+        # ITEM_factors are orthonormal, so the ridge regression factors are the shrunk projection of the profiles
+        assert np.allclose(recommender.USER_factors[n_users:], URM_new_users.dot(recommender.ITEM_factors) / (1 + recommender.FOLD_IN_L2_REG),
+                           atol=1e-4), "Fold-in factors do not match"
+
+        # Seen items of the new users are removed from the recommendations
+        recommendations = recommender.recommend(user_id_array, cutoff=10)
+
+        for user_index, user_recommendations in enumerate(recommendations):
+            assert len(np.intersect1d(user_recommendations, URM_new_users[user_index].indices)) == 0
+
+        # Appending in several steps must give the same factors and reuse the buffer
+        recommender.fold_in_users(URM_new_users[:3])
+        USER_factors_buffer = recommender._USER_factors_buffer
+        recommender.fold_in_users(URM_new_users[3:4])
+
+        assert recommender._USER_factors_buffer is USER_factors_buffer
+        assert np.allclose(recommender.USER_factors[-4:], recommender.USER_factors[n_users:n_users+4])
+
+        # Replacing the profile of an existing user
+        recommender.fold_in_users(URM_new_users[:2], user_id_array=[5, 9])
+
+        assert recommender.n_users == n_users + 34
+        assert np.allclose(recommender.USER_factors[[5, 9]], recommender.USER_factors[n_users:n_users+2])
+        assert np.array_equal(recommender.URM_train[5].indices, URM_new_users[0].indices)
+        assert np.array_equal(recommender.URM_train[10].indices, URM_train[10].indices)
+
+
+    def test_fold_in_users_IALS(self):
+
+        from Recommenders.MatrixFactorization.IALSRecommender import IALSRecommender
+
+        n_users, n_items = 200, 80
+
+        URM_train = _get_URM(n_users, n_items, 42)
+        URM_new_users = _get_URM(30, n_items, 43)
+
+        recommender = IALSRecommender(URM_train, verbose=False)
+        recommender.fit(epochs=3, num_factors=8, alpha=2.0, reg=1e-2, confidence_scaling="log")
+
+        # The factors of the training users are computed with the same update of the last epoch, which also uses
+        # the item factors before their own update, so the fold-in is only compared with a further user update
+        USER_factors = np.zeros((n_users, 8), dtype=np.float32)
+        recommender._update_rows(USER_factors, recommender.warm_users_batches, recommender.C, recommender.ITEM_factors,
+                                 recommender.ITEM_factors.T.dot(recommender.ITEM_factors))
+
+        fold_in_factors = recommender._fold_in_user_factors(check_matrix(URM_train, 'csr', dtype=np.float32))
+        assert np.allclose(fold_in_factors, USER_factors, atol=1e-4), "Fold-in factors of training users do not match"
+
+        user_id_array = recommender.fold_in_users(URM_new_users)
+        assert np.allclose(recommender.USER_factors[user_id_array], recommender._fold_in_user_factors(check_matrix(URM_new_users, 'csr', dtype=np.float32)))
+
+        scores = recommender._compute_item_score(user_id_array)
+        assert scores.shape == (30, n_items)
+
+
+    def test_fold_in_users_IALS_load_model(self):
+
+        from Recommenders.MatrixFactorization.IALSRecommender import IALSRecommender
+        import shutil, tempfile
+
+        n_users, n_items = 200, 80
+
+        URM_train = _get_URM(n_users, n_items, 42)
+        URM_new_users = _get_URM(30, n_items, 43)
+
+        recommender = IALSRecommender(URM_train, verbose=False)
+        recommender.fit(epochs=3, num_factors=8, alpha=2.0, reg=1e-2, confidence_scaling="log")
+
+        temp_folder_path = tempfile.mkdtemp() + "/"
+
+        try:
+            recommender.save_model(temp_folder_path)
+
+            recommender_loaded = IALSRecommender(URM_train, verbose=False)
+            recommender_loaded.load_model(temp_folder_path)
+
+        finally:
+            shutil.rmtree(temp_folder_path, ignore_errors=True)
+
+        user_id_array = recommender_loaded.fold_in_users(URM_new_users)
+        user_id_array_trained = recommender.fold_in_users(URM_new_users)
+
+        assert np.array_equal(user_id_array, user_id_array_trained)
+        assert np.allclose(recommender_loaded.USER_factors[user_id_array], recommender.USER_factors[user_id_array_trained], atol=1e-5), \
+            "Fold-in factors of the loaded model do not match"
+
+
+    def test_fold_in_users_NMF(self):
+
+        from Recommenders.MatrixFactorization.NMFRecommender import NMFRecommender
+
+        n_users, n_items = 200, 80
+
+        URM_train = _get_URM(n_users, n_items, 42)
+        URM_new_users = _get_URM(30, n_items, 43)
+
+        recommender = NMFRecommender(URM_train, verbose=False)
+        recommender.fit(num_factors=10, random_seed=42)
+
+        user_id_array = recommender.fold_in_users(URM_new_users)
+
+        assert (recommender.USER_factors[user_id_array] >= 0).all()
+        assert recommender._compute_item_score(user_id_array).shape == (30, n_items)
+
+
+if __name__ == '__main__':
+    unittest.main()
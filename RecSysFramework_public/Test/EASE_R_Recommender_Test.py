@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/2026
+
+@author: Anonymous
+"""
+
+import numpy as np
+import scipy.sparse as sps
+import unittest
+
+
+def _compute_EASE_R_dense(URM_train, l2_norm):
+    """
+    Computes the EASE_R model with the general inverse in float64, as a reference for the Cholesky one
+    """
+
+    grahm_matrix = URM_train.T.dot(URM_train).toarray().astype(np.float64)
+
+    diag_indices = np.diag_indices(grahm_matrix.shape[0])
+    grahm_matrix[diag_indices] = np.ediff1d(URM_train.tocsc().indptr) + l2_norm
+
+    P = np.linalg.inv(grahm_matrix)
+    B = P / (-np.diag(P))
+    B[diag_indices] = 0.0
+
+    return B
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_EASE_R_Cholesky_inverse(self):
+
+        from Recommenders.EASE_R.EASE_R_Recommender import EASE_R_Recommender
+
+        n_users, n_items = 500, 120
+
+        URM_train = sps.random(n_users, n_items, density=0.05, format="csr", random_state=42)
+        URM_train.data = np.ones_like(URM_train.data)
+
+        B = _compute_EASE_R_dense(URM_train, l2_norm = 10.0)
+
+        # Small blocks so that the Grahm matrix and its inverse are processed in several blocks
+        for block_max_values in [n_items*7, 2**24]:
+
+            recommender = EASE_R_Recommender(URM_train)
+            recommender.fit(l2_norm = 10.0, verbose = False, block_max_values = block_max_values)
+
+            assert isinstance(recommender.W_sparse, np.ndarray) and recommender.W_sparse.dtype == np.float32
+            assert np.allclose(recommender.W_sparse, B, atol=1e-6), "Cholesky inverse does not match the general one"
+
+
+    def test_EASE_R_topK(self):
+
+        from Recommenders.EASE_R.EASE_R_Recommender import EASE_R_Recommender
+        from Recommenders.Recommender_utils import similarityMatrixTopK
+
+        n_users, n_items, topK = 500, 120, 10
+
+        URM_train = sps.random(n_users, n_items, density=0.05, format="csr", random_state=42)
+        URM_train.data = np.ones_like(URM_train.data)
+
+        recommender = EASE_R_Recommender(URM_train)
+        recommender.fit(l2_norm = 10.0, verbose = False)
+        W_topK = similarityMatrixTopK(recommender.W_sparse, k = topK).toarray()
+
+        for block_max_values in [n_items*7, 2**24]:
+
+            recommender = EASE_R_Recommender(URM_train, sparse_threshold_quota = 1.0)
+            recommender.fit(topK = topK, l2_norm = 10.0, verbose = False, block_max_values = block_max_values)
+
+            assert sps.issparse(recommender.W_sparse)
+            assert np.all(np.ediff1d(recommender.W_sparse.tocsc().indptr) <= topK)
+            assert np.array_equal(recommender.W_sparse.toarray(), W_topK), "TopK selected by blocks does not match similarityMatrixTopK"
+
+
+
+if __name__ == '__main__':
+    unittest.main()
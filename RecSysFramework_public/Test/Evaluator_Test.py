@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/2026
+
+@author: Anonymous
+"""
+
+import numpy as np
+import scipy.sparse as sps
+import unittest
+
+from Recommenders.BaseRecommender import BaseRecommender
+
+
+class _RandomScoresRecommender(BaseRecommender):
+
+    RECOMMENDER_NAME = "RandomScoresRecommender"
+
+    def fit(self, random_seed = 42):
+        self.W_scores = np.random.default_rng(random_seed).random((self.n_users, self.n_items)).astype(np.float32)
+
+    def _compute_item_score(self, user_id_array, items_to_compute = None):
+
+        if items_to_compute is not None:
+            item_scores = - np.ones((len(user_id_array), self.n_items), dtype=np.float32)*np.inf
+            item_scores[:, items_to_compute] = self.W_scores[user_id_array][:, items_to_compute]
+        else:
+            item_scores = self.W_scores[user_id_array].copy()
+
+        return item_scores
+
+
+
+def _compute_metrics_per_user(recommender, URM_test, cutoff):
+    """
+    Computes the metrics one user at a time with the scalar functions, as a reference for the batch ones
+    """
+
+    from Evaluation.metrics import precision, precision_recall_min_denominator, recall, ndcg, arhr_all_hits, \
+        average_precision, average_precision_min_denominator, rr
+
+    results = {"PRECISION": 0.0, "PRECISION_RECALL_MIN_DEN": 0.0, "RECALL": 0.0, "NDCG": 0.0, "ARHR_ALL_HITS": 0.0,
+               "MAP": 0.0, "MAP_MIN_DEN": 0.0, "MRR": 0.0, "HIT_RATE": 0.0}
+    n_users_evaluated = 0
+
+    for test_user in range(URM_test.shape[0]):
+
+        relevant_items = URM_test.indices[URM_test.indptr[test_user]:URM_test.indptr[test_user+1]]
+        relevance = URM_test.data[URM_test.indptr[test_user]:URM_test.indptr[test_user+1]]
+
+        if len(relevant_items) == 0:
+            continue
+
+        recommended_items = np.array(recommender.recommend(test_user, cutoff = cutoff))
+        is_relevant = np.in1d(recommended_items, relevant_items, assume_unique=True)
+
+        results["PRECISION"] += precision(is_relevant)
+        results["PRECISION_RECALL_MIN_DEN"] += precision_recall_min_denominator(is_relevant, len(relevant_items))
+        results["RECALL"] += recall(is_relevant, relevant_items)
+        results["NDCG"] += ndcg(recommended_items, relevant_items, relevance=relevance, at=cutoff)
+        results["ARHR_ALL_HITS"] += arhr_all_hits(is_relevant)
+        results["MAP"] += average_precision(is_relevant)
+        results["MAP_MIN_DEN"] += average_precision_min_denominator(is_relevant, relevant_items)
+        results["MRR"] += rr(is_relevant)
+        results["HIT_RATE"] += is_relevant.any()
+        n_users_evaluated += 1
+
+    return {metric: value/n_users_evaluated for metric, value in results.items()}
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_EvaluatorHoldout_batch_metrics(self):
+
+        from Evaluation.Evaluator import EvaluatorHoldout
+
+        n_users, n_items, cutoff = 300, 50, 10
+
+        URM_all = sps.random(n_users, n_items, density=0.2, format="csr", random_state=42)
+        URM_all.data = np.random.default_rng(42).integers(1, 6, URM_all.nnz).astype(np.float64)
+
+        train_mask = np.random.default_rng(43).random(URM_all.nnz) < 0.8
+        URM_train = sps.csr_matrix((URM_all.data*train_mask, URM_all.indices, URM_all.indptr), shape=URM_all.shape)
+        URM_test = sps.csr_matrix((URM_all.data*np.logical_not(train_mask), URM_all.indices, URM_all.indptr), shape=URM_all.shape)
+        URM_train.eliminate_zeros()
+        URM_test.eliminate_zeros()
+
+        recommender = _RandomScoresRecommender(URM_train, verbose=False)
+        recommender.fit()
+
+        evaluator = EvaluatorHoldout(URM_test, cutoff_list=[5, cutoff], verbose=False)
+        results_df, _ = evaluator.evaluateRecommender(recommender)
+
+        reference = _compute_metrics_per_user(recommender, URM_test, cutoff)
+
+        for metric, value in reference.items():
+            assert np.isclose(value, results_df.loc[cutoff, metric]), "{} batch value {} does not match per user value {}".format(
+                metric, results_df.loc[cutoff, metric], value)
+
+
+    def test_recommend_item_chunks(self):
+
+        from Evaluation.Evaluator import EvaluatorHoldout
+
+        n_users, n_items, cutoff = 200, 57, 10
+
+        URM_all = sps.random(n_users, n_items, density=0.2, format="csr", random_state=42)
+        URM_train = URM_all[:, :]
+        URM_test = sps.random(n_users, n_items, density=0.1, format="csr", random_state=43)
+
+        recommender = _RandomScoresRecommender(URM_train, verbose=False)
+        recommender.fit()
+        recommender.set_items_to_ignore([0, 5, 7])
+
+        user_id_array = np.arange(n_users)
+        items_to_compute = np.arange(0, n_items, 2)
+
+        for item_chunk_size in [1, 8, cutoff, n_items, 2*n_items]:
+            for recommend_kwargs in [{}, {"items_to_compute": items_to_compute}, {"remove_custom_items_flag": True}, {"remove_seen_flag": False}]:
+
+                recommendations = recommender.recommend(user_id_array, cutoff=cutoff, **recommend_kwargs)
+                recommendations_chunks, scores_chunks = recommender.recommend(user_id_array, cutoff=cutoff, item_chunk_size=item_chunk_size,
+                                                                              return_scores=True, **recommend_kwargs)
+
+                assert recommendations == recommendations_chunks, "Recommendations computed with item_chunk_size={} and {} do not match".format(item_chunk_size, recommend_kwargs)
+                assert scores_chunks.shape == (n_users, n_items)
+
+        evaluator = EvaluatorHoldout(URM_test, cutoff_list=[5, cutoff], verbose=False)
+        results_df, _ = evaluator.evaluateRecommender(recommender)
+
+        evaluator = EvaluatorHoldout(URM_test, cutoff_list=[5, cutoff], verbose=False, item_chunk_size=8)
+        results_chunks_df, _ = evaluator.evaluateRecommender(recommender)
+
+        assert np.allclose(results_df.values.astype(np.float64), results_chunks_df.values.astype(np.float64)), "Evaluation with item chunks does not match"
+
+
+    def test_EvaluatorHoldoutParallel(self):
+
+        from Evaluation.Evaluator import EvaluatorHoldout, EvaluatorHoldoutParallel
+
+        n_users, n_items = 500, 80
+
+        URM_train = sps.random(n_users, n_items, density=0.2, format="csr", random_state=42)
+        URM_test = sps.random(n_users, n_items, density=0.1, format="csr", random_state=43)
+
+        recommender = _RandomScoresRecommender(URM_train, verbose=False)
+        recommender.fit()
+
+        evaluator = EvaluatorHoldout(URM_test, cutoff_list=[5, 10], verbose=False, ignore_items=[1, 2])
+        results_df, _ = evaluator.evaluateRecommender(recommender)
+
+        evaluator = EvaluatorHoldoutParallel(URM_test, cutoff_list=[5, 10], verbose=False, ignore_items=[1, 2], n_workers=3)
+        results_parallel_df, _ = evaluator.evaluateRecommender(recommender)
+
+        assert np.allclose(results_df.values.astype(np.float64), results_parallel_df.values.astype(np.float64)), "Parallel evaluation does not match"
+
+
+    def test_EvaluatorHoldoutParallel_daemonic_process(self):
+
+        import multiprocessing
+        from Evaluation.Evaluator import EvaluatorHoldout, EvaluatorHoldoutParallel
+
+        if "fork" not in multiprocessing.get_all_start_methods():
+            self.skipTest("The fork start method is not available")
+
+        n_users, n_items = 200, 50
+
+        URM_train = sps.random(n_users, n_items, density=0.2, format="csr", random_state=42)
+        URM_test = sps.random(n_users, n_items, density=0.1, format="csr", random_state=43)
+
+        recommender = _RandomScoresRecommender(URM_train, verbose=False)
+        recommender.fit()
+
+        evaluator = EvaluatorHoldout(URM_test, cutoff_list=[5], verbose=False)
+        results_df, _ = evaluator.evaluateRecommender(recommender)
+
+        # Daemonic processes, e.g., Dask workers, cannot create the pool and must evaluate the users sequentially
+        context = multiprocessing.get_context("fork")
+        results_queue = context.Queue()
+
+        def _evaluate_in_daemonic_process():
+            evaluator_parallel = EvaluatorHoldoutParallel(URM_test, cutoff_list=[5], verbose=False, n_workers=3)
+            results_parallel_df, _ = evaluator_parallel.evaluateRecommender(recommender)
+            results_queue.put(results_parallel_df.values.astype(np.float64))
+
+        process = context.Process(target=_evaluate_in_daemonic_process, daemon=True)
+        process.start()
+        results_parallel = results_queue.get(timeout=120)
+        process.join()
+
+        assert np.allclose(results_df.values.astype(np.float64), results_parallel), "Parallel evaluation does not match"
+
+
+    def test_EvaluatorNegativeItemSample_batch(self):
+
+        from Evaluation.Evaluator import EvaluatorNegativeItemSample
+
+        class _PerUserEvaluatorNegativeItemSample(EvaluatorNegativeItemSample):
+
+            def _recommend_items_to_rank(self, recommender_object, test_user_batch_array):
+
+                recommended_items_batch_list = []
+
+                for test_user in test_user_batch_array:
+                    recommended_items = recommender_object.recommend(test_user,
+                                                                     remove_seen_flag=self.exclude_seen,
+                                                                     cutoff = self.max_cutoff,
+                                                                     items_to_compute = self._get_user_specific_items_to_compute(test_user),
+                                                                     remove_custom_items_flag=self.ignore_items_flag)
+                    recommended_items_batch_list.append(recommended_items)
+
+                return recommended_items_batch_list, np.zeros((len(test_user_batch_array), self.n_items))
+
+        n_users, n_items = 300, 100
+
+        URM_train = sps.random(n_users, n_items, density=0.2, format="csr", random_state=42)
+        URM_test = sps.random(n_users, n_items, density=0.05, format="csr", random_state=43)
+        URM_test_negative = sps.random(n_users, n_items, density=0.2, format="csr", random_state=44)
+
+        recommender = _RandomScoresRecommender(URM_train, verbose=False)
+        recommender.fit()
+
+        for ignore_items in [None, [3, 4, 5]]:
+            evaluator = EvaluatorNegativeItemSample(URM_test, URM_test_negative, cutoff_list=[5, 10], ignore_items=ignore_items)
+            results_df, _ = evaluator.evaluateRecommender(recommender)
+
+            evaluator = _PerUserEvaluatorNegativeItemSample(URM_test, URM_test_negative, cutoff_list=[5, 10], ignore_items=ignore_items)
+            results_per_user_df, _ = evaluator.evaluateRecommender(recommender)
+
+            assert np.allclose(results_df.values.astype(np.float64), results_per_user_df.values.astype(np.float64)), "Batch negative item sample evaluation does not match"
+
+
+    def test_EvaluatorNegativeItemSample_overridden_recommend(self):
+
+        from Evaluation.Evaluator import EvaluatorNegativeItemSample
+
+        class _OverriddenRecommendRecommender(_RandomScoresRecommender):
+            """
+            Ranks the items with recommend only, as the recommenders that re-rank candidates or sort by ranking keys do
+            """
+
+            def _compute_item_score(self, user_id_array, items_to_compute = None):
+                raise NotImplementedError("Scores must be computed through recommend")
+
+            def recommend(self, user_id_array, cutoff = None, remove_seen_flag=True, items_to_compute = None,
+                          remove_top_pop_flag = False, remove_custom_items_flag = False, return_scores = False, **kwargs):
+
+                single_user = np.isscalar(user_id_array)
+                user_id_array = np.atleast_1d(user_id_array)
+
+                scores_batch = super(_OverriddenRecommendRecommender, self)._compute_item_score(user_id_array, items_to_compute = items_to_compute)
+
+                if remove_seen_flag:
+                    for user_index, user_id in enumerate(user_id_array):
+                        scores_batch[user_index, :] = self._remove_seen_on_scores(user_id, scores_batch[user_index, :])
+
+                if remove_custom_items_flag:
+                    scores_batch = self._remove_custom_items_on_scores(scores_batch)
+
+                cutoff = min(self.n_items - 1 if cutoff is None else cutoff, self.n_items - 1)
+                ranking = np.argsort(-scores_batch, axis=1, kind="stable")[:, :cutoff]
+                ranking_scores = np.take_along_axis(scores_batch, ranking, axis=1)
+
+                return self._format_ranking(user_id_array, ranking, ranking_scores, single_user, return_scores)
+
+        n_users, n_items = 300, 100
+
+        URM_train = sps.random(n_users, n_items, density=0.2, format="csr", random_state=42)
+        URM_test = sps.random(n_users, n_items, density=0.05, format="csr", random_state=43)
+        URM_test_negative = sps.random(n_users, n_items, density=0.2, format="csr", random_state=44)
+
+        recommender = _RandomScoresRecommender(URM_train, verbose=False)
+        recommender.fit()
+
+        overridden_recommender = _OverriddenRecommendRecommender(URM_train, verbose=False)
+        overridden_recommender.fit()
+
+        for ignore_items in [None, [3, 4, 5]]:
+            evaluator = EvaluatorNegativeItemSample(URM_test, URM_test_negative, cutoff_list=[5, 10], ignore_items=ignore_items)
+            results_df, _ = evaluator.evaluateRecommender(recommender)
+            results_overridden_df, _ = evaluator.evaluateRecommender(overridden_recommender)
+
+            assert np.allclose(results_df.values.astype(np.float64), results_overridden_df.values.astype(np.float64)), "Negative item sample evaluation does not use recommend"
+
+
+    def test_EvaluatorNegativeItemSample_all_items_to_rank(self):
+
+        from Evaluation.Evaluator import EvaluatorNegativeItemSample
+
+        class _OverriddenRecommendRecommender(_RandomScoresRecommender):
+
+            def recommend(self, user_id_array, **kwargs):
+                return super(_OverriddenRecommendRecommender, self).recommend(user_id_array, **kwargs)
+
+        n_users, n_items = 100, 40
+
+        URM_train = sps.random(n_users, n_items, density=0.2, format="csr", random_state=42)
+        URM_test = sps.random(n_users, n_items, density=0.05, format="csr", random_state=43)
+
+        # The first users rank the whole catalog, so the union of the items to rank of any batch covers every item
+        URM_test_negative = sps.lil_matrix(sps.random(n_users, n_items, density=0.2, format="csr", random_state=44))
+        URM_test_negative[:3, :] = 1
+        URM_test_negative = sps.csr_matrix(URM_test_negative)
+
+        for recommender_class in [_RandomScoresRecommender, _OverriddenRecommendRecommender]:
+
+            recommender = recommender_class(URM_train, verbose=False)
+            recommender.fit()
+
+            evaluator = EvaluatorNegativeItemSample(URM_test, URM_test_negative, cutoff_list=[5, n_items], exclude_seen=False)
+            recommended_items_batch_list, _ = evaluator._recommend_items_to_rank(recommender, np.arange(n_users))
+
+            for test_user in range(n_users):
+                recommended_items = recommender.recommend(test_user, cutoff = n_items, remove_seen_flag = False,
+                                                          items_to_compute = evaluator._get_user_specific_items_to_compute(test_user))
+
+                assert recommended_items_batch_list[test_user] == list(recommended_items), \
+                    "{}: ranking of user {} does not match the one of recommend".format(recommender_class.__name__, test_user)
+
+
+if __name__ == '__main__':
+    unittest.main()
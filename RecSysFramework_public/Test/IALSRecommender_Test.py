@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/2026
+
+@author: Anonymous
+"""
+
+import numpy as np
+import scipy.sparse as sps
+import unittest
+
+
+def _update_factors_per_row(recommender, factors, rows, C, Y):
+    """
+    Updates the latent factors one row at a time with _update_row, as a reference for the batched epoch
+    """
+
+    YtY = Y.T.dot(Y)
+
+    for row_id in rows:
+        start_pos = C.indptr[row_id]
+        end_pos = C.indptr[row_id + 1]
+
+        factors[row_id, :] = recommender._update_row(C.indices[start_pos:end_pos], C.data[start_pos:end_pos], Y, YtY)
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_IALSRecommender_batched_epoch(self):
+
+        from Recommenders.MatrixFactorization.IALSRecommender import IALSRecommender
+
+        n_users, n_items = 300, 120
+
+        URM_train = sps.random(n_users, n_items, density=0.05, format="csr", random_state=42)
+        URM_train.data = np.random.default_rng(42).integers(1, 6, URM_train.nnz).astype(np.float64)
+
+        # Small batches so that the rows are split in several batches solved by different threads
+        for batch_max_values in [1, 2**12, 2**22]:
+
+            recommender = IALSRecommender(URM_train, verbose=False)
+            recommender.fit(epochs=1, num_factors=8, alpha=2.0, reg=1e-2, n_workers=3, batch_max_values=batch_max_values)
+
+            assert recommender.USER_factors.dtype == np.float32 and recommender.ITEM_factors.dtype == np.float32
+
+            batched_rows = np.sort(np.concatenate(recommender.warm_users_batches))
+            assert np.array_equal(batched_rows, recommender.warm_users), "Batches do not contain all the warm users"
+
+            ITEM_factors_initial = recommender.ITEM_factors.astype(np.float64)
+            recommender.ITEM_factors = ITEM_factors_initial.astype(np.float32)
+            recommender._run_epoch(0)
+
+            USER_factors = np.zeros((n_users, 8))
+            ITEM_factors = ITEM_factors_initial.copy()
+            _update_factors_per_row(recommender, USER_factors, recommender.warm_users, recommender.C, ITEM_factors)
+            _update_factors_per_row(recommender, ITEM_factors, recommender.warm_items, recommender.C_csc, USER_factors)
+
+            assert np.allclose(recommender.USER_factors, USER_factors, atol=1e-4), "Batched user factors do not match"
+            assert np.allclose(recommender.ITEM_factors, ITEM_factors, atol=1e-4), "Batched item factors do not match"
+
+
+    def test_IALSRecommender_blas_threads(self):
+
+        from threadpoolctl import threadpool_info
+        from Recommenders.MatrixFactorization.IALSRecommender import IALSRecommender
+
+        URM_train = sps.random(200, 80, density=0.05, format="csr", random_state=42)
+
+        blas_num_threads = []
+
+        class _IALSRecommender(IALSRecommender):
+            def _update_rows_batch(self, rows, C, Y, YtY):
+                blas_num_threads.extend(info["num_threads"] for info in threadpool_info() if info["user_api"] == "blas")
+                return super(_IALSRecommender, self)._update_rows_batch(rows, C, Y, YtY)
+
+        recommender = _IALSRecommender(URM_train, verbose=False)
+        recommender.fit(epochs=1, num_factors=8, n_workers=3, batch_max_values=2**8)
+
+        # Each worker thread must use a single BLAS thread, otherwise the threads oversubscribe the cpus
+        assert len(blas_num_threads) == 0 or max(blas_num_threads) == 1, "BLAS is not limited to one thread per worker"
+
+
+if __name__ == '__main__':
+    unittest.main()
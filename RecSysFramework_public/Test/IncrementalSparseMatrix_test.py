@@ -13,7 +13,7 @@ import unittest
 
 import scipy.sparse as sps
 
-from Data_manager.IncrementalSparseMatrix import IncrementalSparseMatrix
+from Data_manager.IncrementalSparseMatrix import IncrementalSparseMatrix, IncrementalSparseMatrix_FilterIDs
 
 
 def sparse_are_equals(A, B):
@@ -97,6 +97,143 @@ class MyTestCase(unittest.TestCase):
 
 
 
+    def test_IncrementalSparseMatrix_add_arrays_with_mapper(self):
+
+        import numpy as np
+
+        n_rows = 100
+        n_cols = 200
+
+        randomMatrix = sps.random(n_rows, n_cols, density=0.1, format='coo', random_state=42)
+        row_ID_array = np.array(["row_{}".format(row) for row in randomMatrix.row], dtype=object)
+        col_ID_array = np.array(["col_{}".format(col) for col in randomMatrix.col], dtype=object)
+
+        incrementalMatrix = IncrementalSparseMatrix(auto_create_row_mapper=True, auto_create_col_mapper=True)
+
+        for start in range(0, randomMatrix.nnz, 37):
+            incrementalMatrix.add_data_lists(row_ID_array[start:start+37],
+                                             col_ID_array[start:start+37],
+                                             randomMatrix.data[start:start+37])
+
+        # The mapper assigns the indices in order of first appearance, as when adding one element at a time
+        row_mapper = incrementalMatrix.get_row_token_to_id_mapper()
+        col_mapper = incrementalMatrix.get_column_token_to_id_mapper()
+
+        assert list(row_mapper.keys()) == list(dict.fromkeys(row_ID_array))
+        assert list(row_mapper.values()) == list(range(len(row_mapper)))
+        assert list(col_mapper.keys()) == list(dict.fromkeys(col_ID_array))
+
+        row_index_array = np.array([row_mapper[row_ID] for row_ID in row_ID_array])
+        col_index_array = np.array([col_mapper[col_ID] for col_ID in col_ID_array])
+
+        randomMatrix_mapped = sps.csr_matrix((randomMatrix.data, (row_index_array, col_index_array)),
+                                             shape=(len(row_mapper), len(col_mapper)))
+
+        assert sparse_are_equals(randomMatrix_mapped, incrementalMatrix.get_SparseMatrix())
+
+
+
+    def test_IncrementalSparseMatrix_save_mapper(self):
+
+        import shutil, tempfile
+        from Recommenders.DataIO import DataIO
+
+        incrementalMatrix = IncrementalSparseMatrix(auto_create_row_mapper=True, auto_create_col_mapper=True)
+        incrementalMatrix.add_data_lists([10, 20, 10], [30, 30, 40], [1.0, 2.0, 3.0])
+
+        row_mapper = incrementalMatrix.get_row_token_to_id_mapper()
+
+        # The mapper keys must keep the type of the original IDs to be saved as json
+        assert row_mapper == {10: 0, 20: 1}
+        assert all(type(row_ID) is int for row_ID in row_mapper.keys())
+
+        folder_path = tempfile.mkdtemp()
+
+        try:
+            dataIO = DataIO(folder_path = folder_path)
+            dataIO.save_data("mapper", {"row_mapper": row_mapper, "col_mapper": incrementalMatrix.get_column_token_to_id_mapper()})
+            data_loaded = dataIO.load_data("mapper")
+        finally:
+            shutil.rmtree(folder_path, ignore_errors=True)
+
+        assert data_loaded["row_mapper"] == {"10": 0, "20": 1}
+        assert data_loaded["col_mapper"] == {"30": 0, "40": 1}
+
+
+
+    def test_IncrementalSparseMatrix_sorted_rows_duplicates(self):
+
+        import numpy as np
+
+        n_rows = 100
+        n_cols = 200
+
+        randomMatrix = sps.random(n_rows, n_cols, density=0.1, format='coo', random_state=42)
+
+        # Rows in order, with unsorted columns, duplicates and explicit zeros
+        row_array = np.concatenate((randomMatrix.row, randomMatrix.row[:50]))
+        col_array = np.concatenate((randomMatrix.col, randomMatrix.col[:50]))
+        data_array = np.concatenate((randomMatrix.data, randomMatrix.data[:50]))
+        data_array[100:110] = 0.0
+
+        sort_index = np.argsort(row_array, kind="stable")
+
+        for row_order in [sort_index, np.arange(len(row_array))]:
+
+            incrementalMatrix = IncrementalSparseMatrix(n_rows=n_rows, n_cols=n_cols)
+            incrementalMatrix.add_data_lists(row_array[row_order], col_array[row_order], data_array[row_order])
+            randomMatrix_incremental = incrementalMatrix.get_SparseMatrix()
+
+            randomMatrix_coo = sps.csr_matrix((data_array, (row_array, col_array)), shape=(n_rows, n_cols))
+            randomMatrix_coo.eliminate_zeros()
+
+            assert sparse_are_equals(randomMatrix_coo, randomMatrix_incremental)
+            assert randomMatrix_incremental.has_canonical_format
+            assert randomMatrix_incremental.nnz == randomMatrix_coo.nnz
+
+
+
+    def test_IncrementalSparseMatrix_empty(self):
+
+        incrementalMatrix = IncrementalSparseMatrix()
+        emptyMatrix = incrementalMatrix.get_SparseMatrix()
+
+        assert emptyMatrix.shape == (1, 1)
+        assert emptyMatrix.nnz == 0
+
+        incrementalMatrix = IncrementalSparseMatrix(n_rows=10, n_cols=20)
+        emptyMatrix = incrementalMatrix.get_SparseMatrix()
+
+        assert emptyMatrix.shape == (10, 20)
+        assert emptyMatrix.nnz == 0
+
+
+
+    def test_IncrementalSparseMatrix_FilterIDs_ignore(self):
+
+        import numpy as np
+
+        row_ID_array = np.array(["a", "b", "x", "a", "c", "y"], dtype=object)
+        col_ID_array = np.array([0, 1, 1, 5, 2, 0])
+        data_array = np.arange(1, 7, dtype=np.float64)
+
+        incrementalMatrix = IncrementalSparseMatrix_FilterIDs(preinitialized_row_mapper={"a": 0, "b": 1, "c": 2}, on_new_row="ignore",
+                                                              preinitialized_col_mapper={0: 0, 1: 1, 2: 2}, on_new_col="add")
+
+        incrementalMatrix.add_data_lists(row_ID_array, col_ID_array, data_array)
+
+        # The new column 5 is added even if its row is not
+        assert incrementalMatrix.get_row_token_to_id_mapper() == {"a": 0, "b": 1, "c": 2}
+        assert incrementalMatrix.get_column_token_to_id_mapper() == {0: 0, 1: 1, 2: 2, 5: 3}
+
+        expected_matrix = sps.csr_matrix(([1.0, 2.0, 4.0, 5.0], ([0, 1, 0, 2], [0, 1, 3, 2])), shape=(3, 4))
+
+        assert sparse_are_equals(expected_matrix, incrementalMatrix.get_SparseMatrix())
+
+
+
+
+
 
 
 
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/2026
+
+@author: Anonymous
+"""
+
+import time
+import numpy as np
+import pandas as pd
+import unittest
+
+from Recommenders.Incremental_Training_Early_Stopping import Incremental_Training_Early_Stopping
+
+
+class _EpochCounterModel(Incremental_Training_Early_Stopping):
+    """
+    Model whose parameters are updated in place at every epoch, the validation metric peaks at epoch 6
+    """
+
+    RECOMMENDER_NAME = "EpochCounterModel"
+
+    def fit(self, epochs = 20, **earlystopping_kwargs):
+
+        self.W = np.zeros(3)
+        self._update_best_model()
+        self._train_with_early_stopping(epochs, algorithm_name = self.RECOMMENDER_NAME, **earlystopping_kwargs)
+
+    def _run_epoch(self, num_epoch):
+        self.W += 1
+        time.sleep(0.01)
+
+    def _prepare_model_for_validation(self):
+        pass
+
+    def _update_best_model(self):
+        self.W_best = self.W.copy()
+
+    def _get_validation_snapshot(self):
+        return self._copy_model_for_validation()
+
+
+
+class _EpochCounterModelInProcess(_EpochCounterModel):
+
+    VALIDATION_ASYNC_IN_PROCESS = True
+
+
+
+class _EpochCounterModelNoSnapshot(_EpochCounterModel):
+
+    _get_validation_snapshot = Incremental_Training_Early_Stopping._get_validation_snapshot
+
+
+
+class _EpochCounterEvaluator(object):
+
+    def evaluateRecommender(self, recommender):
+        W = recommender.W.copy()
+        time.sleep(0.03)
+
+        # The model must not change during the evaluation
+        assert np.array_equal(W, recommender.W)
+
+        metric_value = - abs(W[0] - 6)
+        return pd.DataFrame({"MAP": [metric_value]}, index=[10]), "MAP: {}".format(metric_value)
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_validation_async(self):
+
+        earlystopping_kwargs = {"validation_every_n": 2,
+                                "stop_on_validation": True,
+                                "validation_metric": "MAP",
+                                "lower_validations_allowed": 2,
+                                "evaluator_object": _EpochCounterEvaluator()}
+
+        model = _EpochCounterModel()
+        model.fit(**earlystopping_kwargs)
+
+        model_async = _EpochCounterModel()
+        model_async.fit(validation_async = True, **earlystopping_kwargs)
+
+        assert model.epochs_best == model_async.epochs_best == 6
+        assert model.best_validation_metric == model_async.best_validation_metric
+        assert np.array_equal(model.W_best, model_async.W_best)
+
+        # Convergence is reached at epoch 10, the background validation lets the training run at most two more epochs
+        assert model.W[0] == 10
+        assert 10 <= model_async.W[0] <= 12
+
+
+    def test_validation_async_in_process(self):
+
+        earlystopping_kwargs = {"validation_every_n": 2,
+                                "stop_on_validation": True,
+                                "validation_metric": "MAP",
+                                "lower_validations_allowed": 2,
+                                "evaluator_object": _EpochCounterEvaluator()}
+
+        model = _EpochCounterModel()
+        model.fit(**earlystopping_kwargs)
+
+        model_async = _EpochCounterModelInProcess()
+        model_async.fit(validation_async = True, **earlystopping_kwargs)
+
+        assert model.epochs_best == model_async.epochs_best == 6
+        assert model.best_validation_metric == model_async.best_validation_metric
+        assert np.array_equal(model.W_best, model_async.W_best)
+
+
+    def test_validation_async_requires_snapshot(self):
+
+        earlystopping_kwargs = {"validation_every_n": 2,
+                                "stop_on_validation": True,
+                                "validation_metric": "MAP",
+                                "lower_validations_allowed": 2,
+                                "evaluator_object": _EpochCounterEvaluator()}
+
+        with self.assertRaises(AssertionError):
+            _EpochCounterModelNoSnapshot().fit(validation_async = True, **earlystopping_kwargs)
+
+        # The synchronous validation does not need the snapshot
+        _EpochCounterModelNoSnapshot().fit(**earlystopping_kwargs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/2026
+
+@author: Anonymous
+"""
+
+import numpy as np
+import scipy.sparse as sps
+import unittest
+
+
+def _compute_RP3beta_dense(URM_train, alpha, beta, topK):
+    """
+    Computes the RP3beta similarity on dense matrices, selecting the topK of each row and then of each column with
+    argsort, as a reference for the sparse blocks
+    """
+
+    from sklearn.preprocessing import normalize
+
+    Pui = normalize(URM_train, norm='l1', axis=1)
+
+    X_bool = URM_train.transpose(copy=True)
+    X_bool.data = np.ones(X_bool.data.size, np.float32)
+
+    X_bool_sum = np.array(X_bool.sum(axis=1)).ravel()
+    degree = np.zeros(URM_train.shape[1], dtype=np.float32)
+    degree[X_bool_sum != 0.0] = np.power(X_bool_sum[X_bool_sum != 0.0], -beta)
+
+    Piu = normalize(X_bool, norm='l1', axis=1)
+
+    if alpha != 1.:
+        Pui = Pui.power(alpha)
+        Piu = Piu.power(alpha)
+
+    similarity = (Piu * Pui).toarray().astype(np.float32) * degree
+    np.fill_diagonal(similarity, 0.0)
+
+    W = np.zeros_like(similarity)
+
+    for row in range(similarity.shape[0]):
+        best = similarity[row].argsort()[::-1][:topK]
+        W[row, best] = similarity[row, best]
+
+    W = normalize(sps.csr_matrix(W), norm='l1', axis=1).toarray()
+
+    W_top_k = np.zeros_like(W)
+
+    for col in range(W.shape[1]):
+        best = W[:, col].argsort()[::-1][:topK]
+        W_top_k[best, col] = W[best, col]
+
+    return W_top_k
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_RP3beta_top_k(self):
+
+        from Recommenders.GraphBased.RP3betaRecommender import RP3betaRecommender
+
+        n_users, n_items = 300, 80
+
+        # Continuous ratings, so that there are no ties among the similarities
+        URM_train = sps.random(n_users, n_items, density=0.1, format="csr", random_state=42)
+        URM_train.data = np.random.default_rng(42).random(URM_train.nnz) + 0.5
+
+        for alpha, beta, topK in [(1.0, 0.6, 10), (0.7, 0.3, 35), (1.0, 0.0, 2*n_items)]:
+
+            W_dense = _compute_RP3beta_dense(URM_train, alpha, beta, topK)
+
+            # A block_dim of 7 does not divide n_items, so the last block is smaller than the others
+            for n_workers, block_dim in [(1, 200), (1, 7), (2, 7), (3, 16)]:
+
+                recommender = RP3betaRecommender(URM_train.copy(), verbose = False)
+                recommender.fit(alpha = alpha, beta = beta, topK = topK, n_workers = n_workers, block_dim = block_dim)
+
+                assert sps.isspmatrix_csr(recommender.W_sparse)
+                assert np.allclose(recommender.W_sparse.toarray(), W_dense, atol=1e-6), \
+                    "W_sparse with alpha={}, beta={}, topK={}, n_workers={}, block_dim={} does not match the dense reference".format(
+                        alpha, beta, topK, n_workers, block_dim)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on 18/10/2026
+
+@author: Anonymous
+"""
+
+import numpy as np
+import scipy.sparse as sps
+import unittest
+
+
+def _split_leave_k_out_per_user(URM, k_out, use_validation_set, leave_random_out):
+    """
+    Splits the URM one user at a time, as a reference for the vectorized split
+    """
+
+    n_users, n_items = URM.shape
+    split_lists = {"train": ([], [], []), "validation": ([], [], []), "test": ([], [], [])}
+
+    for user_id in range(n_users):
+
+        user_profile = URM.indices[URM.indptr[user_id]:URM.indptr[user_id+1]]
+        user_data = URM.data[URM.indptr[user_id]:URM.indptr[user_id+1]]
+
+        if leave_random_out:
+            sampling_order = np.arange(len(user_profile))
+            np.random.shuffle(sampling_order)
+        else:
+            sampling_order = np.argsort(-user_data, kind="stable")
+
+        for split_name, split_start, split_end in [("test", 0, k_out), ("validation", k_out, k_out*2), ("train", k_out*2, None)]:
+            rows, cols, data = split_lists[split_name]
+            rows.extend([user_id]*len(sampling_order[split_start:split_end]))
+            cols.extend(user_profile[sampling_order[split_start:split_end]])
+            data.extend(user_data[sampling_order[split_start:split_end]])
+
+    URM_splits = {split_name: sps.csr_matrix((data, (rows, cols)), shape=(n_users, n_items), dtype=np.float64) for split_name, (rows, cols, data) in split_lists.items()}
+
+    if use_validation_set:
+        return URM_splits["train"], URM_splits["validation"], URM_splits["test"]
+
+    return URM_splits["train"], URM_splits["test"]
+
+
+
+class MyTestCase(unittest.TestCase):
+
+    def test_split_train_leave_k_out_user_wise(self):
+
+        from Data_manager.split_functions.split_train_validation_leave_k_out import split_train_leave_k_out_user_wise
+
+        n_users, n_items = 400, 200
+
+        URM = sps.random(n_users, n_items, density=0.1, format="csr", random_state=42)
+        URM.data = np.random.default_rng(42).permutation(URM.nnz).astype(np.float64) + 1
+
+        for k_out in [1, 3]:
+            for use_validation_set in [True, False]:
+                for leave_random_out in [True, False]:
+
+                    np.random.seed(42)
+                    URM_splits = split_train_leave_k_out_user_wise(URM, k_out = k_out, use_validation_set = use_validation_set, leave_random_out = leave_random_out)
+
+                    np.random.seed(42)
+                    URM_splits_per_user = _split_leave_k_out_per_user(URM, k_out, use_validation_set, leave_random_out)
+
+                    assert len(URM_splits) == len(URM_splits_per_user)
+
+                    for URM_split, URM_split_per_user in zip(URM_splits, URM_splits_per_user):
+                        assert URM_split.dtype == URM_split_per_user.dtype
+                        assert np.array_equal(URM_split.indptr, URM_split_per_user.indptr)
+                        assert np.array_equal(URM_split.indices, URM_split_per_user.indices)
+                        assert np.array_equal(URM_split.data, URM_split_per_user.data)
+
+                    # The splits are a partition of the URM, except the interactions between k_out and 2*k_out without validation
+                    if use_validation_set:
+                        assert (sum(URM_splits) != URM).nnz == 0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
+import collections
 import itertools
+import mmap
 import os
 import uuid
 from enum import Enum
@@ -7,6 +9,8 @@ from typing import Type, Optional, Any, cast, Sequence
 import Recommenders.Recommender_import_list as recommenders
 import attrs
 import numpy as np
+import scipy.sparse as sp
+from distributed import Future
 from HyperparameterTuning.SearchAbstractClass import SearchInputRecommenderArgs
 from HyperparameterTuning.SearchBayesianSkopt import SearchBayesianSkopt
 from Recommenders.BaseMatrixFactorizationRecommender import BaseMatrixFactorizationRecommender
@@ -21,6 +25,7 @@ from recsys_framework_extensions.logging import get_logger
 from recsys_framework_extensions.plotting import generate_accuracy_and_beyond_metrics_latex
 
 import experiments.commons as commons
+from impression_recommenders.re_ranking.candidates import compute_top_n_candidates, TopNCandidatesRecommender
 from impression_recommenders.user_profile.folding import FoldedMatrixFactorizationRecommender
 
 logger = get_logger(__name__)
@@ -170,6 +175,49 @@ class TrainedRecommenderType(Enum):
     TRAIN_VALIDATION = "TRAIN_VALIDATION"
 
 
+# Trained recommenders loaded by this process and their size in bytes, see `load_trained_recommender`. The least
+# recently used are evicted first.
+_CACHE_TRAINED_RECOMMENDERS: "collections.OrderedDict[tuple, tuple[BaseRecommender, int]]" = collections.OrderedDict()
+
+
+def _get_recommender_arrays(
+    recommender: BaseRecommender,
+) -> list[np.ndarray]:
+    """
+    Returns the numpy arrays held by the attributes of a recommender, including the ones of its sparse matrices and of
+    the recommenders it wraps, e.g., the trained recommender of a `FoldedMatrixFactorizationRecommender`.
+    """
+    arrays: list[np.ndarray] = []
+
+    for value in vars(recommender).values():
+        if isinstance(value, np.ndarray):
+            arrays.append(value)
+        elif sp.issparse(value):
+            for attr_name in ["data", "indices", "indptr", "row", "col"]:
+                arr = getattr(value, attr_name, None)
+                if isinstance(arr, np.ndarray):
+                    arrays.append(arr)
+        elif isinstance(value, BaseRecommender):
+            arrays.extend(_get_recommender_arrays(value))
+
+    return arrays
+
+
+def _is_memory_mapped(
+    arr: np.ndarray,
+) -> bool:
+    """
+    Tells whether the array, or the array it is a view of, is memory-mapped from a file, e.g., the arrays loaded from an
+    uncompressed `DataIO` archive.
+    """
+    while isinstance(arr, np.ndarray):
+        if isinstance(arr, np.memmap) or isinstance(arr.base, mmap.mmap):
+            return True
+        arr = arr.base
+
+    return False
+
+
 def load_trained_recommender(
     experiment_recommender: commons.ExperimentRecommender,
     experiment_benchmark: commons.ExperimentBenchmark,
@@ -183,7 +231,84 @@ def load_trained_recommender(
 
     This function loads the requested recommender (`experiment_recommender`) on disk. It can load a folded-in
     or the original version of the recommender. If the recommender cannot be loaded, then it returns None.
+
+    If `HyperParameterTuningParameters.cache_trained_recommenders_max_bytes` is greater than 0, then loaded
+    recommenders are cached in the process up to that many bytes, so the jobs a dask worker runs on the same baseline,
+    e.g., the searches of every impressions recommender, load it once. The instance is shared by these jobs, hence,
+    its arrays are made read-only, and modifying them raises an error.
+
+    Baselines are saved uncompressed (see `commons`), hence, their arrays are memory-mapped and the processes loading the
+    same baseline share its pages. Read-only memory-mapped arrays are not counted in the bytes of the cache, as the
+    pages belong to the file and not to the process.
     """
+    cache_max_bytes = experiment_hyper_parameter_tuning_parameters.cache_trained_recommenders_max_bytes
+
+    load_kwargs = dict(
+        experiment_recommender=experiment_recommender,
+        experiment_benchmark=experiment_benchmark,
+        experiment_hyper_parameter_tuning_parameters=experiment_hyper_parameter_tuning_parameters,
+        data_splits=data_splits,
+        similarity=similarity,
+        model_type=model_type,
+        try_folded_recommender=try_folded_recommender,
+    )
+
+    if cache_max_bytes == 0:
+        return _load_trained_recommender_from_disk(**load_kwargs)
+
+    cache_key = (
+        experiment_benchmark.benchmark,
+        experiment_hyper_parameter_tuning_parameters.evaluation_strategy,
+        experiment_recommender.recommender,
+        similarity,
+        model_type,
+        try_folded_recommender,
+    )
+
+    if cache_key in _CACHE_TRAINED_RECOMMENDERS:
+        _CACHE_TRAINED_RECOMMENDERS.move_to_end(cache_key)
+        trained_recommender_instance, _ = _CACHE_TRAINED_RECOMMENDERS[cache_key]
+        return trained_recommender_instance
+
+    trained_recommender_instance = _load_trained_recommender_from_disk(**load_kwargs)
+
+    # Failures are not cached, the recommender may be tuned by a job running at the moment.
+    if trained_recommender_instance is None:
+        return None
+
+    recommender_arrays = _get_recommender_arrays(trained_recommender_instance)
+    # Arrays shared by several attributes, e.g., views, are counted once.
+    recommender_nbytes = sum(
+        {
+            id(arr): arr.nbytes
+            for arr in recommender_arrays
+            if not _is_memory_mapped(arr)
+        }.values()
+    )
+
+    # Recommenders that do not fit in the cache are not cached, and the cache is not emptied for them.
+    if recommender_nbytes > cache_max_bytes:
+        return trained_recommender_instance
+
+    for arr in recommender_arrays:
+        arr.flags.writeable = False
+
+    _CACHE_TRAINED_RECOMMENDERS[cache_key] = (trained_recommender_instance, recommender_nbytes)
+    while sum(nbytes for _, nbytes in _CACHE_TRAINED_RECOMMENDERS.values()) > cache_max_bytes:
+        _CACHE_TRAINED_RECOMMENDERS.popitem(last=False)
+
+    return trained_recommender_instance
+
+
+def _load_trained_recommender_from_disk(
+    experiment_recommender: commons.ExperimentRecommender,
+    experiment_benchmark: commons.ExperimentBenchmark,
+    experiment_hyper_parameter_tuning_parameters: commons.HyperParameterTuningParameters,
+    data_splits: InteractionsDataSplits,
+    similarity: Optional[str],
+    model_type: TrainedRecommenderType,
+    try_folded_recommender: bool,
+) -> Optional[BaseRecommender]:
     if TrainedRecommenderType.TRAIN == model_type:
         urm_train = data_splits.sp_urm_train.copy()
         file_name_postfix = "best_model"
@@ -263,6 +388,57 @@ def load_trained_recommender(
         return trained_recommender_instance
 
 
+def load_trained_recommender_candidates(
+    trained_recommender: BaseRecommender,
+    experiment_benchmark: commons.ExperimentBenchmark,
+    experiment_hyper_parameter_tuning_parameters: commons.HyperParameterTuningParameters,
+    data_splits: InteractionsDataSplits,
+    model_type: TrainedRecommenderType,
+    top_n: int,
+) -> TopNCandidatesRecommender:
+    """Wraps an already-trained recommender into a `TopNCandidatesRecommender`.
+
+    The top-n candidates are computed for the users evaluated with the recommender, i.e., the users in the validation
+    split for recommenders trained on the train split and the users in the test split for recommenders trained on the
+    train and validation splits. The first job computing the candidates saves them next to the trained recommender,
+    and every other job memory-maps them.
+    """
+    if TrainedRecommenderType.TRAIN == model_type:
+        urm_train = data_splits.sp_urm_train
+        urm_evaluation = data_splits.sp_urm_validation
+        file_name_postfix = "best_model"
+    elif TrainedRecommenderType.TRAIN_VALIDATION == model_type:
+        urm_train = data_splits.sp_urm_train_validation
+        urm_evaluation = data_splits.sp_urm_test
+        file_name_postfix = "best_model_last"
+    else:
+        raise ValueError(
+            f"{load_trained_recommender_candidates.__name__} failed because it received an invalid instance of the "
+            f"enum {TrainedRecommenderType} (received value {model_type}). Valid values are "
+            f"{list(TrainedRecommenderType)}")
+
+    folder_path = HYPER_PARAMETER_TUNING_EXPERIMENTS_DIR.format(
+        benchmark=experiment_benchmark.benchmark.value,
+        evaluation_strategy=experiment_hyper_parameter_tuning_parameters.evaluation_strategy.value,
+    )
+
+    candidates_arrays = commons.load_or_materialize_arrays(
+        folder_path=os.path.join(folder_path, "candidates", ""),
+        file_name=f"{trained_recommender.RECOMMENDER_NAME}_{file_name_postfix}_top_{top_n}",
+        to_arrays_func=lambda: compute_top_n_candidates(
+            trained_recommender=trained_recommender,
+            user_id_array=np.flatnonzero(np.ediff1d(urm_evaluation.tocsr().indptr) > 0),
+            top_n=top_n,
+        ),
+    )
+
+    return TopNCandidatesRecommender(
+        urm_train=urm_train.copy(),
+        trained_recommender=trained_recommender,
+        **candidates_arrays,
+    )
+
+
 def _run_baselines_folded_hyper_parameter_tuning(
     experiment_case: commons.ExperimentCase,
     similarity: str,
@@ -273,6 +449,8 @@ def _run_baselines_folded_hyper_parameter_tuning(
 
     This method should not be called from outside.
     """
+    commons.save_trained_recommenders_uncompressed()
+
     experiment_benchmark = commons.MAPPER_AVAILABLE_BENCHMARKS[experiment_case.benchmark]
     experiment_recommender = commons.MAPPER_AVAILABLE_RECOMMENDERS[experiment_case.recommender]
     experiment_folded = commons.MAPPER_AVAILABLE_RECOMMENDERS[commons.RecommenderFolded.FOLDED]
@@ -280,13 +458,11 @@ def _run_baselines_folded_hyper_parameter_tuning(
         experiment_case.hyper_parameter_tuning_parameters
     ]
 
-    benchmark_reader = commons.get_reader_from_benchmark(
+    dataset = commons.get_dataset_from_benchmark(
         benchmark_config=experiment_benchmark.config,
         benchmark=experiment_benchmark.benchmark,
     )
 
-    dataset = benchmark_reader.dataset
-
     interactions_data_splits = dataset.get_urm_splits(
         evaluation_strategy=experiment_hyper_parameter_tuning_parameters.evaluation_strategy,
     )
@@ -429,6 +605,7 @@ def _run_baselines_folded_hyper_parameter_tuning(
 
         n_cases=experiment_hyper_parameter_tuning_parameters.num_cases,
         n_random_starts=experiment_hyper_parameter_tuning_parameters.num_random_starts,
+        n_parallel_cases=experiment_hyper_parameter_tuning_parameters.num_parallel_cases,
 
         output_file_name_root=experiment_file_name_root,
         output_folder_path=experiments_folder_path,
@@ -452,18 +629,18 @@ def _run_baselines_hyper_parameter_tuning(
 
     This method should not be called from outside.
     """
+    commons.save_trained_recommenders_uncompressed()
+
     experiment_benchmark = commons.MAPPER_AVAILABLE_BENCHMARKS[experiment_case.benchmark]
     experiment_recommender = commons.MAPPER_AVAILABLE_RECOMMENDERS[experiment_case.recommender]
     experiment_hyper_parameter_tuning_parameters = commons.MAPPER_AVAILABLE_HYPER_PARAMETER_TUNING_PARAMETERS[
         experiment_case.hyper_parameter_tuning_parameters
     ]
 
-    benchmark_reader = commons.get_reader_from_benchmark(
+    dataset = commons.get_dataset_from_benchmark(
         benchmark_config=experiment_benchmark.config,
         benchmark=experiment_benchmark.benchmark,
     )
-    
-    dataset = benchmark_reader.dataset
 
     data_splits = dataset.get_urm_splits(
         evaluation_strategy=experiment_hyper_parameter_tuning_parameters.evaluation_strategy
@@ -515,6 +692,7 @@ def _run_baselines_hyper_parameter_tuning(
 
         n_cases=experiment_hyper_parameter_tuning_parameters.num_cases,
         n_random_starts=experiment_hyper_parameter_tuning_parameters.num_random_starts,
+        n_parallel_cases=experiment_hyper_parameter_tuning_parameters.num_parallel_cases,
 
         output_folder_path=experiments_folder_path,
 
@@ -535,18 +713,22 @@ def _run_baselines_hyper_parameter_tuning(
 def run_baselines_experiments(
     dask_interface: DaskInterface,
     experiment_cases_interface: commons.ExperimentCasesInterface,
-) -> None:
+) -> commons.T_EXPERIMENT_CASES_JOBS:
     """
     Public method that tells Dask to run the hyper-parameter tuning of recommenders. This function instructs Dask to
     execute the hyper-parameter tuning of each recommender in a separate worker. Processes should be always preferred
     instead of threads, as the hyper-parameter tuning loops are not thread-safe. Validations are not done in case of
     debug.
+
+    Returns the jobs of each experiment case, so experiments loading the tuned recommenders can depend on them.
     """
+    baselines_jobs: commons.T_EXPERIMENT_CASES_JOBS = dict()
+
     for experiment_case in experiment_cases_interface.experiment_cases:
         experiment_benchmark = commons.MAPPER_AVAILABLE_BENCHMARKS[experiment_case.benchmark]
         experiment_recommender = commons.MAPPER_AVAILABLE_RECOMMENDERS[experiment_case.recommender]
 
-        dask_interface.submit_job(
+        baselines_jobs[experiment_case] = [dask_interface.submit_job(
             job_key=(
                 f"_run_baselines_hyper_parameter_tuning"
                 f"|{experiment_benchmark.benchmark.value}"
@@ -558,23 +740,38 @@ def run_baselines_experiments(
                 "recommender": experiment_recommender.recommender.RECOMMENDER_NAME,
                 "benchmark": experiment_benchmark.benchmark.value,
             },
+            job_resources=commons.get_job_resources(
+                experiment_case=experiment_case,
+                recommender_classes=[experiment_recommender.recommender],
+            ),
             method=_run_baselines_hyper_parameter_tuning,
             method_kwargs={
                 "experiment_case": experiment_case,
             }
-        )
+        )]
+
+    return baselines_jobs
 
 
 def run_baselines_folded(
     dask_interface: DaskInterface,
     experiment_cases_interface: commons.ExperimentCasesInterface,
-) -> None:
+    baselines_jobs: Optional[commons.T_EXPERIMENT_CASES_JOBS] = None,
+) -> commons.T_EXPERIMENT_CASES_JOBS:
     """
     Public method that tells Dask to run the hyper-parameter tuning of folded recommenders. This function instructs
     Dask to execute the hyper-parameter tuning of each recommender in a separate worker. Processes should be always
     preferred instead of threads, as the hyper-parameter tuning loops are not thread-safe. Validations are not done
     in case of debug.
+
+    Each job starts when the job tuning its recommender in `baselines_jobs` finishes, recommenders without a job are
+    expected to be tuned already. Returns the jobs of each experiment case.
     """
+    if baselines_jobs is None:
+        baselines_jobs = dict()
+
+    folded_jobs: commons.T_EXPERIMENT_CASES_JOBS = dict()
+
     for experiment_case in experiment_cases_interface.experiment_cases:
         experiment_benchmark = commons.MAPPER_AVAILABLE_BENCHMARKS[experiment_case.benchmark]
         experiment_recommender = commons.MAPPER_AVAILABLE_RECOMMENDERS[experiment_case.recommender]
@@ -589,8 +786,9 @@ def run_baselines_folded(
         ]:
             similarities = experiment_hyper_parameter_tuning_parameters.knn_similarity_types
 
+        folded_jobs[experiment_case] = []
         for similarity in similarities:
-            dask_interface.submit_job(
+            job_future = dask_interface.submit_job(
                 job_key=(
                     f"_run_baselines_folded_hyper_parameter_tuning"
                     f"|{experiment_benchmark.benchmark.value}"
@@ -604,9 +802,17 @@ def run_baselines_folded(
                     "recommender_folded": experiment_folded.recommender.RECOMMENDER_NAME,
                     "benchmark": experiment_benchmark.benchmark.value,
                 },
+                job_resources=commons.get_job_resources(
+                    experiment_case=experiment_case,
+                    recommender_classes=[experiment_recommender.recommender, experiment_folded.recommender],
+                ),
+                job_dependencies=baselines_jobs.get(experiment_case),
                 method=_run_baselines_folded_hyper_parameter_tuning,
                 method_kwargs={
                     "experiment_case": experiment_case,
                     "similarity": similarity,
                 }
             )
+            folded_jobs[experiment_case].append(job_future)
+
+    return folded_jobs
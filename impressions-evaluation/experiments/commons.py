@@ -1,16 +1,26 @@
+import fcntl
+import functools
+import inspect
 import itertools
+import json
 import os
+import tempfile
 from enum import Enum
-from typing import Type, Literal, Optional, cast, Union, TypeVar
+from typing import Type, Literal, Optional, cast, Union, TypeVar, Callable, Any
 
 import Recommenders.Recommender_import_list as recommenders
 import attrs
+import scipy.sparse as sp
+from distributed import Future
 from Evaluation.Evaluator import EvaluatorHoldout
 from Recommenders.BaseRecommender import BaseRecommender
+from Recommenders.DataIO import DataIO
 from recsys_framework_extensions.data.io import attach_to_extended_json_decoder
-from recsys_framework_extensions.data.mixins import InteractionsDataSplits
+from recsys_framework_extensions.data.mixins import InteractionsDataSplits, ImpressionsDataSplits
 from recsys_framework_extensions.data.reader import DataReader
+from recsys_framework_extensions.dask import RESOURCE_MEMORY, RESOURCE_CPU
 from recsys_framework_extensions.evaluation import EvaluationStrategy, exclude_from_evaluation
+from recsys_framework_extensions.logging import get_logger
 from recsys_framework_extensions.recommenders.base import SearchHyperParametersBaseRecommender
 
 from ContentWiseImpressionsReader import ContentWiseImpressionsReader, ContentWiseImpressionsConfig
@@ -30,6 +40,8 @@ from impression_recommenders.user_profile.weighted import (
     ItemWeightedUserProfileRecommender, SearchHyperParametersWeightedUserProfileRecommender,
 )
 
+logger = get_logger(__name__)
+
 
 class ImpressionsFeatures(Enum):
     USER_ITEM_FREQUENCY = "user_item_frequency"
@@ -134,6 +146,17 @@ class HyperParameterTuningParameters:
     cutoff_to_optimize: int = attrs.field(default=10)
     num_cases: int = attrs.field(default=50, validator=[attrs.validators.instance_of(int)])
     num_random_starts: int = attrs.field(default=int(50 / 3), validator=[attrs.validators.instance_of(int)])
+    # Cases fitted in parallel processes by each search, see `SearchBayesianSkopt.search`. Their memory and cores are
+    # added to the resources of every job, see `get_job_resources`. Daemonic processes cannot have children, hence,
+    # values above 1 require Dask workers created with `distributed.worker.daemon: False`, otherwise the cases are
+    # fitted sequentially.
+    num_parallel_cases: int = attrs.field(
+        default=1,
+        validator=[
+            attrs.validators.instance_of(int),
+            attrs.validators.ge(1),
+        ],
+    )
     knn_similarity_types: list[T_SIMILARITY_TYPE] = attrs.field(default=[
         "cosine",
         "dice",
@@ -165,6 +188,25 @@ class HyperParameterTuningParameters:
     save_metadata: bool = attrs.field(default=True, validator=[attrs.validators.instance_of(bool)])
     save_model: T_SAVE_MODEL = attrs.field(default="best")
     terminate_on_memory_error: bool = attrs.field(default=True, validator=[attrs.validators.instance_of(bool)])
+    # If set, then re-ranking recommenders only re-rank the top-n items of their trained recommender, which are
+    # precomputed once per trained recommender, see `TopNCandidatesRecommender` and `MixinCandidatesReRanking`. It must
+    # not be lower than the largest evaluation cutoff. None to re-rank all items.
+    re_ranking_top_n_candidates: Optional[int] = attrs.field(
+        default=None,
+        validator=attrs.validators.optional([
+            attrs.validators.instance_of(int),
+            attrs.validators.gt(0),
+        ]),
+    )
+    # Bytes of trained recommenders each worker process keeps loaded, so the jobs on the same baseline load it once,
+    # see `baselines.load_trained_recommender`. The bytes are added to the memory of every job. 0 disables the cache.
+    cache_trained_recommenders_max_bytes: int = attrs.field(
+        default=0,
+        validator=[
+            attrs.validators.instance_of(int),
+            attrs.validators.ge(0),
+        ],
+    )
 
 
 @attrs.define(frozen=True, kw_only=True)
@@ -202,6 +244,11 @@ class ExperimentCase:
     recommender: T_RECOMMENDER = attrs.field()  # type: ignore
 
 
+# Futures of the jobs submitted for each experiment case, see `DaskInterface.submit_job`. Jobs that load the
+# recommenders tuned in an experiment case depend on them.
+T_EXPERIMENT_CASES_JOBS = dict[ExperimentCase, list[Future]]
+
+
 @attrs.define(frozen=True, kw_only=True)
 class ExperimentCasesInterface:
     to_use_benchmarks: list[Benchmarks] = attrs.field()
@@ -498,6 +545,16 @@ MAPPER_AVAILABLE_HYPER_PARAMETER_TUNING_PARAMETERS = {
 
 
 # Should be called from main.py
+def save_trained_recommenders_uncompressed() -> None:
+    """
+    Public method that makes the recommenders trained by the calling process be saved uncompressed, so the jobs loading
+    the same trained recommender memory-map it and share its pages instead of each loading a copy, see
+    `baselines.load_trained_recommender`. Each job calls it before training, as it changes `BaseRecommender` in the
+    whole process.
+    """
+    BaseRecommender.SAVE_MODEL_COMPRESS = False
+
+
 def create_necessary_folders(
     benchmarks: list[Benchmarks],
     evaluation_strategies: list[EvaluationStrategy]
@@ -554,6 +611,402 @@ def get_reader_from_benchmark(
     return benchmark_reader
 
 
+def _get_arrays_metadata_file_path(
+    folder_path: str,
+    file_name: str,
+) -> str:
+    return os.path.join(folder_path, f"{file_name}-metadata.json")
+
+
+def _save_arrays_metadata(
+    folder_path: str,
+    file_name: str,
+    arrays: dict[str, Any],
+) -> None:
+    # The file is written under a temporary name and then renamed, so readers never see a partially written file.
+    arrays_metadata = {
+        name: {
+            "shape": [int(dim) for dim in array.shape],
+            "nnz": int(array.nnz) if sp.issparse(array) else int(array.size),
+        }
+        for name, array in arrays.items()
+        if hasattr(array, "shape")
+    }
+
+    file_descriptor, temp_file_path = tempfile.mkstemp(suffix=".json", dir=folder_path)
+    with os.fdopen(file_descriptor, "w") as temp_file:
+        json.dump(arrays_metadata, temp_file)
+
+    os.replace(
+        temp_file_path,
+        _get_arrays_metadata_file_path(folder_path=folder_path, file_name=file_name),
+    )
+
+
+def load_arrays_metadata(
+    folder_path: str,
+    file_name: str,
+) -> Optional[dict[str, dict[str, Any]]]:
+    """
+    Public method that returns the shape and number of stored values of the arrays or sparse matrices of an archive
+    created by `load_or_materialize_arrays`, without loading the archive. None if the archive has not been created yet.
+    """
+    try:
+        with open(_get_arrays_metadata_file_path(folder_path=folder_path, file_name=file_name), "r") as metadata_file:
+            return json.load(metadata_file)
+    except FileNotFoundError:
+        return None
+
+
+def load_or_materialize_arrays(
+    folder_path: str,
+    file_name: str,
+    to_arrays_func: Callable[[], dict[str, Any]],
+) -> dict[str, Any]:
+    """
+    Public method that memory-maps the arrays or sparse matrices saved in an uncompressed `DataIO` archive. If the
+    archive does not exist, then the first process calling this method creates it with `to_arrays_func`, and the
+    others wait for it and then memory-map it. The arrays are copy-on-write, i.e., changing them does not alter the
+    archive. The shapes of the arrays are also saved, see `load_arrays_metadata`.
+    """
+    data_io = DataIO(folder_path=folder_path, compress=False)
+    file_path = os.path.join(folder_path, f"{file_name}.zip")
+
+    if not os.path.exists(file_path):
+        os.makedirs(folder_path, exist_ok=True)
+
+        with open(os.path.join(folder_path, f".{file_name}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            if not os.path.exists(file_path):
+                logger.info(
+                    f"Materializing {file_name} in {folder_path}"
+                )
+                data_io.save_data(
+                    file_name=file_name,
+                    data_dict_to_save=to_arrays_func(),
+                )
+
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    arrays = data_io.load_data(
+        file_name=file_name,
+    )
+
+    # Archives created before the metadata was saved get it on their first load.
+    if not os.path.exists(_get_arrays_metadata_file_path(folder_path=folder_path, file_name=file_name)):
+        _save_arrays_metadata(
+            folder_path=folder_path,
+            file_name=file_name,
+            arrays=arrays,
+        )
+
+    return arrays
+
+
+class MemoryMappedDataset:
+    """
+    Node-local cache of the sparse matrices used by the experiments of a benchmark.
+
+    The first job that requests a matrix, e.g., the URM splits of an evaluation strategy or an impressions feature,
+    loads it from the dataset and saves it as an uncompressed `DataIO` archive in the data folder of the benchmark.
+    Afterwards, every job in the node memory-maps the archive instead of loading the dataset, so concurrent dask
+    workers share the same pages. The matrices are copy-on-write, i.e., changing them does not alter the cache.
+
+    The cache folder depends on the hash of the benchmark config, so it is not reused if the config changes.
+    """
+
+    _NAMES_URM_SPLITS = ["sp_urm_train", "sp_urm_validation", "sp_urm_train_validation", "sp_urm_test"]
+    _NAMES_UIM_SPLITS = ["sp_uim_train", "sp_uim_validation", "sp_uim_train_validation", "sp_uim_test"]
+
+    def __init__(
+        self,
+        benchmark_reader: DataReader,
+    ):
+        self._benchmark_reader = benchmark_reader
+        self._cache_folder = os.path.join(
+            benchmark_reader.config.data_folder, "data-cache", benchmark_reader.config.sha256_hash, "",
+        )
+
+    @functools.cached_property
+    def _dataset(self):
+        # Only loaded if a matrix is not in the cache.
+        return self._benchmark_reader.dataset
+
+    def _load_or_materialize(
+        self,
+        file_name: str,
+        to_sparse_matrices_func: Callable[[], dict[str, sp.spmatrix]],
+    ) -> dict[str, sp.spmatrix]:
+        return load_or_materialize_arrays(
+            folder_path=self._cache_folder,
+            file_name=file_name,
+            to_arrays_func=to_sparse_matrices_func,
+        )
+
+    @staticmethod
+    def _get_splits_dict(
+        data_splits: Union[InteractionsDataSplits, ImpressionsDataSplits],
+        names: list[str],
+    ) -> dict[str, sp.spmatrix]:
+        return {
+            name: getattr(data_splits, name)
+            for name in names
+        }
+
+    @staticmethod
+    def _get_urm_splits_file_name(
+        evaluation_strategy: EvaluationStrategy,
+    ) -> str:
+        return f"urm_splits-{evaluation_strategy.value}"
+
+    def get_urm_splits(
+        self,
+        evaluation_strategy: EvaluationStrategy,
+    ) -> InteractionsDataSplits:
+        sparse_matrices = self._load_or_materialize(
+            file_name=self._get_urm_splits_file_name(evaluation_strategy=evaluation_strategy),
+            to_sparse_matrices_func=lambda: self._get_splits_dict(
+                data_splits=self._dataset.get_urm_splits(
+                    evaluation_strategy=evaluation_strategy,
+                ),
+                names=self._NAMES_URM_SPLITS,
+            ),
+        )
+
+        return InteractionsDataSplits(**sparse_matrices)
+
+    def get_urm_splits_metadata(
+        self,
+        evaluation_strategy: EvaluationStrategy,
+    ) -> Optional[dict[str, dict[str, Any]]]:
+        """
+        Returns the shape and number of interactions of each URM split without loading them, None if no job has
+        requested the splits yet, see `load_arrays_metadata`.
+        """
+        return load_arrays_metadata(
+            folder_path=self._cache_folder,
+            file_name=self._get_urm_splits_file_name(evaluation_strategy=evaluation_strategy),
+        )
+
+    def get_uim_splits(
+        self,
+        evaluation_strategy: EvaluationStrategy,
+    ) -> ImpressionsDataSplits:
+        sparse_matrices = self._load_or_materialize(
+            file_name=f"uim_splits-{evaluation_strategy.value}",
+            to_sparse_matrices_func=lambda: self._get_splits_dict(
+                data_splits=self._dataset.get_uim_splits(
+                    evaluation_strategy=evaluation_strategy,
+                ),
+                names=self._NAMES_UIM_SPLITS,
+            ),
+        )
+
+        return ImpressionsDataSplits(**sparse_matrices)
+
+    def sparse_matrix_impression_feature(
+        self,
+        feature: str,
+    ) -> sp.csr_matrix:
+        sparse_matrices = self._load_or_materialize(
+            file_name=f"impressions_feature-{feature}",
+            to_sparse_matrices_func=lambda: {
+                "feature": self._dataset.sparse_matrix_impression_feature(
+                    feature=feature,
+                ),
+            },
+        )
+
+        return sparse_matrices["feature"]
+
+
+def get_dataset_from_benchmark(
+    benchmark_config: object,
+    benchmark: Benchmarks,
+) -> MemoryMappedDataset:
+    """
+    Returns a `MemoryMappedDataset` of the benchmark, to be used by the experiments running in dask workers instead of
+    loading the dataset of the reader in each worker.
+    """
+    benchmark_reader = get_reader_from_benchmark(
+        benchmark_config=benchmark_config,
+        benchmark=benchmark,
+    )
+
+    return MemoryMappedDataset(
+        benchmark_reader=benchmark_reader,
+    )
+
+
+def get_benchmark_shape(
+    benchmark: Benchmarks,
+    evaluation_strategy: EvaluationStrategy,
+) -> tuple[int, int, int]:
+    """
+    Returns the number of users, items and interactions of the train and validation split of a benchmark. They are
+    read from the metadata of the dataset cache, so the splits are not loaded, see `MemoryMappedDataset`. If the
+    dataset cache of the benchmark has not been created yet, then the splits are cached by the calling process.
+    """
+    experiment_benchmark = MAPPER_AVAILABLE_BENCHMARKS[benchmark]
+
+    dataset = get_dataset_from_benchmark(
+        benchmark_config=experiment_benchmark.config,
+        benchmark=experiment_benchmark.benchmark,
+    )
+    urm_splits_metadata = dataset.get_urm_splits_metadata(
+        evaluation_strategy=evaluation_strategy,
+    )
+
+    if urm_splits_metadata is None:
+        # On a fresh run the jobs are submitted before any of them creates the cache, so the client creates it to
+        # estimate the resources of the jobs, see `get_job_resources`.
+        dataset.get_urm_splits(
+            evaluation_strategy=evaluation_strategy,
+        )
+        urm_splits_metadata = dataset.get_urm_splits_metadata(
+            evaluation_strategy=evaluation_strategy,
+        )
+
+    num_users, num_items = urm_splits_metadata["sp_urm_train_validation"]["shape"]
+
+    return num_users, num_items, urm_splits_metadata["sp_urm_train_validation"]["nnz"]
+
+
+# Largest values of the hyper-parameters that determine the size of the models in the searches.
+_ESTIMATE_MAX_TOP_K = 1000
+_ESTIMATE_MAX_NUM_FACTORS = 350
+_ESTIMATE_MAX_HIDDEN_UNITS = 600
+
+# Memory of a worker process, the evaluators, which process the users in blocks of ~1GB in the worker process (see
+# `get_evaluators`), and the train splits, which are copied by each recommender.
+_ESTIMATE_BASE_MEMORY = 2 * 2 ** 30
+_ESTIMATE_BYTES_PER_INTERACTION = 12
+
+# Memory of a child process started by a job, besides the pages it shares with the worker process.
+_ESTIMATE_CHILD_PROCESS_MEMORY = 2 ** 30
+
+# Recommenders that use all the cores of a worker, through BLAS or thread pools.
+_MULTI_THREADED_RECOMMENDERS: tuple[Type[BaseRecommender], ...] = (
+    recommenders.EASE_R_Recommender,
+    recommenders.IALSRecommender,
+    recommenders.PureSVDRecommender,
+    recommenders.MultiThreadSLIM_SLIMElasticNetRecommender,
+)
+
+
+def estimate_recommender_memory(
+    recommender_class: Type[BaseRecommender],
+    num_users: int,
+    num_items: int,
+    num_interactions: int,
+) -> int:
+    """
+    Public method that estimates the peak memory, in bytes, of the model of a recommender with the largest
+    hyper-parameters of the searches. Two models are accounted, as the hyper-parameter tuning keeps the one trained on
+    the train split and the one trained on the train and validation splits. The child processes the recommender starts
+    during training are also accounted.
+    """
+    bytes_float = 4
+    bytes_sparse_value = 12
+
+    if issubclass(recommender_class, (recommenders.EASE_R_Recommender, recommenders.SLIM_BPR_Cython)):
+        # Dense item-item matrix.
+        model_memory = bytes_float * num_items ** 2
+
+    elif issubclass(recommender_class, recommenders.UserKNNCFRecommender):
+        model_memory = bytes_sparse_value * num_users * _ESTIMATE_MAX_TOP_K
+
+    elif issubclass(recommender_class, (
+        recommenders.ItemKNNCFRecommender,
+        recommenders.P3alphaRecommender,
+        recommenders.RP3betaRecommender,
+        recommenders.SLIMElasticNetRecommender,
+        FoldedMatrixFactorizationRecommender,
+    )):
+        model_memory = bytes_sparse_value * num_items * _ESTIMATE_MAX_TOP_K
+
+    elif issubclass(recommender_class, (
+        recommenders.MatrixFactorization_AsySVD_Cython,
+        recommenders.MatrixFactorization_FunkSVD_Cython,
+        recommenders.MatrixFactorization_BPR_Cython,
+        recommenders.PureSVDRecommender,
+        recommenders.NMFRecommender,
+        recommenders.IALSRecommender,
+        recommenders.LightFMCFRecommender,
+    )):
+        # Latent factors of users and items, and their copies used during training.
+        model_memory = 3 * 2 * bytes_float * (num_users + num_items) * _ESTIMATE_MAX_NUM_FACTORS
+
+    elif issubclass(recommender_class, recommenders.MultVAERecommender):
+        # Weights of the encoder and decoder, and their optimizer state.
+        model_memory = 3 * 2 * bytes_float * num_items * _ESTIMATE_MAX_HIDDEN_UNITS
+
+    else:
+        # Non-personalized recommenders and the impressions ones, whose models are impressions features with as many
+        # values as interactions.
+        model_memory = bytes_sparse_value * num_interactions
+
+    children_memory = 0
+    if issubclass(recommender_class, recommenders.MultiThreadSLIM_SLIMElasticNetRecommender):
+        # Workers are child processes, each one densifies at most `gram_block_size` values of the Gram matrix at a time.
+        num_workers = inspect.signature(recommender_class.fit).parameters["workers"].default
+        children_memory = num_workers * (_ESTIMATE_CHILD_PROCESS_MEMORY + 2 * bytes_float * 2 ** 24)
+
+    return 2 * model_memory + children_memory
+
+
+def get_job_resources(
+    experiment_case: ExperimentCase,
+    recommender_classes: list[Type[BaseRecommender]],
+) -> dict[str, float]:
+    """
+    Public method that returns the resources of a job that trains the given recommenders, e.g., an impressions
+    re-ranking recommender and the baseline it loads, on the benchmark of an experiment case. See
+    `DaskInterface.submit_job`.
+    """
+    experiment_hyper_parameter_tuning_parameters = MAPPER_AVAILABLE_HYPER_PARAMETER_TUNING_PARAMETERS[
+        experiment_case.hyper_parameter_tuning_parameters
+    ]
+
+    num_users, num_items, num_interactions = get_benchmark_shape(
+        benchmark=experiment_case.benchmark,
+        evaluation_strategy=experiment_hyper_parameter_tuning_parameters.evaluation_strategy,
+    )
+    num_parallel_cases = experiment_hyper_parameter_tuning_parameters.num_parallel_cases
+
+    # Each case fitted in parallel copies the train splits and holds its recommenders. The cache of trained
+    # recommenders of the worker process outlives the job, but it is held while the job runs.
+    case_memory = _ESTIMATE_BYTES_PER_INTERACTION * num_interactions
+    for recommender_class in recommender_classes:
+        case_memory += estimate_recommender_memory(
+            recommender_class=recommender_class,
+            num_users=num_users,
+            num_items=num_items,
+            num_interactions=num_interactions,
+        )
+
+    job_memory = (
+        _ESTIMATE_BASE_MEMORY
+        + num_parallel_cases * case_memory
+        + experiment_hyper_parameter_tuning_parameters.cache_trained_recommenders_max_bytes
+    )
+    if num_parallel_cases > 1:
+        job_memory += num_parallel_cases * _ESTIMATE_CHILD_PROCESS_MEMORY
+
+    # The resources are capped to the cores of the workers when submitting the job.
+    is_multi_threaded = any(
+        issubclass(recommender_class, _MULTI_THREADED_RECOMMENDERS)
+        for recommender_class in recommender_classes
+    )
+    job_cpus = num_parallel_cases * (os.cpu_count() if is_multi_threaded else 1)
+
+    return {
+        RESOURCE_MEMORY: job_memory,
+        RESOURCE_CPU: job_cpus,
+    }
+
+
 @attrs.define(frozen=True, kw_only=True, slots=False)
 class Evaluators:
     validation: EvaluatorHoldout = attrs.field()
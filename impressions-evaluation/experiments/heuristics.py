@@ -49,6 +49,7 @@ def _run_impressions_heuristics_hyper_parameter_tuning(
 
     This method should not be called from outside.
     """
+    commons.save_trained_recommenders_uncompressed()
     
     experiment_benchmark = commons.MAPPER_AVAILABLE_BENCHMARKS[experiment_case.benchmark]
     experiment_recommender = commons.MAPPER_AVAILABLE_RECOMMENDERS[experiment_case.recommender]
@@ -58,12 +59,10 @@ def _run_impressions_heuristics_hyper_parameter_tuning(
 
     assert experiment_recommender.search_hyper_parameters is not None
 
-    benchmark_reader = commons.get_reader_from_benchmark(
+    dataset = commons.get_dataset_from_benchmark(
         benchmark_config=experiment_benchmark.config,
         benchmark=experiment_benchmark.benchmark,
     )
-    
-    dataset = benchmark_reader.dataset
 
     interactions_data_splits = dataset.get_urm_splits(
         evaluation_strategy=experiment_hyper_parameter_tuning_parameters.evaluation_strategy
@@ -210,6 +209,7 @@ def _run_impressions_heuristics_hyper_parameter_tuning(
 
             n_cases=experiment_hyper_parameter_tuning_parameters.num_cases,
             n_random_starts=experiment_hyper_parameter_tuning_parameters.num_random_starts,
+            n_parallel_cases=experiment_hyper_parameter_tuning_parameters.num_parallel_cases,
 
             output_file_name_root=experiment_file_name_root,
             output_folder_path=experiments_folder_path,
@@ -278,6 +278,10 @@ def run_impressions_heuristics_experiments(
                 "recommender": experiment_recommender.recommender.RECOMMENDER_NAME,
                 "benchmark": experiment_benchmark.benchmark.value,
             },
+            job_resources=commons.get_job_resources(
+                experiment_case=experiment_case,
+                recommender_classes=[experiment_recommender.recommender],
+            ),
             method=_run_impressions_heuristics_hyper_parameter_tuning,
             method_kwargs={
                 "experiment_case": experiment_case,
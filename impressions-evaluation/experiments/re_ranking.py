@@ -7,11 +7,18 @@ import attrs
 from HyperparameterTuning.SearchAbstractClass import SearchInputRecommenderArgs
 from HyperparameterTuning.SearchBayesianSkopt import SearchBayesianSkopt
 from Recommenders.BaseMatrixFactorizationRecommender import BaseMatrixFactorizationRecommender
+from Recommenders.BaseRecommender import BaseRecommender
 from recsys_framework_extensions.dask import DaskInterface
+from recsys_framework_extensions.data.mixins import InteractionsDataSplits
 from recsys_framework_extensions.logging import get_logger
 
 import experiments.commons as commons
-from experiments.baselines import load_trained_recommender, TrainedRecommenderType
+from experiments.baselines import (
+    load_trained_recommender,
+    load_trained_recommender_candidates,
+    TrainedRecommenderType,
+)
+from impression_recommenders.re_ranking.candidates import TopNCandidatesRecommender
 from impression_recommenders.re_ranking.impressions_discounting import DICT_SEARCH_CONFIGS as \
     ImpressionsDiscountingSearchConfigs
 from impression_recommenders.user_profile.folding import FoldedMatrixFactorizationRecommender
@@ -46,6 +53,38 @@ commons.FOLDERS.add(HYPER_PARAMETER_TUNING_EXPERIMENTS_DIR)
 #                    Hyper-parameter tuning of Re-Ranking Recommender                              #
 ####################################################################################################
 ####################################################################################################
+def _load_top_n_candidates(
+    baseline_recommender_trained_train: BaseRecommender,
+    baseline_recommender_trained_train_validation: BaseRecommender,
+    experiment_baseline_benchmark: commons.ExperimentBenchmark,
+    experiment_baseline_hyper_parameters: commons.HyperParameterTuningParameters,
+    data_splits: InteractionsDataSplits,
+    top_n: int,
+) -> tuple[TopNCandidatesRecommender, TopNCandidatesRecommender]:
+    """
+    Wraps the trained recommenders given to a re-ranking recommender, so their top-n candidates are computed once for
+    all the trials of a hyper-parameter search, see `HyperParameterTuningParameters.re_ranking_top_n_candidates`.
+    """
+    candidates_trained_train = load_trained_recommender_candidates(
+        trained_recommender=baseline_recommender_trained_train,
+        experiment_benchmark=experiment_baseline_benchmark,
+        experiment_hyper_parameter_tuning_parameters=experiment_baseline_hyper_parameters,
+        data_splits=data_splits,
+        model_type=TrainedRecommenderType.TRAIN,
+        top_n=top_n,
+    )
+    candidates_trained_train_validation = load_trained_recommender_candidates(
+        trained_recommender=baseline_recommender_trained_train_validation,
+        experiment_benchmark=experiment_baseline_benchmark,
+        experiment_hyper_parameter_tuning_parameters=experiment_baseline_hyper_parameters,
+        data_splits=data_splits,
+        model_type=TrainedRecommenderType.TRAIN_VALIDATION,
+        top_n=top_n,
+    )
+
+    return candidates_trained_train, candidates_trained_train_validation
+
+
 def _run_signal_analysis_ablation_impressions_re_ranking_hyper_parameter_tuning(
     experiment_case_ablation_reranking: commons.ExperimentCase,
     experiment_case_baseline: commons.ExperimentCase,
@@ -59,6 +98,8 @@ def _run_signal_analysis_ablation_impressions_re_ranking_hyper_parameter_tuning(
 
     This method should not be called from outside.
     """
+    commons.save_trained_recommenders_uncompressed()
+
     experiment_can_be_executed = (
         experiment_case_ablation_reranking.benchmark == experiment_case_baseline.benchmark
         and experiment_case_ablation_reranking.hyper_parameter_tuning_parameters == experiment_case_baseline.hyper_parameter_tuning_parameters
@@ -102,13 +143,11 @@ def _run_signal_analysis_ablation_impressions_re_ranking_hyper_parameter_tuning(
 
     assert experiment_re_ranking_recommender.search_hyper_parameters is not None
 
-    benchmark_reader = commons.get_reader_from_benchmark(
+    dataset = commons.get_dataset_from_benchmark(
         benchmark_config=experiment_re_ranking_benchmark.config,
         benchmark=experiment_re_ranking_benchmark.benchmark,
     )
 
-    dataset = benchmark_reader.dataset
-
     interactions_data_splits = dataset.get_urm_splits(
         evaluation_strategy=experiment_re_ranking_hyper_parameters.evaluation_strategy
     )
@@ -255,6 +294,16 @@ def _run_signal_analysis_ablation_impressions_re_ranking_hyper_parameter_tuning(
 
     assert baseline_recommender_trained_train.RECOMMENDER_NAME == baseline_recommender_trained_train_validation.RECOMMENDER_NAME
 
+    if experiment_re_ranking_hyper_parameters.re_ranking_top_n_candidates is not None:
+        baseline_recommender_trained_train, baseline_recommender_trained_train_validation = _load_top_n_candidates(
+            baseline_recommender_trained_train=baseline_recommender_trained_train,
+            baseline_recommender_trained_train_validation=baseline_recommender_trained_train_validation,
+            experiment_baseline_benchmark=experiment_baseline_benchmark,
+            experiment_baseline_hyper_parameters=experiment_baseline_hyper_parameters,
+            data_splits=interactions_data_splits,
+            top_n=experiment_re_ranking_hyper_parameters.re_ranking_top_n_candidates,
+        )
+
     experiments_folder_path = HYPER_PARAMETER_TUNING_EXPERIMENTS_DIR.format(
         benchmark=experiment_re_ranking_benchmark.benchmark.value,
         evaluation_strategy=experiment_re_ranking_hyper_parameters.evaluation_strategy.value,
@@ -287,6 +336,8 @@ def _run_signal_analysis_ablation_impressions_re_ranking_hyper_parameter_tuning(
             "uim_last_seen": impressions_feature_last_seen_train.copy(),
             "seed": experiment_re_ranking_hyper_parameters.reproducibility_seed,
             "trained_recommender": baseline_recommender_trained_train,
+            "cache_transformed_features": dict(),
+            "num_candidates": experiment_re_ranking_hyper_parameters.re_ranking_top_n_candidates,
         },
         FIT_POSITIONAL_ARGS=[],
         FIT_KEYWORD_ARGS={},
@@ -303,6 +354,8 @@ def _run_signal_analysis_ablation_impressions_re_ranking_hyper_parameter_tuning(
             "uim_last_seen": impressions_feature_last_seen_train_validation.copy(),
             "seed": experiment_re_ranking_hyper_parameters.reproducibility_seed,
             "trained_recommender": baseline_recommender_trained_train_validation,
+            "cache_transformed_features": dict(),
+            "num_candidates": experiment_re_ranking_hyper_parameters.re_ranking_top_n_candidates,
         },
         FIT_POSITIONAL_ARGS=[],
         FIT_KEYWORD_ARGS={},
@@ -349,6 +402,7 @@ def _run_signal_analysis_ablation_impressions_re_ranking_hyper_parameter_tuning(
 
         n_cases=experiment_re_ranking_hyper_parameters.num_cases,
         n_random_starts=experiment_re_ranking_hyper_parameters.num_random_starts,
+        n_parallel_cases=experiment_re_ranking_hyper_parameters.num_parallel_cases,
 
         output_file_name_root=experiment_file_name_root,
         output_folder_path=experiments_folder_path,
@@ -375,6 +429,8 @@ def _run_ablation_impressions_re_ranking_hyper_parameter_tuning(
 
     This method should not be called from outside.
     """
+    commons.save_trained_recommenders_uncompressed()
+
     experiment_can_be_executed = (
         experiment_case_ablation_reranking.benchmark == experiment_case_baseline.benchmark
         and experiment_case_ablation_reranking.hyper_parameter_tuning_parameters == experiment_case_baseline.hyper_parameter_tuning_parameters
@@ -418,13 +474,11 @@ def _run_ablation_impressions_re_ranking_hyper_parameter_tuning(
 
     assert experiment_re_ranking_recommender.search_hyper_parameters is not None
 
-    benchmark_reader = commons.get_reader_from_benchmark(
+    dataset = commons.get_dataset_from_benchmark(
         benchmark_config=experiment_re_ranking_benchmark.config,
         benchmark=experiment_re_ranking_benchmark.benchmark,
     )
 
-    dataset = benchmark_reader.dataset
-
     interactions_data_splits = dataset.get_urm_splits(
         evaluation_strategy=experiment_re_ranking_hyper_parameters.evaluation_strategy
     )
@@ -571,6 +625,16 @@ def _run_ablation_impressions_re_ranking_hyper_parameter_tuning(
 
     assert baseline_recommender_trained_train.RECOMMENDER_NAME == baseline_recommender_trained_train_validation.RECOMMENDER_NAME
 
+    if experiment_re_ranking_hyper_parameters.re_ranking_top_n_candidates is not None:
+        baseline_recommender_trained_train, baseline_recommender_trained_train_validation = _load_top_n_candidates(
+            baseline_recommender_trained_train=baseline_recommender_trained_train,
+            baseline_recommender_trained_train_validation=baseline_recommender_trained_train_validation,
+            experiment_baseline_benchmark=experiment_baseline_benchmark,
+            experiment_baseline_hyper_parameters=experiment_baseline_hyper_parameters,
+            data_splits=interactions_data_splits,
+            top_n=experiment_re_ranking_hyper_parameters.re_ranking_top_n_candidates,
+        )
+
     experiments_folder_path = HYPER_PARAMETER_TUNING_EXPERIMENTS_DIR.format(
         benchmark=experiment_re_ranking_benchmark.benchmark.value,
         evaluation_strategy=experiment_re_ranking_hyper_parameters.evaluation_strategy.value,
@@ -603,6 +667,8 @@ def _run_ablation_impressions_re_ranking_hyper_parameter_tuning(
             "uim_last_seen": impressions_feature_last_seen_train.copy(),
             "seed": experiment_re_ranking_hyper_parameters.reproducibility_seed,
             "trained_recommender": baseline_recommender_trained_train,
+            "cache_transformed_features": dict(),
+            "num_candidates": experiment_re_ranking_hyper_parameters.re_ranking_top_n_candidates,
         },
         FIT_POSITIONAL_ARGS=[],
         FIT_KEYWORD_ARGS={},
@@ -619,6 +685,8 @@ def _run_ablation_impressions_re_ranking_hyper_parameter_tuning(
             "uim_last_seen": impressions_feature_last_seen_train_validation.copy(),
             "seed": experiment_re_ranking_hyper_parameters.reproducibility_seed,
             "trained_recommender": baseline_recommender_trained_train_validation,
+            "cache_transformed_features": dict(),
+            "num_candidates": experiment_re_ranking_hyper_parameters.re_ranking_top_n_candidates,
         },
         FIT_POSITIONAL_ARGS=[],
         FIT_KEYWORD_ARGS={},
@@ -665,6 +733,7 @@ def _run_ablation_impressions_re_ranking_hyper_parameter_tuning(
 
         n_cases=experiment_re_ranking_hyper_parameters.num_cases,
         n_random_starts=experiment_re_ranking_hyper_parameters.num_random_starts,
+        n_parallel_cases=experiment_re_ranking_hyper_parameters.num_parallel_cases,
 
         output_file_name_root=experiment_file_name_root,
         output_folder_path=experiments_folder_path,
@@ -690,6 +759,7 @@ def _run_impressions_re_ranking_hyper_parameter_tuning(
 
     This method should not be called from outside.
     """
+    commons.save_trained_recommenders_uncompressed()
 
     experiment_re_ranking_benchmark = commons.MAPPER_AVAILABLE_BENCHMARKS[
         experiment_case_reranking.benchmark
@@ -713,12 +783,10 @@ def _run_impressions_re_ranking_hyper_parameter_tuning(
 
     assert experiment_re_ranking_recommender.search_hyper_parameters is not None
 
-    benchmark_reader = commons.get_reader_from_benchmark(
+    dataset = commons.get_dataset_from_benchmark(
         benchmark_config=experiment_re_ranking_benchmark.config,
         benchmark=experiment_re_ranking_benchmark.benchmark,
     )
-    
-    dataset = benchmark_reader.dataset
 
     interactions_data_splits = dataset.get_urm_splits(
         evaluation_strategy=experiment_re_ranking_hyper_parameters.evaluation_strategy
@@ -867,6 +935,16 @@ def _run_impressions_re_ranking_hyper_parameter_tuning(
 
         assert baseline_recommender_trained_train.RECOMMENDER_NAME == baseline_recommender_trained_train_validation.RECOMMENDER_NAME
 
+        if experiment_re_ranking_hyper_parameters.re_ranking_top_n_candidates is not None:
+            baseline_recommender_trained_train, baseline_recommender_trained_train_validation = _load_top_n_candidates(
+                baseline_recommender_trained_train=baseline_recommender_trained_train,
+                baseline_recommender_trained_train_validation=baseline_recommender_trained_train_validation,
+                experiment_baseline_benchmark=experiment_baseline_benchmark,
+                experiment_baseline_hyper_parameters=experiment_baseline_hyper_parameters,
+                data_splits=interactions_data_splits,
+                top_n=experiment_re_ranking_hyper_parameters.re_ranking_top_n_candidates,
+            )
+
         experiments_folder_path = HYPER_PARAMETER_TUNING_EXPERIMENTS_DIR.format(
             benchmark=experiment_re_ranking_benchmark.benchmark.value,
             evaluation_strategy=experiment_re_ranking_hyper_parameters.evaluation_strategy.value,
@@ -897,6 +975,8 @@ def _run_impressions_re_ranking_hyper_parameter_tuning(
                 "uim_last_seen": impressions_feature_last_seen_train.copy(),
                 "seed": experiment_re_ranking_hyper_parameters.reproducibility_seed,
                 "trained_recommender": baseline_recommender_trained_train,
+                "cache_transformed_features": dict(),
+                "num_candidates": experiment_re_ranking_hyper_parameters.re_ranking_top_n_candidates,
             },
             FIT_POSITIONAL_ARGS=[],
             FIT_KEYWORD_ARGS={},
@@ -913,6 +993,8 @@ def _run_impressions_re_ranking_hyper_parameter_tuning(
                 "uim_last_seen": impressions_feature_last_seen_train_validation.copy(),
                 "seed": experiment_re_ranking_hyper_parameters.reproducibility_seed,
                 "trained_recommender": baseline_recommender_trained_train_validation,
+                "cache_transformed_features": dict(),
+                "num_candidates": experiment_re_ranking_hyper_parameters.re_ranking_top_n_candidates,
             },
             FIT_POSITIONAL_ARGS=[],
             FIT_KEYWORD_ARGS={},
@@ -958,6 +1040,7 @@ def _run_impressions_re_ranking_hyper_parameter_tuning(
 
             n_cases=experiment_re_ranking_hyper_parameters.num_cases,
             n_random_starts=experiment_re_ranking_hyper_parameters.num_random_starts,
+            n_parallel_cases=experiment_re_ranking_hyper_parameters.num_parallel_cases,
 
             output_file_name_root=experiment_file_name_root,
             output_folder_path=experiments_folder_path,
@@ -977,18 +1060,25 @@ def run_impressions_re_ranking_experiments(
     dask_interface: DaskInterface,
     re_ranking_experiment_cases_interface: commons.ExperimentCasesInterface,
     baseline_experiment_cases_interface: commons.ExperimentCasesInterface,
+    baselines_jobs: Optional[commons.T_EXPERIMENT_CASES_JOBS] = None,
 ) -> None:
     """
     Public method that instructs dask to run in dask workers the hyper-parameter tuning of the impressions discounting
     recommenders.
 
+    Each job starts when the job tuning its baseline in `baselines_jobs` finishes, baselines without a job are expected
+    to be tuned already.
+
     Processes are always preferred than threads as the hyper-parameter tuning loop is probably not thread-safe.
     """
+    if baselines_jobs is None:
+        baselines_jobs = dict()
+
     for experiment_case_reranking in re_ranking_experiment_cases_interface.experiment_cases:
         for experiment_case_baseline in baseline_experiment_cases_interface.experiment_cases:
             if (
                 experiment_case_reranking.benchmark != experiment_case_baseline.benchmark
-                and experiment_case_reranking.hyper_parameter_tuning_parameters != experiment_case_baseline.hyper_parameter_tuning_parameters
+                or experiment_case_reranking.hyper_parameter_tuning_parameters != experiment_case_baseline.hyper_parameter_tuning_parameters
             ):
                 continue
 
@@ -1032,6 +1122,11 @@ def run_impressions_re_ranking_experiments(
                         "similarity": similarity,
                         "benchmark": re_ranking_benchmark.benchmark.value,
                     },
+                    job_resources=commons.get_job_resources(
+                        experiment_case=experiment_case_reranking,
+                        recommender_classes=[re_ranking_recommender.recommender, baseline_recommender.recommender],
+                    ),
+                    job_dependencies=baselines_jobs.get(experiment_case_baseline),
                     method=_run_impressions_re_ranking_hyper_parameter_tuning,
                     method_kwargs={
                         "experiment_case_reranking": experiment_case_reranking,
@@ -1045,13 +1140,23 @@ def run_ablation_impressions_re_ranking_experiments(
     dask_interface: DaskInterface,
     ablation_re_ranking_experiment_cases_interface: commons.ExperimentCasesInterface,
     baseline_experiment_cases_interface: commons.ExperimentCasesInterface,
+    baselines_jobs: Optional[commons.T_EXPERIMENT_CASES_JOBS] = None,
+    folded_jobs: Optional[commons.T_EXPERIMENT_CASES_JOBS] = None,
 ) -> None:
     """
     Public method that instructs dask to run in dask workers the hyper-parameter tuning of the impressions discounting
     recommenders for the ablation study.
 
+    Each job starts when the jobs tuning its baseline in `baselines_jobs`, and its folded version in `folded_jobs`,
+    finish. Baselines without a job are expected to be tuned already.
+
     Processes are always preferred than threads as the hyper-parameter tuning loop is probably not thread-safe.
     """
+    if baselines_jobs is None:
+        baselines_jobs = dict()
+    if folded_jobs is None:
+        folded_jobs = dict()
+
     for experiment_case_ablation_reranking in ablation_re_ranking_experiment_cases_interface.experiment_cases:
         for experiment_case_baseline in baseline_experiment_cases_interface.experiment_cases:
             experiment_can_be_tested = (
@@ -1114,6 +1219,18 @@ def run_ablation_impressions_re_ranking_experiments(
                             "benchmark": re_ranking_benchmark.benchmark.value,
                             "try_folded_recommender": try_folded_recommender,
                         },
+                        job_resources=commons.get_job_resources(
+                            experiment_case=experiment_case_ablation_reranking,
+                            recommender_classes=[
+                                re_ranking_recommender.recommender,
+                                baseline_recommender.recommender,
+                                *([FoldedMatrixFactorizationRecommender] if try_folded_recommender else []),
+                            ],
+                        ),
+                        job_dependencies=[
+                            *baselines_jobs.get(experiment_case_baseline, []),
+                            *(folded_jobs.get(experiment_case_baseline, []) if try_folded_recommender else []),
+                        ],
                         method=_run_ablation_impressions_re_ranking_hyper_parameter_tuning,
                         method_kwargs={
                             "experiment_case_ablation_reranking": experiment_case_ablation_reranking,
@@ -1128,13 +1245,23 @@ def run_signal_analysis_ablation_impressions_re_ranking_experiments(
     dask_interface: DaskInterface,
     ablation_re_ranking_experiment_cases_interface: commons.ExperimentCasesInterface,
     baseline_experiment_cases_interface: commons.ExperimentCasesInterface,
+    baselines_jobs: Optional[commons.T_EXPERIMENT_CASES_JOBS] = None,
+    folded_jobs: Optional[commons.T_EXPERIMENT_CASES_JOBS] = None,
 ) -> None:
     """
     Public method that instructs dask to run in dask workers the hyper-parameter tuning of the impressions discounting
     recommenders for the ablation study while manually specifying the signals within impressions.
 
+    Each job starts when the jobs tuning its baseline in `baselines_jobs`, and its folded version in `folded_jobs`,
+    finish. Baselines without a job are expected to be tuned already.
+
     Processes are always preferred than threads as the hyper-parameter tuning loop is probably not thread-safe.
     """
+    if baselines_jobs is None:
+        baselines_jobs = dict()
+    if folded_jobs is None:
+        folded_jobs = dict()
+
     for experiment_case_ablation_reranking in ablation_re_ranking_experiment_cases_interface.experiment_cases:
         for experiment_case_baseline in baseline_experiment_cases_interface.experiment_cases:
             experiment_can_be_tested = (
@@ -1198,6 +1325,18 @@ def run_signal_analysis_ablation_impressions_re_ranking_experiments(
                                 "benchmark": re_ranking_benchmark.benchmark.value,
                                 "try_folded_recommender": try_folded_recommender,
                             },
+                            job_resources=commons.get_job_resources(
+                                experiment_case=experiment_case_ablation_reranking,
+                                recommender_classes=[
+                                    re_ranking_recommender.recommender,
+                                    baseline_recommender.recommender,
+                                    *([FoldedMatrixFactorizationRecommender] if try_folded_recommender else []),
+                                ],
+                            ),
+                            job_dependencies=[
+                                *baselines_jobs.get(experiment_case_baseline, []),
+                                *(folded_jobs.get(experiment_case_baseline, []) if try_folded_recommender else []),
+                            ],
                             method=_run_signal_analysis_ablation_impressions_re_ranking_hyper_parameter_tuning,
                             method_kwargs={
                                 "experiment_case_ablation_reranking": experiment_case_ablation_reranking,
@@ -61,6 +61,7 @@ def _run_impressions_user_profiles_hyper_parameter_tuning(
 
     This method should not be called from outside.
     """
+    commons.save_trained_recommenders_uncompressed()
 
     experiment_user_profiles_benchmark = commons.MAPPER_AVAILABLE_BENCHMARKS[
         experiment_case_user_profile.benchmark
@@ -84,12 +85,10 @@ def _run_impressions_user_profiles_hyper_parameter_tuning(
 
     assert experiment_user_profiles_recommender.search_hyper_parameters is not None
 
-    benchmark_reader = commons.get_reader_from_benchmark(
+    dataset = commons.get_dataset_from_benchmark(
         benchmark_config=experiment_user_profiles_benchmark.config,
         benchmark=experiment_user_profiles_benchmark.benchmark,
     )
-    
-    dataset = benchmark_reader.dataset
 
     interactions_data_splits = dataset.get_urm_splits(
         evaluation_strategy=experiment_user_profiles_hyper_parameters.evaluation_strategy,
@@ -265,6 +264,7 @@ def _run_impressions_user_profiles_hyper_parameter_tuning(
 
             n_cases=experiment_user_profiles_hyper_parameters.num_cases,
             n_random_starts=experiment_user_profiles_hyper_parameters.num_random_starts,
+            n_parallel_cases=experiment_user_profiles_hyper_parameters.num_parallel_cases,
 
             output_file_name_root=experiment_file_name_root,
             output_folder_path=experiments_folder_path,
@@ -292,6 +292,7 @@ def _run_signal_analysis_impressions_user_profiles_hyper_parameter_tuning(
 
     This method should not be called from outside.
     """
+    commons.save_trained_recommenders_uncompressed()
 
     experiment_user_profiles_benchmark = commons.MAPPER_AVAILABLE_BENCHMARKS[
         experiment_case_user_profile.benchmark
@@ -315,13 +316,11 @@ def _run_signal_analysis_impressions_user_profiles_hyper_parameter_tuning(
 
     assert experiment_user_profiles_recommender.search_hyper_parameters is not None
 
-    benchmark_reader = commons.get_reader_from_benchmark(
+    dataset = commons.get_dataset_from_benchmark(
         benchmark_config=experiment_user_profiles_benchmark.config,
         benchmark=experiment_user_profiles_benchmark.benchmark,
     )
 
-    dataset = benchmark_reader.dataset
-
     interactions_data_splits = dataset.get_urm_splits(
         evaluation_strategy=experiment_user_profiles_hyper_parameters.evaluation_strategy,
     )
@@ -499,6 +498,7 @@ def _run_signal_analysis_impressions_user_profiles_hyper_parameter_tuning(
 
             n_cases=experiment_user_profiles_hyper_parameters.num_cases,
             n_random_starts=experiment_user_profiles_hyper_parameters.num_random_starts,
+            n_parallel_cases=experiment_user_profiles_hyper_parameters.num_parallel_cases,
 
             output_file_name_root=experiment_file_name_root,
             output_folder_path=experiments_folder_path,
@@ -518,18 +518,25 @@ def run_impressions_user_profiles_experiments(
     dask_interface: DaskInterface,
     user_profiles_experiment_cases_interface: commons.ExperimentCasesInterface,
     baseline_experiment_cases_interface: commons.ExperimentCasesInterface,
+    baselines_jobs: Optional[commons.T_EXPERIMENT_CASES_JOBS] = None,
 ) -> None:
     """
     Public method that instructs dask to run in dask workers the hyper-parameter tuning of the impressions as user
     profiles recommenders.
 
+    Each job starts when the job tuning its baseline in `baselines_jobs` finishes, baselines without a job are expected
+    to be tuned already.
+
     Processes are always preferred than threads as the hyper-parameter tuning loop is probably not thread-safe.
     """
+    if baselines_jobs is None:
+        baselines_jobs = dict()
+
     for experiment_case_user_profiles in user_profiles_experiment_cases_interface.experiment_cases:
         for experiment_case_baseline in baseline_experiment_cases_interface.experiment_cases:
             if (
                 experiment_case_user_profiles.benchmark != experiment_case_baseline.benchmark
-                and experiment_case_user_profiles.hyper_parameter_tuning_parameters != experiment_case_baseline.hyper_parameter_tuning_parameters
+                or experiment_case_user_profiles.hyper_parameter_tuning_parameters != experiment_case_baseline.hyper_parameter_tuning_parameters
             ):
                 continue
 
@@ -553,6 +560,11 @@ def run_impressions_user_profiles_experiments(
             ]:
                 similarities = baseline_hyper_parameters.knn_similarity_types
 
+            job_resources = commons.get_job_resources(
+                experiment_case=experiment_case_user_profiles,
+                recommender_classes=[user_profiles_recommender.recommender, baseline_recommender.recommender],
+            )
+
             for similarity in similarities:
                 dask_interface.submit_job(
                     job_key=(
@@ -574,6 +586,8 @@ def run_impressions_user_profiles_experiments(
                         "similarity": similarity,
                         "benchmark": user_profiles_benchmark.benchmark.value,
                     },
+                    job_resources=job_resources,
+                    job_dependencies=baselines_jobs.get(experiment_case_baseline),
                     method=_run_impressions_user_profiles_hyper_parameter_tuning,
                     method_kwargs={
                         "experiment_case_user_profile": experiment_case_user_profiles,
@@ -604,6 +618,8 @@ def run_impressions_user_profiles_experiments(
                             "similarity": similarity,
                             "benchmark": user_profiles_benchmark.benchmark.value,
                         },
+                        job_resources=job_resources,
+                        job_dependencies=baselines_jobs.get(experiment_case_baseline),
                         method=_run_signal_analysis_impressions_user_profiles_hyper_parameter_tuning,
                         method_kwargs={
                             "experiment_case_user_profile": experiment_case_user_profiles,
@@ -7,7 +7,7 @@ from Recommenders.BaseRecommender import BaseRecommender
 from Recommenders.Recommender_utils import check_matrix
 from recsys_framework_extensions.data.io import DataIO
 from recsys_framework_extensions.recommenders.base import SearchHyperParametersBaseRecommender
-from recsys_framework_extensions.recommenders.mixins import MixinLoadModel
+from recsys_framework_extensions.recommenders.mixins import MixinLoadModel, MixinTopKByRankingKeys
 from recsys_framework_extensions.recommenders.rank import rank_data_by_row
 from skopt.space import Categorical
 
@@ -38,7 +38,7 @@ class SearchHyperParametersRecencyRecommender(SearchHyperParametersBaseRecommend
     )
 
 
-class FrequencyRecencyRecommender(MixinLoadModel, BaseRecommender):
+class FrequencyRecencyRecommender(MixinTopKByRankingKeys, MixinLoadModel, BaseRecommender):
     RECOMMENDER_NAME = "FrequencyRecencyRecommender"
 
     def __init__(
@@ -129,6 +129,29 @@ class FrequencyRecencyRecommender(MixinLoadModel, BaseRecommender):
         self._sp_matrix_frequency_scores = check_matrix(X=self._sp_matrix_frequency_scores, format="csr", dtype=np.float32)
         self._sp_matrix_timestamp_scores = check_matrix(X=self._sp_matrix_timestamp_scores, format="csr", dtype=np.float32)
 
+    def _compute_ranking_keys(
+        self,
+        user_id_array: list[int],
+        items_to_compute: list[int] = None
+    ) -> tuple[sp.csr_matrix, np.ndarray, Optional[np.ndarray]]:
+        """
+        The primary key is the sparse frequency score and the secondary key is the timestamp score. Only user-item
+        pairs with both a frequency and a timestamp can be recommended.
+        """
+        sp_scores_frequency: sp.csr_matrix = self._sp_matrix_frequency_scores[user_id_array, :]
+        arr_scores_timestamp: np.ndarray = self._sp_matrix_timestamp_scores[user_id_array, :].toarray()
+
+        sp_coo_scores_frequency = sp_scores_frequency.tocoo()
+        arr_mask_frequency = sp_coo_scores_frequency.data != 0
+
+        arr_mask_candidates = np.zeros_like(arr_scores_timestamp, dtype=np.bool_)
+        arr_mask_candidates[
+            sp_coo_scores_frequency.row[arr_mask_frequency], sp_coo_scores_frequency.col[arr_mask_frequency]
+        ] = True
+        arr_mask_candidates &= arr_scores_timestamp != 0
+
+        return sp_scores_frequency, arr_scores_timestamp, arr_mask_candidates
+
     def _compute_item_score(
         self,
         user_id_array: list[int],
@@ -146,8 +169,11 @@ class FrequencyRecencyRecommender(MixinLoadModel, BaseRecommender):
         num_score_users: int = len(user_id_array)
         num_score_items: int = self.URM_train.shape[1]
 
-        arr_scores_timestamp = self._sp_matrix_timestamp_scores[user_id_array, :].toarray()
-        arr_scores_frequency = self._sp_matrix_frequency_scores[user_id_array, :].toarray()
+        sp_scores_frequency, arr_scores_timestamp, _ = self._compute_ranking_keys(
+            user_id_array=user_id_array,
+            items_to_compute=None,
+        )
+        arr_scores_frequency = sp_scores_frequency.toarray()
 
         assert arr_scores_frequency.shape == arr_scores_timestamp.shape
         assert num_score_items == arr_scores_timestamp.shape[1]
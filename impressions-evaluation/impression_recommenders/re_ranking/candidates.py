@@ -0,0 +1,430 @@
+import abc
+from typing import Optional
+
+import numpy as np
+import scipy.sparse as sp
+from Recommenders.BaseRecommender import BaseRecommender
+
+
+def compute_top_n_candidates(
+    trained_recommender: BaseRecommender,
+    user_id_array: np.ndarray,
+    top_n: int,
+    remove_seen_flag: bool = True,
+    block_size: int = 1000,
+) -> dict[str, np.ndarray]:
+    """
+    Computes the `top_n` items with the highest score of a trained recommender for each user in `user_id_array`, i.e.,
+    the candidates a re-ranking recommender re-orders. Users are scored in blocks of `block_size` users, so only a
+    (block_size, N) array of scores is dense at a time.
+
+    If `remove_seen_flag` is True, then items in the train data of the trained recommender are not candidates, as the
+    evaluation does not recommend them.
+
+    Returns
+    -------
+    dict[str, np.ndarray]
+        The arrays needed to create a `TopNCandidatesRecommender`: the (M,) `user_id_array`, the (M, top_n)
+        `candidates_items`, and the (M, top_n) `candidates_scores`, where M = |user_id_array|. Candidates of each
+        user are sorted by decreasing score.
+    """
+    assert top_n > 0
+    assert block_size > 0
+
+    user_id_array = np.asarray(user_id_array, dtype=np.int32)
+
+    num_users = user_id_array.shape[0]
+    num_items = trained_recommender.URM_train.shape[1]
+    top_n = min(top_n, num_items)
+
+    candidates_items = np.empty(shape=(num_users, top_n), dtype=np.int32)
+    candidates_scores: Optional[np.ndarray] = None
+
+    for block_start in range(0, num_users, block_size):
+        block_end = min(block_start + block_size, num_users)
+        block_user_id_array = user_id_array[block_start:block_end]
+
+        arr_scores: np.ndarray = np.array(
+            trained_recommender._compute_item_score(
+                user_id_array=block_user_id_array,
+                items_to_compute=None,
+            ),
+            copy=True,
+        )
+
+        if remove_seen_flag:
+            urm_users = trained_recommender.URM_train[block_user_id_array, :].tocoo()
+            arr_scores[urm_users.row, urm_users.col] = -np.inf
+
+        # Partition to get the top-n items of each user, then sort only them by decreasing score.
+        arr_block_items = np.argpartition(-arr_scores, kth=top_n - 1, axis=1)[:, :top_n]
+        arr_block_scores = np.take_along_axis(arr_scores, arr_block_items, axis=1)
+
+        arr_sort = np.argsort(-arr_block_scores, axis=1, kind="stable")
+        arr_block_items = np.take_along_axis(arr_block_items, arr_sort, axis=1)
+        arr_block_scores = np.take_along_axis(arr_block_scores, arr_sort, axis=1)
+
+        if candidates_scores is None:
+            candidates_scores = np.empty(shape=(num_users, top_n), dtype=arr_scores.dtype)
+
+        candidates_items[block_start:block_end, :] = arr_block_items
+        candidates_scores[block_start:block_end, :] = arr_block_scores
+
+    if candidates_scores is None:
+        candidates_scores = np.empty(shape=(num_users, top_n), dtype=np.float32)
+
+    return {
+        "user_id_array": user_id_array,
+        "candidates_items": candidates_items,
+        "candidates_scores": candidates_scores,
+    }
+
+
+class TopNCandidatesRecommender(BaseRecommender):
+    """
+    Serves the scores of a trained recommender that were precomputed with `compute_top_n_candidates`.
+
+    The scores of the candidates of each user are kept, the rest of the items get -inf, i.e., the trained recommender
+    acts as a candidate generator for a re-ranking recommender. As the candidates are computed once, the re-ranking
+    recommenders do not compute the scores of the trained recommender in every trial of a hyper-parameter search. The
+    arrays can be memory-mapped, so concurrent searches share them. Scores of users without candidates are computed
+    by the trained recommender and restricted to their top-n items as well.
+    """
+
+    RECOMMENDER_NAME = "TopNCandidatesRecommender"
+
+    def __init__(
+        self,
+        urm_train: sp.csr_matrix,
+        trained_recommender: BaseRecommender,
+        user_id_array: np.ndarray,
+        candidates_items: np.ndarray,
+        candidates_scores: np.ndarray,
+        remove_seen_flag: bool = True,
+        **kwargs,
+    ):
+        super().__init__(
+            URM_train=urm_train,
+            verbose=False,
+        )
+
+        assert candidates_items.shape == candidates_scores.shape
+        assert user_id_array.shape[0] == candidates_items.shape[0]
+
+        self._trained_recommender = trained_recommender
+        self._candidates_items = candidates_items
+        self._candidates_scores = candidates_scores
+        self._remove_seen_flag = remove_seen_flag
+        self._top_n: int = candidates_items.shape[1]
+
+        # Row of the candidates of each user, -1 if the user does not have precomputed candidates.
+        self._candidates_user_rows = np.full(shape=self.n_users, fill_value=-1, dtype=np.int32)
+        self._candidates_user_rows[user_id_array] = np.arange(user_id_array.shape[0], dtype=np.int32)
+
+        self.RECOMMENDER_NAME = f"Top{self._top_n}Candidates_{trained_recommender.RECOMMENDER_NAME}"
+
+    @property
+    def top_n(self) -> int:
+        return self._top_n
+
+    def get_candidates(
+        self,
+        user_id_array: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the (M, top_n) candidate items and their (M, top_n) scores for the users in `user_id_array`, where
+        M = |user_id_array|. Candidates of each user are sorted by decreasing score.
+        """
+        user_id_array = np.atleast_1d(np.asarray(user_id_array))
+        arr_user_rows = self._candidates_user_rows[user_id_array]
+
+        arr_mask_precomputed = arr_user_rows != -1
+        if np.all(arr_mask_precomputed):
+            return self._candidates_items[arr_user_rows, :], self._candidates_scores[arr_user_rows, :]
+
+        candidates_missing = compute_top_n_candidates(
+            trained_recommender=self._trained_recommender,
+            user_id_array=user_id_array[~arr_mask_precomputed],
+            top_n=self._top_n,
+            remove_seen_flag=self._remove_seen_flag,
+        )
+
+        candidates_items = np.empty(shape=(user_id_array.shape[0], self._top_n), dtype=self._candidates_items.dtype)
+        candidates_scores = np.empty(shape=(user_id_array.shape[0], self._top_n), dtype=self._candidates_scores.dtype)
+
+        candidates_items[arr_mask_precomputed] = self._candidates_items[arr_user_rows[arr_mask_precomputed], :]
+        candidates_scores[arr_mask_precomputed] = self._candidates_scores[arr_user_rows[arr_mask_precomputed], :]
+        candidates_items[~arr_mask_precomputed] = candidates_missing["candidates_items"]
+        candidates_scores[~arr_mask_precomputed] = candidates_missing["candidates_scores"]
+
+        return candidates_items, candidates_scores
+
+    def _compute_item_score(
+        self,
+        user_id_array: np.ndarray,
+        items_to_compute: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Returns
+        -------
+        np.ndarray
+            A (M, N) numpy array with the scores of the candidates of each user and -inf elsewhere, where
+            M = |user_id_array| and N = #Items.
+        """
+        candidates_items, candidates_scores = self.get_candidates(
+            user_id_array=user_id_array,
+        )
+
+        num_score_users = candidates_items.shape[0]
+
+        item_scores = np.full(
+            shape=(num_score_users, self.n_items),
+            fill_value=-np.inf,
+            dtype=np.result_type(candidates_scores.dtype, np.float32),
+        )
+        np.put_along_axis(item_scores, candidates_items, candidates_scores, axis=1)
+
+        if items_to_compute is not None:
+            arr_mask_items = np.ones(shape=self.n_items, dtype=np.bool_)
+            arr_mask_items[items_to_compute] = False
+            item_scores[:, arr_mask_items] = -np.inf
+
+        return item_scores
+
+    def fit(self, **kwargs):
+        pass
+
+
+def get_num_candidates(
+    trained_recommender: BaseRecommender,
+    num_candidates: Optional[int],
+) -> Optional[int]:
+    """
+    Returns the number of candidates a re-ranking recommender of `trained_recommender` must re-rank.
+
+    The scores of a `TopNCandidatesRecommender` are -inf outside its candidates, and the transforms of the re-ranking
+    recommenders do not keep them as -inf, e.g., ranks make them finite and a negative discount makes them +inf. Hence,
+    re-rankers of a `TopNCandidatesRecommender` always re-rank only its candidates, at most its `top_n` ones.
+    """
+    if isinstance(trained_recommender, TopNCandidatesRecommender):
+        if num_candidates is None:
+            return trained_recommender.top_n
+
+        return min(num_candidates, trained_recommender.top_n)
+
+    return num_candidates
+
+
+def get_candidates_values(
+    sp_matrix: sp.csr_matrix,
+    user_id_array: np.ndarray,
+    arr_candidates_items: np.ndarray,
+) -> np.ndarray:
+    """
+    Gathers the values of a sparse (#Users, #Items) matrix in the candidates of each user, without densifying the rows
+    of the users.
+
+    Returns
+    -------
+    np.ndarray
+        A (M, K) numpy array with the value of each user-candidate pair, where M = |user_id_array| and K is the number
+        of candidates.
+    """
+    num_users, num_candidates = arr_candidates_items.shape
+
+    arr_rows = np.repeat(np.asarray(user_id_array), num_candidates)
+    arr_values = sp_matrix[arr_rows, arr_candidates_items.ravel()]
+
+    return np.asarray(arr_values).reshape((num_users, num_candidates))
+
+
+class MixinCandidatesReRanking(abc.ABC):
+    """
+    Mixin for re-ranking recommenders that can re-rank only the top-K candidates of their trained recommender,
+    instead of every item in the catalog.
+
+    Subclasses set `_trained_recommender` and `_num_candidates` (None to re-rank all items), and implement
+    `_compute_candidates_scores`, which computes the new scores of a (M, K) block of candidates. The candidates are
+    the ones of the trained recommender if it is a `TopNCandidatesRecommender`, else they are computed with
+    `compute_top_n_candidates`. Items in the train data of the users are never candidates.
+
+    In this mode `recommend` selects the top-k items of each user inside the block, so the work per user does not
+    depend on the number of items, and `_compute_item_score` returns -inf for the items that are not candidates.
+
+    Recommenders using this mixin without implementing `_compute_candidates_scores` fail when their class is defined.
+    """
+
+    RECOMMENDER_NAME = ""
+
+    _trained_recommender: BaseRecommender
+    _num_candidates: Optional[int] = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        if issubclass(cls, BaseRecommender) and getattr(cls._compute_candidates_scores, "__isabstractmethod__", False):
+            raise TypeError(
+                f"{cls.__name__} re-ranks candidates but does not implement `_compute_candidates_scores`."
+            )
+
+    @abc.abstractmethod
+    def _compute_candidates_scores(
+        self,
+        user_id_array: np.ndarray,
+        arr_candidates_items: np.ndarray,
+        arr_candidates_scores: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Parameters
+        ----------
+        arr_candidates_items
+            A (M, K) numpy array with the candidates of each user, sorted by decreasing relevance.
+        arr_candidates_scores
+            A (M, K) numpy array with the relevance scores given by the trained recommender to the candidates.
+
+        Returns
+        -------
+        np.ndarray
+            A (M, K) numpy array with the new score of each user-candidate pair, where M = |user_id_array|.
+        """
+        pass
+
+    def _get_candidates_scores(
+        self,
+        user_id_array: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        assert self._num_candidates is not None
+
+        if isinstance(self._trained_recommender, TopNCandidatesRecommender):
+            arr_candidates_items, arr_candidates_scores = self._trained_recommender.get_candidates(
+                user_id_array=user_id_array,
+            )
+            arr_candidates_items = arr_candidates_items[:, :self._num_candidates]
+            arr_candidates_scores = arr_candidates_scores[:, :self._num_candidates]
+        else:
+            candidates = compute_top_n_candidates(
+                trained_recommender=self._trained_recommender,
+                user_id_array=user_id_array,
+                top_n=self._num_candidates,
+                block_size=len(user_id_array),
+            )
+            arr_candidates_items = candidates["candidates_items"]
+            arr_candidates_scores = candidates["candidates_scores"]
+
+        arr_new_scores = self._compute_candidates_scores(
+            user_id_array=user_id_array,
+            arr_candidates_items=arr_candidates_items,
+            arr_candidates_scores=arr_candidates_scores,
+        )
+
+        assert arr_candidates_items.shape == arr_new_scores.shape
+
+        # Users with fewer than K items that can be recommended have candidates with -inf relevance, which cannot be
+        # recommended either after the re-ranking.
+        arr_new_scores = np.where(
+            np.isneginf(arr_candidates_scores),
+            -np.inf,
+            arr_new_scores,
+        )
+
+        return arr_candidates_items, arr_new_scores
+
+    def _compute_candidates_item_score(
+        self,
+        user_id_array: np.ndarray,
+        items_to_compute: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Returns
+        -------
+        np.ndarray
+            A (M, N) numpy array with the new scores of the candidates of each user and -inf elsewhere, where
+            M = |user_id_array| and N = #Items.
+        """
+        user_id_array = np.atleast_1d(np.asarray(user_id_array))
+        num_items: int = self.URM_train.shape[1]  # type: ignore
+
+        arr_candidates_items, arr_new_scores = self._get_candidates_scores(
+            user_id_array=user_id_array,
+        )
+
+        new_item_scores = np.full(
+            shape=(len(user_id_array), num_items),
+            fill_value=-np.inf,
+            dtype=np.result_type(arr_new_scores.dtype, np.float32),
+        )
+        np.put_along_axis(new_item_scores, arr_candidates_items, arr_new_scores, axis=1)
+
+        if items_to_compute is not None:
+            arr_mask_items = np.ones(shape=num_items, dtype=np.bool_)
+            arr_mask_items[items_to_compute] = False
+            new_item_scores[:, arr_mask_items] = -np.inf
+
+        return new_item_scores
+
+    def recommend(
+        self,
+        user_id_array,
+        cutoff: Optional[int] = None,
+        remove_seen_flag: bool = True,
+        items_to_compute: Optional[np.ndarray] = None,
+        remove_top_pop_flag: bool = False,
+        remove_custom_items_flag: bool = False,
+        return_scores: bool = False,
+        **kwargs,
+    ):
+        if self._num_candidates is None:
+            return super().recommend(  # type: ignore
+                user_id_array,
+                cutoff=cutoff,
+                remove_seen_flag=remove_seen_flag,
+                items_to_compute=items_to_compute,
+                remove_top_pop_flag=remove_top_pop_flag,
+                remove_custom_items_flag=remove_custom_items_flag,
+                return_scores=return_scores,
+                **kwargs,
+            )
+
+        single_user = np.isscalar(user_id_array)
+        user_id_array = np.atleast_1d(user_id_array)
+
+        num_items: int = self.URM_train.shape[1]  # type: ignore
+        if cutoff is None:
+            cutoff = num_items - 1
+        cutoff = min(cutoff, num_items - 1)
+
+        arr_candidates_items, arr_new_scores = self._get_candidates_scores(
+            user_id_array=user_id_array,
+        )
+
+        arr_mask_excluded = np.zeros_like(arr_candidates_items, dtype=np.bool_)
+
+        if items_to_compute is not None:
+            arr_mask_items = np.ones(shape=num_items, dtype=np.bool_)
+            arr_mask_items[items_to_compute] = False
+            arr_mask_excluded |= arr_mask_items[arr_candidates_items]
+
+        if remove_seen_flag:
+            arr_mask_excluded |= get_candidates_values(
+                sp_matrix=self.URM_train,  # type: ignore
+                user_id_array=user_id_array,
+                arr_candidates_items=arr_candidates_items,
+            ) != 0
+
+        if remove_top_pop_flag:
+            arr_mask_excluded |= np.isin(arr_candidates_items, self.filterTopPop_ItemsID)  # type: ignore
+
+        if remove_custom_items_flag:
+            arr_mask_excluded |= np.isin(arr_candidates_items, self.items_to_ignore_ID)  # type: ignore
+
+        arr_new_scores = np.where(arr_mask_excluded, -np.inf, arr_new_scores)
+
+        # Candidates are few, so they are sorted instead of partitioned. Excluded candidates have -inf scores and are
+        # removed from the recommendations by `_format_ranking`.
+        arr_sorting = np.argsort(-arr_new_scores, axis=1, kind="stable")[:, :cutoff]
+        ranking = np.take_along_axis(arr_candidates_items, arr_sorting, axis=1)
+        ranking_scores = np.take_along_axis(arr_new_scores, arr_sorting, axis=1)
+
+        return self._format_ranking(  # type: ignore
+            user_id_array, ranking, ranking_scores, single_user, return_scores, scores_batch=None,
+        )
@@ -7,10 +7,12 @@ from Recommenders.BaseRecommender import BaseRecommender
 from Recommenders.Recommender_utils import check_matrix
 from recsys_framework_extensions.data.io import DataIO
 from recsys_framework_extensions.recommenders.base import SearchHyperParametersBaseRecommender
-from recsys_framework_extensions.recommenders.mixins import MixinLoadModel
+from recsys_framework_extensions.recommenders.mixins import MixinLoadModel, MixinTopKByRankingKeys
 from recsys_framework_extensions.recommenders.rank import rank_data_by_row
 from skopt.space import Integer, Categorical
 
+from impression_recommenders.re_ranking.candidates import MixinCandidatesReRanking, get_num_candidates, get_candidates_values
+
 
 T_SIGN = Literal[-1, 1]
 
@@ -91,7 +93,7 @@ assert np.array_equal(
 )
 
 
-class CyclingRecommender(MixinLoadModel, BaseRecommender):
+class CyclingRecommender(MixinCandidatesReRanking, MixinTopKByRankingKeys, MixinLoadModel, BaseRecommender):
     RECOMMENDER_NAME = "CyclingRecommender"
 
     def __init__(
@@ -99,14 +101,27 @@ class CyclingRecommender(MixinLoadModel, BaseRecommender):
         urm_train: sp.csr_matrix,
         uim_frequency: sp.csr_matrix,
         trained_recommender: BaseRecommender,
+        num_candidates: Optional[int] = None,
         **kwargs,
     ):
+        """
+        Parameters
+        ----------
+        num_candidates
+            If not None, then only the top `num_candidates` items of the trained recommender are re-ranked, see
+            `MixinCandidatesReRanking`. Re-rankers of a `TopNCandidatesRecommender` always re-rank only its
+            candidates, see `get_num_candidates`.
+        """
         super().__init__(
             URM_train=urm_train,
             verbose=True,
         )
 
         self._trained_recommender = trained_recommender
+        self._num_candidates = get_num_candidates(
+            trained_recommender=trained_recommender,
+            num_candidates=num_candidates,
+        )
         self._uim_frequency = uim_frequency
         self._matrix_presentation_scores = sp.csr_matrix(np.array([], dtype=np.float32))
         self._cycling_weight: int = 3
@@ -144,18 +159,20 @@ class CyclingRecommender(MixinLoadModel, BaseRecommender):
         assert user_id_array is not None
         assert len(user_id_array) > 0
 
+        if self._num_candidates is not None:
+            return self._compute_candidates_item_score(
+                user_id_array=user_id_array,
+                items_to_compute=items_to_compute,
+            )
+
         num_score_users: int = len(user_id_array)
         num_score_items: int = self.URM_train.shape[1]
 
-        # Dense array of shape (M,N) where M is len(user_id_array) and N is the total number of users in the dataset.
-        arr_scores_relevance: np.ndarray = self._trained_recommender._compute_item_score(
+        sp_scores_presentation, arr_scores_relevance, _ = self._compute_ranking_keys(
             user_id_array=user_id_array,
             items_to_compute=items_to_compute,
         )
-        arr_scores_presentation: np.ndarray = self._matrix_presentation_scores[user_id_array, :].toarray()
-
-        assert (num_score_users, num_score_items) == arr_scores_presentation.shape
-        assert (num_score_users, num_score_items) == arr_scores_relevance.shape
+        arr_scores_presentation: np.ndarray = sp_scores_presentation.toarray()
 
         # Note: `rank_data_by_row` requires that the most important array are place right-most in the tuple. In  this
         # case, we want to sort first by `arr_scores_presentation` and then by `arr_scores_relevance`.
@@ -185,6 +202,51 @@ class CyclingRecommender(MixinLoadModel, BaseRecommender):
 
         return new_item_scores
 
+    def _compute_ranking_keys(
+        self,
+        user_id_array: list[int],
+        items_to_compute: Optional[list[int]] = None,
+    ) -> tuple[sp.csr_matrix, np.ndarray, Optional[np.ndarray]]:
+        """
+        The primary key of cycling is the sparse presentation score and the secondary key is the dense relevance score
+        given by the trained recommender. Only the relevance score is computed as a dense array, the `recommend` of
+        `MixinTopKByRankingKeys` selects the top-k items without densifying the presentation score.
+        """
+        num_score_users: int = len(user_id_array)
+        num_score_items: int = self.URM_train.shape[1]
+
+        # Dense array of shape (M,N) where M is len(user_id_array) and N is the total number of users in the dataset.
+        arr_scores_relevance: np.ndarray = self._trained_recommender._compute_item_score(
+            user_id_array=user_id_array,
+            items_to_compute=items_to_compute,
+        )
+        sp_scores_presentation: sp.csr_matrix = self._matrix_presentation_scores[user_id_array, :]
+
+        assert (num_score_users, num_score_items) == sp_scores_presentation.shape
+        assert (num_score_users, num_score_items) == arr_scores_relevance.shape
+
+        return sp_scores_presentation, arr_scores_relevance, None
+
+    def _compute_candidates_scores(
+        self,
+        user_id_array: np.ndarray,
+        arr_candidates_items: np.ndarray,
+        arr_candidates_scores: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Ranks the candidates of each user as `_compute_item_score` ranks all items, i.e., first by their presentation
+        score and then by their relevance score. Ranks go from 1 to K, the number of candidates.
+        """
+        arr_candidates_presentation = get_candidates_values(
+            sp_matrix=self._matrix_presentation_scores,
+            user_id_array=user_id_array,
+            arr_candidates_items=arr_candidates_items,
+        ).astype(np.float32)
+
+        return rank_data_by_row(
+            keys=(arr_candidates_scores, arr_candidates_presentation)
+        )
+
     def fit(
         self,
         weight: int,
@@ -10,6 +10,7 @@ from recsys_framework_extensions.recommenders.base import SearchHyperParametersB
 from skopt.space import Real
 
 from impression_recommenders.constants import ERankMethod
+from impression_recommenders.re_ranking.candidates import MixinCandidatesReRanking, get_num_candidates
 
 
 @attrs.define(kw_only=True, frozen=True, slots=False)
@@ -24,7 +25,7 @@ class SearchHyperParametersDitheringRecommender(SearchHyperParametersBaseRecomme
     )
 
 
-class DitheringRecommender(BaseRecommender):
+class DitheringRecommender(MixinCandidatesReRanking, BaseRecommender):
     """
     Dithering [1]_ is a plug-in recommender that re-ranks recommendations by adding random noise to the original ranks
     in the recommendation list.
@@ -54,14 +55,27 @@ class DitheringRecommender(BaseRecommender):
         urm_train: sp.csr_matrix,
         trained_recommender: BaseRecommender,
         seed: int,
+        num_candidates: Optional[int] = None,
         **kwargs,
     ):
+        """
+        Parameters
+        ----------
+        num_candidates
+            If not None, then only the top `num_candidates` items of the trained recommender are re-ranked, see
+            `MixinCandidatesReRanking`. Re-rankers of a `TopNCandidatesRecommender` always re-rank only its
+            candidates, see `get_num_candidates`.
+        """
         super().__init__(
             URM_train=urm_train,
             verbose=True,
         )
 
         self._trained_recommender = trained_recommender
+        self._num_candidates = get_num_candidates(
+            trained_recommender=trained_recommender,
+            num_candidates=num_candidates,
+        )
         self._rank_method: ERankMethod = ERankMethod.MIN
 
         self._rng = np.random.default_rng(seed=seed)
@@ -84,6 +98,12 @@ class DitheringRecommender(BaseRecommender):
         assert user_id_array is not None
         assert len(user_id_array) > 0
 
+        if self._num_candidates is not None:
+            return self._compute_candidates_item_score(
+                user_id_array=user_id_array,
+                items_to_compute=items_to_compute,
+            )
+
         item_scores_trained_recommender = self._trained_recommender._compute_item_score(
             user_id_array=user_id_array,
             items_to_compute=items_to_compute,
@@ -133,6 +153,39 @@ class DitheringRecommender(BaseRecommender):
 
         return new_item_scores
 
+    def _compute_candidates_scores(
+        self,
+        user_id_array: np.ndarray,
+        arr_candidates_items: np.ndarray,
+        arr_candidates_scores: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Computes the dithering scores of the candidates. Ranks are computed among the K candidates and shifted by
+        #Items - K, so the log-ranks of the candidates are in the same range as when all items are ranked.
+        """
+        num_items: int = self.URM_train.shape[1]
+        num_candidates: int = arr_candidates_items.shape[1]
+
+        ranks_candidates_scores = st.rankdata(
+            a=arr_candidates_scores,
+            method=self._rank_method.value,
+            axis=1,
+        ).astype(
+            np.float32,
+        ) + (num_items - num_candidates)
+
+        log_ranks_candidates_scores = np.log(
+            ranks_candidates_scores
+        )
+
+        random_noise_candidates_scores = self._rng.normal(
+            loc=self._rng_func_mean,
+            scale=self._rng_func_variance,
+            size=ranks_candidates_scores.shape,
+        )
+
+        return log_ranks_candidates_scores + random_noise_candidates_scores
+
     def fit(
         self,
         epsilon: float,
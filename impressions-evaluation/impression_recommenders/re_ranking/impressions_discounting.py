@@ -11,6 +11,8 @@ from recsys_framework_extensions.recommenders.base import SearchHyperParametersB
 from recsys_framework_extensions.recommenders.mixins import MixinLoadModel
 from skopt.space import Real, Categorical
 
+from impression_recommenders.re_ranking.candidates import MixinCandidatesReRanking, get_num_candidates, get_candidates_values
+
 
 @attach_to_extended_json_decoder
 class EImpressionsDiscountingFunctions(enum.Enum):
@@ -284,7 +286,7 @@ _DICT_IMPRESSIONS_DISCOUNTING_FUNCTIONS: dict[EImpressionsDiscountingFunctions,
 }
 
 
-class ImpressionsDiscountingRecommender(MixinLoadModel, BaseRecommender):
+class ImpressionsDiscountingRecommender(MixinCandidatesReRanking, MixinLoadModel, BaseRecommender):
     RECOMMENDER_NAME = "ImpressionsDiscountingRecommender"
 
     def __init__(
@@ -294,14 +296,37 @@ class ImpressionsDiscountingRecommender(MixinLoadModel, BaseRecommender):
         uim_position: sp.csr_matrix,
         uim_last_seen: sp.csr_matrix,
         trained_recommender: BaseRecommender,
+        cache_transformed_features: Optional[dict[tuple[str, EImpressionsDiscountingFunctions], np.ndarray]] = None,
+        num_candidates: Optional[int] = None,
         **kwargs,
     ):
+        """
+        Parameters
+        ----------
+        cache_transformed_features
+            Optional dictionary where the transformed features are stored, keyed by `(feature, function)`. Passing
+            the same dictionary to several instances built with the same matrices, e.g., during a hyper-parameter
+            search, lets them transform each feature only once. If None, each instance uses its own cache.
+        num_candidates
+            If not None, then only the top `num_candidates` items of the trained recommender are re-ranked, see
+            `MixinCandidatesReRanking`. Re-rankers of a `TopNCandidatesRecommender` always re-rank only its
+            candidates, see `get_num_candidates`.
+        """
         super().__init__(
             URM_train=urm_train,
             verbose=True,
         )
 
         self._trained_recommender = trained_recommender
+        self._num_candidates = get_num_candidates(
+            trained_recommender=trained_recommender,
+            num_candidates=num_candidates,
+        )
+        self._cache_transformed_features = (
+            dict()
+            if cache_transformed_features is None
+            else cache_transformed_features
+        )
 
         self._user_frequency: np.ndarray = np.ediff1d(
             self.URM_train.indptr
@@ -327,6 +352,13 @@ class ImpressionsDiscountingRecommender(MixinLoadModel, BaseRecommender):
         self._reg_uim_position: float = 1.0
         self._reg_uim_last_seen: float = 1.0
 
+        # Signs and regularization are applied at scoring time as `sign * reg` coefficients of the transformed
+        # features, in this way the transformed features can be shared between different hyper-parameters.
+        self._coef_user_frequency: float = 1.0
+        self._coef_uim_frequency: float = 1.0
+        self._coef_uim_position: float = 1.0
+        self._coef_uim_last_seen: float = 1.0
+
         self._func_user_frequency:  EImpressionsDiscountingFunctions = EImpressionsDiscountingFunctions.LINEAR
         self._func_uim_frequency: EImpressionsDiscountingFunctions = EImpressionsDiscountingFunctions.LINEAR
         self._func_uim_position:  EImpressionsDiscountingFunctions = EImpressionsDiscountingFunctions.LINEAR
@@ -348,55 +380,98 @@ class ImpressionsDiscountingRecommender(MixinLoadModel, BaseRecommender):
         assert user_id_array is not None
         assert len(user_id_array) > 0
 
+        if self._num_candidates is not None:
+            return self._compute_candidates_item_score(
+                user_id_array=user_id_array,
+                items_to_compute=items_to_compute,
+            )
+
         num_score_users: int = len(user_id_array)
         num_score_items: int = self.URM_train.shape[1]
 
         # Dense array of shape (M,N) where M is len(user_id_array) and N is the total number of users in the dataset.
+        # The cast also copies the array, so the trained recommender scores are never modified in place.
         arr_scores_relevance: np.ndarray = self._trained_recommender._compute_item_score(
             user_id_array=user_id_array,
             items_to_compute=items_to_compute,
-        ).astype(np.float64)
+        ).astype(np.float32)
+
+        assert (num_score_users, num_score_items) == arr_scores_relevance.shape
 
-        # Compute the discounting scores for the current users. This results in a dense matrix array with shape
-        # (num_score_users, num_score_items).
         # Eq. 8 In the original paper. The paper also says that the discounting score should be divided by the maximum
         # score in the dataset. Mathematically, however, this is not needed.
-        arr_impressions_discounting_scores: np.ndarray = np.asarray(
-            (
-                1
-                + self._arr_user_frequency_scores[user_id_array, :]
-                + self._matrix_uim_frequency_scores[user_id_array, :]
-                + self._matrix_uim_position_scores[user_id_array, :]
-                + self._matrix_uim_last_seen_scores[user_id_array, :]
-            )
-        ).astype(np.float64)
+        # The discounting score is `1 + user_freq + uim_freq + uim_pos + uim_last_seen`. As the impressions matrices
+        # are very sparse, most cells only have the user term. Therefore, we scale each row by its user term and only
+        # patch the cells with impressions, instead of materializing the dense (M, N) discounting scores.
+        arr_user_discounting_scores: np.ndarray = (
+            1 + self._coef_user_frequency * self._arr_user_frequency_scores[user_id_array, :]
+        ).astype(np.float32)
+
+        matrix_impressions_discounting_scores: sp.csr_matrix = sp.csr_matrix(
+            self._coef_uim_frequency * self._matrix_uim_frequency_scores[user_id_array, :]
+            + self._coef_uim_position * self._matrix_uim_position_scores[user_id_array, :]
+            + self._coef_uim_last_seen * self._matrix_uim_last_seen_scores[user_id_array, :]
+        )
+        arr_impressions_rows = np.repeat(
+            np.arange(num_score_users),
+            np.ediff1d(matrix_impressions_discounting_scores.indptr),
+        )
+        arr_impressions_cols = matrix_impressions_discounting_scores.indices
 
-        assert (num_score_users, num_score_items) == arr_impressions_discounting_scores.shape
-        assert (num_score_users, num_score_items) == arr_scores_relevance.shape
+        # Relevance scores must be gathered before the rows are scaled.
+        arr_impressions_relevance = arr_scores_relevance[arr_impressions_rows, arr_impressions_cols]
 
-        new_item_scores = (
-            arr_scores_relevance
-            * arr_impressions_discounting_scores
+        new_item_scores = arr_scores_relevance
+        new_item_scores *= arr_user_discounting_scores
+        new_item_scores[arr_impressions_rows, arr_impressions_cols] = arr_impressions_relevance * (
+            arr_user_discounting_scores[arr_impressions_rows, 0]
+            + matrix_impressions_discounting_scores.data.astype(np.float32)
         )
 
         # If we are computing scores to a specific set of items, then we must set items outside this set to np.NINF,
         # so they are not
         if items_to_compute is not None:
-            arr_mask_items = np.zeros_like(new_item_scores, dtype=np.bool8)
-            arr_mask_items[:, items_to_compute] = True
+            arr_mask_items = np.ones(shape=(num_score_items,), dtype=np.bool8)
+            arr_mask_items[items_to_compute] = False
 
             # If the item is in `items_to_compute`, then keep the value from `new_item_scores`.
             # Else, set to -inf.
-            new_item_scores = np.where(
-                arr_mask_items,
-                new_item_scores,
-                np.NINF,
-            )
+            new_item_scores[:, arr_mask_items] = np.NINF
 
         assert (num_score_users, num_score_items) == new_item_scores.shape
 
         return new_item_scores
 
+    def _compute_candidates_scores(
+        self,
+        user_id_array: np.ndarray,
+        arr_candidates_items: np.ndarray,
+        arr_candidates_scores: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Computes Eq. 8 of the original paper only for the candidates, gathering the impressions features of each
+        user-candidate pair instead of slicing the rows of the impressions matrices.
+        """
+        # Inputs are converted to arrays, as products of `np.matrix` instances are matrix products, not elementwise.
+        arr_discounting_scores: np.ndarray = np.asarray(
+            1 + self._coef_user_frequency * np.asarray(self._arr_user_frequency_scores)[user_id_array, :]
+        )
+
+        for coef, matrix_scores in [
+            (self._coef_uim_frequency, self._matrix_uim_frequency_scores),
+            (self._coef_uim_position, self._matrix_uim_position_scores),
+            (self._coef_uim_last_seen, self._matrix_uim_last_seen_scores),
+        ]:
+            arr_discounting_scores = arr_discounting_scores + coef * np.asarray(
+                get_candidates_values(
+                    sp_matrix=matrix_scores,
+                    user_id_array=user_id_array,
+                    arr_candidates_items=arr_candidates_items,
+                )
+            )
+
+        return np.asarray(arr_candidates_scores, dtype=np.float32) * arr_discounting_scores.astype(np.float32)
+
     def fit(
         self,
         sign_user_frequency: T_SIGN,
@@ -441,32 +516,59 @@ class ImpressionsDiscountingRecommender(MixinLoadModel, BaseRecommender):
         self._func_uim_position = EImpressionsDiscountingFunctions(func_uim_position)
         self._func_uim_last_seen = EImpressionsDiscountingFunctions(func_uim_last_seen)
 
-        # Compute the different arrays and matrices used in the calculation of the discounting function.
-        selected_func = _DICT_IMPRESSIONS_DISCOUNTING_FUNCTIONS[self._func_user_frequency]
-        arr_user_frequency_scores: np.ndarray = self._sign_user_frequency * self._reg_user_frequency * selected_func(
-            self._user_frequency
-        )
+        self._coef_user_frequency = self._sign_user_frequency * self._reg_user_frequency
+        self._coef_uim_frequency = self._sign_uim_frequency * self._reg_uim_frequency
+        self._coef_uim_position = self._sign_uim_position * self._reg_uim_position
+        self._coef_uim_last_seen = self._sign_uim_last_seen * self._reg_uim_last_seen
 
-        selected_func = _DICT_IMPRESSIONS_DISCOUNTING_FUNCTIONS[self._func_uim_frequency]
-        matrix_uim_frequency_scores: sp.csr_matrix = self._sign_uim_frequency * self._reg_uim_frequency * selected_func(
-            self._uim_frequency
+        # The arrays and matrices used in the calculation of the discounting function are not scaled, the
+        # coefficients are applied in `_compute_item_score`.
+        self._arr_user_frequency_scores = self._get_transformed_feature(
+            feature="user_frequency", func=self._func_user_frequency,
         )
-
-        selected_func = _DICT_IMPRESSIONS_DISCOUNTING_FUNCTIONS[self._func_uim_position]
-        matrix_uim_position_scores: sp.csr_matrix = self._sign_uim_position * self._reg_uim_position * selected_func(
-            self._uim_position
+        self._matrix_uim_frequency_scores = self._get_transformed_feature(
+            feature="uim_frequency", func=self._func_uim_frequency,
         )
-
-        selected_func = _DICT_IMPRESSIONS_DISCOUNTING_FUNCTIONS[self._func_uim_last_seen]
-        matrix_uim_last_seen_scores: sp.csr_matrix = self._sign_uim_last_seen * self._reg_uim_last_seen * selected_func(
-            self._uim_last_seen
+        self._matrix_uim_position_scores = self._get_transformed_feature(
+            feature="uim_position", func=self._func_uim_position,
+        )
+        self._matrix_uim_last_seen_scores = self._get_transformed_feature(
+            feature="uim_last_seen", func=self._func_uim_last_seen,
         )
 
-        # Save all arrays and matrices
-        self._arr_user_frequency_scores = arr_user_frequency_scores
-        self._matrix_uim_frequency_scores = matrix_uim_frequency_scores
-        self._matrix_uim_position_scores = matrix_uim_position_scores
-        self._matrix_uim_last_seen_scores = matrix_uim_last_seen_scores
+    def _get_transformed_feature(
+        self,
+        feature: Literal["user_frequency", "uim_frequency", "uim_position", "uim_last_seen"],
+        func: EImpressionsDiscountingFunctions,
+    ) -> Any:
+        """
+        Applies `func` to a feature only the first time it is requested, later calls use the cached values.
+
+        All functions keep the sparsity structure of the impressions matrices, hence, only their data arrays are
+        cached and the returned matrices share the `indices` and `indptr` arrays of the original feature.
+        """
+        arr_or_matrix_feature = getattr(self, f"_{feature}")
+        key = (feature, func)
+
+        if key not in self._cache_transformed_features:
+            selected_func = _DICT_IMPRESSIONS_DISCOUNTING_FUNCTIONS[func]
+            transformed_feature = selected_func(arr_or_matrix_feature)
+
+            if sp.issparse(transformed_feature):
+                assert transformed_feature.nnz == arr_or_matrix_feature.nnz
+                transformed_feature = transformed_feature.data
+
+            self._cache_transformed_features[key] = transformed_feature
+
+        transformed_feature = self._cache_transformed_features[key]
+
+        if sp.issparse(arr_or_matrix_feature):
+            return sp.csr_matrix(
+                (transformed_feature, arr_or_matrix_feature.indices, arr_or_matrix_feature.indptr),
+                shape=arr_or_matrix_feature.shape,
+            )
+
+        return transformed_feature
 
     def save_model(self, folder_path, file_name=None):
         if file_name is None:
@@ -476,16 +578,21 @@ class ImpressionsDiscountingRecommender(MixinLoadModel, BaseRecommender):
             folder_path=folder_path,
             file_name=file_name,
             data_dict_to_save={
-                "_sign_user_frequency": self._reg_user_frequency,
-                "_sign_uim_frequency": self._reg_uim_frequency,
-                "_sign_uim_position": self._reg_uim_position,
-                "_sign_uim_last_seen": self._reg_uim_last_seen,
+                "_sign_user_frequency": self._sign_user_frequency,
+                "_sign_uim_frequency": self._sign_uim_frequency,
+                "_sign_uim_position": self._sign_uim_position,
+                "_sign_uim_last_seen": self._sign_uim_last_seen,
 
                 "_reg_user_frequency": self._reg_user_frequency,
                 "_reg_uim_frequency": self._reg_uim_frequency,
                 "_reg_uim_position": self._reg_uim_position,
                 "_reg_uim_last_seen": self._reg_uim_last_seen,
 
+                "_coef_user_frequency": self._coef_user_frequency,
+                "_coef_uim_frequency": self._coef_uim_frequency,
+                "_coef_uim_position": self._coef_uim_position,
+                "_coef_uim_last_seen": self._coef_uim_last_seen,
+
                 "_func_user_frequency": self._func_user_frequency,
                 "_func_uim_frequency": self._func_uim_frequency,
                 "_func_uim_position": self._func_uim_position,
@@ -12,6 +12,7 @@ from experiments.commons import (
     Benchmarks,
     HyperParameterTuningParameters,
     ensure_datasets_exist, RecommenderImpressions, EHyperParameterTuningParameters, RecommenderBaseline,
+    T_EXPERIMENT_CASES_JOBS,
 )
 
 from experiments.heuristics import run_impressions_heuristics_experiments
@@ -32,7 +33,8 @@ class ConsoleArguments(Tap):
 
     include_folded: bool = False
     """If the flag is included, then the script folds the tuned matrix-factorization base recommenders. If the 
-    recommenders are not previously tuned, then this flag fails."""
+    recommenders are not previously tuned, then this flag fails, unless `--include_baselines` is also included, in 
+    which case each recommender is folded as soon as it is tuned."""
 
     include_impressions_time_aware: bool = False
     """If the flag is included, then the script tunes the hyper-parameter of time-aware impressions recommenders: 
@@ -41,16 +43,19 @@ class ConsoleArguments(Tap):
     include_impressions_reranking: bool = False
     """If the flag is included, then the script tunes the hyper-parameter of re-ranking impressions recommenders: 
     Cycling and Impressions Discounting. These recommenders need base recommenders to be tuned, if they aren't then 
-    the method fails."""
+    the method fails. If `--include_baselines` is also included, then each recommender starts as soon as its base 
+    recommender is tuned."""
 
     include_ablation_impressions_reranking: bool = False
     """If the flag is included, then the script tunes the hyper-parameter of re-ranking impressions recommenders: 
     Impressions Discounting with only impressions frequency. These recommenders need base recommenders to be tuned, 
-    if they aren't then the method fails."""
+    if they aren't then the method fails. If `--include_baselines` and `--include_folded` are also included, then each 
+    recommender starts as soon as its base recommender is tuned."""
 
     include_impressions_profile: bool = False
     """If the flag is included, then the script tunes the hyper-parameter of impressions as user profiles recommenders. 
-    These recommenders need similarity-based recommenders to be tuned, if they aren't then the method fails."""
+    These recommenders need similarity-based recommenders to be tuned, if they aren't then the method fails. If 
+    `--include_baselines` is also included, then each recommender starts as soon as its base recommender is tuned."""
 
     print_evaluation_results: bool = False
     """Export to CSV and LaTeX the accuracy, beyond-accuracy, optimal hyper-parameters, and scalability metrics of 
@@ -160,22 +165,24 @@ if __name__ == '__main__':
             experiment_cases_interface=experiments_interface_baselines,
         )
 
+    # Experiments loading tuned baselines depend on the jobs tuning them, so all phases are submitted at once and Dask
+    # starts each job as soon as the baselines it needs are tuned.
+    baselines_jobs: T_EXPERIMENT_CASES_JOBS = dict()
+    folded_jobs: T_EXPERIMENT_CASES_JOBS = dict()
+
     if input_flags.include_baselines:
-        run_baselines_experiments(
+        baselines_jobs = run_baselines_experiments(
             dask_interface=dask_interface,
             experiment_cases_interface=experiments_interface_baselines,
         )
 
-    dask_interface.wait_for_jobs()
-
     if input_flags.include_folded:
-        run_baselines_folded(
+        folded_jobs = run_baselines_folded(
             dask_interface=dask_interface,
             experiment_cases_interface=experiments_interface_baselines,
+            baselines_jobs=baselines_jobs,
         )
 
-    dask_interface.wait_for_jobs()
-
     if input_flags.include_impressions_time_aware:
         run_impressions_heuristics_experiments(
             dask_interface=dask_interface,
@@ -187,6 +194,7 @@ if __name__ == '__main__':
             dask_interface=dask_interface,
             re_ranking_experiment_cases_interface=experiments_impressions_re_ranking_interface,
             baseline_experiment_cases_interface=experiments_interface_baselines,
+            baselines_jobs=baselines_jobs,
         )
 
     if input_flags.include_impressions_profile:
@@ -194,6 +202,7 @@ if __name__ == '__main__':
             dask_interface=dask_interface,
             user_profiles_experiment_cases_interface=experiments_impressions_user_profiles_interface,
             baseline_experiment_cases_interface=experiments_interface_baselines,
+            baselines_jobs=baselines_jobs,
         )
 
     if input_flags.include_ablation_impressions_reranking:
@@ -201,11 +210,15 @@ if __name__ == '__main__':
             dask_interface=dask_interface,
             ablation_re_ranking_experiment_cases_interface=experiments_ablation_impressions_re_ranking_interface,
             baseline_experiment_cases_interface=experiments_interface_baselines,
+            baselines_jobs=baselines_jobs,
+            folded_jobs=folded_jobs,
         )
         run_signal_analysis_ablation_impressions_re_ranking_experiments(
             dask_interface=dask_interface,
             ablation_re_ranking_experiment_cases_interface=experiments_ablation_impressions_re_ranking_interface,
             baseline_experiment_cases_interface=experiments_interface_baselines,
+            baselines_jobs=baselines_jobs,
+            folded_jobs=folded_jobs,
         )
 
     dask_interface.wait_for_jobs()
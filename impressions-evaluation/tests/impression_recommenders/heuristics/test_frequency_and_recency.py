@@ -3,6 +3,7 @@ import scipy.sparse as sp
 
 from impression_recommenders.heuristics.frequency_and_recency import RecencyRecommender, FrequencyRecencyRecommender, \
     T_SIGN
+from Recommenders.BaseRecommender import BaseRecommender
 
 
 class TestRecencyRecommender:
@@ -517,3 +518,52 @@ class TestFrequencyRecencyRecommender:
 
         # assert
         assert np.allclose(expected_item_scores, scores)
+
+    def test_recommend_top_k_by_ranking_keys(
+        self, urm: sp.csr_matrix, uim_timestamp: sp.csr_matrix, uim_frequency: sp.csr_matrix,
+    ):
+        # arrange
+        test_users = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+        test_cutoffs = [1, 3, 10]
+        test_items_values = [None, [1, 2, 5]]
+        test_remove_seen_flag_values = [False, True]
+
+        rec = FrequencyRecencyRecommender(
+            urm_train=urm,
+            uim_timestamp=uim_timestamp,
+            uim_frequency=uim_frequency,
+        )
+        rec.fit(sign_recency=-1, sign_frequency=1)
+
+        for test_cutoff in test_cutoffs:
+            for test_items in test_items_values:
+                for test_remove_seen_flag in test_remove_seen_flag_values:
+                    # act
+                    # `BaseRecommender.recommend` ranks all items with `_compute_item_score`.
+                    expected_recommendations, expected_scores = BaseRecommender.recommend(
+                        rec,
+                        user_id_array=test_users,
+                        items_to_compute=test_items,
+                        cutoff=test_cutoff,
+                        remove_seen_flag=test_remove_seen_flag,
+                        return_scores=True,
+                    )
+                    recommendations = rec.recommend(
+                        user_id_array=test_users,
+                        items_to_compute=test_items,
+                        cutoff=test_cutoff,
+                        remove_seen_flag=test_remove_seen_flag,
+                        return_scores=False,
+                    )
+                    recommendations_with_scores, scores = rec.recommend(
+                        user_id_array=test_users,
+                        items_to_compute=test_items,
+                        cutoff=test_cutoff,
+                        remove_seen_flag=test_remove_seen_flag,
+                        return_scores=True,
+                    )
+
+                    # assert
+                    assert expected_recommendations == recommendations
+                    assert expected_recommendations == recommendations_with_scores
+                    assert np.array_equal(expected_scores, scores)
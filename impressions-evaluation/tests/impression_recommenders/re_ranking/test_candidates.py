@@ -0,0 +1,394 @@
+from mock import patch
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from impression_recommenders.re_ranking.candidates import (
+    compute_top_n_candidates, TopNCandidatesRecommender, MixinCandidatesReRanking, get_candidates_values,
+)
+from impression_recommenders.re_ranking.cycling import CyclingRecommender
+from impression_recommenders.re_ranking.dithering import DitheringRecommender
+from impression_recommenders.re_ranking.impressions_discounting import ImpressionsDiscountingRecommender
+from tests.conftest import seed
+from Recommenders.BaseRecommender import BaseRecommender
+
+
+test_trained_recommender_item_scores = np.array(
+    [
+        [1, 6, 3, 2, 3, 5, 4],
+        [1, 1, 1, 1, 1, 1, 1],
+        [1, 2, 3, 4, 5, 6, 7],
+        [7, 6, 5, 4, 3, 2, 1],
+        [9, 7, 5, 4, 8, 7, 3],
+
+        [1, 6, 3, 2, 3, 5, 4],
+        [1, 1, 1, 1, 1, 1, 1],
+        [1, 2, 3, 4, 5, 6, 7],
+        [7, 6, 5, 4, 3, 2, 1],
+        [9, 7, 5, 4, 8, 7, 3],
+    ],
+    dtype=np.float32,
+)
+
+
+def _compute_item_score(
+    user_id_array,
+    items_to_compute=None,
+):
+    return test_trained_recommender_item_scores[user_id_array, :]
+
+
+class TestTopNCandidatesRecommender:
+    def test_compute_top_n_candidates(
+        self, urm: sp.csr_matrix,
+    ):
+        # arrange
+        test_users = np.array([0, 2, 3, 4, 7, 9], dtype=np.int32)
+        test_top_n = 3
+
+        expected_item_scores = test_trained_recommender_item_scores[test_users, :].copy()
+        urm_users = urm[test_users, :].tocoo()
+        expected_item_scores[urm_users.row, urm_users.col] = -np.inf
+
+        mock_base_recommender = BaseRecommender(URM_train=urm)
+        with patch.object(
+            mock_base_recommender,
+            '_compute_item_score',
+            side_effect=_compute_item_score,
+        ) as _:
+            # act
+            candidates = compute_top_n_candidates(
+                trained_recommender=mock_base_recommender,
+                user_id_array=test_users,
+                top_n=test_top_n,
+                block_size=4,
+            )
+
+            # assert
+            assert np.array_equal(test_users, candidates["user_id_array"])
+            assert (len(test_users), test_top_n) == candidates["candidates_items"].shape
+            assert (len(test_users), test_top_n) == candidates["candidates_scores"].shape
+
+            for idx_user in range(len(test_users)):
+                arr_items = candidates["candidates_items"][idx_user]
+                arr_scores = candidates["candidates_scores"][idx_user]
+
+                assert np.array_equal(expected_item_scores[idx_user, arr_items], arr_scores)
+                assert np.all(np.diff(arr_scores) <= 0)
+                assert np.array_equal(
+                    np.sort(expected_item_scores[idx_user])[::-1][:test_top_n],
+                    arr_scores,
+                )
+
+    def test_compute_item_score(
+        self, urm: sp.csr_matrix,
+    ):
+        # arrange
+        test_precomputed_users = np.array([0, 2, 3, 4, 7, 9], dtype=np.int32)
+        test_users = np.array([9, 1, 0, 4, 8], dtype=np.int32)
+        test_items = np.array([0, 1, 2, 4, 5], dtype=np.int32)
+        test_top_n = 3
+
+        mock_base_recommender = BaseRecommender(URM_train=urm)
+        with patch.object(
+            mock_base_recommender,
+            '_compute_item_score',
+            side_effect=_compute_item_score,
+        ) as _:
+            candidates_all_users = compute_top_n_candidates(
+                trained_recommender=mock_base_recommender,
+                user_id_array=test_users,
+                top_n=test_top_n,
+            )
+            candidates_precomputed_users = compute_top_n_candidates(
+                trained_recommender=mock_base_recommender,
+                user_id_array=test_precomputed_users,
+                top_n=test_top_n,
+            )
+
+            rec = TopNCandidatesRecommender(
+                urm_train=urm,
+                trained_recommender=mock_base_recommender,
+                **candidates_precomputed_users,
+            )
+
+            # act
+            item_scores = rec._compute_item_score(
+                user_id_array=test_users,
+                items_to_compute=None,
+            )
+            item_scores_items_to_compute = rec._compute_item_score(
+                user_id_array=test_users,
+                items_to_compute=test_items,
+            )
+
+            # assert
+            assert (len(test_users), urm.shape[1]) == item_scores.shape
+            assert np.all(np.isinf(item_scores).sum(axis=1) == urm.shape[1] - test_top_n)
+
+            for idx_user in range(len(test_users)):
+                arr_items = candidates_all_users["candidates_items"][idx_user]
+                arr_scores = candidates_all_users["candidates_scores"][idx_user]
+
+                assert np.array_equal(arr_scores, item_scores[idx_user, arr_items])
+
+            arr_mask_items = np.ones(shape=urm.shape[1], dtype=np.bool_)
+            arr_mask_items[test_items] = False
+
+            assert np.all(np.isneginf(item_scores_items_to_compute[:, arr_mask_items]))
+            assert np.array_equal(
+                item_scores[:, test_items],
+                item_scores_items_to_compute[:, test_items],
+            )
+
+
+# Distinct scores, so the recommendations do not depend on how ties are broken.
+test_distinct_item_scores = np.array(
+    [
+        np.random.default_rng(seed=idx_user).permutation(7) + 1
+        for idx_user in range(10)
+    ],
+    dtype=np.float32,
+)
+
+
+def _compute_distinct_item_score(
+    user_id_array,
+    items_to_compute=None,
+):
+    return test_distinct_item_scores[user_id_array, :].copy()
+
+
+class TestMixinCandidatesReRanking:
+    def test_missing_compute_candidates_scores_fails_at_class_definition(self):
+        # act & assert
+        with pytest.raises(TypeError):
+            class _RecommenderWithoutCandidatesScores(MixinCandidatesReRanking, BaseRecommender):
+                pass
+
+    def test_get_candidates_values_returns_arrays(
+        self, uim_frequency: sp.csr_matrix,
+    ):
+        # arrange
+        test_users = np.array([0, 2], dtype=np.int32)
+        test_candidates_items = np.array([[0, 1, 2], [2, 1, 0]], dtype=np.int32)
+
+        expected_values = uim_frequency.toarray()[test_users[:, np.newaxis], test_candidates_items]
+
+        # act
+        values = get_candidates_values(
+            sp_matrix=uim_frequency,
+            user_id_array=test_users,
+            arr_candidates_items=test_candidates_items,
+        )
+
+        # assert
+        assert not isinstance(values, np.matrix)
+        assert np.array_equal(expected_values, values)
+
+    def test_cycling_all_items_as_candidates(
+        self, urm: sp.csr_matrix, uim_frequency: sp.csr_matrix,
+    ):
+        # arrange
+        test_users = np.arange(urm.shape[0], dtype=np.int32)
+        test_cutoff = 3
+
+        mock_base_recommender = BaseRecommender(URM_train=urm)
+        with patch.object(
+            mock_base_recommender,
+            '_compute_item_score',
+            side_effect=_compute_distinct_item_score,
+        ) as _:
+            rec = CyclingRecommender(
+                urm_train=urm,
+                uim_frequency=uim_frequency,
+                trained_recommender=mock_base_recommender,
+            )
+            rec_candidates = CyclingRecommender(
+                urm_train=urm,
+                uim_frequency=uim_frequency,
+                trained_recommender=mock_base_recommender,
+                num_candidates=urm.shape[1],
+            )
+
+            rec.fit(weight=2, sign=-1)
+            rec_candidates.fit(weight=2, sign=-1)
+
+            # act
+            expected_recommendations = rec.recommend(
+                user_id_array=test_users,
+                cutoff=test_cutoff,
+                remove_seen_flag=True,
+            )
+            recommendations = rec_candidates.recommend(
+                user_id_array=test_users,
+                cutoff=test_cutoff,
+                remove_seen_flag=True,
+            )
+
+            # assert
+            assert expected_recommendations == recommendations
+
+    def test_impressions_discounting_all_items_as_candidates(
+        self,
+        urm: sp.csr_matrix,
+        uim_frequency: sp.csr_matrix,
+        uim_position: sp.csr_matrix,
+        uim_last_seen: sp.csr_matrix,
+    ):
+        # arrange
+        test_users = np.arange(urm.shape[0], dtype=np.int32)
+        test_cutoff = 3
+        test_hyper_parameters = dict(
+            sign_user_frequency=1,
+            sign_uim_frequency=-1,
+            sign_uim_position=1,
+            sign_uim_last_seen=1,
+            reg_user_frequency=0.5,
+            reg_uim_frequency=0.3,
+            reg_uim_position=0.2,
+            reg_uim_last_seen=0.1,
+            func_user_frequency="LINEAR",
+            func_uim_frequency="INVERSE",
+            func_uim_position="QUADRATIC",
+            func_uim_last_seen="LINEAR",
+        )
+
+        mock_base_recommender = BaseRecommender(URM_train=urm)
+        with patch.object(
+            mock_base_recommender,
+            '_compute_item_score',
+            side_effect=_compute_distinct_item_score,
+        ) as _:
+            recommenders = [
+                ImpressionsDiscountingRecommender(
+                    urm_train=urm,
+                    uim_frequency=uim_frequency,
+                    uim_position=uim_position,
+                    uim_last_seen=uim_last_seen,
+                    trained_recommender=mock_base_recommender,
+                    num_candidates=num_candidates,
+                )
+                for num_candidates in [None, urm.shape[1]]
+            ]
+
+            # act
+            list_recommendations = []
+            for rec in recommenders:
+                rec.fit(**test_hyper_parameters)
+                list_recommendations.append(
+                    rec.recommend(
+                        user_id_array=test_users,
+                        cutoff=test_cutoff,
+                        remove_seen_flag=True,
+                        return_scores=True,
+                    )
+                )
+
+            # assert
+            (expected_recommendations, expected_scores), (recommendations, scores) = list_recommendations
+
+            # In candidates mode the scores are returned as a sparse matrix with only the recommended items.
+            arr_scores = scores.toarray()
+
+            assert expected_recommendations == recommendations
+            for idx_user, arr_items in enumerate(recommendations):
+                assert np.allclose(expected_scores[idx_user, arr_items], arr_scores[idx_user, arr_items])
+
+    def test_dithering_recommends_only_candidates(
+        self, urm: sp.csr_matrix,
+    ):
+        # arrange
+        test_users = np.arange(urm.shape[0], dtype=np.int32)
+        test_cutoff = 3
+        test_num_candidates = 4
+
+        mock_base_recommender = BaseRecommender(URM_train=urm)
+        with patch.object(
+            mock_base_recommender,
+            '_compute_item_score',
+            side_effect=_compute_distinct_item_score,
+        ) as _:
+            candidates = compute_top_n_candidates(
+                trained_recommender=mock_base_recommender,
+                user_id_array=test_users,
+                top_n=test_num_candidates,
+            )
+
+            rec = DitheringRecommender(
+                urm_train=urm,
+                trained_recommender=mock_base_recommender,
+                seed=seed,
+                num_candidates=test_num_candidates,
+            )
+            rec.fit(epsilon=2.)
+
+            # act
+            recommendations = rec.recommend(
+                user_id_array=test_users,
+                cutoff=test_cutoff,
+                remove_seen_flag=True,
+            )
+            item_scores = rec._compute_item_score(
+                user_id_array=test_users,
+            )
+
+            # assert
+            assert (len(test_users), urm.shape[1]) == item_scores.shape
+            for idx_user, user_id in enumerate(test_users):
+                arr_candidates = candidates["candidates_items"][idx_user][
+                    np.isfinite(candidates["candidates_scores"][idx_user])
+                ]
+
+                assert set(recommendations[idx_user]) <= set(arr_candidates)
+                assert len(recommendations[idx_user]) == min(test_cutoff, len(arr_candidates))
+                assert set(np.flatnonzero(np.isfinite(item_scores[idx_user]))) == set(arr_candidates)
+
+    def test_dithering_of_top_n_candidates_recommender(
+        self, urm: sp.csr_matrix,
+    ):
+        # arrange
+        test_users = np.arange(urm.shape[0], dtype=np.int32)
+        test_cutoff = 5
+        test_top_n = 3
+
+        mock_base_recommender = BaseRecommender(URM_train=urm)
+        with patch.object(
+            mock_base_recommender,
+            '_compute_item_score',
+            side_effect=_compute_distinct_item_score,
+        ) as _:
+            candidates = compute_top_n_candidates(
+                trained_recommender=mock_base_recommender,
+                user_id_array=test_users,
+                top_n=test_top_n,
+            )
+            candidates_recommender = TopNCandidatesRecommender(
+                urm_train=urm,
+                trained_recommender=mock_base_recommender,
+                **candidates,
+            )
+
+            # Without `num_candidates`, the noise would make the -inf scores of the non-candidates finite.
+            rec = DitheringRecommender(
+                urm_train=urm,
+                trained_recommender=candidates_recommender,
+                seed=seed,
+            )
+            rec.fit(epsilon=50.)
+
+            # act
+            recommendations = rec.recommend(
+                user_id_array=test_users,
+                cutoff=test_cutoff,
+                remove_seen_flag=True,
+            )
+
+            # assert
+            assert test_top_n == rec._num_candidates
+            for idx_user in range(len(test_users)):
+                arr_candidates = candidates["candidates_items"][idx_user][
+                    np.isfinite(candidates["candidates_scores"][idx_user])
+                ]
+
+                assert set(recommendations[idx_user]) <= set(arr_candidates)
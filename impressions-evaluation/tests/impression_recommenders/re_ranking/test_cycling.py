@@ -6,8 +6,10 @@ import numpy as np
 import scipy.sparse as sp
 
 from impression_recommenders.re_ranking.cycling import CyclingRecommender, T_SIGN
+from recsys_framework_extensions.recommenders.rank import compute_top_k_by_row
 from tests.conftest import seed
 from Recommenders.BaseRecommender import BaseRecommender
+from Evaluation.Evaluator import EvaluatorHoldout
 
 
 class TestCyclingRecommender:
@@ -527,3 +529,137 @@ class TestCyclingRecommender:
 
             # assert
             assert np.allclose(expected_item_scores, scores)
+
+    def test_recommend_top_k_by_ranking_keys(
+        self, urm: sp.csr_matrix, uim_frequency: sp.csr_matrix,
+    ):
+        test_trained_recommender_compute_item_score = np.array(
+            [
+                [1, 6, 3, 2, 3, 5, 4],
+                [1, 1, 1, 1, 1, 1, 1],
+                [1, 2, 3, 4, 5, 6, 7],
+                [7, 6, 5, 4, 3, 2, 1],
+                [9, 7, 5, 4, 8, 7, 3],
+
+                [1, 6, 3, 2, 3, 5, 4],
+                [1, 1, 1, 1, 1, 1, 1],
+                [1, 2, 3, 4, 5, 6, 7],
+                [7, 6, 5, 4, 3, 2, 1],
+                [9, 7, 5, 4, 8, 7, 3],
+            ],
+            dtype=np.int32,
+        )
+
+        mock_base_recommender = BaseRecommender(URM_train=urm)
+        with patch.object(
+            mock_base_recommender,
+            '_compute_item_score',
+            return_value=test_trained_recommender_compute_item_score
+        ) as _:
+            # arrange
+            test_users = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+            test_cutoffs = [1, 3, 10]
+            test_items_values = [None, [1, 2, 5]]
+            test_remove_seen_flag_values = [False, True]
+
+            rec = CyclingRecommender(
+                urm_train=urm,
+                uim_frequency=uim_frequency,
+                trained_recommender=mock_base_recommender,
+                seed=seed,
+            )
+            rec.fit(weight=2, sign=-1)
+
+            for test_cutoff in test_cutoffs:
+                for test_items in test_items_values:
+                    for test_remove_seen_flag in test_remove_seen_flag_values:
+                        # act
+                        # `BaseRecommender.recommend` ranks all items with `_compute_item_score`.
+                        expected_recommendations, expected_scores = BaseRecommender.recommend(
+                            rec,
+                            user_id_array=test_users,
+                            items_to_compute=test_items,
+                            cutoff=test_cutoff,
+                            remove_seen_flag=test_remove_seen_flag,
+                            return_scores=True,
+                        )
+                        recommendations = rec.recommend(
+                            user_id_array=test_users,
+                            items_to_compute=test_items,
+                            cutoff=test_cutoff,
+                            remove_seen_flag=test_remove_seen_flag,
+                            return_scores=False,
+                        )
+                        recommendations_with_scores, scores = rec.recommend(
+                            user_id_array=test_users,
+                            items_to_compute=test_items,
+                            cutoff=test_cutoff,
+                            remove_seen_flag=test_remove_seen_flag,
+                            return_scores=True,
+                        )
+
+                        # assert
+                        assert expected_recommendations == recommendations
+                        assert expected_recommendations == recommendations_with_scores
+                        assert np.array_equal(expected_scores, scores)
+
+    def test_evaluator_holdout_uses_top_k_by_ranking_keys(
+        self, urm: sp.csr_matrix, uim_frequency: sp.csr_matrix,
+    ):
+        # arrange
+        # Distinct relevance scores, so the recommendations do not depend on how ties are broken.
+        test_trained_recommender_compute_item_score = np.array(
+            [
+                np.random.default_rng(seed=idx_user).permutation(urm.shape[1]) + 1
+                for idx_user in range(urm.shape[0])
+            ],
+            dtype=np.float32,
+        )
+        test_urm_test = sp.csr_matrix(
+            np.array([
+                [0, 0, 0, 0, 1, 0, 1],
+                [0, 1, 1, 0, 0, 0, 0],
+                [0, 1, 0, 0, 1, 0, 0],
+                [1, 0, 0, 0, 0, 0, 1],
+                [0, 0, 0, 0, 1, 0, 0],
+                [0, 0, 0, 0, 0, 0, 1],
+                [0, 1, 0, 1, 0, 0, 0],
+                [1, 0, 0, 0, 0, 0, 1],
+                [0, 0, 1, 0, 0, 1, 0],
+                [1, 0, 1, 0, 0, 0, 0],
+            ], dtype=np.float32)
+        )
+
+        mock_base_recommender = BaseRecommender(URM_train=urm)
+        with patch.object(
+            mock_base_recommender,
+            '_compute_item_score',
+            side_effect=lambda user_id_array, items_to_compute=None: test_trained_recommender_compute_item_score[user_id_array, :],
+        ) as _:
+            rec = CyclingRecommender(
+                urm_train=urm,
+                uim_frequency=uim_frequency,
+                trained_recommender=mock_base_recommender,
+                seed=seed,
+            )
+            rec.fit(weight=2, sign=-1)
+
+            evaluator = EvaluatorHoldout(test_urm_test, cutoff_list=[1, 3], exclude_seen=True, verbose=False)
+
+            # act
+            with patch(
+                'recsys_framework_extensions.recommenders.mixins.compute_top_k_by_row',
+                wraps=compute_top_k_by_row,
+            ) as mock_compute_top_k_by_row:
+                results_df, _ = evaluator.evaluateRecommender(rec)
+
+            with patch.object(
+                rec,
+                'recommend',
+                side_effect=lambda *args, **kwargs: BaseRecommender.recommend(rec, *args, **kwargs),
+            ) as _:
+                expected_results_df, _ = evaluator.evaluateRecommender(rec)
+
+            # assert
+            assert mock_compute_top_k_by_row.called
+            assert expected_results_df.equals(results_df)
@@ -891,3 +891,78 @@ class TestImpressionsDiscountingRecommender:
 
             # assert
             assert np.allclose(expected_item_scores, scores)
+
+    def test_shared_cache_transformed_features(
+        self, urm: sp.csr_matrix, uim_frequency: sp.csr_matrix, uim_position: sp.csr_matrix,
+        uim_last_seen: sp.csr_matrix,
+    ):
+        test_trained_recommender_compute_item_score = np.array(
+            [
+                [1, 6, 3, 2, 3, 5, 4],
+                [1, 1, 1, 1, 1, 1, 1],
+                [1, 2, 3, 4, 5, 6, 7],
+                [7, 6, 5, 4, 3, 2, 1],
+                [9, 7, 5, 4, 8, 7, 3],
+
+                [1, 6, 3, 2, 3, 5, 4],
+                [1, 1, 1, 1, 1, 1, 1],
+                [1, 2, 3, 4, 5, 6, 7],
+                [7, 6, 5, 4, 3, 2, 1],
+                [9, 7, 5, 4, 8, 7, 3],
+            ],
+            dtype=np.int32,
+        )
+
+        mock_base_recommender = BaseRecommender(URM_train=urm)
+        with patch.object(
+            mock_base_recommender,
+            '_compute_item_score',
+            return_value=test_trained_recommender_compute_item_score
+        ) as _:
+            # arrange
+            test_users = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+            test_funcs = dict(
+                func_user_frequency=EImpressionsDiscountingFunctions.INVERSE,
+                func_uim_frequency=EImpressionsDiscountingFunctions.EXPONENTIAL,
+                func_uim_position=EImpressionsDiscountingFunctions.LOGARITHMIC,
+                func_uim_last_seen=EImpressionsDiscountingFunctions.SQUARE_ROOT,
+            )
+            test_signs_and_regs = [
+                dict(
+                    sign_user_frequency=1, sign_uim_frequency=1, sign_uim_position=1, sign_uim_last_seen=1,
+                    reg_user_frequency=1.0, reg_uim_frequency=1.0, reg_uim_position=1.0, reg_uim_last_seen=1.0,
+                ),
+                dict(
+                    sign_user_frequency=-1, sign_uim_frequency=1, sign_uim_position=-1, sign_uim_last_seen=1,
+                    reg_user_frequency=0.5, reg_uim_frequency=1e-3, reg_uim_position=0.2, reg_uim_last_seen=0.,
+                ),
+            ]
+            test_cache_transformed_features = dict()
+
+            for test_kwargs in test_signs_and_regs:
+                rec_no_cache = ImpressionsDiscountingRecommender(
+                    urm_train=urm,
+                    uim_frequency=uim_frequency,
+                    uim_position=uim_position,
+                    uim_last_seen=uim_last_seen,
+                    trained_recommender=mock_base_recommender,
+                )
+                rec_shared_cache = ImpressionsDiscountingRecommender(
+                    urm_train=urm,
+                    uim_frequency=uim_frequency,
+                    uim_position=uim_position,
+                    uim_last_seen=uim_last_seen,
+                    trained_recommender=mock_base_recommender,
+                    cache_transformed_features=test_cache_transformed_features,
+                )
+
+                # act
+                rec_no_cache.fit(**test_kwargs, **test_funcs)  # type: ignore
+                rec_shared_cache.fit(**test_kwargs, **test_funcs)  # type: ignore
+
+                expected_item_scores = rec_no_cache._compute_item_score(user_id_array=test_users)
+                obtained_item_scores = rec_shared_cache._compute_item_score(user_id_array=test_users)
+
+                # assert
+                assert np.allclose(expected_item_scores, obtained_item_scores)
+                assert len(test_cache_transformed_features) == 4
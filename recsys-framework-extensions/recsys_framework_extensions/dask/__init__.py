@@ -1,6 +1,6 @@
 import os
 import socket
-from typing import Any, Callable
+from typing import Any, Callable, Optional
 
 import attr
 import distributed
@@ -13,6 +13,10 @@ from recsys_framework_extensions.logging import get_logger
 
 logger = get_logger(__name__)
 
+# Names of the resources each worker declares, see `DaskInterface.submit_job`.
+RESOURCE_MEMORY = "MEMORY"
+RESOURCE_CPU = "CPU"
+
 
 @attr.s(frozen=True, kw_only=True)
 class DaskConfig:
@@ -40,6 +44,32 @@ class DaskInterface:
             )
         return self.__client
 
+    def _get_feasible_resources(
+        self,
+        job_resources: Optional[dict[str, float]],
+    ) -> Optional[dict[str, float]]:
+        """
+        Caps the resources of a job to the largest amount declared by a worker, so jobs that need more than any worker
+        still run (alone) instead of waiting forever. Resources not declared by any worker are ignored.
+        """
+        if job_resources is None:
+            return None
+
+        max_workers_resources: dict[str, float] = dict()
+        for worker_info in self._client.scheduler_info()["workers"].values():
+            for resource_name, resource_amount in worker_info.get("resources", dict()).items():
+                max_workers_resources[resource_name] = max(
+                    resource_amount, max_workers_resources.get(resource_name, 0.)
+                )
+
+        feasible_resources = {
+            resource_name: min(resource_amount, max_workers_resources[resource_name])
+            for resource_name, resource_amount in job_resources.items()
+            if resource_name in max_workers_resources
+        }
+
+        return feasible_resources if len(feasible_resources) > 0 else None
+
     def submit_job(
         self,
         job_key: str,
@@ -47,17 +77,50 @@ class DaskInterface:
         job_info: dict[str, Any],
         method: Callable[[Any], None],
         method_kwargs: dict[str, Any],
-    ):
-        job_future = self._client.submit(
-            func=method,
-            pure=False,
-            key=job_key,
-            priority=job_priority,
-            **method_kwargs,
+        job_resources: Optional[dict[str, float]] = None,
+        job_dependencies: Optional[list[Future]] = None,
+    ) -> Future:
+        """
+        Submits a job to the cluster and returns its future.
+
+        `job_resources` are the resources the job holds while it runs, e.g., `{RESOURCE_MEMORY: 2 ** 30, RESOURCE_CPU: 1}`.
+        The scheduler runs a job in a worker only if the worker has enough of them available, so jobs are packed in the
+        workers without exceeding their memory. If None, the job is only limited by the threads of the workers.
+
+        `job_dependencies` are futures of previously-submitted jobs, e.g., the ones creating the files this job reads.
+        The scheduler starts the job as soon as all of them finish successfully, if any of them fails, then the job
+        fails with the same error without running.
+        """
+        job_resources = self._get_feasible_resources(
+            job_resources=job_resources,
         )
+
+        if job_dependencies is None or len(job_dependencies) == 0:
+            job_future = self._client.submit(
+                method,
+                pure=False,
+                key=job_key,
+                priority=job_priority,
+                resources=job_resources,
+                **method_kwargs,
+            )
+        else:
+            job_future = self._client.submit(
+                _run_job_after_dependencies,
+                method,
+                job_dependencies,
+                pure=False,
+                key=job_key,
+                priority=job_priority,
+                resources=job_resources,
+                **method_kwargs,
+            )
+
         self._job_futures.append(job_future)
         self._job_futures_info[job_future.key] = job_info
 
+        return job_future
+
     def scatter_data(
         self,
         data: Any,
@@ -102,6 +165,16 @@ class DaskInterface:
         self._is_closed = True
 
 
+def _run_job_after_dependencies(
+    method: Callable[..., Any],
+    job_dependencies: list[Any],
+    **method_kwargs: Any,
+) -> Any:
+    # Dask replaces the futures in `job_dependencies` by their results before calling this function, i.e., the
+    # method runs after the dependencies finish. Their results are not needed by the method.
+    return method(**method_kwargs)
+
+
 def _load_logger_config() -> DaskConfig:
     with open(os.path.join(os.getcwd(), "pyproject.toml"), "r") as project_file:
         config = toml.load(
@@ -165,6 +238,11 @@ def configure_dask_cluster() -> DaskInterface:
         # 0 for no limit.  14 * 2 ** 30  # machine_memory / n_workers
         # Each worker will have this memory limit.
         memory_limit = memory_limit
+
+        # Jobs submitted with resources are scheduled so the ones running in a worker fit in its share of the
+        # machine's memory and cores.
+        worker_memory = memory_limit if memory_limit > 0 else machine_memory // n_workers
+        worker_cpus = threads_per_worker
     else:
         # Default value in Dask's source code
         n_workers = 1
@@ -175,6 +253,9 @@ def configure_dask_cluster() -> DaskInterface:
         # machine_memory  # Default value in Dask's source code
         memory_limit = machine_memory
 
+        worker_memory = machine_memory
+        worker_cpus = cpu_count
+
     if _is_scheduler_alive(
         scheduler_address=scheduler_address,
         scheduler_port=scheduler_port
@@ -197,6 +278,7 @@ def configure_dask_cluster() -> DaskInterface:
             f"\n* Installed memory={(machine_memory + 2 ** 30) / 2 ** 30:.2f} GB"
             f"\n* Whole Cluster Usable Memory={machine_memory / 2 ** 30:.2f} GB"
             f"\n* Worker Usable Memory={memory_limit / 2 ** 30:.2f} GB"
+            f"\n* Worker Resources={RESOURCE_MEMORY}: {worker_memory / 2 ** 30:.2f} GB, {RESOURCE_CPU}: {worker_cpus}"
             f"\n* Use Processes={use_processes}"
         )
 
@@ -211,6 +293,10 @@ def configure_dask_cluster() -> DaskInterface:
                 processes=use_processes,
                 dashboard_address=dashboard_address,
                 scheduler_port=scheduler_port,
+                resources={
+                    RESOURCE_MEMORY: worker_memory,
+                    RESOURCE_CPU: worker_cpus,
+                },
             )
         )
 
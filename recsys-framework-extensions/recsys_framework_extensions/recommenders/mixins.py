@@ -1,8 +1,12 @@
 from typing import Optional
 
+import numpy as np
+import scipy.sparse as sp
+
 from recsys_framework_extensions.data.io import DataIO
 
 from recsys_framework_extensions.logging import get_logger
+from recsys_framework_extensions.recommenders.rank import compute_top_k_by_row
 
 logger = get_logger(
     logger_name=__file__,
@@ -49,3 +53,131 @@ class MixinLoadModel:
         logger.info(
             "Loading complete"
         )
+
+
+class MixinTopKByRankingKeys:
+    """
+    Mixin for recommenders whose scores are the ranks of a composite key, i.e., a sparse primary key and a dense
+    secondary key used to resolve ties (see `rank_data_by_row`).
+
+    Subclasses implement `_compute_ranking_keys`, and `recommend` selects the top-k items of each user directly on
+    the keys with `compute_top_k_by_row`, instead of ranking all items and then sorting the ranks. The resulting
+    recommendations are the same as the ones of `BaseRecommender.recommend`.
+
+    When scores are requested, e.g., by `EvaluatorHoldout`, the kernel is still used to rank the items, and the scores
+    are the dense ones of `_compute_item_score` with the removed items set to -inf, as `BaseRecommender.recommend`
+    returns them.
+    """
+
+    def _compute_ranking_keys(
+        self,
+        user_id_array: np.ndarray,
+        items_to_compute: Optional[np.ndarray] = None,
+    ) -> tuple[sp.csr_matrix, np.ndarray, Optional[np.ndarray]]:
+        """
+        Returns
+        -------
+        tuple[sp.csr_matrix, np.ndarray, Optional[np.ndarray]]
+            The (M, N) sparse primary key, the (M, N) dense secondary key, and a (M, N) boolean array telling which
+            user-item pairs can be recommended (None if all of them can be recommended), where
+            M = |user_id_array| and N = #Items.
+        """
+        raise NotImplementedError
+
+    def recommend(
+        self,
+        user_id_array,
+        cutoff: Optional[int] = None,
+        remove_seen_flag: bool = True,
+        items_to_compute: Optional[np.ndarray] = None,
+        remove_top_pop_flag: bool = False,
+        remove_custom_items_flag: bool = False,
+        return_scores: bool = False,
+        **kwargs,
+    ):
+        if kwargs.get("item_chunk_size", None) is not None:
+            return super().recommend(  # type: ignore
+                user_id_array,
+                cutoff=cutoff,
+                remove_seen_flag=remove_seen_flag,
+                items_to_compute=items_to_compute,
+                remove_top_pop_flag=remove_top_pop_flag,
+                remove_custom_items_flag=remove_custom_items_flag,
+                return_scores=return_scores,
+                **kwargs,
+            )
+
+        single_user = np.isscalar(user_id_array)
+        user_id_array = np.atleast_1d(user_id_array)
+
+        num_items: int = self.URM_train.shape[1]  # type: ignore
+        if cutoff is None:
+            cutoff = num_items - 1
+        cutoff = min(cutoff, num_items - 1)
+
+        sp_primary_key, arr_secondary_key, arr_mask_candidates = self._compute_ranking_keys(
+            user_id_array=user_id_array,
+            items_to_compute=items_to_compute,
+        )
+
+        if arr_mask_candidates is None:
+            arr_mask_excluded = np.zeros(shape=(len(user_id_array), num_items), dtype=np.bool_)
+        else:
+            arr_mask_excluded = np.logical_not(arr_mask_candidates)
+
+        if items_to_compute is not None:
+            arr_mask_items = np.ones(shape=num_items, dtype=np.bool_)
+            arr_mask_items[items_to_compute] = False
+            arr_mask_excluded[:, arr_mask_items] = True
+
+        urm_users = None
+        if remove_seen_flag:
+            urm_users = self.URM_train[user_id_array, :].tocoo()  # type: ignore
+            arr_mask_excluded[urm_users.row, urm_users.col] = True
+
+        if remove_top_pop_flag:
+            arr_mask_excluded[:, self.filterTopPop_ItemsID] = True  # type: ignore
+
+        if remove_custom_items_flag:
+            arr_mask_excluded[:, self.items_to_ignore_ID] = True  # type: ignore
+
+        arr_top_k_items = compute_top_k_by_row(
+            sp_primary_key=sp_primary_key,
+            arr_secondary_key=arr_secondary_key,
+            arr_mask_excluded=arr_mask_excluded,
+            cutoff=cutoff,
+        )
+
+        # Rows are padded with -1 when users have less than `cutoff` items that can be recommended. Padded positions
+        # get -inf scores, so `_format_ranking` removes them from the recommendations.
+        arr_mask_padded = arr_top_k_items == -1
+        arr_top_k_items = np.where(arr_mask_padded, 0, arr_top_k_items)
+
+        arr_scores = None
+        if return_scores:
+            arr_scores = self._compute_item_score(  # type: ignore
+                user_id_array,
+                items_to_compute=items_to_compute,
+            )
+
+            if remove_seen_flag:
+                arr_scores[urm_users.row, urm_users.col] = -np.inf
+
+            if remove_top_pop_flag:
+                arr_scores = self._remove_TopPop_on_scores(arr_scores)  # type: ignore
+
+            if remove_custom_items_flag:
+                arr_scores = self._remove_custom_items_on_scores(arr_scores)  # type: ignore
+
+            arr_top_k_scores = np.take_along_axis(arr_scores, arr_top_k_items, axis=1).astype(np.float64)
+            arr_top_k_scores[arr_mask_padded] = -np.inf
+        else:
+            arr_top_k_scores = np.where(
+                arr_mask_padded,
+                -np.inf,
+                num_items - np.arange(arr_top_k_items.shape[1], dtype=np.float32),
+            )
+
+        return self._format_ranking(  # type: ignore
+            user_id_array, arr_top_k_items, arr_top_k_scores, single_user, return_scores, scores_batch=arr_scores,
+        )
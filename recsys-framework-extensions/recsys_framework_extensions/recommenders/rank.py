@@ -2,22 +2,36 @@ from typing import Sequence
 
 import numpy as np
 import numba
+import scipy.sparse as sp
 
 
-@numba.jit(nopython=True, parallel=False)
-def _compute_rank_by_indices(
-    arr_sorted_indices_by_row: np.ndarray,
+@numba.jit(
+    [
+        numba.float32[:, ::1](numba.float32[:, :, ::1]),
+        numba.float32[:, ::1](numba.float64[:, :, ::1]),
+    ],
+    nopython=True,
+    parallel=True,
+    cache=True,
+)
+def _rank_data_by_row_stacked_keys(
+    arr_stacked_keys: np.ndarray,
 ) -> np.ndarray:
-    assert len(arr_sorted_indices_by_row.shape) == 2
-    num_rows, num_cols = arr_sorted_indices_by_row.shape
+    num_keys, num_rows, num_cols = arr_stacked_keys.shape
 
-    arr_scores = np.empty_like(arr_sorted_indices_by_row, dtype=np.float32)
+    arr_scores = np.empty((num_rows, num_cols), dtype=np.float32)
+
+    for idx_row in numba.prange(num_rows):
+        # Same as `numpy.lexsort`: the row is sorted by the first key and then, with a stable sort, by each of the
+        # following keys, so the last key is the most important one.
+        arr_sorted_indices = np.argsort(arr_stacked_keys[0, idx_row], kind="mergesort")
+        for idx_key in range(1, num_keys):
+            arr_key_values = arr_stacked_keys[idx_key, idx_row][arr_sorted_indices]
+            arr_sorted_indices = arr_sorted_indices[np.argsort(arr_key_values, kind="mergesort")]
 
-    for idx_row in range(num_rows):
         rank_value = 1
         for idx_col in range(num_cols):
-            sorted_idx_col = arr_sorted_indices_by_row[idx_row, idx_col]
-            arr_scores[idx_row, sorted_idx_col] = rank_value
+            arr_scores[idx_row, arr_sorted_indices[idx_col]] = rank_value
             rank_value += 1
 
     return arr_scores
@@ -36,8 +50,10 @@ def rank_data_by_row(keys: Sequence[np.ndarray]) -> np.ndarray:
 
     Notes
     -----
-    This method is equivalent to `scipy.stats.rankdata(a, method="ordinal", axis=1)` but faster because
-    `numpy.lexsort` is faster than `numpy.argsort` (this last used internally by scipy.stats.rankdata).
+    This method is equivalent to `scipy.stats.rankdata(a, method="ordinal", axis=1)` but faster because rows are
+    sorted in parallel with a stable sort per key, as `numpy.lexsort` does. Keys are cast to float32 if all of them
+    are float32, else to float64. The kernel is compiled for these two types and cached on disk, therefore, it is not
+    compiled again by each process importing this module.
 
     Returns
     -------
@@ -78,36 +94,210 @@ def rank_data_by_row(keys: Sequence[np.ndarray]) -> np.ndarray:
     array([[3., 2., 1.],
            [1., 2., 3.]], dtype=float32)
     """
-    arr_sorted_indices_by_row: np.ndarray = np.lexsort(
-        keys=keys,
-        axis=1,
+    # Keys are stacked in a single C-contiguous array to match one of the compiled signatures of the kernel.
+    dtype = np.float32 if all(np.asarray(key).dtype == np.float32 for key in keys) else np.float64
+    arr_stacked_keys = np.stack(
+        [np.asarray(key, dtype=dtype) for key in keys],
+        axis=0,
     )
 
-    return _compute_rank_by_indices(arr_sorted_indices_by_row=arr_sorted_indices_by_row)
+    assert len(arr_stacked_keys.shape) == 3
+
+    return _rank_data_by_row_stacked_keys(np.ascontiguousarray(arr_stacked_keys))
+
+
+@numba.jit(nopython=True, cache=True)
+def _is_lower_composite_key(
+    primary_key_a: float, secondary_key_a: float, col_a: int,
+    primary_key_b: float, secondary_key_b: float, col_b: int,
+) -> bool:
+    if primary_key_a != primary_key_b:
+        return primary_key_a < primary_key_b
+    if secondary_key_a != secondary_key_b:
+        return secondary_key_a < secondary_key_b
+    return col_a < col_b
+
+
+@numba.jit(nopython=True, cache=True)
+def _sift_down_heap(
+    arr_heap_primary_key: np.ndarray,
+    arr_heap_secondary_key: np.ndarray,
+    arr_heap_cols: np.ndarray,
+    heap_size: int,
+    idx_heap: int,
+) -> None:
+    while True:
+        idx_lowest = idx_heap
+        idx_left = 2 * idx_heap + 1
+        idx_right = idx_left + 1
+
+        for idx_child in (idx_left, idx_right):
+            if idx_child < heap_size and _is_lower_composite_key(
+                arr_heap_primary_key[idx_child], arr_heap_secondary_key[idx_child], arr_heap_cols[idx_child],
+                arr_heap_primary_key[idx_lowest], arr_heap_secondary_key[idx_lowest], arr_heap_cols[idx_lowest],
+            ):
+                idx_lowest = idx_child
+
+        if idx_lowest == idx_heap:
+            return
+
+        arr_heap_primary_key[idx_heap], arr_heap_primary_key[idx_lowest] = (
+            arr_heap_primary_key[idx_lowest], arr_heap_primary_key[idx_heap]
+        )
+        arr_heap_secondary_key[idx_heap], arr_heap_secondary_key[idx_lowest] = (
+            arr_heap_secondary_key[idx_lowest], arr_heap_secondary_key[idx_heap]
+        )
+        arr_heap_cols[idx_heap], arr_heap_cols[idx_lowest] = arr_heap_cols[idx_lowest], arr_heap_cols[idx_heap]
+
+        idx_heap = idx_lowest
+
+
+@numba.jit(nopython=True, parallel=True, cache=True)
+def _compute_top_k_by_row_sparse_dense(
+    arr_primary_key_indptr: np.ndarray,
+    arr_primary_key_indices: np.ndarray,
+    arr_primary_key_data: np.ndarray,
+    arr_secondary_key: np.ndarray,
+    arr_mask_excluded: np.ndarray,
+    cutoff: int,
+) -> np.ndarray:
+    num_rows, num_cols = arr_secondary_key.shape
+
+    arr_top_k = np.full((num_rows, cutoff), -1, dtype=np.int64)
+
+    for idx_row in numba.prange(num_rows):
+        # Min-heap holding the `cutoff` highest (primary key, secondary key, column) seen so far, its root is the
+        # lowest of them.
+        arr_heap_primary_key = np.empty(cutoff, dtype=np.float64)
+        arr_heap_secondary_key = np.empty(cutoff, dtype=np.float64)
+        arr_heap_cols = np.empty(cutoff, dtype=np.int64)
+        heap_size = 0
+
+        # Indices of the sparse key are sorted, therefore, the primary key of each column is found by moving a
+        # pointer along the row.
+        idx_sparse = arr_primary_key_indptr[idx_row]
+        idx_sparse_end = arr_primary_key_indptr[idx_row + 1]
+
+        for idx_col in range(num_cols):
+            primary_key = 0.
+            while idx_sparse < idx_sparse_end and arr_primary_key_indices[idx_sparse] < idx_col:
+                idx_sparse += 1
+            if idx_sparse < idx_sparse_end and arr_primary_key_indices[idx_sparse] == idx_col:
+                primary_key = arr_primary_key_data[idx_sparse]
+
+            if arr_mask_excluded[idx_row, idx_col] or cutoff == 0:
+                continue
+
+            secondary_key = arr_secondary_key[idx_row, idx_col]
+
+            if heap_size < cutoff:
+                # Sift up the new element.
+                idx_heap = heap_size
+                heap_size += 1
+                while idx_heap > 0:
+                    idx_parent = (idx_heap - 1) // 2
+                    if not _is_lower_composite_key(
+                        primary_key, secondary_key, idx_col,
+                        arr_heap_primary_key[idx_parent], arr_heap_secondary_key[idx_parent], arr_heap_cols[idx_parent],
+                    ):
+                        break
+                    arr_heap_primary_key[idx_heap] = arr_heap_primary_key[idx_parent]
+                    arr_heap_secondary_key[idx_heap] = arr_heap_secondary_key[idx_parent]
+                    arr_heap_cols[idx_heap] = arr_heap_cols[idx_parent]
+                    idx_heap = idx_parent
+
+                arr_heap_primary_key[idx_heap] = primary_key
+                arr_heap_secondary_key[idx_heap] = secondary_key
+                arr_heap_cols[idx_heap] = idx_col
+
+            elif _is_lower_composite_key(
+                arr_heap_primary_key[0], arr_heap_secondary_key[0], arr_heap_cols[0],
+                primary_key, secondary_key, idx_col,
+            ):
+                arr_heap_primary_key[0] = primary_key
+                arr_heap_secondary_key[0] = secondary_key
+                arr_heap_cols[0] = idx_col
+                _sift_down_heap(
+                    arr_heap_primary_key, arr_heap_secondary_key, arr_heap_cols, heap_size, 0,
+                )
+
+        # Popping the root returns the elements in ascending order, so they are placed from the end of the ranking.
+        while heap_size > 0:
+            arr_top_k[idx_row, heap_size - 1] = arr_heap_cols[0]
+
+            heap_size -= 1
+            arr_heap_primary_key[0] = arr_heap_primary_key[heap_size]
+            arr_heap_secondary_key[0] = arr_heap_secondary_key[heap_size]
+            arr_heap_cols[0] = arr_heap_cols[heap_size]
+            _sift_down_heap(
+                arr_heap_primary_key, arr_heap_secondary_key, arr_heap_cols, heap_size, 0,
+            )
+
+    return arr_top_k
+
+
+def compute_top_k_by_row(
+    sp_primary_key: sp.csr_matrix,
+    arr_secondary_key: np.ndarray,
+    arr_mask_excluded: np.ndarray,
+    cutoff: int,
+) -> np.ndarray:
+    """
+    Computes, for each row, the `cutoff` columns with the highest rank given by
+    `rank_data_by_row(keys=(arr_secondary_key, sp_primary_key.toarray()))` without sorting all the columns nor
+    densifying the primary key.
+
+    Parameters
+    ----------
+    sp_primary_key: scipy.sparse.csr_matrix
+        A (M, N) sparse matrix with the first key to rank columns, missing values are considered zeros.
+    arr_secondary_key: numpy.ndarray
+        A (M, N) dense array with the key used to resolve ties in the primary key.
+    arr_mask_excluded: numpy.ndarray
+        A (M, N) boolean array, columns set to `True` are never part of the result.
+    cutoff: int
+        Number of columns to select on each row.
+
+    Notes
+    -----
+    Ties in both keys are resolved as in `rank_data_by_row`, i.e., the column with the highest index gets the highest
+    rank. Each row is processed in parallel and has a cost of O(N log(cutoff)).
+
+    Returns
+    -------
+    numpy.ndarray
+        A (M, cutoff) array with the selected columns sorted by decreasing rank. Rows with less than `cutoff`
+        non-excluded columns are padded with -1.
+
+    Examples
+    --------
+    >>> from numpy import array
+    >>> from scipy.sparse import csr_matrix
+    >>> compute_top_k_by_row(
+    ...     sp_primary_key=csr_matrix(array([[0., 1., 0., 1.]])),
+    ...     arr_secondary_key=array([[9., 8., 7., 8.]]),
+    ...     arr_mask_excluded=array([[False, False, False, False]]),
+    ...     cutoff=3,
+    ... )
+    array([[3, 1, 0]])
+    """
+    sp_primary_key = sp.csr_matrix(sp_primary_key, copy=True)
+    sp_primary_key.sort_indices()
+
+    assert sp_primary_key.shape == arr_secondary_key.shape
+    assert sp_primary_key.shape == arr_mask_excluded.shape
+    assert cutoff >= 0
+
+    return _compute_top_k_by_row_sparse_dense(
+        arr_primary_key_indptr=sp_primary_key.indptr,
+        arr_primary_key_indices=sp_primary_key.indices,
+        arr_primary_key_data=sp_primary_key.data.astype(np.float64),
+        arr_secondary_key=arr_secondary_key.astype(np.float64),
+        arr_mask_excluded=arr_mask_excluded.astype(np.bool_),
+        cutoff=cutoff,
+    )
 
 
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
-
-else:
-    # jit-compile this function with expected values.
-    rank_data_by_row(keys=(
-        np.array([[1., 2., 3.], [4., 5., 6.]], dtype=np.float32),
-        np.array([[4., 5., 6.], [1., 2., 3.]], dtype=np.float32),
-    ))
-
-    rank_data_by_row(keys=(
-        np.array([[1., 2., 3.], [4., 5., 6.]], dtype=np.float32),
-        np.array([[4., 5., 6.], [1., 2., 3.]], dtype=np.float64),
-    ))
-
-    rank_data_by_row(keys=(
-        np.array([[1., 2., 3.], [4., 5., 6.]], dtype=np.float64),
-        np.array([[4., 5., 6.], [1., 2., 3.]], dtype=np.float32),
-    ))
-
-    rank_data_by_row(keys=(
-        np.array([[1., 2., 3.], [4., 5., 6.]], dtype=np.float64),
-        np.array([[4., 5., 6.], [1., 2., 3.]], dtype=np.float64),
-    ))
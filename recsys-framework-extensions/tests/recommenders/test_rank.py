@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from recsys_framework_extensions.recommenders.rank import rank_data_by_row, compute_top_k_by_row
+
+
+seed = 1234567890
+
+
+def _lexsort_by_row(keys: tuple[np.ndarray, ...]) -> np.ndarray:
+    # `numpy.lexsort` is stable, so ties in all keys are sorted by increasing column.
+    return np.array([
+        np.lexsort(tuple(key[idx_row] for key in keys))
+        for idx_row in range(keys[0].shape[0])
+    ])
+
+
+class TestRankDataByRow:
+    @pytest.mark.parametrize("dtype", [np.float32, np.float64])
+    @pytest.mark.parametrize("num_keys", [1, 2, 3])
+    def test_same_as_lexsort(self, dtype, num_keys: int):
+        # arrange
+        rng = np.random.default_rng(seed=seed)
+        # Few distinct values, so there are ties in each key and in all of them.
+        test_keys = tuple(
+            rng.integers(low=0, high=3, size=(20, 50)).astype(dtype)
+            for _ in range(num_keys)
+        )
+
+        expected_ranks = np.empty(shape=(20, 50), dtype=np.float32)
+        np.put_along_axis(
+            expected_ranks,
+            _lexsort_by_row(test_keys),
+            np.arange(start=1, stop=51, dtype=np.float32)[np.newaxis, :],
+            axis=1,
+        )
+
+        # act
+        ranks = rank_data_by_row(keys=test_keys)
+
+        # assert
+        assert np.float32 == ranks.dtype
+        assert np.array_equal(expected_ranks, ranks)
+
+    def test_mixed_dtypes(self):
+        # arrange
+        rng = np.random.default_rng(seed=seed)
+        # The difference cannot be represented in float32, so keys must be ranked as float64 if any of them is.
+        test_dense_key = np.full(shape=(5, 10), fill_value=1., dtype=np.float64)
+        test_dense_key[:, ::2] += 1e-12
+        test_sparse_key = rng.integers(low=0, high=2, size=(5, 10)).astype(np.float32)
+
+        expected_ranks = np.empty(shape=(5, 10), dtype=np.float32)
+        np.put_along_axis(
+            expected_ranks,
+            _lexsort_by_row((test_dense_key, test_sparse_key)),
+            np.arange(start=1, stop=11, dtype=np.float32)[np.newaxis, :],
+            axis=1,
+        )
+
+        # act
+        ranks = rank_data_by_row(keys=(test_dense_key, test_sparse_key))
+
+        # assert
+        assert np.array_equal(expected_ranks, ranks)
+
+
+class TestComputeTopKByRow:
+    @pytest.mark.parametrize("dtype", [np.float32, np.float64])
+    @pytest.mark.parametrize("cutoff", [0, 1, 5, 30, 40])
+    def test_same_as_lexsort(self, dtype, cutoff: int):
+        # arrange
+        num_rows, num_cols = 20, 30
+        rng = np.random.default_rng(seed=seed)
+
+        test_primary_key = sp.random(
+            num_rows, num_cols, density=0.3, format="csr", random_state=seed,
+            data_rvs=lambda size: rng.integers(low=1, high=3, size=size),
+        ).astype(dtype)
+        test_secondary_key = rng.integers(low=0, high=3, size=(num_rows, num_cols)).astype(dtype)
+
+        # Some rows have less than `cutoff` columns that can be selected, and the last one none of them.
+        test_mask_excluded = rng.random(size=(num_rows, num_cols)) < np.linspace(0., 1., num=num_rows)[:, np.newaxis]
+        test_mask_excluded[-1, :] = True
+
+        arr_sorting = _lexsort_by_row((test_secondary_key, test_primary_key.toarray()))
+        expected_top_k = np.full(shape=(num_rows, cutoff), fill_value=-1, dtype=np.int64)
+        for idx_row in range(num_rows):
+            arr_ranking = arr_sorting[idx_row, ::-1]
+            arr_ranking = arr_ranking[np.logical_not(test_mask_excluded[idx_row, arr_ranking])][:cutoff]
+            expected_top_k[idx_row, :len(arr_ranking)] = arr_ranking
+
+        # act
+        top_k = compute_top_k_by_row(
+            sp_primary_key=test_primary_key,
+            arr_secondary_key=test_secondary_key,
+            arr_mask_excluded=test_mask_excluded,
+            cutoff=cutoff,
+        )
+
+        # assert
+        assert (num_rows, cutoff) == top_k.shape
+        assert np.array_equal(expected_top_k, top_k)
+        assert np.all(top_k[-1] == -1)
+
+    def test_unsorted_primary_key_indices(self):
+        # arrange
+        rng = np.random.default_rng(seed=seed)
+        test_primary_key = sp.csr_matrix(
+            (
+                np.array([2., 1., 1.], dtype=np.float32),
+                np.array([4, 0, 2]),
+                np.array([0, 3]),
+            ),
+            shape=(1, 5),
+        )
+        test_secondary_key = rng.random(size=(1, 5))
+        test_mask_excluded = np.zeros(shape=(1, 5), dtype=np.bool_)
+
+        expected_top_k = _lexsort_by_row((test_secondary_key, test_primary_key.toarray()))[:, ::-1][:, :3]
+
+        # act
+        top_k = compute_top_k_by_row(
+            sp_primary_key=test_primary_key,
+            arr_secondary_key=test_secondary_key,
+            arr_mask_excluded=test_mask_excluded,
+            cutoff=3,
+        )
+
+        # assert
+        assert not test_primary_key.has_sorted_indices
+        assert np.array_equal(expected_top_k, top_k)